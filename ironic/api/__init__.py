@@ -29,6 +29,14 @@ API_SERVICE_OPTS = [
                default=1000,
                help=_('The maximum number of items returned in a single '
                       'response from a collection resource.')),
+    cfg.BoolOpt('stream_collections',
+                default=False,
+                help=_('Whether the detailed collections of nodes and ports '
+                       'are sent as they are serialized, rather than once '
+                       'the whole response is built. This makes the time to '
+                       'the first byte of a page independent of its size, '
+                       'but an error while serializing the collection can '
+                       'then only be reported by closing the connection.')),
 ]
 
 CONF = cfg.CONF
@@ -180,6 +180,9 @@ class ChassisController(rest.RestController):
         chassis = objects.Chassis.list(pecan.request.context, limit,
                                        marker_obj, sort_key=sort_key,
                                        sort_dir=sort_dir)
+        not_modified = api_utils.check_etag(chassis)
+        if not_modified:
+            return not_modified
         return ChassisCollection.convert_with_links(chassis, limit,
                                                     url=resource_url,
                                                     fields=fields,
@@ -235,6 +238,9 @@ class ChassisController(rest.RestController):
         api_utils.check_allow_specify_fields(fields)
         rpc_chassis = objects.Chassis.get_by_uuid(pecan.request.context,
                                                   chassis_uuid)
+        not_modified = api_utils.check_etag([rpc_chassis])
+        if not_modified:
+            return not_modified
         return Chassis.convert_with_links(rpc_chassis, fields=fields)
 
     @expose.expose(Chassis, body=Chassis, status_code=http_client.CREATED)
@@ -38,11 +38,16 @@ class Collection(base.APIBase):
         if not self.has_next(limit):
             return wtypes.Unset
 
-        resource_url = url or self._type
-        q_args = ''.join(['%s=%s&' % (key, kwargs[key]) for key in kwargs])
-        next_args = '?%(args)slimit=%(limit)d&marker=%(marker)s' % {
-            'args': q_args, 'limit': limit,
-            'marker': self.collection[-1].uuid}
-
-        return link.Link.make_link('next', pecan.request.host_url,
-                                   resource_url, next_args).href
+        return get_next_href(self._type, self.collection[-1].uuid, limit,
+                             url=url, **kwargs)
+
+
+def get_next_href(resource, marker, limit, url=None, **kwargs):
+    """Return the URL of the subset of a collection after the marker."""
+    resource_url = url or resource
+    q_args = ''.join(['%s=%s&' % (key, kwargs[key]) for key in kwargs])
+    next_args = '?%(args)slimit=%(limit)d&marker=%(marker)s' % {
+        'args': q_args, 'limit': limit, 'marker': marker}
+
+    return link.build_url(resource_url, next_args,
+                          base_url=pecan.request.host_url)
@@ -0,0 +1,106 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import pecan
+from pecan import rest
+import wsme
+from wsme import types as wtypes
+
+from ironic.api.controllers import base
+from ironic.api.controllers import link
+from ironic.api.controllers.v1 import types
+from ironic.api.controllers.v1 import utils as api_utils
+from ironic.api import expose
+from ironic.common import exception
+
+
+class Conductor(base.APIBase):
+    """API representation of a conductor."""
+
+    hostname = wtypes.text
+    """The hostname of the conductor"""
+
+    drivers = [wtypes.text]
+    """A list of the drivers loaded by the conductor"""
+
+    links = wsme.wsattr([link.Link], readonly=True)
+    """A list containing self and bookmark links"""
+
+    @staticmethod
+    def convert_with_links(hostname, drivers):
+        conductor = Conductor()
+        conductor.hostname = hostname
+        conductor.drivers = drivers
+        conductor.links = [
+            link.Link.make_link('self',
+                                pecan.request.host_url,
+                                'conductors', hostname),
+            link.Link.make_link('bookmark',
+                                pecan.request.host_url,
+                                'conductors', hostname,
+                                bookmark=True)
+        ]
+        return conductor
+
+    @classmethod
+    def sample(cls):
+        sample = cls(hostname="fake-host",
+                     drivers=["sample-driver"])
+        return sample
+
+
+class ConductorStatsController(rest.RestController):
+    """REST controller for the statistics of a conductor."""
+
+    @expose.expose(types.jsontype, wtypes.text)
+    def get(self, hostname):
+        """Retrieve the statistics of a conductor.
+
+        :param hostname: the hostname of the conductor.
+        :returns: a dictionary with the statistics of the workers pool, of
+            the tasks and of the locks on the nodes.
+        :raises: NotAcceptable, if requested version of the API is less than
+            1.13.
+        :raises: ConductorNotFound (HTTP 404) if the conductor is not
+            registered, or is offline.
+        """
+        if not api_utils.allow_conductor_stats():
+            raise exception.NotAcceptable()
+        # NOTE: make sure the conductor is alive, rather than waiting for
+        # the RPC call to time out.
+        pecan.request.dbapi.get_conductor(hostname)
+        topic = '%s.%s' % (pecan.request.rpcapi.topic, hostname)
+        return pecan.request.rpcapi.get_conductor_stats(
+            pecan.request.context, topic=topic)
+
+
+class ConductorsController(rest.RestController):
+    """REST controller for Conductors."""
+
+    stats = ConductorStatsController()
+    """Expose the statistics as a sub-element of conductors"""
+
+    @expose.expose(Conductor, wtypes.text)
+    def get_one(self, hostname):
+        """Retrieve a single conductor.
+
+        :param hostname: the hostname of the conductor.
+        :raises: NotAcceptable, if requested version of the API is less than
+            1.13.
+        :raises: ConductorNotFound (HTTP 404) if the conductor is not
+            registered, or is offline.
+        """
+        if not api_utils.allow_conductor_stats():
+            raise exception.NotAcceptable()
+        conductor = pecan.request.dbapi.get_conductor(hostname)
+        return Conductor.convert_with_links(conductor.hostname,
+                                            conductor.drivers)
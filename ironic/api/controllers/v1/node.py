@@ -13,12 +13,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import ast
 import datetime
 
 from oslo_config import cfg
 from oslo_log import log
-from oslo_utils import strutils
 from oslo_utils import uuidutils
 import pecan
 from pecan import rest
@@ -37,6 +35,7 @@ from ironic.api import expose
 from ironic.common import exception
 from ironic.common.i18n import _
 from ironic.common import states as ir_states
+from ironic.common import utils
 from ironic import objects
 
 
@@ -59,6 +58,14 @@ _VENDOR_METHODS = {}
 _DEFAULT_RETURN_FIELDS = ('instance_uuid', 'maintenance', 'power_state',
                           'provision_state', 'uuid', 'name')
 
+# The fields identifying the state of the nodes for their entity tags.
+# NOTE: the states change in quick succession, possibly within the
+# precision of updated_at in the database.
+_ETAG_FIELDS = api_utils.ETAG_FIELDS + ('provision_state',
+                                        'target_provision_state',
+                                        'power_state', 'target_power_state',
+                                        'maintenance', 'reservation')
+
 # Minimum API version to use for certain verbs
 MIN_VERB_VERSIONS = {
     # v1.4 added the MANAGEABLE state and two verbs to move nodes into
@@ -70,25 +77,31 @@ MIN_VERB_VERSIONS = {
 }
 
 
-def hide_fields_in_newer_versions(obj):
+def get_hidden_fields():
+    """Return the fields of the nodes hidden in the requested API version."""
+    hidden = []
     # if requested version is < 1.3, hide driver_internal_info
     if pecan.request.version.minor < versions.MINOR_3_DRIVER_INTERNAL_INFO:
-        obj.driver_internal_info = wsme.Unset
+        hidden.append('driver_internal_info')
 
     if not api_utils.allow_node_logical_names():
-        obj.name = wsme.Unset
+        hidden.append('name')
 
     # if requested version is < 1.6, hide inspection_*_at fields
     if pecan.request.version.minor < versions.MINOR_6_INSPECT_STATE:
-        obj.inspection_finished_at = wsme.Unset
-        obj.inspection_started_at = wsme.Unset
+        hidden.extend(['inspection_finished_at', 'inspection_started_at'])
 
     if pecan.request.version.minor < versions.MINOR_7_NODE_CLEAN:
-        obj.clean_step = wsme.Unset
+        hidden.append('clean_step')
 
     if pecan.request.version.minor < versions.MINOR_12_RAID_CONFIG:
-        obj.raid_config = wsme.Unset
-        obj.target_raid_config = wsme.Unset
+        hidden.extend(['raid_config', 'target_raid_config'])
+    return hidden
+
+
+def hide_fields_in_newer_versions(obj):
+    for field in get_hidden_fields():
+        setattr(obj, field, wsme.Unset)
 
 
 def assert_juno_provision_state_name(obj):
@@ -98,6 +111,24 @@ def assert_juno_provision_state_name(obj):
         obj.provision_state = ir_states.NOSTATE
 
 
+def get_db_fields(fields):
+    """Return the fields of the nodes to load to return the given fields.
+
+    :param fields: the fields of the API nodes to return, or None for all
+        of them.
+    :returns: a list of fields of :class:`ironic.objects.Node`, or None for
+        all of them.
+    """
+    if fields is None:
+        return None
+    db_fields = set(f for f in fields if f in objects.Node.fields)
+    if 'chassis_uuid' in fields:
+        db_fields.add('chassis_id')
+    # NOTE: the links are built with the UUID
+    db_fields.add('uuid')
+    return sorted(db_fields)
+
+
 def check_allow_management_verbs(verb):
     min_version = MIN_VERB_VERSIONS.get(verb)
     if min_version is not None and pecan.request.version.minor < min_version:
@@ -446,7 +477,7 @@ class NodeStatesController(rest.RestController):
             raise exception.NodeInMaintenance(op=_('provisioning'),
                                               node=rpc_node.uuid)
 
-        m = ir_states.machine.copy()
+        m = ir_states.machine_table.cursor()
         m.initialize(rpc_node.provision_state)
         if not m.is_actionable_event(ir_states.VERBS.get(target, target)):
             # Normally, we let the task manager recognize and deal with
@@ -659,9 +690,7 @@ class Node(base.APIBase):
                           ]
 
         if not show_password and node.driver_info != wtypes.Unset:
-            node.driver_info = ast.literal_eval(strutils.mask_password(
-                                                node.driver_info,
-                                                "******"))
+            node.driver_info = utils.mask_secrets(node.driver_info)
 
         # NOTE(lucasagomes): The numeric ID should not be exposed to
         #                    the user, it's internal only.
@@ -717,6 +746,112 @@ class Node(base.APIBase):
                                        fields=fields)
 
 
+def _copy_dict(value):
+    # NOTE: WSME copies the JSON documents of the nodes like this twice,
+    # when validating them and when serializing them. The copies are
+    # made the same way to get the same order of the keys, and thus the
+    # same JSON, as when serializing the Node objects.
+    return dict((k, v) for k, v in value.items())
+
+
+class _NodeConverter(object):
+    """Converts nodes to the JSON documents of the API nodes.
+
+    This gives the same documents as converting the nodes to
+    :class:`Node` objects with :meth:`Node.convert_with_links` and
+    serializing them with WSME, in the requested API version, without
+    building and validating a :class:`Node` and its links.
+    """
+
+    # The fields of the nodes set in the API nodes
+    node_fields = [f for f in objects.Node.fields if hasattr(Node, f)]
+
+    # The attributes of the API nodes, in the order in which WSME
+    # serializes them
+    attributes = [(attr.key, attr.datatype)
+                  for attr in wtypes.list_attributes(Node)]
+
+    def __init__(self, fields=None):
+        self.fields = fields
+        self.context = pecan.request.context
+        self.url = pecan.request.host_url
+        self.show_password = pecan.request.context.show_password
+        self.hidden_fields = get_hidden_fields()
+        self.juno_state_names = (pecan.request.version.minor <
+                                 versions.MINOR_2_AVAILABLE_STATE)
+        self._chassis_uuids = {}
+
+    def _get_chassis_uuid(self, chassis_id):
+        try:
+            return self._chassis_uuids[chassis_id]
+        except KeyError:
+            pass
+        try:
+            chassis = objects.Chassis.get(self.context, chassis_id)
+        except exception.ChassisNotFound as e:
+            e.code = http_client.BAD_REQUEST
+            raise e
+        self._chassis_uuids[chassis_id] = chassis.uuid
+        return chassis.uuid
+
+    def _make_links(self, resource_args):
+        return [{'href': link.build_url('nodes', resource_args,
+                                        base_url=self.url),
+                 'rel': 'self'},
+                {'href': link.build_url('nodes', resource_args,
+                                        bookmark=True, base_url=self.url),
+                 'rel': 'bookmark'}]
+
+    def __call__(self, rpc_node):
+        """Return the JSON document of a node, as a dict."""
+        values = rpc_node.as_dict()
+        node = dict((f, values[f]) for f in self.node_fields if f in values)
+        if values.get('chassis_id'):
+            node['chassis_uuid'] = self._get_chassis_uuid(values['chassis_id'])
+
+        if self.fields is not None:
+            valid_fields = list(node)
+            if values.get('chassis_id'):
+                valid_fields.append('chassis_id')
+            api_utils.check_for_invalid_fields(self.fields, valid_fields)
+
+        if (self.juno_state_names and
+                node.get('provision_state') == ir_states.AVAILABLE):
+            node['provision_state'] = ir_states.NOSTATE
+        for field in self.hidden_fields:
+            node.pop(field, None)
+
+        node_uuid = rpc_node.uuid
+        if self.fields is not None:
+            node = dict((f, v) for f, v in node.items() if f in self.fields)
+        else:
+            node['ports'] = self._make_links(node_uuid + "/ports")
+
+        if not self.show_password and node.get('driver_info') is not None:
+            node['driver_info'] = utils.mask_secrets(
+                _copy_dict(node['driver_info']))
+        node['links'] = self._make_links(node_uuid)
+
+        result = {}
+        for name, datatype in self.attributes:
+            if name not in node:
+                continue
+            value = node[name]
+            if value is not None:
+                if isinstance(datatype, wtypes.DictType):
+                    value = _copy_dict(_copy_dict(value))
+                elif datatype is datetime.datetime:
+                    value = value.isoformat()
+            result[name] = value
+        return result
+
+
+def _get_next_href(nodes, limit, url=None, **kwargs):
+    if nodes and len(nodes) == limit:
+        return collection.get_next_href('nodes', nodes[-1].uuid, limit,
+                                        url=url, **kwargs)
+
+
 class NodeCollection(collection.Collection):
     """API representation of a collection of nodes."""
 
@@ -734,6 +869,30 @@ class NodeCollection(collection.Collection):
         collection.next = collection.get_next(limit, url=url, **kwargs)
         return collection
 
+    @staticmethod
+    def convert_to_dict(nodes, limit, url=None, fields=None, **kwargs):
+        """Return the JSON document of a collection of nodes, as a dict.
+
+        This is the document that serializing the collection returned by
+        :meth:`convert_with_links` gives, built without the API objects.
+        """
+        result = {'nodes': list(map(_NodeConverter(fields), nodes))}
+        next_href = _get_next_href(nodes, limit, url=url, **kwargs)
+        if next_href is not None:
+            result['next'] = next_href
+        return result
+
+    @staticmethod
+    def stream(nodes, limit, url=None, fields=None, **kwargs):
+        """Return a response streaming the JSON document of a collection.
+
+        The document is the one returned by :meth:`convert_to_dict`, with
+        the nodes converted while the response is sent.
+        """
+        return api_utils.stream_collection(
+            'nodes', nodes, _NodeConverter(fields),
+            next_href=_get_next_href(nodes, limit, url=url, **kwargs))
+
     @classmethod
     def sample(cls):
         sample = cls()
@@ -865,7 +1024,7 @@ class NodesController(rest.RestController):
     def _get_nodes_collection(self, chassis_uuid, instance_uuid, associated,
                               maintenance, provision_state, marker, limit,
                               sort_key, sort_dir, resource_url=None,
-                              fields=None):
+                              fields=None, stream=False):
         if self.from_chassis and not chassis_uuid:
             raise exception.MissingParameterValue(
                 _("Chassis id not specified."))
@@ -896,19 +1055,33 @@ class NodesController(rest.RestController):
             if provision_state:
                 filters['provision_state'] = provision_state
 
+            db_fields = get_db_fields(fields)
+            if db_fields is not None:
+                db_fields = sorted(set(db_fields) | set(_ETAG_FIELDS))
             nodes = objects.Node.list(pecan.request.context, limit, marker_obj,
                                       sort_key=sort_key, sort_dir=sort_dir,
-                                      filters=filters)
+                                      filters=filters, fields=db_fields)
+
+        not_modified = api_utils.check_etag(nodes, _ETAG_FIELDS)
+        if not_modified:
+            return not_modified
 
         parameters = {'sort_key': sort_key, 'sort_dir': sort_dir}
         if associated:
             parameters['associated'] = associated
         if maintenance:
             parameters['maintenance'] = maintenance
-        return NodeCollection.convert_with_links(nodes, limit,
-                                                 url=resource_url,
-                                                 fields=fields,
-                                                 **parameters)
+        if stream:
+            return NodeCollection.stream(nodes, limit, url=resource_url,
+                                         fields=fields, **parameters)
+        # NOTE: the collection is serialized without building its Node
+        # objects, which is much faster for large collections.
+        result = NodeCollection.convert_to_dict(nodes, limit,
+                                                url=resource_url,
+                                                fields=fields,
+                                                **parameters)
+        return wsme.api.Response(result, status_code=http_client.OK,
+                                 return_type=types.jsontype)
 
     def _get_nodes_by_instance(self, instance_uuid):
         """Retrieve a node by its instance uuid.
@@ -1040,11 +1213,10 @@ class NodesController(rest.RestController):
             raise exception.HTTPNotFound
 
         resource_url = '/'.join(['nodes', 'detail'])
-        return self._get_nodes_collection(chassis_uuid, instance_uuid,
-                                          associated, maintenance,
-                                          provision_state, marker,
-                                          limit, sort_key, sort_dir,
-                                          resource_url)
+        return self._get_nodes_collection(
+            chassis_uuid, instance_uuid, associated, maintenance,
+            provision_state, marker, limit, sort_key, sort_dir,
+            resource_url, stream=CONF.api.stream_collections)
 
     @expose.expose(wtypes.text, types.uuid_or_name, types.uuid)
     def validate(self, node=None, node_uuid=None):
@@ -1083,6 +1255,9 @@ class NodesController(rest.RestController):
         api_utils.check_allow_specify_fields(fields)
 
         rpc_node = api_utils.get_rpc_node(node_ident)
+        not_modified = api_utils.check_etag([rpc_node], _ETAG_FIELDS)
+        if not_modified:
+            return not_modified
         return Node.convert_with_links(rpc_node, fields=fields)
 
     @expose.expose(Node, body=Node, status_code=http_client.CREATED)
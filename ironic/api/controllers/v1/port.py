@@ -15,11 +15,13 @@
 
 import datetime
 
+from oslo_config import cfg
 from oslo_utils import uuidutils
 import pecan
 from pecan import rest
 from six.moves import http_client
 import wsme
+from wsme.rest import json as wsme_json
 from wsme import types as wtypes
 
 from ironic.api.controllers import base
@@ -33,6 +35,8 @@ from ironic.common.i18n import _
 from ironic import objects
 
 
+CONF = cfg.CONF
+
 _DEFAULT_RETURN_FIELDS = ('uuid', 'address')
 
 
@@ -131,13 +135,21 @@ class Port(base.APIBase):
         return port
 
     @classmethod
-    def convert_with_links(cls, rpc_port, fields=None):
-        port = Port(**rpc_port.as_dict())
+    def convert_with_links(cls, rpc_port, fields=None, node_uuid=None,
+                           url=None):
+        port_dict = rpc_port.as_dict()
+        if node_uuid is not None:
+            # NOTE: the node of the port was looked up by the caller, do
+            # not look it up again when setting node_uuid.
+            port_dict.pop('node_id', None)
+        port = Port(**port_dict)
+        if node_uuid is not None:
+            port._node_uuid = node_uuid
 
         if fields is not None:
             api_utils.check_for_invalid_fields(fields, port.as_dict())
 
-        return cls._convert_with_links(port, pecan.request.host_url,
+        return cls._convert_with_links(port, url or pecan.request.host_url,
                                        fields=fields)
 
     @classmethod
@@ -155,6 +167,22 @@ class Port(base.APIBase):
                                        fields=fields)
 
 
+def _get_node_uuids(rpc_ports):
+    """Look up the UUIDs of the nodes of the ports in a single query.
+
+    :param rpc_ports: a list of :class:`ironic.objects.Port` objects.
+    :returns: a dict mapping the IDs of the nodes of the ports to their
+              UUIDs. The nodes that do not exist any more are missing.
+    """
+    node_ids = set(p.node_id for p in rpc_ports if p.node_id is not None)
+    if not node_ids:
+        return {}
+    nodes = objects.Node.list(pecan.request.context,
+                              filters={'id_in': sorted(node_ids)},
+                              fields=['uuid'])
+    return dict((node.id, node.uuid) for node in nodes)
+
+
 class PortCollection(collection.Collection):
     """API representation of a collection of ports."""
 
@@ -167,11 +195,43 @@ class PortCollection(collection.Collection):
     @staticmethod
     def convert_with_links(rpc_ports, limit, url=None, fields=None, **kwargs):
         collection = PortCollection()
-        collection.ports = [Port.convert_with_links(p, fields=fields)
-                            for p in rpc_ports]
+        node_uuids = _get_node_uuids(rpc_ports)
+        collection.ports = [
+            Port.convert_with_links(p, fields=fields,
+                                    node_uuid=node_uuids.get(p.node_id))
+            for p in rpc_ports]
         collection.next = collection.get_next(limit, url=url, **kwargs)
         return collection
 
+    @staticmethod
+    def stream(rpc_ports, limit, url=None, fields=None, **kwargs):
+        """Return a response streaming the JSON document of a collection.
+
+        The document is the one of the collection returned by
+        :meth:`convert_with_links`, with the ports converted while the
+        response is sent. The nodes of the ports are looked up beforehand.
+        """
+        host_url = pecan.request.host_url
+        node_uuids = _get_node_uuids(rpc_ports)
+        # NOTE: a port whose node is not found was deleted with its node
+        # since the ports were listed, skip it. Looking its node up would
+        # need the request, which is over by the time the port is sent.
+        found_ports = [p for p in rpc_ports
+                       if p.node_id is None or p.node_id in node_uuids]
+
+        def convert(rpc_port):
+            port = Port.convert_with_links(
+                rpc_port, fields=fields,
+                node_uuid=node_uuids.get(rpc_port.node_id), url=host_url)
+            return wsme_json.tojson(Port, port)
+
+        next_href = None
+        if rpc_ports and len(rpc_ports) == limit:
+            next_href = collection.get_next_href(
+                'ports', rpc_ports[-1].uuid, limit, url=url, **kwargs)
+        return api_utils.stream_collection('ports', found_ports, convert,
+                                           next_href=next_href)
+
     @classmethod
     def sample(cls):
         sample = cls()
@@ -194,7 +254,7 @@ class PortsController(rest.RestController):
 
     def _get_ports_collection(self, node_ident, address, marker, limit,
                               sort_key, sort_dir, resource_url=None,
-                              fields=None):
+                              fields=None, stream=False):
         if self.from_nodes and not node_ident:
             raise exception.MissingParameterValue(
                 _("Node identifier not specified."))
@@ -229,6 +289,13 @@ class PortsController(rest.RestController):
                                       marker_obj, sort_key=sort_key,
                                       sort_dir=sort_dir)
 
+        not_modified = api_utils.check_etag(ports)
+        if not_modified:
+            return not_modified
+        if stream:
+            return PortCollection.stream(ports, limit, url=resource_url,
+                                         fields=fields, sort_key=sort_key,
+                                         sort_dir=sort_dir)
         return PortCollection.convert_with_links(ports, limit,
                                                  url=resource_url,
                                                  fields=fields,
@@ -325,7 +392,8 @@ class PortsController(rest.RestController):
         resource_url = '/'.join(['ports', 'detail'])
         return self._get_ports_collection(node_uuid or node, address, marker,
                                           limit, sort_key, sort_dir,
-                                          resource_url)
+                                          resource_url,
+                                          stream=CONF.api.stream_collections)
 
     @expose.expose(Port, types.uuid, types.listtype)
     def get_one(self, port_uuid, fields=None):
@@ -341,6 +409,9 @@ class PortsController(rest.RestController):
         api_utils.check_allow_specify_fields(fields)
 
         rpc_port = objects.Port.get_by_uuid(pecan.request.context, port_uuid)
+        not_modified = api_utils.check_etag([rpc_port])
+        if not_modified:
+            return not_modified
         return Port.convert_with_links(rpc_port, fields=fields)
 
     @expose.expose(Port, body=Port, status_code=http_client.CREATED)
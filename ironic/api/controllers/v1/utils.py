@@ -13,6 +13,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import hashlib
+import json
+
 import jsonpatch
 from oslo_config import cfg
 from oslo_utils import uuidutils
@@ -32,6 +35,8 @@ from ironic import objects
 
 CONF = cfg.CONF
 
+# The fields identifying the state of the objects shown by the API
+ETAG_FIELDS = ('uuid', 'created_at', 'updated_at')
 
 JSONPATCH_EXCEPTIONS = (jsonpatch.JsonPatchException,
                         jsonpatch.JsonPointerException,
@@ -171,6 +176,79 @@ def vendor_passthru(ident, method, topic, data=None, driver_passthru=False):
     return wsme.api.Response(return_value, **response_params)
 
 
+def check_etag(rpc_objects, fields=ETAG_FIELDS):
+    """Set the entity tag of the response, and check If-None-Match.
+
+    The representation of a resource, or of a collection, depends on the
+    request (its URL, the API version requested and whether passwords are
+    shown) and on the state of the objects it is made of, which is
+    identified by the values of some of their fields, the time they were
+    last updated by default. The entity tag is derived from these, so
+    that it can be checked without converting the objects.
+
+    :param rpc_objects: the objects shown in the response, in order.
+    :param fields: the fields identifying the state of the objects. They
+        must be loaded.
+    :returns: a 304 (Not Modified) response if the request has an
+        If-None-Match header matching the entity tag, None otherwise.
+    """
+    request = pecan.request
+    md5 = hashlib.md5()
+    values = [request.host_url, request.path_qs, request.version.minor,
+              request.context.show_password]
+    for rpc_object in rpc_objects:
+        values.extend(getattr(rpc_object, field) for field in fields)
+    for value in values:
+        md5.update(six.text_type(value).encode('utf-8'))
+        md5.update(b'\0')
+    etag = md5.hexdigest()
+
+    pecan.response.headers['ETag'] = '"%s"' % etag
+    if etag in request.if_none_match:
+        return wsme.api.Response(None, status_code=http_client.NOT_MODIFIED,
+                                 return_type=None)
+
+
+def stream_collection(resource, items, convert, next_href=None):
+    """Return a response streaming the JSON document of a collection.
+
+    The document is the same as when serializing the collection as a
+    whole, but each item is converted and serialized while the response
+    is sent, so that the client gets the first bytes of the collection
+    before the last items are converted. The request is over by then:
+    the conversion must not use pecan.request.
+
+    :param resource: the name of the collection, eg 'nodes'.
+    :param items: the objects of the collection, in order.
+    :param convert: a function returning the JSON document of an object,
+        as a dict.
+    :param next_href: the URL of the next subset of the collection, if any.
+    :returns: a 200 (OK) response, whose body is sent by the application
+        iterator of pecan.response.
+    """
+    def generate():
+        yield ('{"%s": [' % resource).encode('utf-8')
+        separator = ''
+        # NOTE: the status and the headers are sent already when an item
+        # fails to be converted. The exception is left to the WSGI
+        # server, which closes the connection rather than ending the
+        # incomplete document.
+        for item in items:
+            yield (separator + json.dumps(convert(item))).encode('utf-8')
+            separator = ', '
+        end = ']'
+        if next_href is not None:
+            end += ', "next": %s' % json.dumps(next_href)
+        yield (end + '}').encode('utf-8')
+
+    pecan.response.app_iter = generate()
+    # WSME does not render a response without a return type, the content
+    # type is set for pecan.
+    pecan.override_template(None, 'application/json')
+    return wsme.api.Response(None, status_code=http_client.OK,
+                             return_type=None)
+
+
 def check_for_invalid_fields(fields, object_fields):
     """Check for requested non-existent fields.
 
@@ -231,3 +309,11 @@ def allow_raid_config():
     Version 1.12 of the API allows RAID configuration for the node.
     """
     return pecan.request.version.minor >= versions.MINOR_12_RAID_CONFIG
+
+
+def allow_conductor_stats():
+    """Check if the conductors and their statistics can be retrieved.
+
+    Version 1.13 of the API exposes the conductors and their statistics.
+    """
+    return pecan.request.version.minor >= versions.MINOR_13_CONDUCTOR_STATS
@@ -444,6 +444,11 @@ class NodeNotLocked(Invalid):
     message = _("Node %(node)s found not to be locked on release")
 
 
+class NodeNotEligible(InvalidState):
+    message = _("Node %(node)s does not match the constraints required "
+                "to acquire it.")
+
+
 class NoFreeConductorWorker(TemporaryFailure):
     message = _('Requested action cannot be performed due to lack of free '
                 'conductor workers.')
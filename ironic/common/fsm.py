@@ -109,3 +109,123 @@ class FSM(machines.FiniteMachine):
         super(FSM, self).initialize(start_state=start_state)
         current_state = self._current.name
         self._target_state = self._states[current_state]['target']
+
+    def compile(self):
+        """Compile the states and transitions of this state machine.
+
+        :returns: a :class:`FSMTable`. Later changes to this state machine
+                  are not reflected in it.
+        """
+        return FSMTable(self._states, self._transitions)
+
+
+class _CompiledState(object):
+    """A state of a :class:`FSMTable`, with the transitions leaving it."""
+
+    __slots__ = ('name', 'terminal', 'target', 'on_enter', 'on_exit',
+                 'transitions')
+
+    def __init__(self, name, data):
+        self.name = name
+        self.terminal = data['terminal']
+        self.target = data['target']
+        self.on_enter = data['on_enter']
+        self.on_exit = data['on_exit']
+        self.transitions = {}
+
+
+class FSMTable(object):
+    """The immutable states and transitions of a state machine.
+
+    Copying a whole :class:`FSM` to track the state of a single node is
+    costly. A table is compiled once with :meth:`FSM.compile` and shared:
+    each user walks through it with its own :class:`FSMCursor`, which only
+    holds the current and target states.
+    """
+
+    def __init__(self, states, transitions):
+        self._states = dict((name, _CompiledState(name, data))
+                            for name, data in six.iteritems(states))
+        for start, jumps in six.iteritems(transitions):
+            for event, jump in six.iteritems(jumps):
+                self._states[start].transitions[event] = (
+                    self._states[jump.name])
+
+    @property
+    def states(self):
+        """The names of the states."""
+        return list(self._states)
+
+    def cursor(self):
+        """Return a new, uninitialized, :class:`FSMCursor` on this table."""
+        return FSMCursor(self)
+
+
+class FSMCursor(object):
+    """The current state of a walk through a :class:`FSMTable`.
+
+    Offers the same methods as :class:`FSM` to process events.
+    """
+
+    __slots__ = ('_table', '_current', '_target_state')
+
+    def __init__(self, table):
+        self._table = table
+        self._current = None
+        self._target_state = None
+
+    @property
+    def current_state(self):
+        if self._current is not None:
+            return self._current.name
+
+    @property
+    def target_state(self):
+        return self._target_state
+
+    @_translate_excp
+    def initialize(self, start_state):
+        state = self._table._states.get(start_state)
+        if state is None:
+            raise automaton_exceptions.NotFound(
+                "Can not start from a undefined state '%s'" % start_state)
+        if state.terminal:
+            raise automaton_exceptions.InvalidState(
+                "Can not start from a terminal state '%s'" % start_state)
+        self._current = state
+        self._target_state = state.target
+
+    def is_actionable_event(self, event):
+        """Check whether the event is allowed in the current state."""
+        current = self._current
+        if current is None or current.terminal:
+            return False
+        return event in current.transitions
+
+    @_translate_excp
+    def process_event(self, event):
+        current = self._current
+        if current is None:
+            raise automaton_exceptions.NotInitialized(
+                "Can not process event '%s'; the state machine hasn't been "
+                "initialized" % event)
+        if current.terminal:
+            raise automaton_exceptions.InvalidState(
+                "Can not transition from terminal state '%s' on event '%s'"
+                % (current.name, event))
+        replacement = current.transitions.get(event)
+        if replacement is None:
+            raise automaton_exceptions.NotFound(
+                "Can not transition from state '%s' on event '%s' (no "
+                "defined transition)" % (current.name, event))
+        if current.on_exit is not None:
+            current.on_exit(current.name, event)
+        if replacement.on_enter is not None:
+            replacement.on_enter(replacement.name, event)
+        self._current = replacement
+        # Clear the target state if we've reached it, and set the target
+        # of the new state, if any
+        if self._target_state == replacement.name:
+            self._target_state = None
+        if replacement.target is not None:
+            self._target_state = replacement.target
@@ -14,7 +14,9 @@
 #    under the License.
 
 import bisect
+import collections
 import hashlib
+import math
 import threading
 
 from oslo_config import cfg
@@ -47,11 +49,93 @@ hash_opts = [
                       'conductor services to prepare deployment environments '
                       'and potentially allow the Ironic cluster to recover '
                       'more quickly if a conductor instance is terminated.')),
+    cfg.IntOpt('hash_ring_cache_size',
+               default=10000,
+               help=_('Maximum number of lookups cached by each hash ring '
+                      '(there is one ring per driver). The cache is dropped '
+                      'when the rings are rebuilt. Set to 0 to disable the '
+                      'cache.')),
+    cfg.BoolOpt('hash_ring_weighted',
+                default=False,
+                help=_('[Experimental Feature] '
+                       'Map nodes onto conductors in proportion to the size '
+                       'of their worker pools (the workers_pool_size option '
+                       'of each conductor), and cap the share of each '
+                       'conductor, see hash_ring_load_factor. This must be '
+                       'set to the same value on all the API and conductor '
+                       'services.')),
+    cfg.FloatOpt('hash_ring_load_factor',
+                 default=0.25,
+                 help=_('When hash_ring_weighted is enabled, no conductor is '
+                        'mapped onto more than (1 + hash_ring_load_factor) '
+                        'times its share of the hash partitions. Lower values '
+                        'balance the load more evenly, but move more nodes '
+                        'when conductors join or leave. This must be set to '
+                        'the same value on all the API and conductor '
+                        'services.')),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(hash_opts)
 
+# Number of leading bits of the hash of a key that are kept by hash_key().
+HASH_KEY_BITS = 32
+_HASH_BITS = 128
+
+
+def _hash(data):
+    if six.PY3 and data is not None:
+        data = data.encode('utf-8')
+    return int(hashlib.md5(data).hexdigest(), 16)
+
+
+def hash_key(data):
+    """Get the short hash of the data, used to look it up in the ring.
+
+    This is the hash used by :meth:`HashRing.get_hosts` to map the data
+    onto the ring, truncated to :data:`HASH_KEY_BITS` bits so that it can
+    be stored in an indexed database column.
+
+    :param data: A string identifier to be mapped across the ring.
+    :returns: an integer in the range [0, 2 ** HASH_KEY_BITS).
+    """
+    try:
+        return _hash(data) >> (_HASH_BITS - HASH_KEY_BITS)
+    except TypeError:
+        raise exception.Invalid(
+            _("Invalid data supplied to HashRing.get_hosts."))
+
+
+class _LRUCache(object):
+    """A bounded, thread-safe, least recently used cache."""
+
+    def __init__(self, size):
+        self._size = size
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._items.pop(key)
+            except KeyError:
+                return None
+            # re-insert to mark the item as the most recently used
+            self._items[key] = value
+            return value
+
+    def set(self, key, value):
+        if self._size <= 0:
+            return
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            if len(self._items) > self._size:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
 
 class HashRing(object):
     """A stable hash ring.
@@ -66,13 +150,21 @@ class HashRing(object):
       just one other host assigned to it.
     """
 
-    def __init__(self, hosts, replicas=None):
+    def __init__(self, hosts, replicas=None, weights=None, load_factor=None):
         """Create a new hash ring across the specified hosts.
 
         :param hosts: an iterable of hosts which will be mapped.
         :param replicas: number of hosts to map to each hash partition,
                          or len(hosts), which ever is lesser.
                          Default: CONF.hash_distribution_replicas
+        :param weights: a dict mapping hosts to positive weights. Each host
+                        is given a number of partitions proportional to its
+                        weight, hosts without a weight are given the average
+                        weight. Default: None, all the hosts are given
+                        2^hash_partition_exponent partitions.
+        :param load_factor: when not None, no host is mapped onto more than
+                            (1 + load_factor) times its weighted share of the
+                            ring, see :meth:`_bound_loads`. Default: None.
 
         """
         if replicas is None:
@@ -85,17 +177,96 @@ class HashRing(object):
             raise exception.Invalid(
                 _("Invalid hosts supplied when building HashRing."))
 
+        self.weights = weights
+        host_weights = self._get_host_weights(weights)
         self._host_hashes = {}
         for host in hosts:
             key = str(host).encode('utf8')
             key_hash = hashlib.md5(key)
-            for p in range(2 ** CONF.hash_partition_exponent):
+            for p in range(self._get_host_partitions(host_weights[host])):
                 key_hash.update(key)
                 hashed_key = self._hash2int(key_hash)
                 self._host_hashes[hashed_key] = host
         # Gather the (possibly colliding) resulting hashes into a bisectable
         # list.
         self._partitions = sorted(self._host_hashes.keys())
+        if load_factor is not None and self._partitions:
+            self._bound_loads(host_weights, load_factor)
+        # NOTE: a ring never changes once built, so lookups can be cached
+        # for its lifetime. Rebuilding the rings drops the cache.
+        self._cache = _LRUCache(CONF.hash_ring_cache_size)
+
+    def _get_host_weights(self, weights):
+        """Get the weight of every host, relative to the average weight.
+
+        :param weights: a dict mapping hosts to positive weights, or None.
+        :returns: a dict mapping every host of the ring to its weight
+                  divided by the average weight.
+        """
+        weights = dict((host, weight)
+                       for host, weight in (weights or {}).items()
+                       if host in self.hosts)
+        try:
+            if any(weight <= 0 for weight in weights.values()):
+                raise TypeError()
+            average = (float(sum(weights.values())) / len(weights)
+                       if weights else 1.0)
+        except TypeError:
+            raise exception.Invalid(
+                _("Invalid weights supplied when building HashRing."))
+        return dict((host, weights.get(host, average) / average)
+                    for host in self.hosts)
+
+    def _get_host_partitions(self, weight):
+        """Get the number of partitions of a host of the given weight."""
+        return max(1, int(round(2 ** CONF.hash_partition_exponent * weight)))
+
+    def _bound_loads(self, host_weights, load_factor):
+        """Remap the ring onto equal partitions with bounded loads.
+
+        Splits the hash space into 2^hash_partition_exponent equal partitions
+        per host. Each partition is mapped onto the host that the ring built
+        so far maps it onto, unless this host already has its share of
+        partitions; then onto the first host found walking the ring from
+        there which is still under its share. The share of a host is
+        (1 + load_factor) times the number of partitions its weight entitles
+        it to, rounded up.
+
+        :param host_weights: a dict mapping every host to its relative weight.
+        :param load_factor: a positive number.
+        """
+        try:
+            load_factor = float(load_factor)
+            if load_factor < 0:
+                raise ValueError()
+        except (TypeError, ValueError):
+            raise exception.Invalid(
+                _("Invalid load factor supplied when building HashRing."))
+
+        count = 2 ** CONF.hash_partition_exponent * len(self.hosts)
+        step = 2 ** _HASH_BITS // count
+        total = sum(host_weights.values())
+        # NOTE: the shares add up to at least count, so every partition
+        # finds a host.
+        shares = dict((host, math.ceil((1 + load_factor) * count *
+                                       weight / total))
+                      for host, weight in host_weights.items())
+        loads = collections.defaultdict(int)
+        host_hashes = {}
+        for index in range(count):
+            # Partition N covers the hashes from divider N-1 (included) to
+            # divider N (excluded), look up the last of them.
+            divider = index * step
+            partition = bisect.bisect(self._partitions, divider - 1)
+            partition %= len(self._partitions)
+            host = self._get_host(partition)
+            while loads[host] >= shares[host]:
+                partition = (partition + 1) % len(self._partitions)
+                host = self._get_host(partition)
+            loads[host] += 1
+            host_hashes[divider] = host
+        self._host_hashes = host_hashes
+        self._partitions = sorted(host_hashes)
 
     def _hash2int(self, key_hash):
         """Convert the given hash's digest to a numerical value for the ring.
@@ -106,10 +277,7 @@ class HashRing(object):
 
     def _get_partition(self, data):
         try:
-            if six.PY3 and data is not None:
-                data = data.encode('utf-8')
-            key_hash = hashlib.md5(data)
-            hashed_key = self._hash2int(key_hash)
+            hashed_key = _hash(data)
             position = bisect.bisect(self._partitions, hashed_key)
             return position if position < len(self._partitions) else 0
         except TypeError:
@@ -129,13 +297,68 @@ class HashRing(object):
                   this `HashRing` was created with. It may be less than this
                   if ignore_hosts is not None.
         """
-        hosts = []
+        ignore_hosts = self._get_ignore_hosts(ignore_hosts)
+        cache_key = (data, ignore_hosts)
+        try:
+            hosts = self._cache.get(cache_key)
+        except TypeError:
+            raise exception.Invalid(
+                _("Invalid data supplied to HashRing.get_hosts."))
+        if hosts is None:
+            partition = self._get_partition(data)
+            hosts = self._get_partition_hosts(partition, ignore_hosts)
+            self._cache.set(cache_key, hosts)
+        return list(hosts)
+
+    def get_hosts_batch(self, data_list, ignore_hosts=None):
+        """Get the lists of hosts which several pieces of data map onto.
+
+        Equivalent to calling :meth:`get_hosts` for each piece of data, but
+        hashes the data first and then walks the partitions once in
+        order, instead of searching the partition of each piece of data.
+
+        :param data_list: A list of string identifiers to be mapped across
+                          the ring.
+        :param ignore_hosts: A list of hosts to skip when performing the hash.
+                             Default: None.
+        :returns: a list of lists of hosts, in the order of data_list.
+        """
+        ignore_hosts = self._get_ignore_hosts(ignore_hosts)
+        try:
+            hashed = sorted((_hash(data), index)
+                            for index, data in enumerate(data_list))
+        except TypeError:
+            raise exception.Invalid(
+                _("Invalid data supplied to HashRing.get_hosts."))
+
+        results = [None] * len(hashed)
+        partitions_count = len(self._partitions)
+        position = 0
+        for hashed_key, index in hashed:
+            # same result as bisect.bisect(), as the keys are sorted
+            while (position < partitions_count and
+                   self._partitions[position] <= hashed_key):
+                position += 1
+            partition = position if position < partitions_count else 0
+            hosts = self._get_partition_hosts(partition, ignore_hosts)
+            self._cache.set((data_list[index], ignore_hosts), hosts)
+            results[index] = list(hosts)
+        return results
+
+    def _get_ignore_hosts(self, ignore_hosts):
+        """Get the hosts of the ring to skip, as a hashable set."""
         if ignore_hosts is None:
-            ignore_hosts = set()
-        else:
-            ignore_hosts = set(ignore_hosts)
-            ignore_hosts.intersection_update(self.hosts)
-        partition = self._get_partition(data)
+            return frozenset()
+        return frozenset(ignore_hosts).intersection(self.hosts)
+
+    def _get_partition_hosts(self, partition, ignore_hosts):
+        """Get the list of hosts which a partition maps onto.
+
+        :param partition: The index of the partition in the partition map.
+        :param ignore_hosts: A set of hosts of the ring to skip.
+        :returns: a list of hosts.
+        """
+        hosts = []
         for replica in range(0, self.replicas):
             if len(hosts) + len(ignore_hosts) == len(self.hosts):
                 # prevent infinite loop - cannot allocate more fallbacks.
@@ -159,9 +382,47 @@ class HashRing(object):
         """
         return self._host_hashes[self._partitions[partition]]
 
+    def get_hash_key_ranges(self, host):
+        """Get the ranges of hash keys which map onto a host.
+
+        The data whose :func:`hash_key` is in one of these ranges is a
+        superset of the data that :meth:`get_hosts` maps onto the host:
+        as hash keys are truncated, the data whose hash key is at a
+        boundary of a range may map onto another host.
+
+        :param host: A host of the ring.
+        :returns: a sorted list of non-overlapping (first, last) tuples of
+                  inclusive bounds of hash keys. Empty if the host is not
+                  part of the ring.
+        """
+        shift = _HASH_BITS - HASH_KEY_BITS
+        last_key = 2 ** HASH_KEY_BITS - 1
+        ranges = []
+        for partition in range(len(self._partitions)):
+            if host not in self._get_partition_hosts(partition, set()):
+                continue
+            # Partition N covers the hashes from divider N-1 (included)
+            # to divider N (excluded), the first partition also covers
+            # the hashes past the last divider.
+            end = self._partitions[partition] >> shift
+            if partition == 0:
+                ranges.append((0, end))
+                ranges.append((self._partitions[-1] >> shift, last_key))
+            else:
+                ranges.append((self._partitions[partition - 1] >> shift, end))
+
+        merged = []
+        for first, last in sorted(ranges):
+            if merged and first <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(last, merged[-1][1]))
+            else:
+                merged.append((first, last))
+        return merged
+
 
 class HashRingManager(object):
     _hash_rings = None
+    _generation = 0
     _lock = threading.Lock()
 
     def __init__(self):
@@ -179,18 +440,71 @@ class HashRingManager(object):
                 self.__class__._hash_rings = rings
             return self._hash_rings
 
-    def _load_hash_rings(self):
+    @property
+    def generation(self):
+        """Counter incremented every time the hash rings may have changed.
+
+        Callers caching anything derived from the rings can compare the
+        generation read before computing it with the current one to tell
+        whether it is stale.
+        """
+        return self._generation
+
+    def _load_hash_rings(self, current_rings=None):
+        """Build the hash rings from the active conductors.
+
+        :param current_rings: a dict of rings to reuse for the drivers
+                              whose set of conductors has not changed.
+        :returns: a dict mapping driver names to HashRing objects.
+        """
+        current_rings = current_rings or {}
         rings = {}
         d2c = self.dbapi.get_active_driver_dict()
+        weights = None
+        load_factor = None
+        if CONF.hash_ring_weighted:
+            weights = self.dbapi.get_active_conductor_weights()
+            load_factor = CONF.hash_ring_load_factor
 
         for driver_name, hosts in d2c.items():
-            rings[driver_name] = HashRing(hosts)
+            host_weights = None
+            if weights is not None:
+                host_weights = dict((host, weights[host]) for host in hosts
+                                    if host in weights)
+            ring = current_rings.get(driver_name)
+            if (ring is None or ring.hosts != set(hosts) or
+                    ring.weights != host_weights):
+                ring = HashRing(hosts, weights=host_weights,
+                                load_factor=load_factor)
+            rings[driver_name] = ring
         return rings
 
+    def refresh(self):
+        """Rebuild the hash rings whose conductors have changed.
+
+        Unlike reset(), this keeps the rings (and the lookups they cached)
+        of the drivers whose set of active conductors did not change.
+
+        :returns: True if any ring was added, rebuilt or removed.
+        """
+        cls = self.__class__
+        with self._lock:
+            current_rings = self._hash_rings
+            rings = self._load_hash_rings(current_rings)
+            changed = (current_rings is None or
+                       set(rings) != set(current_rings) or
+                       any(ring is not current_rings[driver_name]
+                           for driver_name, ring in rings.items()))
+            if changed:
+                cls._hash_rings = rings
+                cls._generation += 1
+            return changed
+
     @classmethod
     def reset(cls):
         with cls._lock:
             cls._hash_rings = None
+            cls._generation += 1
 
     def __getitem__(self, driver_name):
         try:
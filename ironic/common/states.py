@@ -335,3 +335,8 @@ machine.add_transition(VERIFYING, MANAGEABLE, 'done')
 
 # Verification can fail with setting last_error and rolling back to ENROLL
 machine.add_transition(VERIFYING, ENROLL, 'fail')
+
+# The states and transitions shared by all the tasks. Each task keeps track
+# of the state of its node with a cursor on this table, rather than with its
+# own copy of the machine.
+machine_table = machine.compile()
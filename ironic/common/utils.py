@@ -18,10 +18,12 @@
 
 """Utilities and helper functions."""
 
+import collections
 import contextlib
 import datetime
 import errno
 import hashlib
+import json
 import os
 import random
 import re
@@ -33,6 +35,7 @@ from oslo_concurrency import processutils
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_utils import excutils
+from oslo_utils import strutils
 from oslo_utils import timeutils
 import paramiko
 import pytz
@@ -658,6 +661,42 @@ def get_updated_capabilities(current_capabilities, new_capabilities):
                     for key, value in six.iteritems(cap_dict))
 
 
+# The keys holding secrets end with one of these, eg ipmi_password. These
+# are the keys masked by oslo_utils.strutils.mask_password().
+_SECRET_KEYS = ('password', 'adminPass', 'admin_pass', 'new_pass',
+                'auth_token', 'secret_uuid', 'sys_pswd')
+
+
+def mask_secrets(value, secret='******'):
+    """Return a copy of a JSON document with its secrets masked.
+
+    The values of the keys holding secrets, like the ipmi_password of
+    the driver_info of a node, are replaced with the secret, in the
+    nested dicts and lists too. The secrets in the other strings, like
+    "password=..." in a command line, are masked with
+    oslo_utils.strutils.mask_password().
+
+    :param value: a JSON document, like the driver_info of a node.
+    :param secret: the value to replace the secrets with.
+    :returns: a copy of the document, with its secrets masked.
+    """
+    if isinstance(value, dict):
+        return dict((k, secret if _is_secret(k, v)
+                     else mask_secrets(v, secret))
+                    for k, v in value.items())
+    if isinstance(value, list):
+        return [mask_secrets(v, secret) for v in value]
+    if (isinstance(value, six.string_types) and
+            any(key in value for key in _SECRET_KEYS)):
+        return strutils.mask_password(value, secret)
+    return value
+
+
+def _is_secret(key, value):
+    return (isinstance(key, six.string_types) and key.endswith(_SECRET_KEYS)
+            and value is not None and not isinstance(value, (dict, list)))
+
+
 def is_regex_string_in_file(path, string):
     with open(path, 'r') as inf:
         return any(re.search(string, line) for line in inf.readlines())
@@ -671,3 +710,59 @@ def unix_file_modification_datetime(file_name):
             os.path.getmtime(file_name), tz=pytz.utc
         )
     )
+
+
+class LazyJsonDict(collections.MutableMapping):
+    """A dict which is decoded from its JSON encoding on first access.
+
+    Reading a large JSON document from the database is expensive, so it is
+    only decoded when its content is used. A document which was not decoded
+    is saved back with its original encoding.
+    """
+
+    def __init__(self, encoded):
+        self._encoded = encoded
+        self._value = None
+        self._decoded = False
+
+    def decode(self):
+        """Return the decoded dict, or exactly what else was encoded."""
+        if not self._decoded:
+            self._value = json.loads(self._encoded)
+            self._decoded = True
+        return self._value
+
+    def is_decoded(self):
+        return self._decoded
+
+    def encode(self):
+        """Return the JSON encoding of the dict."""
+        if not self._decoded:
+            return self._encoded
+        return json.dumps(self._value)
+
+    def __getitem__(self, key):
+        return self.decode()[key]
+
+    def __setitem__(self, key, value):
+        self.decode()[key] = value
+
+    def __delitem__(self, key):
+        del self.decode()[key]
+
+    def __iter__(self):
+        return iter(self.decode())
+
+    def __len__(self):
+        return len(self.decode())
+
+    def __eq__(self, other):
+        if isinstance(other, LazyJsonDict):
+            other = other.decode()
+        return self.decode() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(self.decode())
@@ -0,0 +1,277 @@
+# coding=utf-8
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Waiting for the locks on the nodes.
+
+A task which cannot lock a node because another task of this conductor
+holds the lock does not need to poll the database: it registers with
+:class:`LockWaiters` before trying to lock the node, and is woken up as
+soon as the other task releases it. Locks held by other conductors are
+retried after a jittered exponential backoff, see :func:`get_backoff`.
+
+The time taken to lock the nodes and the time the locks are held are
+aggregated per purpose of the tasks, see :func:`get_lock_stats`.
+"""
+
+import bisect
+import collections
+import contextlib
+import random
+import threading
+
+from oslo_utils import strutils
+
+# NOTE: the wait statistics are only kept for this many nodes, the nodes
+# which waited least recently are dropped first.
+_MAX_NODES_STATS = 1000
+
+# Upper bounds of the buckets of the histograms, in seconds
+_HISTOGRAM_BUCKETS = (0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 600, 1800)
+
+
+def _get_key(node_id):
+    if strutils.is_int_like(node_id):
+        return int(node_id)
+    return node_id
+
+
+class LockWaiters(object):
+    """The tasks waiting for the locks held by this conductor.
+
+    The waiters are shared by all the instances of this class in a process.
+    """
+
+    # Node ID or UUID -> [event, number of waiters]
+    _entries = {}
+    _lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def watch(self, node_id):
+        """Watch for the release of the lock on a node.
+
+        The lock should be requested within this context, so that a
+        release happening between a failed attempt and waiting for the
+        release is not missed.
+
+        :param node_id: the ID or UUID of the node.
+        :returns: a context manager yielding a threading.Event, set when
+                  this conductor releases the lock on the node.
+        """
+        key = _get_key(node_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = [threading.Event(), 0]
+            entry[1] += 1
+        try:
+            yield entry[0]
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1] and self._entries.get(key) is entry:
+                    del self._entries[key]
+
+    def notify(self, *node_ids):
+        """Wake up the tasks waiting for the lock on a node.
+
+        :param node_ids: the ID and/or the UUID of the node.
+        """
+        with self._lock:
+            for node_id in node_ids:
+                entry = self._entries.pop(_get_key(node_id), None)
+                if entry is not None:
+                    entry[0].set()
+
+
+def get_backoff(attempt, attempts, budget):
+    """Return the time to wait before retrying to lock a node.
+
+    The delays double at each attempt, and all of them add up to the
+    budget at most. Each delay is randomized, so that the tasks waiting for
+    the same lock do not retry at the same time.
+
+    :param attempt: the number of failed attempts, from 1.
+    :param attempts: the maximum number of attempts.
+    :param budget: the maximum total time to wait, in seconds.
+    :returns: the delay in seconds.
+    """
+    if attempts < 2:
+        return 0
+    delay = float(budget) * 2 ** (attempt - 1) / (2 ** (attempts - 1) - 1)
+    return delay * random.uniform(0.5, 1.0)
+
+
+_stats = collections.OrderedDict()
+_stats_lock = threading.Lock()
+
+
+def record_wait(node_id, wait_time, acquired):
+    """Record the time a task waited for the lock on a node.
+
+    :param node_id: the ID or UUID of the node.
+    :param wait_time: the time waited, in seconds.
+    :param acquired: whether the lock was eventually acquired.
+    """
+    key = _get_key(node_id)
+    with _stats_lock:
+        stats = _stats.pop(key, None)
+        if stats is None:
+            stats = {'waits': 0, 'failures': 0, 'wait_time': 0.0,
+                     'max_wait_time': 0.0}
+            if len(_stats) >= _MAX_NODES_STATS:
+                _stats.popitem(last=False)
+        _stats[key] = stats
+        stats['waits'] += 1
+        if not acquired:
+            stats['failures'] += 1
+        stats['wait_time'] += wait_time
+        stats['max_wait_time'] = max(stats['max_wait_time'], wait_time)
+
+
+def get_wait_stats():
+    """Return the statistics of the waits for the locks on the nodes.
+
+    :returns: a dict mapping the ID or UUID of the nodes whose lock was
+              waited for to a dict with the number of 'waits', the number
+              of them which did not get the lock ('failures'), and the total
+              and maximum time waited in seconds ('wait_time' and
+              'max_wait_time').
+    """
+    with _stats_lock:
+        return dict((key, dict(stats)) for key, stats in _stats.items())
+
+
+def reset_wait_stats():
+    """Drop the statistics of the waits for the locks on the nodes."""
+    with _stats_lock:
+        _stats.clear()
+
+
+class Histogram(object):
+    """The distribution of durations, in fixed buckets."""
+
+    def __init__(self, buckets=_HISTOGRAM_BUCKETS):
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        """Add a duration to the histogram.
+
+        :param value: the duration, in seconds.
+        """
+        self._counts[bisect.bisect_left(self._buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def as_dict(self):
+        """Return the histogram as a dict.
+
+        :returns: a dict with the 'count', 'sum' and 'max' of the durations
+                  and the 'buckets', a list of dicts with the upper bound
+                  of the bucket in seconds ('le', None for the last one)
+                  and the number of durations in it ('count').
+        """
+        bounds = list(self._buckets) + [None]
+        return {'count': self.count,
+                'sum': self.sum,
+                'max': self.max,
+                'buckets': [{'le': le, 'count': count}
+                            for le, count in zip(bounds, self._counts)]}
+
+
+class _PurposeStats(object):
+
+    def __init__(self):
+        self.acquired = 0
+        self.failed = 0
+        self.upgrades = 0
+        self.acquire_time = Histogram()
+        self.hold_time = Histogram()
+
+    def as_dict(self):
+        return {'acquired': self.acquired,
+                'failed': self.failed,
+                'upgrades': self.upgrades,
+                'acquire_time': self.acquire_time.as_dict(),
+                'hold_time': self.hold_time.as_dict()}
+
+
+_lock_stats = collections.defaultdict(_PurposeStats)
+
+
+def record_acquired(purpose, acquire_time):
+    """Record that a task locked a node.
+
+    :param purpose: the purpose of the task.
+    :param acquire_time: the time taken to lock the node, in seconds.
+    """
+    with _stats_lock:
+        stats = _lock_stats[purpose]
+        stats.acquired += 1
+        stats.acquire_time.add(acquire_time)
+
+
+def record_failed(purpose):
+    """Record that a task could not lock a node, as it was locked.
+
+    :param purpose: the purpose of the task.
+    """
+    with _stats_lock:
+        _lock_stats[purpose].failed += 1
+
+
+def record_upgrade(purpose):
+    """Record that a task upgraded its shared lock to an exclusive lock.
+
+    :param purpose: the purpose of the task.
+    """
+    with _stats_lock:
+        _lock_stats[purpose].upgrades += 1
+
+
+def record_released(purpose, hold_time):
+    """Record that a task released the lock on a node.
+
+    :param purpose: the purpose of the task.
+    :param hold_time: the time the lock was held, in seconds.
+    """
+    with _stats_lock:
+        _lock_stats[purpose].hold_time.add(hold_time)
+
+
+def get_lock_stats():
+    """Return the statistics of the locks on the nodes, per purpose.
+
+    :returns: a dict mapping the purposes of the tasks to a dict with the
+              number of exclusive locks 'acquired', the number of tasks
+              which 'failed' to lock a node as it was locked, the number of
+              shared locks upgraded to exclusive locks ('upgrades'), and the
+              histograms of the time taken to acquire the locks
+              ('acquire_time') and of the time they were held ('hold_time'),
+              see :meth:`Histogram.as_dict`.
+    """
+    with _stats_lock:
+        return dict((purpose, stats.as_dict())
+                    for purpose, stats in _lock_stats.items())
+
+
+def reset_lock_stats():
+    """Drop the statistics of the locks on the nodes."""
+    with _stats_lock:
+        _lock_stats.clear()
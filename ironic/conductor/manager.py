@@ -44,12 +44,13 @@ a change, etc.
 import collections
 import datetime
 import inspect
+import itertools
 import tempfile
 import threading
+import time
 
 import eventlet
 from eventlet import greenpool
-from oslo_concurrency import lockutils
 from oslo_config import cfg
 from oslo_context import context as ironic_context
 from oslo_db import exception as db_exception
@@ -57,6 +58,7 @@ from oslo_log import log
 import oslo_messaging as messaging
 from oslo_service import periodic_task
 from oslo_utils import excutils
+from oslo_utils import timeutils
 from oslo_utils import uuidutils
 
 from ironic.common import dhcp_factory
@@ -73,13 +75,15 @@ from ironic.common import images
 from ironic.common import rpc
 from ironic.common import states
 from ironic.common import swift
+from ironic.conductor import locks
 from ironic.conductor import task_manager
+from ironic.conductor import timeouts
 from ironic.conductor import utils
+from ironic.conductor import workers
 from ironic.db import api as dbapi
 from ironic import objects
 
 MANAGER_TOPIC = 'ironic.conductor_manager'
-WORKER_SPAWN_lOCK = "conductor_worker_spawn"
 
 LOG = log.getLogger(__name__)
 
@@ -104,6 +108,17 @@ conductor_opts = [
                default=60,
                help=_('Interval between checks of provision timeouts, '
                       'in seconds.')),
+    cfg.IntOpt('provision_timeout_reconcile_interval',
+               default=600,
+               help=_('The conductor tracks in memory when the nodes '
+                      'waiting in the "deploy wait", "clean wait" and '
+                      '"inspecting" states time out, and fails them within '
+                      'a second. It only checks the database for nodes '
+                      'which timed out when it starts, when the conductors '
+                      'mapped to the nodes change, and at this interval, '
+                      'in seconds. Set to 0 to disable the tracking and '
+                      'check the database every '
+                      'check_provision_state_interval seconds instead.')),
     cfg.IntOpt('deploy_callback_timeout',
                default=1800,
                help=_('Timeout (seconds) to wait for a callback from '
@@ -128,12 +143,65 @@ conductor_opts = [
     cfg.IntOpt('workers_pool_size',
                default=100,
                help=_('The size of the workers greenthread pool.')),
+    cfg.IntOpt('workers_pool_reserved_api',
+               default=10,
+               min=0,
+               help=_('The number of workers reserved for the work '
+                      'requested through the API, such as deployments and '
+                      'power actions. The work resuming after a callback '
+                      'from a ramdisk and the work started by periodic '
+                      'tasks cannot use these workers.')),
+    cfg.IntOpt('workers_pool_reserved_callback',
+               default=10,
+               min=0,
+               help=_('The number of workers reserved for the work '
+                      'requested through the API or resuming after a '
+                      'callback from a ramdisk. The work started by '
+                      'periodic tasks, such as taking over nodes or '
+                      'failing the nodes which timed out, cannot use these '
+                      'workers.')),
+    cfg.IntOpt('workers_pool_queue_size',
+               default=10,
+               min=0,
+               help=_('The maximum number of pieces of work waiting for a '
+                      'free worker. The work of the highest priority '
+                      'starts first. When the queue is full, new work is '
+                      'rejected. Set to 0 to reject the work as soon as no '
+                      'worker can run it.')),
+    cfg.IntOpt('sync_power_state_workers',
+               default=8,
+               min=1,
+               help=_('The maximum number of greenthreads the power state '
+                      'sync periodic task uses to query nodes\' BMCs '
+                      'concurrently. These greenthreads are not taken from '
+                      'the workers pool. Set to 1 to sync nodes one at a '
+                      'time.')),
+    cfg.IntOpt('sync_power_state_batch_size',
+               default=100,
+               min=1,
+               help=_('The maximum number of nodes whose power state is '
+                      'queried with a single call, for drivers that can get '
+                      'the power states of several nodes at once.')),
+    cfg.IntOpt('periodic_nodes_batch_size',
+               default=1000,
+               min=1,
+               help=_('The number of nodes loaded from the database at '
+                      'once by the periodic tasks. The periodic tasks work '
+                      'on the nodes of a batch before loading the next '
+                      'one.')),
     cfg.IntOpt('node_locked_retry_attempts',
                default=3,
-               help=_('Number of attempts to grab a node lock.')),
+               help=_('Number of attempts to grab a node lock held by '
+                      'another conductor. A lock held by this conductor is '
+                      'grabbed as soon as it is released.')),
     cfg.IntOpt('node_locked_retry_interval',
                default=1,
-               help=_('Seconds to sleep between node lock attempts.')),
+               help=_('Average number of seconds to wait between node lock '
+                      'attempts. The waits for a lock held by another '
+                      'conductor grow exponentially and are randomized; a '
+                      'lock held by this conductor is waited for at most '
+                      '(node_locked_retry_attempts - 1) * '
+                      'node_locked_retry_interval seconds.')),
     cfg.BoolOpt('send_sensor_data',
                 default=False,
                 help=_('Enable sending sensor data message via the '
@@ -147,6 +215,16 @@ conductor_opts = [
                 help=_('List of comma separated meter types which need to be'
                        ' sent to Ceilometer. The default value, "ALL", is a '
                        'special value meaning send all the sensor data.')),
+    cfg.BoolOpt('send_worker_pool_stats',
+                default=False,
+                help=_('Enable sending the statistics of the workers pool, '
+                       'such as the number of waiting workers and the time '
+                       'spent waiting and running by each task, via the '
+                       'notification bus.')),
+    cfg.IntOpt('send_worker_pool_stats_interval',
+               default=60,
+               help=_('Seconds between conductor sending the statistics of '
+                      'the workers pool via the notification bus.')),
     cfg.IntOpt('sync_local_state_interval',
                default=180,
                help=_('When conductors join or leave the cluster, existing '
@@ -204,13 +282,27 @@ CLEANING_INTERFACE_PRIORITY = {
     'deploy': 1
 }
 SYNC_EXCLUDED_STATES = (states.DEPLOYWAIT, states.CLEANWAIT, states.ENROLL)
+# NOTE(deva): we should not acquire a lock on a node in
+#             DEPLOYWAIT/CLEANWAIT, as this could cause
+#             an error within a deploy ramdisk POSTing back
+#             at the same time.
+# NOTE(dtantsur): it's also pointless (and dangerous) to
+# sync power state when a power action is in progress
+SYNC_POWER_STATE_FILTERS = {'maintenance': False,
+                            'provision_state_not_in': SYNC_EXCLUDED_STATES,
+                            'target_power_state': None}
+
+# The provision states which time out, see
+# ConductorManager._get_provision_timeout()
+PROVISION_TIMEOUT_STATES = (states.DEPLOYWAIT, states.CLEANWAIT,
+                            states.INSPECTING)
 
 
 class ConductorManager(periodic_task.PeriodicTasks):
     """Ironic Conductor manager main class."""
 
     # NOTE(rloo): This must be in sync with rpcapi.ConductorAPI's.
-    RPC_API_VERSION = '1.30'
+    RPC_API_VERSION = '1.31'
 
     target = messaging.Target(version=RPC_API_VERSION)
 
@@ -222,6 +314,10 @@ class ConductorManager(periodic_task.PeriodicTasks):
         self.topic = topic
         self.power_state_sync_count = collections.defaultdict(int)
         self.notifier = rpc.get_notifier()
+        self._provision_timeouts = None
+        self._provision_timeouts_checked = {}
+        self._hash_key_ranges = None
+        self._hash_key_ranges_generation = None
 
     def _get_driver(self, driver_name):
         """Get the driver.
@@ -243,9 +339,16 @@ class ConductorManager(periodic_task.PeriodicTasks):
         self._keepalive_evt = threading.Event()
         """Event for the keepalive thread."""
 
-        self._worker_pool = greenpool.GreenPool(
-            size=CONF.conductor.workers_pool_size)
-        """GreenPool of background workers for performing tasks async."""
+        self._timeouts_evt = threading.Event()
+        """Event for the provision timeouts thread."""
+
+        self._worker_pool = workers.WorkerPool(
+            CONF.conductor.workers_pool_size,
+            reserved={workers.API: CONF.conductor.workers_pool_reserved_api,
+                      workers.CALLBACK:
+                          CONF.conductor.workers_pool_reserved_callback},
+            queue_size=CONF.conductor.workers_pool_queue_size)
+        """Pool of background workers for performing tasks async."""
 
         self.ring_manager = hash.HashRingManager()
         """Consistent hash ring which maps drivers to conductors."""
@@ -279,19 +382,29 @@ class ConductorManager(periodic_task.PeriodicTasks):
         self.dbapi.clear_node_reservations_for_conductor(self.host)
         try:
             # Register this conductor with the cluster
-            cdr = self.dbapi.register_conductor({'hostname': self.host,
-                                                 'drivers': self.drivers})
+            cdr = self.dbapi.register_conductor(
+                {'hostname': self.host,
+                 'drivers': self.drivers,
+                 'weight': CONF.conductor.workers_pool_size})
         except exception.ConductorAlreadyRegistered:
             # This conductor was already registered and did not shut down
             # properly, so log a warning and update the record.
             LOG.warn(_LW("A conductor with hostname %(hostname)s "
                          "was previously registered. Updating registration"),
                      {'hostname': self.host})
-            cdr = self.dbapi.register_conductor({'hostname': self.host,
-                                                 'drivers': self.drivers},
-                                                update_existing=True)
+            cdr = self.dbapi.register_conductor(
+                {'hostname': self.host,
+                 'drivers': self.drivers,
+                 'weight': CONF.conductor.workers_pool_size},
+                update_existing=True)
         self.conductor = cdr
 
+        if CONF.conductor.provision_timeout_reconcile_interval:
+            self._provision_timeouts = timeouts.ProvisionTimeouts()
+            self._provision_timeouts.configure(
+                dict((state, self._get_provision_timeout(state)[0])
+                     for state in PROVISION_TIMEOUT_STATES))
+
         # NOTE(lucasagomes): If the conductor server dies abruptly
         # mid deployment (OMM Killer, power outage, etc...) we
         # can not resume the deployment even if the conductor
@@ -319,6 +432,12 @@ class ConductorManager(periodic_task.PeriodicTasks):
                 LOG.critical(_LC('Failed to start keepalive'))
                 self.del_host()
 
+        # Spawn a dedicated greenthread for the provision timeouts. NOTE:
+        # it runs as long as the conductor, it is not taken from the
+        # workers pool.
+        if self._provision_timeouts is not None:
+            eventlet.spawn(self._provision_timeouts_loop)
+
     def _collect_periodic_tasks(self, obj):
         for n, method in inspect.getmembers(obj, inspect.ismethod):
             if getattr(method, '_periodic_enabled', False):
@@ -326,6 +445,7 @@ class ConductorManager(periodic_task.PeriodicTasks):
 
     def del_host(self, deregister=True):
         self._keepalive_evt.set()
+        self._timeouts_evt.set()
         if deregister:
             try:
                 # Inform the cluster that this conductor is shutting down.
@@ -350,22 +470,35 @@ class ConductorManager(periodic_task.PeriodicTasks):
         """Periodic tasks are run at pre-specified interval."""
         return self.run_periodic_tasks(context, raise_on_error=raise_on_error)
 
-    @lockutils.synchronized(WORKER_SPAWN_lOCK, 'ironic-')
     def _spawn_worker(self, func, *args, **kwargs):
 
         """Create a greenthread to run func(*args, **kwargs).
 
-        Spawns a greenthread if there are free slots in pool, otherwise raises
-        exception. Execution control returns immediately to the caller.
+        Spawns a greenthread running the work with the priority of the
+        work requested through the API, waiting for a free worker if
+        needed. Execution control returns immediately to the caller.
 
         :returns: GreenThread object.
         :raises: NoFreeConductorWorker if worker pool is currently full.
 
         """
-        if self._worker_pool.free():
-            return self._worker_pool.spawn(func, *args, **kwargs)
-        else:
-            raise exception.NoFreeConductorWorker()
+        return self._worker_pool.spawn(workers.API, func, *args, **kwargs)
+
+    def _spawn_callback_worker(self, func, *args, **kwargs):
+        """Create a greenthread to run work resuming after a callback.
+
+        Like :meth:`_spawn_worker`, with a lower priority.
+        """
+        return self._worker_pool.spawn(workers.CALLBACK, func,
+                                       *args, **kwargs)
+
+    def _spawn_periodic_worker(self, func, *args, **kwargs):
+        """Create a greenthread to run work started by a periodic task.
+
+        Like :meth:`_spawn_worker`, with the lowest priority.
+        """
+        return self._worker_pool.spawn(workers.PERIODIC, func,
+                                       *args, **kwargs)
 
     def _conductor_service_record_keepalive(self):
         while not self._keepalive_evt.is_set():
@@ -376,6 +509,55 @@ class ConductorManager(periodic_task.PeriodicTasks):
                                 'while heartbeating.'))
             self._keepalive_evt.wait(CONF.conductor.heartbeat_interval)
 
+    def _provision_timeouts_loop(self):
+        """Fail the nodes whose provision timeout expires, as it expires.
+
+        Each expired node is failed by a periodic worker, see
+        :meth:`_handle_expired_node`.
+        """
+        context = ironic_context.get_admin_context()
+        while not self._timeouts_evt.is_set():
+            expired = self._provision_timeouts.pop_expired()
+            for i, (node_uuid, provision_state) in enumerate(expired):
+                try:
+                    self._spawn_periodic_worker(self._handle_expired_node,
+                                                context, node_uuid,
+                                                provision_state)
+                except exception.NoFreeConductorWorker:
+                    # Retry this node and the next ones on the next pass
+                    now = time.time()
+                    for node_uuid, provision_state in expired[i:]:
+                        self._provision_timeouts.schedule(
+                            node_uuid, provision_state, now)
+                    break
+            self._timeouts_evt.wait(1)
+
+    def _handle_expired_node(self, context, node_uuid, provision_state):
+        """Fail a node whose provision timeout expired, handling errors.
+
+        A node locked by another task, or which can not be failed for lack
+        of a free worker, is retried after
+        [conductor]check_provision_state_interval seconds, like the
+        periodic check of the database would.
+
+        :param context: request context.
+        :param node_uuid: the UUID of the node.
+        :param provision_state: the provision state which timed out.
+        """
+        try:
+            self._fail_expired_node(context, node_uuid, provision_state)
+        except (exception.NodeLocked, exception.NoFreeConductorWorker):
+            self._provision_timeouts.schedule(
+                node_uuid, provision_state,
+                time.time() + CONF.conductor.check_provision_state_interval)
+        except (exception.NodeNotFound, exception.NodeNotEligible):
+            # The node left the provision state, or is in maintenance.
+            pass
+        except Exception:
+            LOG.exception(_LE("Unexpected error while failing node "
+                              "%(node)s after a provision timeout."),
+                          {'node': node_uuid})
+
     @messaging.expected_exceptions(exception.InvalidParameterValue,
                                    exception.MissingParameterValue,
                                    exception.NodeLocked)
@@ -491,7 +673,12 @@ class ConductorManager(periodic_task.PeriodicTasks):
         # require an exclusive lock, we need to do so to guarantee that the
         # state doesn't unexpectedly change between doing a vendor.validate
         # and vendor.vendor_passthru.
-        with task_manager.acquire(context, node_id, shared=False,
+        # NOTE: the methods declared with require_exclusive_lock=False,
+        # like the heartbeats of the agents, are called with a shared lock
+        # and upgrade it themselves when they need to.
+        shared = not self._vendor_method_requires_exclusive_lock(
+            context, node_id, driver_method)
+        with task_manager.acquire(context, node_id, shared=shared,
                                   purpose='calling vendor passthru') as task:
             if not getattr(task.driver, 'vendor', None):
                 raise exception.UnsupportedDriverExtension(
@@ -513,6 +700,10 @@ class ConductorManager(periodic_task.PeriodicTasks):
                     _('The method %(method)s does not support HTTP %(http)s') %
                     {'method': driver_method, 'http': http_method})
 
+            # NOTE: in case the driver of the node changed in the meantime
+            if vendor_opts.get('require_exclusive_lock', True):
+                task.upgrade_lock()
+
             vendor_iface.validate(task, method=driver_method,
                                   http_method=http_method, **info)
 
@@ -531,6 +722,31 @@ class ConductorManager(periodic_task.PeriodicTasks):
                     'async': is_async,
                     'attach': vendor_opts['attach']}
 
+    @staticmethod
+    def _vendor_method_requires_exclusive_lock(context, node_id,
+                                               driver_method):
+        """Check whether a vendor method needs an exclusive lock.
+
+        The node is read without being locked, to find its driver.
+
+        :param context: an admin context.
+        :param node_id: the id or uuid of a node.
+        :param driver_method: the name of the vendor method.
+        :returns: False if the vendor method of the driver of the node is
+                  declared with require_exclusive_lock=False, True otherwise,
+                  including when the node, its driver or the method is not
+                  found. vendor_passthru() raises the errors once the node
+                  is locked.
+        """
+        try:
+            node = objects.Node.get(context, node_id)
+            vendor_iface = driver_factory.get_driver(node.driver).vendor
+            vendor_opts = vendor_iface.vendor_routes[driver_method]
+        except (exception.NodeNotFound, exception.DriverNotFound,
+                AttributeError, KeyError):
+            return True
+        return vendor_opts.get('require_exclusive_lock', True)
+
     @messaging.expected_exceptions(exception.NoFreeConductorWorker,
                                    exception.InvalidParameterValue,
                                    exception.MissingParameterValue,
@@ -871,7 +1087,7 @@ class ConductorManager(periodic_task.PeriodicTasks):
                 task.process_event('resume')
 
             task.spawn_after(
-                self._spawn_worker,
+                self._spawn_callback_worker,
                 self._do_next_clean_step,
                 task,
                 task.node.driver_internal_info.get('clean_steps', []),
@@ -1109,6 +1325,11 @@ class ConductorManager(periodic_task.PeriodicTasks):
         2) Node is not in maintenance mode.
         3) Node is not in DEPLOYWAIT/CLEANWAIT provision state.
         4) Node doesn't have a reservation
+        5) Node doesn't have a power action in progress
+
+        Up to [conductor]sync_power_state_workers nodes are synced
+        concurrently. The duration of the cycle and the number of nodes
+        synced, skipped and failed are logged when it completes.
 
         NOTE: Grabbing a lock here can cause other methods to fail to
         grab it. We want to avoid trying to grab a lock while a node
@@ -1117,54 +1338,197 @@ class ConductorManager(periodic_task.PeriodicTasks):
         can do here to avoid failing a brand new deploy to a node that
         we've locked here, though.
         """
-        # FIXME(comstud): Since our initial state checks are outside
-        # of the lock (to try to avoid the lock), some checks are
-        # repeated after grabbing the lock so we can unlock quickly.
+        # NOTE: the state checks are done both when listing the nodes and,
+        # to avoid racing with state changes, by the query acquiring each
+        # node, so that ineligible nodes are skipped without being locked.
         # The node mapping is not re-checked because it doesn't much
         # matter if things happened to re-balance.
-        #
-        # This is inefficient and racey. We end up with calling DB API's
-        # get_node() twice (once here, and once in acquire(). Ideally we
-        # add a way to pass constraints to task_manager.acquire()
-        # (through to its DB API call) so that we can eliminate our call
-        # and first set of checks below.
-
-        filters = {'reserved': False, 'maintenance': False}
+        filters = dict(SYNC_POWER_STATE_FILTERS, reserved=False)
         node_iter = self.iter_nodes(fields=['id'], filters=filters)
+
+        # NOTE: querying a BMC is mostly waiting on the network, so fan out
+        # over a dedicated pool of greenthreads instead of walking the nodes
+        # one at a time. The pool is separate from the workers pool so that
+        # a slow sync cycle can not starve user requests of workers.
+        stats = collections.Counter()
+        timer = timeutils.StopWatch()
+        timer.start()
+        pool = greenpool.GreenPool(
+            size=CONF.conductor.sync_power_state_workers)
+        batch_size = CONF.conductor.sync_power_state_batch_size
+        batches = collections.defaultdict(list)
         for (node_uuid, driver, node_id) in node_iter:
+            if not self._supports_get_power_states(driver):
+                pool.spawn_n(self._sync_power_state_for_node, context,
+                             node_uuid, stats)
+                continue
+
+            batch = batches[driver]
+            batch.append(node_uuid)
+            if len(batch) >= batch_size:
+                pool.spawn_n(self._sync_power_states_for_nodes, context,
+                             batch, stats)
+                batches[driver] = []
+        for batch in batches.values():
+            if batch:
+                pool.spawn_n(self._sync_power_states_for_nodes, context,
+                             batch, stats)
+        pool.waitall()
+
+        elapsed = timer.elapsed()
+        LOG.info(_LI("Power state sync of %(total)d node(s) took %(time).2f "
+                     "seconds: %(synced)d synced, %(skipped)d skipped, "
+                     "%(failed)d failed."),
+                 {'total': sum(stats.values()), 'time': elapsed,
+                  'synced': stats['synced'], 'skipped': stats['skipped'],
+                  'failed': stats['failed']})
+        if elapsed > CONF.conductor.sync_power_state_interval:
+            LOG.warning(_LW("Power state sync took %(time).2f seconds, which "
+                            "is longer than the sync interval of "
+                            "%(interval)d seconds. Consider increasing "
+                            "[conductor]sync_power_state_workers."),
+                        {'time': elapsed,
+                         'interval': CONF.conductor.sync_power_state_interval})
+
+    @staticmethod
+    def _supports_get_power_states(driver_name):
+        """Check whether a driver can get the power of many nodes at once.
+
+        :param driver_name: the name of the driver.
+        :returns: True if the power interface of the driver overrides
+                  PowerInterface.get_power_states(), False otherwise
+                  or if the driver is not loaded.
+        """
+        try:
+            driver = driver_factory.get_driver(driver_name)
+        except exception.DriverNotFound:
+            return False
+        return driver.power.supports_get_power_states
+
+    def _sync_power_state_for_node(self, context, node_uuid, stats):
+        """Sync the power state of a single node.
+
+        Run by the greenthreads spawned by :meth:`_sync_power_states`.
+
+        :param context: request context.
+        :param node_uuid: the UUID of the node to sync.
+        :param stats: a collections.Counter which is updated with the
+                      outcome of the sync: 'synced', 'skipped' or 'failed'.
+        """
+        try:
+            # NOTE(dtantsur): start with a shared lock, upgrade if needed
+            with task_manager.acquire(
+                    context, node_uuid, purpose='power state sync',
+                    shared=True, filters=SYNC_POWER_STATE_FILTERS) as task:
+                self._do_sync_power_state(task, stats)
+        except Exception as e:
+            self._handle_power_state_sync_error(node_uuid, e, stats)
+        finally:
+            # Yield on every iteration
+            eventlet.sleep(0)
+
+    def _sync_power_states_for_nodes(self, context, node_uuids, stats):
+        """Sync the power states of several nodes using the same driver.
+
+        Locks all the nodes at once, gets all their power states with a
+        single call to the driver's PowerInterface.get_power_states() and
+        then syncs the nodes one by one. Run by the greenthreads spawned by
+        :meth:`_sync_power_states`.
+
+        :param context: request context.
+        :param node_uuids: the UUIDs of the nodes to sync.
+        :param stats: a collections.Counter which is updated with the
+                      outcome of the sync: 'synced', 'skipped' or 'failed'.
+        """
+        # NOTE: the nodes are reserved by a single query instead of being
+        # locked one by one. The lock is exclusive, so it is not upgraded
+        # when the power state of a node has to be fixed. The nodes which
+        # are locked by another task or no longer eligible are skipped.
+        tasks = []
+        try:
             try:
-                # NOTE(dtantsur): start with a shared lock, upgrade if needed
-                with task_manager.acquire(context, node_uuid,
-                                          purpose='power state sync',
-                                          shared=True) as task:
-                    # NOTE(deva): we should not acquire a lock on a node in
-                    #             DEPLOYWAIT/CLEANWAIT, as this could cause
-                    #             an error within a deploy ramdisk POSTing back
-                    #             at the same time.
-                    # NOTE(dtantsur): it's also pointless (and dangerous) to
-                    # sync power state when a power action is in progress
-                    if (task.node.provision_state in SYNC_EXCLUDED_STATES or
-                            task.node.maintenance or
-                            task.node.target_power_state):
-                        continue
-                    count = do_sync_power_state(
-                        task, self.power_state_sync_count[node_uuid])
-                    if count:
-                        self.power_state_sync_count[node_uuid] = count
-                    else:
-                        # don't bloat the dict with non-failing nodes
-                        del self.power_state_sync_count[node_uuid]
-            except exception.NodeNotFound:
-                LOG.info(_LI("During sync_power_state, node %(node)s was not "
-                             "found and presumed deleted by another process."),
-                         {'node': node_uuid})
-            except exception.NodeLocked:
-                LOG.info(_LI("During sync_power_state, node %(node)s was "
-                             "already locked by another process. Skip."),
-                         {'node': node_uuid})
-            finally:
-                # Yield on every iteration
-                eventlet.sleep(0)
+                tasks = task_manager.acquire_many(
+                    context, node_uuids, purpose='power state sync',
+                    filters=SYNC_POWER_STATE_FILTERS)
+            except Exception:
+                LOG.exception(_LE("Failed to lock the nodes %s for a power "
+                                  "state sync."), ', '.join(node_uuids))
+                stats['failed'] += len(node_uuids)
+                return
+            stats['skipped'] += len(node_uuids) - len(tasks)
+
+            if not tasks:
+                return
+
+            try:
+                power_states = tasks[0].driver.power.get_power_states(tasks)
+            except Exception as e:
+                power_states = dict((task.node.uuid, e) for task in tasks)
+
+            for task in tasks:
+                node_uuid = task.node.uuid
+                try:
+                    self._do_sync_power_state(task, stats,
+                                              power_states.get(node_uuid))
+                except Exception as e:
+                    self._handle_power_state_sync_error(node_uuid, e, stats)
+                finally:
+                    eventlet.sleep(0)
+        finally:
+            for task in tasks:
+                task.release_resources()
+
+    def _do_sync_power_state(self, task, stats, power_state=None):
+        """Sync the power state of the task's node and record the outcome.
+
+        :param task: a TaskManager instance with a lock on the node.
+        :param stats: a collections.Counter which is updated with the
+                      outcome of the sync: 'synced' or 'failed'.
+        :param power_state: the power state of the node if it is already
+                            known, see :func:`do_sync_power_state`.
+        """
+        node_uuid = task.node.uuid
+        count = do_sync_power_state(
+            task, self.power_state_sync_count[node_uuid],
+            power_state=power_state)
+        if count:
+            self.power_state_sync_count[node_uuid] = count
+            stats['failed'] += 1
+        else:
+            # don't bloat the dict with non-failing nodes
+            del self.power_state_sync_count[node_uuid]
+            stats['synced'] += 1
+
+    @staticmethod
+    def _handle_power_state_sync_error(node_uuid, e, stats):
+        """Log an error raised while syncing the power state of a node.
+
+        :param node_uuid: the UUID of the node being synced.
+        :param e: the exception raised.
+        :param stats: a collections.Counter which is updated with the
+                      outcome of the sync: 'skipped' or 'failed'.
+        """
+        if isinstance(e, exception.NodeNotFound):
+            LOG.info(_LI("During sync_power_state, node %(node)s was not "
+                         "found and presumed deleted by another process."),
+                     {'node': node_uuid})
+            stats['skipped'] += 1
+        elif isinstance(e, exception.NodeLocked):
+            LOG.info(_LI("During sync_power_state, node %(node)s was "
+                         "already locked by another process. Skip."),
+                     {'node': node_uuid})
+            stats['skipped'] += 1
+        elif isinstance(e, exception.NodeNotEligible):
+            LOG.debug("During sync_power_state, node %(node)s changed "
+                      "state and no longer needs a sync. Skip.",
+                      {'node': node_uuid})
+            stats['skipped'] += 1
+        else:
+            # NOTE: do not let one misbehaving node abort the sync of the
+            # nodes handled by the other greenthreads.
+            LOG.exception(_LE("Unexpected error during sync_power_state "
+                              "for node %(node)s."), {'node': node_uuid})
+            stats['failed'] += 1
 
     @periodic_task.periodic_task(
         spacing=CONF.conductor.check_provision_state_interval)
@@ -1175,19 +1539,7 @@ class ConductorManager(periodic_task.PeriodicTasks):
 
         :param context: request context.
         """
-        callback_timeout = CONF.conductor.deploy_callback_timeout
-        if not callback_timeout:
-            return
-
-        filters = {'reserved': False,
-                   'provision_state': states.DEPLOYWAIT,
-                   'maintenance': False,
-                   'provisioned_before': callback_timeout}
-        sort_key = 'provision_updated_at'
-        callback_method = utils.cleanup_after_timeout
-        err_handler = provisioning_error_handler
-        self._fail_if_in_state(context, filters, states.DEPLOYWAIT,
-                               sort_key, callback_method, err_handler)
+        self._check_provision_timeouts(context, states.DEPLOYWAIT)
 
     @periodic_task.periodic_task(
         spacing=CONF.conductor.check_provision_state_interval)
@@ -1269,20 +1621,7 @@ class ConductorManager(periodic_task.PeriodicTasks):
 
         :param context: request context.
         """
-        callback_timeout = CONF.conductor.clean_callback_timeout
-        if not callback_timeout:
-            return
-
-        filters = {'reserved': False,
-                   'provision_state': states.CLEANWAIT,
-                   'maintenance': False,
-                   'provisioned_before': callback_timeout}
-        last_error = _("Timeout reached while cleaning the node. Please "
-                       "check if the ramdisk responsible for the cleaning is "
-                       "running on the node.")
-        self._fail_if_in_state(context, filters, states.CLEANWAIT,
-                               'provision_updated_at',
-                               last_error=last_error)
+        self._check_provision_timeouts(context, states.CLEANWAIT)
 
     @periodic_task.periodic_task(
         spacing=CONF.conductor.sync_local_state_interval)
@@ -1295,7 +1634,7 @@ class ConductorManager(periodic_task.PeriodicTasks):
         The ensuing actions could include preparing a PXE environment,
         updating the DHCP server, and so on.
         """
-        self.ring_manager.reset()
+        self.ring_manager.refresh()
         filters = {'reserved': False,
                    'maintenance': False,
                    'provision_state': states.ACTIVE}
@@ -1309,22 +1648,22 @@ class ConductorManager(periodic_task.PeriodicTasks):
 
             # Node is mapped here, but not updated by this conductor last
             try:
-                with task_manager.acquire(context, node_uuid,
-                                          purpose='node take over') as task:
-                    # NOTE(deva): now that we have the lock, check again to
-                    # avoid racing with deletes and other state changes
-                    node = task.node
-                    if (node.maintenance or
-                            node.conductor_affinity == self.conductor.id or
-                            node.provision_state != states.ACTIVE):
+                # NOTE(deva): check the state again when locking to
+                # avoid racing with deletes and other state changes
+                with task_manager.acquire(
+                        context, node_uuid, purpose='node take over',
+                        filters={'maintenance': False,
+                                 'provision_state': states.ACTIVE}) as task:
+                    if task.node.conductor_affinity == self.conductor.id:
                         continue
 
-                    task.spawn_after(self._spawn_worker,
+                    task.spawn_after(self._spawn_periodic_worker,
                                      self._do_takeover, task)
 
             except exception.NoFreeConductorWorker:
                 break
-            except (exception.NodeLocked, exception.NodeNotFound):
+            except (exception.NodeLocked, exception.NodeNotFound,
+                    exception.NodeNotEligible):
                 continue
             workers_count += 1
             if workers_count == CONF.conductor.periodic_max_workers:
@@ -1345,26 +1684,82 @@ class ConductorManager(periodic_task.PeriodicTasks):
 
         return self.host in ring.get_hosts(node_uuid)
 
+    def _map_nodes(self, node_list):
+        """Map nodes onto the hash rings of their drivers in one pass.
+
+        This caches the lookups done by :meth:`_mapped_to_this_conductor`,
+        which is cheaper than looking up the nodes one at a time.
+
+        :param node_list: a list of tuples (node_uuid, driver, ...).
+        """
+        uuids_by_driver = collections.defaultdict(list)
+        for result in node_list:
+            uuids_by_driver[result[1]].append(result[0])
+        for driver_name, uuids in uuids_by_driver.items():
+            ring = self.ring_manager.ring.get(driver_name)
+            # NOTE: do not evict the lookups of the first nodes while
+            # caching the lookups of the last ones.
+            if ring is not None and len(uuids) <= CONF.hash_ring_cache_size:
+                ring.get_hosts_batch(uuids)
+
+    def _get_hash_key_ranges(self):
+        """Get the ranges of node hash keys mapped to this conductor.
+
+        :returns: a dict mapping the name of each driver to the ranges of
+                  hash keys that its hash ring maps onto this conductor,
+                  see HashRing.get_hash_key_ranges(). Drivers whose ring
+                  maps nothing onto this conductor are left out. The
+                  result is cached until the rings change.
+        """
+        generation = self.ring_manager.generation
+        if generation == self._hash_key_ranges_generation:
+            return self._hash_key_ranges
+
+        ranges = {}
+        for driver_name, ring in self.ring_manager.ring.items():
+            driver_ranges = ring.get_hash_key_ranges(self.host)
+            if driver_ranges:
+                ranges[driver_name] = driver_ranges
+        self._hash_key_ranges = ranges
+        self._hash_key_ranges_generation = generation
+        return ranges
+
     def iter_nodes(self, fields=None, **kwargs):
         """Iterate over nodes mapped to this conductor.
 
-        Requests node set from and filters out nodes that are not
-        mapped to this conductor.
+        Requests from the database the node set whose hash keys fall into
+        the ranges mapped to this conductor, and filters out nodes that are
+        not mapped to this conductor (as the ranges are slightly larger
+        than the partitions of the hash ring).
 
         Yields tuples (node_uuid, driver, ...) where ... is derived from
         fields argument, e.g.: fields=None means yielding ('uuid', 'driver'),
         fields=['foo'] means yielding ('uuid', 'driver', 'foo').
 
+        The nodes are loaded from the database in batches, and the nodes
+        of a batch are yielded before the next batch is loaded.
+
         :param fields: list of fields to fetch in addition to uuid and driver
         :param kwargs: additional arguments to pass to dbapi when looking for
-                       nodes
+                       nodes, see iter_nodeinfo()
         :return: generator yielding tuples of requested fields
         """
         columns = ['uuid', 'driver'] + list(fields or ())
-        node_list = self.dbapi.get_nodeinfo_list(columns=columns, **kwargs)
-        for result in node_list:
-            if self._mapped_to_this_conductor(*result[:2]):
-                yield result
+        filters = dict(kwargs.pop('filters', None) or {},
+                       hash_key_ranges=self._get_hash_key_ranges())
+        batch_size = CONF.conductor.periodic_nodes_batch_size
+        node_iter = iter(self.dbapi.iter_nodeinfo(columns=columns,
+                                                  filters=filters,
+                                                  batch_size=batch_size,
+                                                  **kwargs))
+        while True:
+            node_list = list(itertools.islice(node_iter, batch_size))
+            if not node_list:
+                return
+            self._map_nodes(node_list)
+            for result in node_list:
+                if self._mapped_to_this_conductor(*result[:2]):
+                    yield result
 
     @messaging.expected_exceptions(exception.NodeLocked)
     def validate_driver_interfaces(self, context, node_id):
@@ -1730,6 +2125,21 @@ class ConductorManager(periodic_task.PeriodicTasks):
         return dict((sensor_type, sensor_value) for (sensor_type, sensor_value)
                     in sensors_data.items() if sensor_type.lower() in allowed)
 
+    @periodic_task.periodic_task(
+        spacing=CONF.conductor.send_worker_pool_stats_interval)
+    def _send_worker_pool_stats(self, context):
+        """Periodically sends the statistics of the workers pool."""
+        # do nothing if send_worker_pool_stats option is False
+        if not CONF.conductor.send_worker_pool_stats:
+            return
+
+        message = {'message_id': uuidutils.generate_uuid(),
+                   'host': self.host,
+                   'timestamp': datetime.datetime.utcnow(),
+                   'event_type': 'conductor.workers.metrics.update',
+                   'payload': self._worker_pool.get_stats()}
+        self.notifier.info(context, 'conductor.workers.metrics', message)
+
     @messaging.expected_exceptions(exception.NodeLocked,
                                    exception.UnsupportedDriverExtension,
                                    exception.InvalidParameterValue,
@@ -1898,17 +2308,146 @@ class ConductorManager(periodic_task.PeriodicTasks):
         :param: context: request context
 
         """
-        callback_timeout = CONF.conductor.inspect_timeout
-        if not callback_timeout:
-            return
+        self._check_provision_timeouts(context, states.INSPECTING)
 
+    def _get_provision_timeout(self, provision_state):
+        """Get how the nodes timing out in a provision state are failed.
+
+        :param provision_state: one of PROVISION_TIMEOUT_STATES.
+        :returns: a tuple (timeout, filters, sort_key, fail_kwargs) of the
+                  timeout in seconds (0 if disabled), the filters selecting
+                  the nodes which timed out, the field holding the time at
+                  which the nodes entered the state, and the keyword
+                  arguments to pass to :meth:`_fail_if_in_state`.
+        """
+        if provision_state == states.DEPLOYWAIT:
+            timeout = CONF.conductor.deploy_callback_timeout
+            filters = {'reserved': False,
+                       'provision_state': states.DEPLOYWAIT,
+                       'maintenance': False,
+                       'provisioned_before': timeout}
+            fail_kwargs = {'callback_method': utils.cleanup_after_timeout,
+                           'err_handler': provisioning_error_handler}
+            return timeout, filters, 'provision_updated_at', fail_kwargs
+
+        if provision_state == states.CLEANWAIT:
+            timeout = CONF.conductor.clean_callback_timeout
+            filters = {'reserved': False,
+                       'provision_state': states.CLEANWAIT,
+                       'maintenance': False,
+                       'provisioned_before': timeout}
+            last_error = _("Timeout reached while cleaning the node. Please "
+                           "check if the ramdisk responsible for the "
+                           "cleaning is running on the node.")
+            return (timeout, filters, 'provision_updated_at',
+                    {'last_error': last_error})
+
+        timeout = CONF.conductor.inspect_timeout
         filters = {'reserved': False,
                    'provision_state': states.INSPECTING,
-                   'inspection_started_before': callback_timeout}
-        sort_key = 'inspection_started_at'
+                   'inspection_started_before': timeout}
         last_error = _("timeout reached while inspecting the node")
-        self._fail_if_in_state(context, filters, states.INSPECTING,
-                               sort_key, last_error=last_error)
+        return (timeout, filters, 'inspection_started_at',
+                {'last_error': last_error})
+
+    def _check_provision_timeouts(self, context, provision_state):
+        """Fail the nodes which timed out in a provision state.
+
+        When the provision timeouts are tracked in memory, this is only a
+        reconciliation pass: it checks the database when the conductor has
+        just started, when the hash ring changed, or every
+        provision_timeout_reconcile_interval seconds, and then tracks the
+        nodes which have not timed out yet.
+
+        :param context: request context.
+        :param provision_state: one of PROVISION_TIMEOUT_STATES.
+        """
+        timeout, filters, sort_key, fail_kwargs = (
+            self._get_provision_timeout(provision_state))
+        if not timeout:
+            return
+
+        if self._provision_timeouts is not None:
+            now = time.time()
+            generation = self.ring_manager.generation
+            last_check = self._provision_timeouts_checked.get(provision_state)
+            interval = CONF.conductor.provision_timeout_reconcile_interval
+            if (last_check is not None and last_check[1] == generation and
+                    now - last_check[0] < interval):
+                return
+            self._provision_timeouts_checked[provision_state] = (now,
+                                                                 generation)
+
+        self._fail_if_in_state(context, filters, provision_state, sort_key,
+                               **fail_kwargs)
+
+        if self._provision_timeouts is not None:
+            self._track_provision_timeouts(context, provision_state,
+                                           timeout, sort_key)
+
+    def _track_provision_timeouts(self, context, provision_state, timeout,
+                                  sort_key):
+        """Track the deadlines of the nodes in a provision state.
+
+        :param context: request context.
+        :param provision_state: one of PROVISION_TIMEOUT_STATES.
+        :param timeout: the timeout of this state, in seconds.
+        :param sort_key: the field holding the time at which the nodes
+                         entered the state.
+        """
+        filters = {'provision_state': provision_state, 'maintenance': False}
+        node_iter = self.iter_nodes(fields=[sort_key], filters=filters)
+        now = time.time()
+        utcnow = timeutils.utcnow()
+        for node_uuid, driver, started_at in node_iter:
+            self._provision_timeouts.schedule(
+                node_uuid, provision_state,
+                _get_deadline(started_at, timeout, now, utcnow))
+
+    def _fail_expired_node(self, context, node_uuid, provision_state):
+        """Fail a node whose provision timeout expired in memory.
+
+        The database decides whether the node timed out: it may have left
+        the provision state, or re-entered it or been touched (eg by an
+        agent heartbeat) since it was tracked. In the latter case, the
+        deadline of the node is scheduled again. A node mapped to another
+        conductor after a hash ring change is left to that conductor.
+
+        :param context: request context.
+        :param node_uuid: the UUID of the node.
+        :param provision_state: the provision state which timed out.
+        :raises: NodeLocked, NodeNotFound, NodeNotEligible,
+                 NoFreeConductorWorker
+        """
+        timeout, filters, sort_key, fail_kwargs = (
+            self._get_provision_timeout(provision_state))
+        if not timeout:
+            return
+        node = objects.Node.get_by_uuid(
+            context, node_uuid, filters={'provision_state': provision_state,
+                                         'maintenance': False})
+        if not self._mapped_to_this_conductor(node.uuid, node.driver):
+            return
+
+        now = time.time()
+        deadline = _get_deadline(getattr(node, sort_key), timeout, now,
+                                 timeutils.utcnow())
+        if deadline > now:
+            self._provision_timeouts.schedule(node_uuid, provision_state,
+                                              deadline)
+            return
+
+        filters = dict((key, value) for key, value in filters.items()
+                       if key != 'reserved')
+        filters['maintenance'] = False
+        try:
+            self._fail_node(context, node_uuid, filters, **fail_kwargs)
+        except exception.NodeNotEligible:
+            # NOTE: the node was touched since it was loaded, or left the
+            # state; in the latter case, the deadline is dropped when it
+            # expires.
+            self._provision_timeouts.schedule(node_uuid, provision_state,
+                                              now + timeout + 1)
 
     def _fail_if_in_state(self, context, filters, provision_state,
                           sort_key, callback_method=None,
@@ -1946,29 +2485,48 @@ class ConductorManager(periodic_task.PeriodicTasks):
         workers_count = 0
         for node_uuid, driver in node_iter:
             try:
-                with task_manager.acquire(context, node_uuid,
-                                          purpose='node state check') as task:
-                    if (task.node.maintenance or
-                        task.node.provision_state != provision_state):
-                        continue
-
-                    # timeout has been reached - process the event 'fail'
-                    if callback_method:
-                        task.process_event('fail',
-                                           callback=self._spawn_worker,
-                                           call_args=(callback_method, task),
-                                           err_handler=err_handler)
-                    else:
-                        task.node.last_error = last_error
-                        task.process_event('fail')
+                self._fail_node(context, node_uuid,
+                                {'maintenance': False,
+                                 'provision_state': provision_state},
+                                callback_method=callback_method,
+                                err_handler=err_handler,
+                                last_error=last_error)
             except exception.NoFreeConductorWorker:
                 break
-            except (exception.NodeLocked, exception.NodeNotFound):
+            except (exception.NodeLocked, exception.NodeNotFound,
+                    exception.NodeNotEligible):
                 continue
             workers_count += 1
             if workers_count >= CONF.conductor.periodic_max_workers:
                 break
 
+    def _fail_node(self, context, node_uuid, filters, callback_method=None,
+                   err_handler=None, last_error=None):
+        """Fail a node, if it matches the given filters.
+
+        :param: context: request context
+        :param: node_uuid: the UUID of the node.
+        :param: filters: the constraints the node must match, see
+                         :func:`task_manager.acquire`.
+        :param: callback_method: see :meth:`_fail_if_in_state`.
+        :param: err_handler: see :meth:`_fail_if_in_state`.
+        :param: last_error: see :meth:`_fail_if_in_state`.
+        :raises: NodeLocked, NodeNotFound, NodeNotEligible,
+                 NoFreeConductorWorker
+        """
+        with task_manager.acquire(context, node_uuid,
+                                  purpose='node state check',
+                                  filters=filters) as task:
+            # timeout has been reached - process the event 'fail'
+            if callback_method:
+                task.process_event('fail',
+                                   callback=self._spawn_periodic_worker,
+                                   call_args=(callback_method, task),
+                                   err_handler=err_handler)
+            else:
+                task.node.last_error = last_error
+                task.process_event('fail')
+
     @messaging.expected_exceptions(exception.NodeLocked,
                                    exception.UnsupportedDriverExtension,
                                    exception.InvalidParameterValue,
@@ -2029,6 +2587,44 @@ class ConductorManager(periodic_task.PeriodicTasks):
 
         return driver.raid.get_logical_disk_properties()
 
+    def get_conductor_stats(self, context):
+        """Get the statistics of this conductor.
+
+        :param context: request context.
+        :returns: a dictionary with the statistics of the 'workers' pool
+                  (see :meth:`ironic.conductor.workers.WorkerPool.get_stats`),
+                  of the 'tasks' (see
+                  :func:`ironic.conductor.task_manager.get_stats`), of the
+                  'locks' per purpose of the tasks (see
+                  :func:`ironic.conductor.locks.get_lock_stats`) and of the
+                  'lock_waits' per node (see
+                  :func:`ironic.conductor.locks.get_wait_stats`).
+        """
+        LOG.debug("RPC get_conductor_stats called")
+        return {'workers': self._worker_pool.get_stats(),
+                'tasks': task_manager.get_stats(),
+                'locks': locks.get_lock_stats(),
+                'lock_waits': locks.get_wait_stats()}
+
+
+def _get_deadline(started_at, timeout, now, utcnow):
+    """Get the deadline of a node which entered a provision state.
+
+    :param started_at: the time the node entered the state, as stored in
+                       the database, or None.
+    :param timeout: the timeout of the state, in seconds.
+    :param now: the current time, as returned by time.time().
+    :param utcnow: the current time, as returned by timeutils.utcnow().
+    :returns: the deadline, as returned by time.time().
+    """
+    elapsed = 0
+    if started_at is not None:
+        elapsed = timeutils.delta_seconds(
+            timeutils.normalize_time(started_at), utcnow)
+    # NOTE: add a second, as the database stores timestamps without
+    # microseconds.
+    return now - elapsed + timeout + 1
+
 
 def get_vendor_passthru_metadata(route_dict):
     d = {}
@@ -2225,7 +2821,24 @@ def handle_sync_power_state_max_retries_exceeded(task,
     LOG.error(msg)
 
 
-def do_sync_power_state(task, count):
+def _get_power_state(task, power_state=None):
+    """Get the power state of the task's node for a power state sync.
+
+    :param task: a TaskManager instance
+    :param power_state: the power state of the node if it is already known,
+                        or the exception raised while retrieving it.
+    :raises: the exception passed as power_state, or any exception raised by
+             the driver while getting the power state.
+    :returns: the power state of the node.
+    """
+    if power_state is None:
+        return task.driver.power.get_power_state(task)
+    if isinstance(power_state, Exception):
+        raise power_state
+    return power_state
+
+
+def do_sync_power_state(task, count, power_state=None):
     """Sync the power state for this node, incrementing the counter on failure.
 
     When the limit of power_state_sync_max_retries is reached, the node is put
@@ -2233,12 +2846,17 @@ def do_sync_power_state(task, count):
 
     :param task: a TaskManager instance
     :param count: number of times this node has previously failed a sync
+    :param power_state: the power state of the node, if it was already
+                        retrieved, e.g. by PowerInterface.get_power_states();
+                        or the exception raised while retrieving it.
+                        If None, the state is retrieved from the driver.
     :raises: NodeLocked if unable to upgrade task lock to an exclusive one
     :returns: Count of failed attempts.
               On success, the counter is set to 0.
               On failure, the count is incremented by one
     """
     node = task.node
+    known_power_state = power_state
     power_state = None
     count += 1
 
@@ -2255,7 +2873,7 @@ def do_sync_power_state(task, count):
     try:
         # The driver may raise an exception, or may return ERROR.
         # Handle both the same way.
-        power_state = task.driver.power.get_power_state(task)
+        power_state = _get_power_state(task, known_power_state)
         if power_state == states.ERROR:
             raise exception.PowerStateFailure(
                 _("Power driver returned ERROR state "
@@ -75,11 +75,12 @@ class ConductorAPI(object):
     |           driver_vendor_passthru to a dictionary
     |    1.30 - Added set_target_raid_config and
     |           get_raid_logical_disk_properties
+    |    1.31 - Added get_conductor_stats
 
     """
 
     # NOTE(rloo): This must be in sync with manager.ConductorManager's.
-    RPC_API_VERSION = '1.30'
+    RPC_API_VERSION = '1.31'
 
     def __init__(self, topic=None):
         super(ConductorAPI, self).__init__()
@@ -104,7 +105,7 @@ class ConductorAPI(object):
         :raises: NoValidHost
 
         """
-        self.ring_manager.reset()
+        self.ring_manager.refresh()
 
         try:
             ring = self.ring_manager[node.driver]
@@ -589,3 +590,14 @@ class ConductorAPI(object):
         cctxt = self.client.prepare(topic=topic or self.topic, version='1.30')
         return cctxt.call(context, 'get_raid_logical_disk_properties',
                           driver_name=driver_name)
+
+    def get_conductor_stats(self, context, topic=None):
+        """Get the statistics of a conductor.
+
+        :param context: request context.
+        :param topic: RPC topic. Defaults to self.topic.
+        :returns: A dictionary with the statistics of the workers pool, of
+            the tasks and of the locks on the nodes.
+        """
+        cctxt = self.client.prepare(topic=topic or self.topic, version='1.31')
+        return cctxt.call(context, 'get_conductor_stats')
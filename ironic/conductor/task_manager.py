@@ -49,7 +49,8 @@ attributes that you may access:
     task.node
         The Node object
     task.ports
-        Ports belonging to the Node
+        Ports belonging to the Node, loaded from the database the first
+        time they are accessed
     task.driver
         The Driver for the Node, or the Driver based on the
         'driver_name' kwarg of TaskManager().
@@ -94,24 +95,31 @@ raised in the background thread.):
 
 """
 
+import collections
 import functools
+import time
 
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_utils import excutils
 from oslo_utils import timeutils
-import retrying
 
 from ironic.common import driver_factory
 from ironic.common import exception
 from ironic.common.i18n import _LW
 from ironic.common import states
+from ironic.conductor import locks
+from ironic.conductor import timeouts
 from ironic import objects
 
 LOG = logging.getLogger(__name__)
 
 CONF = cfg.CONF
 
+# The number of tasks created, and of those which loaded the ports of their
+# node, see get_stats().
+_stats = collections.defaultdict(int)
+
 
 def require_exclusive_lock(f):
     """Decorator to require an exclusive lock.
@@ -136,8 +144,18 @@ def require_exclusive_lock(f):
     return wrapper
 
 
+def get_stats():
+    """Return statistics about the tasks created by this process.
+
+    :returns: a dict with the number of 'tasks' created, and the number of
+              tasks which loaded the ports of their node, 'ports_loaded'.
+    """
+    return {'tasks': _stats['tasks'],
+            'ports_loaded': _stats['ports_loaded']}
+
+
 def acquire(context, node_id, shared=False, driver_name=None,
-            purpose='unspecified action'):
+            purpose='unspecified action', filters=None):
     """Shortcut for acquiring a lock on a Node.
 
     :param context: Request context.
@@ -146,11 +164,59 @@ def acquire(context, node_id, shared=False, driver_name=None,
                    lock. Default: False.
     :param driver_name: Name of Driver. Default: None.
     :param purpose: human-readable purpose to put to debug logs.
+    :param filters: Filters the node must match to be acquired. Default: None.
     :returns: An instance of :class:`TaskManager`.
 
     """
     return TaskManager(context, node_id, shared=shared,
-                       driver_name=driver_name, purpose=purpose)
+                       driver_name=driver_name, purpose=purpose,
+                       filters=filters)
+
+
+def acquire_many(context, node_ids, purpose='unspecified action',
+                 filters=None):
+    """Acquire exclusive locks on many nodes at once.
+
+    The nodes are reserved together, by a single query where the database
+    allows it. Unlike :func:`acquire`, the lock of a node held by another
+    task is not waited for: the nodes which are not found, already locked
+    or do not match the filters are skipped.
+
+    :param context: Request context.
+    :param node_ids: A list of IDs or UUIDs of the nodes to lock.
+    :param purpose: human-readable purpose to put to debug logs.
+    :param filters: Filters the nodes must match to be acquired.
+                    Default: None.
+    :returns: A list of :class:`TaskManager` instances, one for each node
+              locked, in no particular order. The caller is responsible
+              for releasing the resources of each of them.
+    :raises: DriverNotFound, after releasing all the nodes.
+
+    """
+    timer = timeutils.StopWatch()
+    timer.start()
+    nodes = objects.Node.reserve_many(context, CONF.host, node_ids,
+                                      filters=filters)
+    elapsed = timer.elapsed()
+    LOG.debug("%(count)d of %(total)d node(s) reserved for %(purpose)s "
+              "(took %(time).2f seconds)",
+              {'count': len(nodes), 'total': len(node_ids),
+               'purpose': purpose, 'time': elapsed})
+
+    tasks = []
+    try:
+        for node in nodes:
+            locks.record_acquired(purpose, elapsed)
+            tasks.append(TaskManager(context, node.id, purpose=purpose,
+                                     node=node))
+    except Exception:
+        with excutils.save_and_reraise_exception():
+            # NOTE: the task which failed has released its node already.
+            for task in tasks:
+                task.release_resources()
+            for node in nodes[len(tasks) + 1:]:
+                objects.Node.release(context, CONF.host, node.id)
+    return tasks
 
 
 class TaskManager(object):
@@ -162,7 +228,7 @@ class TaskManager(object):
     """
 
     def __init__(self, context, node_id, shared=False, driver_name=None,
-                 purpose='unspecified action'):
+                 purpose='unspecified action', filters=None, node=None):
         """Create a new TaskManager.
 
         Acquire a lock on a node. The lock can be either shared or
@@ -176,10 +242,22 @@ class TaskManager(object):
                        lock. Default: False.
         :param driver_name: The name of the driver to load, if different
                             from the Node's current driver.
-        :param purpose: human-readable purpose to put to debug logs.
+        :param purpose: human-readable purpose to put to debug logs, and
+                        to aggregate the statistics of the locks by.
+        :param filters: Filters the node must match to be acquired, as
+                        accepted by the DB API's get_nodeinfo_list(). They
+                        are checked by the same query that loads (and
+                        reserves) the node, so that callers do not have to
+                        lock a node only to find out it must be skipped.
+                        They are not checked again by upgrade_lock().
+        :param node: the Node object, if it is already reserved by this
+                     conductor, see :func:`acquire_many`. The lock is
+                     then not taken again, shared must be False and
+                     filters are ignored.
         :raises: DriverNotFound
         :raises: NodeNotFound
         :raises: NodeLocked
+        :raises: NodeNotEligible if the node does not match the filters.
 
         """
 
@@ -189,9 +267,10 @@ class TaskManager(object):
         self.context = context
         self.node = None
         self.node_id = node_id
+        self._ports = None
         self.shared = shared
 
-        self.fsm = states.machine.copy()
+        self.fsm = states.machine_table.cursor()
         self._purpose = purpose
         self._debug_timer = timeutils.StopWatch()
 
@@ -200,12 +279,15 @@ class TaskManager(object):
                       "%(purpose)s)",
                       {'type': 'shared' if shared else 'exclusive',
                        'node': node_id, 'purpose': purpose})
-            if not self.shared:
-                self._lock()
+            if node is not None:
+                self._debug_timer.restart()
+                self.node = node
+            elif not self.shared:
+                self._lock(filters=filters)
             else:
                 self._debug_timer.restart()
-                self.node = objects.Node.get(context, node_id)
-            self.ports = objects.Port.list_by_node_id(context, self.node.id)
+                self.node = objects.Node.get(context, node_id,
+                                             filters=filters)
             self.driver = driver_factory.get_driver(driver_name or
                                                     self.node.driver)
 
@@ -216,31 +298,80 @@ class TaskManager(object):
                 self.node.save()
 
             self.fsm.initialize(self.node.provision_state)
+            _stats['tasks'] += 1
 
         except Exception:
             with excutils.save_and_reraise_exception():
                 self.release_resources()
 
-    def _lock(self):
+    @property
+    def ports(self):
+        """The ports of the node.
+
+        Most tasks do not use the ports, they are only loaded from the
+        database the first time they are accessed.
+        """
+        if self._ports is None and self.node is not None:
+            self._ports = objects.Port.list_by_node_id(self.context,
+                                                       self.node.id)
+            _stats['ports_loaded'] += 1
+        return self._ports
+
+    @ports.setter
+    def ports(self, ports):
+        self._ports = ports
+
+    def _lock(self, filters=None):
         self._debug_timer.restart()
 
         # NodeLocked exceptions can be annoying. Let's try to alleviate
-        # some of that pain by retrying our lock attempts. The retrying
-        # module expects a wait_fixed value in milliseconds.
-        @retrying.retry(
-            retry_on_exception=lambda e: isinstance(e, exception.NodeLocked),
-            stop_max_attempt_number=CONF.conductor.node_locked_retry_attempts,
-            wait_fixed=CONF.conductor.node_locked_retry_interval * 1000)
-        def reserve_node():
-            self.node = objects.Node.reserve(self.context, CONF.host,
-                                             self.node_id)
-            LOG.debug("Node %(node)s successfully reserved for %(purpose)s "
-                      "(took %(time).2f seconds)",
-                      {'node': self.node_id, 'purpose': self._purpose,
-                       'time': self._debug_timer.elapsed()})
-            self._debug_timer.restart()
-
-        reserve_node()
+        # some of that pain by retrying our lock attempts. A lock held by
+        # this conductor is retried as soon as it is released, a lock held
+        # by another conductor after a jittered exponential backoff.
+        attempts = CONF.conductor.node_locked_retry_attempts
+        budget = (max(0, attempts - 1) *
+                  CONF.conductor.node_locked_retry_interval)
+        deadline = time.time() + budget
+        waiters = locks.LockWaiters()
+        failures = 0
+        contended = False
+        while True:
+            with waiters.watch(self.node_id) as released:
+                try:
+                    self.node = objects.Node.reserve(self.context, CONF.host,
+                                                     self.node_id,
+                                                     filters=filters)
+                    break
+                except exception.NodeLocked as e:
+                    contended = True
+                    remaining = deadline - time.time()
+                    local = e.kwargs.get('host') == CONF.host
+                    if local:
+                        give_up = remaining <= 0
+                    else:
+                        failures += 1
+                        give_up = failures >= attempts
+                    if give_up:
+                        locks.record_wait(self.node_id,
+                                          self._debug_timer.elapsed(),
+                                          acquired=False)
+                        locks.record_failed(self._purpose)
+                        raise
+                    if local:
+                        released.wait(remaining)
+                        continue
+            time.sleep(min(max(0, remaining),
+                           locks.get_backoff(failures, attempts, budget)))
+
+        elapsed = self._debug_timer.elapsed()
+        if contended:
+            locks.record_wait(self.node_id, elapsed, acquired=True)
+        locks.record_acquired(self._purpose, elapsed)
+        LOG.debug("Node %(node)s successfully reserved for %(purpose)s "
+                  "(took %(time).2f seconds)",
+                  {'node': self.node_id, 'purpose': self._purpose,
+                   'time': elapsed})
+        self._debug_timer.restart()
 
     def upgrade_lock(self):
         """Upgrade a shared lock to an exclusive lock.
@@ -256,6 +387,7 @@ class TaskManager(object):
                        'time': self._debug_timer.elapsed()})
             self._lock()
             self.shared = False
+            locks.record_upgrade(self._purpose)
 
     def spawn_after(self, _spawn_method, *args, **kwargs):
         """Call this to spawn a thread to complete the task.
@@ -304,6 +436,14 @@ class TaskManager(object):
                 # squelch the exception if the node was deleted
                 # within the task's context.
                 pass
+            if self.node:
+                locks.record_released(self._purpose,
+                                      self._debug_timer.elapsed())
+                # Wake up the tasks of this conductor waiting for the lock,
+                # whichever of the ID, UUID or name they asked for.
+                locks.LockWaiters().notify(
+                    *[i for i in (self.node.id, self.node.uuid,
+                                  self.node.name) if i is not None])
         if self.node:
             LOG.debug("Successfully released %(type)s lock for %(purpose)s "
                       "on node %(node)s (lock was held %(time).2f sec)",
@@ -361,6 +501,8 @@ class TaskManager(object):
 
         # publish the state transition by saving the Node
         self.node.save()
+        timeouts.ProvisionTimeouts().watch(self.node.uuid,
+                                           self.node.provision_state)
 
     def __enter__(self):
         return self
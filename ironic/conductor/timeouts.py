@@ -0,0 +1,143 @@
+# coding=utf-8
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+In-memory schedule of the provision timeouts of the nodes.
+
+Some provision states, such as DEPLOYWAIT, time out: a node which stays
+in such a state for too long is failed by the conductor. Rather than
+scanning the database for these nodes, the conductor tracks the deadlines
+of the nodes entering these states in a heap, and only looks at the
+earliest deadlines.
+
+The :class:`TaskManager` registers every provision state change with
+:meth:`ProvisionTimeouts.watch`. Nothing is tracked until the conductor
+sets the timeouts with :meth:`ProvisionTimeouts.configure`.
+"""
+
+import heapq
+import threading
+import time
+
+# NOTE: when more than this many cancelled deadlines are left in the heap,
+# the heap is rebuilt without them.
+_MAX_CANCELLED = 1000
+
+
+class ProvisionTimeouts(object):
+    """The deadlines of the nodes in the provision states which time out.
+
+    The deadlines are shared by all the instances of this class in a
+    process. Each node has at most one deadline: scheduling a node again
+    replaces its previous deadline.
+    """
+
+    _timeouts = {}
+    _heap = []
+    _entries = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, timeouts):
+        """Set the provision states which time out, dropping all deadlines.
+
+        :param timeouts: a dict mapping provision states to their timeout,
+                         in seconds. The states whose timeout is 0 or None
+                         do not time out.
+        """
+        with cls._lock:
+            cls._timeouts = dict((state, timeout)
+                                 for state, timeout in timeouts.items()
+                                 if timeout)
+            cls._heap = []
+            cls._entries = {}
+
+    @classmethod
+    def reset(cls):
+        """Stop tracking deadlines."""
+        cls.configure({})
+
+    def watch(self, node_uuid, provision_state):
+        """Register that a node has just entered a provision state.
+
+        Schedules the deadline of the node if this state times out, and
+        cancels its previous deadline otherwise.
+
+        :param node_uuid: the UUID of the node.
+        :param provision_state: the new provision state of the node.
+        """
+        timeout = self._timeouts.get(provision_state)
+        if timeout:
+            self.schedule(node_uuid, provision_state, time.time() + timeout)
+        elif node_uuid in self._entries:
+            self.cancel(node_uuid)
+
+    def schedule(self, node_uuid, provision_state, deadline):
+        """Schedule the deadline of a node.
+
+        :param node_uuid: the UUID of the node.
+        :param provision_state: the provision state which times out.
+        :param deadline: the time, as returned by time.time(), at which the
+                         node times out.
+        """
+        entry = [deadline, node_uuid, provision_state, True]
+        with self._lock:
+            self._cancel(node_uuid)
+            self._entries[node_uuid] = entry
+            heapq.heappush(self._heap, entry)
+
+    def cancel(self, node_uuid):
+        """Cancel the deadline of a node, if any.
+
+        :param node_uuid: the UUID of the node.
+        """
+        with self._lock:
+            self._cancel(node_uuid)
+
+    def _cancel(self, node_uuid):
+        entry = self._entries.pop(node_uuid, None)
+        if entry is None:
+            return
+        # NOTE: removing an entry from the middle of the heap is costly,
+        # it is marked as cancelled and skipped when it is popped.
+        entry[-1] = False
+        if len(self._heap) - len(self._entries) > _MAX_CANCELLED:
+            self._heap = [e for e in self._heap if e[-1]]
+            heapq.heapify(self._heap)
+
+    def pop_expired(self, now=None):
+        """Remove and return the nodes whose deadline has passed.
+
+        :param now: the current time, as returned by time.time().
+                    Default: time.time().
+        :returns: a list of (node_uuid, provision_state) tuples, the
+                  earliest deadline first.
+        """
+        if now is None:
+            now = time.time()
+        expired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, node_uuid, provision_state, active = (
+                    heapq.heappop(self._heap))
+                if active:
+                    del self._entries[node_uuid]
+                    expired.append((node_uuid, provision_state))
+        return expired
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, node_uuid):
+        return node_uuid in self._entries
@@ -0,0 +1,185 @@
+# coding=utf-8
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Pool of the greenthreads running the background work of the conductor.
+
+The work is spawned with a priority: work requested through the API
+comes first, then work resuming after a callback from a ramdisk, then
+work started by the periodic tasks. Some of the workers are reserved for
+the higher priorities, so that a burst of periodic work cannot take all of
+them. When no worker can run a piece of work, it waits in a short queue,
+highest priority first, rather than being rejected straight away.
+"""
+
+import collections
+import heapq
+import itertools
+import threading
+import time
+
+from eventlet import event
+from eventlet import greenpool
+
+from ironic.common import exception
+
+API = 0
+"""Priority of the work requested through the API."""
+
+CALLBACK = 1
+"""Priority of the work resuming after a callback."""
+
+PERIODIC = 2
+"""Priority of the work started by a periodic task."""
+
+PRIORITIES = {API: 'api', CALLBACK: 'callback', PERIODIC: 'periodic'}
+
+
+def _get_name(func):
+    return getattr(func, '__name__', None) or repr(func)
+
+
+class WorkerPool(object):
+    """A pool of greenthreads which runs work by priority.
+
+    At most `size` workers run at the same time. A piece of work of a given
+    priority only starts when more workers are free than the ones reserved
+    for the higher priorities. Otherwise it waits, unless `queue_size`
+    pieces of work are waiting already. Waiting work starts as soon as it
+    can, the highest priority first and, for a same priority, the oldest
+    first.
+    """
+
+    def __init__(self, size, reserved=None, queue_size=0):
+        """Create a pool.
+
+        :param size: the maximum number of workers running at the same time.
+        :param reserved: a dict mapping priorities to the number of workers
+                         reserved for them, which the work of lower
+                         priorities cannot use. Whatever the reservations,
+                         the work of every priority can use one worker.
+        :param queue_size: the maximum number of pieces of work waiting for
+                           a worker.
+        """
+        self.size = size
+        self.queue_size = queue_size
+        reserved = reserved or {}
+        # The maximum number of workers running the work of each priority
+        self._limits = {}
+        for priority in PRIORITIES:
+            headroom = sum(reserved.get(p, 0) for p in PRIORITIES
+                           if p < priority)
+            self._limits[priority] = max(1, size - headroom)
+        self._pool = greenpool.GreenPool(size + queue_size)
+        self._lock = threading.Lock()
+        self._running = 0
+        # Heap of the [priority, sequence number, event] of the waiting work
+        self._waiting = []
+        self._counter = itertools.count()
+        self._rejected = collections.defaultdict(int)
+        self._stats = {}
+
+    def free(self):
+        """Return the number of workers not running any work."""
+        return self.size - self._running
+
+    def spawn(self, priority, func, *args, **kwargs):
+        """Run func(*args, **kwargs) in a greenthread.
+
+        Execution control returns immediately to the caller, the work
+        starts once a worker can run it.
+
+        :param priority: the priority of the work, one of API, CALLBACK
+                         and PERIODIC.
+        :returns: GreenThread object.
+        :raises: NoFreeConductorWorker if no worker can run the work and
+                 the queue is full.
+        """
+        queued_at = time.time()
+        ready = None
+        with self._lock:
+            if (self._running < self._limits[priority] and
+                    not (self._waiting and self._waiting[0][0] <= priority)):
+                self._running += 1
+            elif len(self._waiting) < self.queue_size:
+                ready = event.Event()
+                heapq.heappush(self._waiting,
+                               [priority, next(self._counter), ready])
+            else:
+                self._rejected[PRIORITIES[priority]] += 1
+                raise exception.NoFreeConductorWorker()
+        return self._pool.spawn(self._run, ready, queued_at, func,
+                                args, kwargs)
+
+    def _run(self, ready, queued_at, func, args, kwargs):
+        if ready is not None:
+            ready.wait()
+        started_at = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            run_time = time.time() - started_at
+            with self._lock:
+                self._running -= 1
+                self._record(_get_name(func), started_at - queued_at,
+                             run_time)
+                self._dispatch()
+
+    def _dispatch(self):
+        # NOTE: called with the lock held
+        while (self._waiting and
+               self._running < self._limits[self._waiting[0][0]]):
+            priority, counter, ready = heapq.heappop(self._waiting)
+            self._running += 1
+            ready.send()
+
+    def _record(self, name, wait_time, run_time):
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = {'count': 0,
+                                         'wait_time': 0.0,
+                                         'max_wait_time': 0.0,
+                                         'run_time': 0.0,
+                                         'max_run_time': 0.0}
+        stats['count'] += 1
+        stats['wait_time'] += wait_time
+        stats['max_wait_time'] = max(stats['max_wait_time'], wait_time)
+        stats['run_time'] += run_time
+        stats['max_run_time'] = max(stats['max_run_time'], run_time)
+
+    def get_stats(self):
+        """Return the statistics of the pool.
+
+        :returns: a dict with the 'size' of the pool, the number of
+                  'running' workers, the number of pieces of work 'waiting'
+                  and 'rejected' by priority name, and the statistics of the
+                  completed work by function name in 'functions': the
+                  'count' of runs, and the total and maximum 'wait_time'
+                  and 'run_time', in seconds.
+        """
+        with self._lock:
+            waiting = dict((name, 0) for name in PRIORITIES.values())
+            for priority, counter, ready in self._waiting:
+                waiting[PRIORITIES[priority]] += 1
+            return {'size': self.size,
+                    'running': self._running,
+                    'waiting': waiting,
+                    'rejected': dict((name, self._rejected[name])
+                                     for name in PRIORITIES.values()),
+                    'functions': dict((name, dict(stats))
+                                      for name, stats in self._stats.items())}
+
+    def waitall(self):
+        """Wait until all the work, running and waiting, is done."""
+        self._pool.waitall()
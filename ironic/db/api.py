@@ -54,6 +54,7 @@ class Connection(object):
                         Defaults to 'id' column when columns == None.
         :param filters: Filters to apply. Defaults to None.
 
+                        :id_in: nodes with one of these IDs
                         :associated: True | False
                         :reserved: True | False
                         :reserved_by_any_of: [conductor1, conductor2]
@@ -61,6 +62,14 @@ class Connection(object):
                         :chassis_uuid: uuid of chassis
                         :driver: driver's name
                         :provision_state: provision state of node
+                        :provision_state_not_in:
+                            nodes not in any of these provision states
+                        :target_power_state: target power state of node
+                        :hash_key_ranges:
+                            {driver: [(first, last), ...]}, nodes using
+                            one of these drivers whose uuid has a hash key
+                            (see ironic.common.hash_ring.hash_key) in one
+                            of the inclusive ranges of the driver
                         :provisioned_before:
                             nodes with provision_updated_at field before this
                             interval in seconds
@@ -73,13 +82,37 @@ class Connection(object):
         :returns: A list of tuples of the specified columns.
         """
 
+    @abc.abstractmethod
+    def iter_nodeinfo(self, columns=None, filters=None, sort_key=None,
+                      sort_dir=None, batch_size=None):
+        """Iterate over specific columns of the matching nodes.
+
+        Like get_nodeinfo_list(), but the nodes are loaded in batches, so
+        that the memory used does not grow with the number of nodes, and
+        the first nodes are returned without waiting for the last ones to
+        be loaded.
+
+        :param columns: List of column names to return.
+                        Defaults to 'id' column when columns == None.
+        :param filters: Filters to apply, as accepted by
+                        get_nodeinfo_list(). Defaults to None.
+        :param sort_key: Attribute by which results should be sorted.
+                         Defaults to 'id'. The nodes for which this
+                         attribute is NULL are not returned.
+        :param sort_dir: direction in which results should be sorted.
+                         (asc, desc)
+        :param batch_size: Number of nodes to load at once.
+        :returns: An iterator over tuples of the specified columns.
+        """
+
     @abc.abstractmethod
     def get_node_list(self, filters=None, limit=None, marker=None,
-                      sort_key=None, sort_dir=None):
+                      sort_key=None, sort_dir=None, fields=None):
         """Return a list of nodes.
 
         :param filters: Filters to apply. Defaults to None.
 
+                        :id_in: nodes with one of these IDs
                         :associated: True | False
                         :reserved: True | False
                         :maintenance: True | False
@@ -95,10 +128,13 @@ class Connection(object):
         :param sort_key: Attribute by which results should be sorted.
         :param sort_dir: direction in which results should be sorted.
                          (asc, desc)
+        :param fields: The fields of the nodes to load, all of them if None.
+                       The other fields of the returned nodes must not be
+                       accessed.
         """
 
     @abc.abstractmethod
-    def reserve_node(self, tag, node_id):
+    def reserve_node(self, tag, node_id, filters=None):
         """Reserve a node.
 
         To prevent other ManagerServices from manipulating the given
@@ -106,9 +142,31 @@ class Connection(object):
 
         :param tag: A string uniquely identifying the reservation holder.
         :param node_id: A node id or uuid.
+        :param filters: Filters the node must match to be reserved, checked
+                        in the same statement that reserves it. Accepts the
+                        same filters as get_nodeinfo_list(). Defaults to None.
         :returns: A Node object.
         :raises: NodeNotFound if the node is not found.
         :raises: NodeLocked if the node is already reserved.
+        :raises: NodeNotEligible if the node does not match the filters.
+        """
+
+    @abc.abstractmethod
+    def reserve_nodes(self, tag, node_ids, filters=None):
+        """Reserve the nodes of a list which are not reserved yet.
+
+        Like reserve_node(), for many nodes at once. The nodes which are
+        not found, already reserved, or do not match the filters are
+        skipped.
+
+        :param tag: A string uniquely identifying the reservation holder.
+        :param node_ids: A list of node ids or uuids.
+        :param filters: Filters the nodes must match to be reserved, checked
+                        in the same statement that reserves them. Accepts
+                        the same filters as get_nodeinfo_list(). Defaults to
+                        None.
+        :returns: A list of the reserved Node objects, in no particular
+                  order.
         """
 
     @abc.abstractmethod
@@ -147,19 +205,27 @@ class Connection(object):
         """
 
     @abc.abstractmethod
-    def get_node_by_id(self, node_id):
+    def get_node_by_id(self, node_id, filters=None):
         """Return a node.
 
         :param node_id: The id of a node.
+        :param filters: Filters the node must match. Accepts the same
+                        filters as get_nodeinfo_list(). Defaults to None.
         :returns: A node.
+        :raises: NodeNotFound if the node is not found.
+        :raises: NodeNotEligible if the node does not match the filters.
         """
 
     @abc.abstractmethod
-    def get_node_by_uuid(self, node_uuid):
+    def get_node_by_uuid(self, node_uuid, filters=None):
         """Return a node.
 
         :param node_uuid: The uuid of a node.
+        :param filters: Filters the node must match. Accepts the same
+                        filters as get_nodeinfo_list(). Defaults to None.
         :returns: A node.
+        :raises: NodeNotFound if the node is not found.
+        :raises: NodeNotEligible if the node does not match the filters.
         """
 
     @abc.abstractmethod
@@ -232,6 +298,15 @@ class Connection(object):
         :returns: A port.
         """
 
+    @abc.abstractmethod
+    def get_ports_by_addresses(self, addresses):
+        """Return the network ports with the given MAC addresses.
+
+        :param addresses: A list of MAC addresses.
+        :returns: A list of ports, in no particular order. The addresses
+                  without a port are ignored.
+        """
+
     @abc.abstractmethod
     def get_port_list(self, limit=None, marker=None,
                       sort_key=None, sort_dir=None):
@@ -348,6 +423,10 @@ class Connection(object):
                                      this Conductor service.
                          'drivers': a list of supported drivers.
                         }
+
+                       and may contain 'weight', the capacity of the
+                       conductor relative to the others, see
+                       :meth:`get_active_conductor_weights`.
         :param update_existing: When false, registration will raise an
                                 exception when a conflicting online record
                                 is found. When true, will overwrite the
@@ -395,6 +474,20 @@ class Connection(object):
                      driverB: set([host2, host3])}
         """
 
+    @abc.abstractmethod
+    def get_active_conductor_weights(self, interval=None):
+        """Retrieve the weights of the registered and active conductors.
+
+        :param interval: Seconds since last check-in of a conductor.
+                         Defaults to [conductor]heartbeat_timeout.
+        :returns: A dict which maps the hostnames of the conductors which
+                  registered a weight to their weight. For example:
+
+                  ::
+
+                    {host1: 100, host2: 50}
+        """
+
     @abc.abstractmethod
     def get_offline_conductors(self):
         """Get a list conductor hostnames that are offline (dead).
@@ -0,0 +1,70 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Add node.hash_key
+
+Revision ID: 1a8f2b6c9d3e
+Revises: 516faf1bb9b1
+Create Date: 2015-09-01 10:12:31.541244
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '1a8f2b6c9d3e'
+down_revision = '516faf1bb9b1'
+
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.sql import column, table
+
+# The number of nodes updated by each statement of the backfill.
+_BATCH_SIZE = 500
+
+node = table('nodes',
+             column('id', sa.Integer),
+             column('uuid', sa.String(36)),
+             column('hash_key', sa.BigInteger))
+
+
+# NOTE: The hash is computed here rather than by importing
+# ironic.common.hash_ring, because that file may change in the future.
+# This migration script must still be able to be run with future versions
+# of the code and still produce the same results.
+def _hash_key(uuid):
+    return int(hashlib.md5(uuid.encode('utf-8')).hexdigest()[:8], 16)
+
+
+def upgrade():
+    op.add_column('nodes', sa.Column('hash_key', sa.BigInteger(),
+                                     nullable=True))
+    op.create_index('nodes_hash_key_idx', 'nodes', ['hash_key'])
+
+    # NOTE: the hash keys are backfilled with one statement executed for
+    # many nodes at once, not with one statement per node.
+    connection = op.get_bind()
+    nodes = connection.execute(
+        sa.select([node.c.id, node.c.uuid]).where(
+            node.c.uuid != sa.null())).fetchall()
+    update = node.update().where(
+        node.c.id == sa.bindparam('node_id')).values(
+            hash_key=sa.bindparam('key'))
+    for i in range(0, len(nodes), _BATCH_SIZE):
+        connection.execute(update, [
+            {'node_id': node_id, 'key': _hash_key(uuid)}
+            for node_id, uuid in nodes[i:i + _BATCH_SIZE]])
+
+
+def downgrade():
+    op.drop_index('nodes_hash_key_idx', 'nodes')
+    op.drop_column('nodes', 'hash_key')
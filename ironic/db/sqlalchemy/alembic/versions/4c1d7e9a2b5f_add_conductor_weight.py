@@ -0,0 +1,34 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Add conductor.weight
+
+Revision ID: 4c1d7e9a2b5f
+Revises: 1a8f2b6c9d3e
+Create Date: 2015-09-08 14:27:05.318562
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4c1d7e9a2b5f'
+down_revision = '1a8f2b6c9d3e'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('conductors', sa.Column('weight', sa.Integer(),
+                  nullable=True))
+
+
+def downgrade():
+    op.drop_column('conductors', 'weight')
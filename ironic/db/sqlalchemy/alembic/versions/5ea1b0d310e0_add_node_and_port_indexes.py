@@ -0,0 +1,48 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Add indexes for the node filters and the ports of a node
+
+Revision ID: 5ea1b0d310e0
+Revises: 4c1d7e9a2b5f
+Create Date: 2015-09-14 11:03:27.916452
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5ea1b0d310e0'
+down_revision = '4c1d7e9a2b5f'
+
+from alembic import op
+
+
+def _indexes_foreign_keys():
+    # NOTE: MySQL already indexes the foreign key of the ports on node_id,
+    # do not index it twice.
+    return op.get_bind().dialect.name == 'mysql'
+
+
+def upgrade():
+    op.create_index('nodes_provision_state_updated_at_idx', 'nodes',
+                    ['provision_state', 'provision_updated_at'])
+    op.create_index('nodes_reservation_idx', 'nodes', ['reservation'])
+    op.create_index('nodes_driver_idx', 'nodes', ['driver'])
+    if not _indexes_foreign_keys():
+        op.create_index('ports_node_id_idx', 'ports', ['node_id'])
+
+
+def downgrade():
+    if not _indexes_foreign_keys():
+        op.drop_index('ports_node_id_idx', 'ports')
+    op.drop_index('nodes_driver_idx', 'nodes')
+    op.drop_index('nodes_reservation_idx', 'nodes')
+    op.drop_index('nodes_provision_state_updated_at_idx', 'nodes')
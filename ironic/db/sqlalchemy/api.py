@@ -28,10 +28,12 @@ from oslo_log import log
 from oslo_utils import strutils
 from oslo_utils import timeutils
 from oslo_utils import uuidutils
+from sqlalchemy import orm
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy import sql
 
 from ironic.common import exception
+from ironic.common import hash_ring
 from ironic.common.i18n import _
 from ironic.common.i18n import _LW
 from ironic.common import states
@@ -49,6 +51,12 @@ LOG = log.getLogger(__name__)
 
 _CONTEXT = threading.local()
 
+# The databases which return the rows changed by UPDATE ... RETURNING
+_UPDATE_RETURNING_DIALECTS = ('postgresql',)
+
+# The number of nodes loaded at once by Connection.iter_nodeinfo()
+_ITER_BATCH_SIZE = 1000
+
 
 def get_backend():
     """The backend is this module itself."""
@@ -92,6 +100,34 @@ def add_identity_filter(query, value):
         raise exception.InvalidIdentity(identity=value)
 
 
+def add_identities_filter(query, model, values):
+    """Adds a filter on a list of identities to a query.
+
+    Filters results by ID for the supplied values which are valid integers,
+    and by UUID for the others.
+
+    :param query: Initial query to add filter to.
+    :param model: The model queried.
+    :param values: Values for filtering results by.
+    :return: Modified query.
+    """
+    ids = []
+    uuids = []
+    for value in values:
+        if strutils.is_int_like(value):
+            ids.append(int(value))
+        elif uuidutils.is_uuid_like(value):
+            uuids.append(value)
+        else:
+            raise exception.InvalidIdentity(identity=value)
+    clauses = []
+    if ids:
+        clauses.append(model.id.in_(ids))
+    if uuids:
+        clauses.append(model.uuid.in_(uuids))
+    return query.filter(sql.or_(*clauses))
+
+
 def add_port_filter(query, value):
     """Adds a port-specific filter to a query.
 
@@ -143,6 +179,63 @@ def _paginate_query(model, limit=None, marker=None, sort_key=None,
     return query.all()
 
 
+def _keyset_clause(columns, values, sort_dir):
+    """Match the rows after the given values of the sort columns.
+
+    :param columns: the columns the rows are sorted by, the last one
+                    being unique.
+    :param values: the values of the columns of the last row seen.
+    :param sort_dir: the direction of the sort, 'asc' or 'desc'.
+    """
+    clauses = []
+    for i, (column, value) in enumerate(zip(columns, values)):
+        after = column > value if sort_dir == 'asc' else column < value
+        equal = [c == v for c, v in zip(columns[:i], values[:i])]
+        clauses.append(sql.and_(*(equal + [after])))
+    return sql.or_(*clauses)
+
+
+def _hash_key_ranges_clause(ranges_by_driver):
+    clauses = []
+    for driver, ranges in ranges_by_driver.items():
+        # NOTE: nodes created before the hash_key column was added have
+        # no hash key until they are migrated, so they always match.
+        key_clauses = [models.Node.hash_key == sql.null()]
+        key_clauses.extend(models.Node.hash_key.between(first, last)
+                           for first, last in ranges)
+        clauses.append(sql.and_(models.Node.driver == driver,
+                                sql.or_(*key_clauses)))
+    if not clauses:
+        return sql.false()
+    return sql.or_(*clauses)
+
+
+def _supports_update_returning(session):
+    return session.get_bind().dialect.name in _UPDATE_RETURNING_DIALECTS
+
+
+def _update_returning(session, model, query, values):
+    """Update the rows matched by a query, and return them.
+
+    Issues a single UPDATE ... RETURNING statement, the database must be
+    one of _UPDATE_RETURNING_DIALECTS.
+
+    :param session: the session to use.
+    :param model: the model queried.
+    :param query: a query on the model, without joins.
+    :param values: a dict of the columns to update.
+    :returns: a list of the updated rows, as models.
+    """
+    table = model.__table__
+    statement = (sql.update(table).where(query.whereclause).values(values).
+                 returning(*table.columns))
+    result = session.execute(statement)
+    # NOTE: some drivers do not describe the columns when no row matched
+    if not result.returns_rows:
+        return []
+    return list(query.instances(result))
+
+
 class Connection(api.Connection):
     """SqlAlchemy connection."""
 
@@ -158,6 +251,8 @@ class Connection(api.Connection):
             # is not found
             chassis_obj = self.get_chassis_by_uuid(filters['chassis_uuid'])
             query = query.filter_by(chassis_id=chassis_obj.id)
+        if 'id_in' in filters:
+            query = query.filter(models.Node.id.in_(filters['id_in']))
         if 'associated' in filters:
             if filters['associated']:
                 query = query.filter(models.Node.instance_uuid != sql.null())
@@ -177,6 +272,15 @@ class Connection(api.Connection):
             query = query.filter_by(driver=filters['driver'])
         if 'provision_state' in filters:
             query = query.filter_by(provision_state=filters['provision_state'])
+        if 'provision_state_not_in' in filters:
+            query = query.filter(~models.Node.provision_state.in_(
+                filters['provision_state_not_in']))
+        if 'target_power_state' in filters:
+            query = query.filter_by(
+                target_power_state=filters['target_power_state'])
+        if 'hash_key_ranges' in filters:
+            query = query.filter(
+                _hash_key_ranges_clause(filters['hash_key_ranges']))
         if 'provisioned_before' in filters:
             limit = (timeutils.utcnow() -
                      datetime.timedelta(seconds=filters['provisioned_before']))
@@ -203,23 +307,81 @@ class Connection(api.Connection):
         return _paginate_query(models.Node, limit, marker,
                                sort_key, sort_dir, query)
 
+    def iter_nodeinfo(self, columns=None, filters=None, sort_key=None,
+                      sort_dir=None, batch_size=None):
+        columns = [getattr(models.Node, c) for c in columns or ['id']]
+        sort_dir = sort_dir or 'asc'
+        if sort_dir not in ('asc', 'desc'):
+            raise exception.InvalidParameterValue(
+                _('The sort_dir value "%s" is not one of "asc" or "desc"')
+                % sort_dir)
+        sort_columns = [models.Node.id]
+        if sort_key and sort_key != 'id':
+            sort_column = getattr(models.Node, sort_key, None)
+            if sort_column is None:
+                raise exception.InvalidParameterValue(
+                    _('The sort_key value "%(key)s" is an invalid field for '
+                      'sorting') % {'key': sort_key})
+            sort_columns.insert(0, sort_column)
+        batch_size = batch_size or _ITER_BATCH_SIZE
+
+        query = model_query(*(columns + sort_columns))
+        query = self._add_nodes_filters(query, filters)
+        # NOTE: the batches are fetched by separate queries, each one
+        # starting after the last node of the previous batch (rather than
+        # at an offset, or with a cursor left open while the caller works
+        # on the nodes). NULL values cannot be compared with the last
+        # node's, so these nodes are left out.
+        for column in sort_columns[:-1]:
+            query = query.filter(column != sql.null())
+        order = [getattr(column, sort_dir)() for column in sort_columns]
+        query = query.order_by(*order)
+
+        last = None
+        while True:
+            batch_query = query
+            if last is not None:
+                batch_query = query.filter(
+                    _keyset_clause(sort_columns, last, sort_dir))
+            rows = batch_query.limit(batch_size).all()
+            for row in rows:
+                yield tuple(row[:len(columns)])
+            if len(rows) < batch_size:
+                return
+            last = rows[-1][len(columns):]
+
     def get_node_list(self, filters=None, limit=None, marker=None,
-                      sort_key=None, sort_dir=None):
+                      sort_key=None, sort_dir=None, fields=None):
         query = model_query(models.Node)
+        if fields is not None:
+            query = query.options(orm.load_only(*fields))
         query = self._add_nodes_filters(query, filters)
         return _paginate_query(models.Node, limit, marker,
                                sort_key, sort_dir, query)
 
-    def reserve_node(self, tag, node_id):
-        with _session_for_write():
+    def reserve_node(self, tag, node_id, filters=None):
+        with _session_for_write() as session:
             query = model_query(models.Node)
             query = add_identity_filter(query, node_id)
             # be optimistic and assume we usually create a reservation
-            count = query.filter_by(reservation=None).update(
-                {'reservation': tag}, synchronize_session=False)
+            reserve_query = self._add_nodes_filters(query, filters)
+            reserve_query = reserve_query.filter_by(reservation=None)
+            if _supports_update_returning(session):
+                nodes = _update_returning(session, models.Node,
+                                          reserve_query, {'reservation': tag})
+                if nodes:
+                    return nodes[0]
+                count = 0
+            else:
+                count = reserve_query.update({'reservation': tag},
+                                             synchronize_session=False)
             try:
                 node = query.one()
                 if count != 1:
+                    if filters and node['reservation'] is None:
+                        # Nothing updated and node exists but is not
+                        # locked. Must not match the filters.
+                        raise exception.NodeNotEligible(node=node_id)
                     # Nothing updated and node exists. Must already be
                     # locked.
                     raise exception.NodeLocked(node=node_id,
@@ -228,6 +390,33 @@ class Connection(api.Connection):
             except NoResultFound:
                 raise exception.NodeNotFound(node_id)
 
+    def reserve_nodes(self, tag, node_ids, filters=None):
+        if not node_ids:
+            return []
+        with _session_for_write() as session:
+            query = model_query(models.Node)
+            query = add_identities_filter(query, models.Node, node_ids)
+            query = self._add_nodes_filters(query, filters)
+            query = query.filter_by(reservation=None)
+            if _supports_update_returning(session):
+                return _update_returning(session, models.Node, query,
+                                         {'reservation': tag})
+
+            # NOTE: the nodes are first reserved with a tag unique to this
+            # call, to find out which ones were reserved. It is replaced
+            # before the transaction is committed, no one else sees it.
+            unique_tag = '%s/%s' % (tag, uuidutils.generate_uuid())
+            count = query.update({'reservation': unique_tag},
+                                 synchronize_session=False)
+            if not count:
+                return []
+            query = model_query(models.Node).filter_by(
+                reservation=unique_tag)
+            nodes = query.all()
+            query.update({'reservation': tag},
+                         synchronize_session='evaluate')
+            return nodes
+
     def release_node(self, tag, node_id):
         with _session_for_write():
             query = model_query(models.Node)
@@ -254,6 +443,7 @@ class Connection(api.Connection):
             values['power_state'] = states.NOSTATE
         if 'provision_state' not in values:
             values['provision_state'] = states.ENROLL
+        values['hash_key'] = hash_ring.hash_key(values['uuid'])
 
         node = models.Node()
         node.update(values)
@@ -271,19 +461,22 @@ class Connection(api.Connection):
                 raise exception.NodeAlreadyExists(uuid=values['uuid'])
             return node
 
-    def get_node_by_id(self, node_id):
-        query = model_query(models.Node).filter_by(id=node_id)
+    def _get_node(self, query, node_id, filters=None):
         try:
-            return query.one()
+            return self._add_nodes_filters(query, filters).one()
         except NoResultFound:
+            # only pay for a second query when the node was filtered out
+            if filters and query.count():
+                raise exception.NodeNotEligible(node=node_id)
             raise exception.NodeNotFound(node=node_id)
 
-    def get_node_by_uuid(self, node_uuid):
+    def get_node_by_id(self, node_id, filters=None):
+        query = model_query(models.Node).filter_by(id=node_id)
+        return self._get_node(query, node_id, filters)
+
+    def get_node_by_uuid(self, node_uuid, filters=None):
         query = model_query(models.Node).filter_by(uuid=node_uuid)
-        try:
-            return query.one()
-        except NoResultFound:
-            raise exception.NodeNotFound(node=node_uuid)
+        return self._get_node(query, node_uuid, filters)
 
     def get_node_by_name(self, node_name):
         query = model_query(models.Node).filter_by(name=node_name)
@@ -398,6 +591,13 @@ class Connection(api.Connection):
         except NoResultFound:
             raise exception.PortNotFound(port=address)
 
+    def get_ports_by_addresses(self, addresses):
+        if not addresses:
+            return []
+        query = model_query(models.Port)
+        query = query.filter(models.Port.address.in_(set(addresses)))
+        return query.all()
+
     def get_port_list(self, limit=None, marker=None,
                       sort_key=None, sort_dir=None):
         return _paginate_query(models.Port, limit, marker,
@@ -598,6 +798,19 @@ class Connection(api.Connection):
                 d2c[driver].add(row['hostname'])
         return d2c
 
+    def get_active_conductor_weights(self, interval=None):
+        if interval is None:
+            interval = CONF.conductor.heartbeat_timeout
+
+        limit = timeutils.utcnow() - datetime.timedelta(seconds=interval)
+        result = (model_query(models.Conductor.hostname,
+                              models.Conductor.weight)
+                  .filter_by(online=True)
+                  .filter(models.Conductor.updated_at >= limit)
+                  .filter(models.Conductor.weight != sql.null())
+                  .all())
+        return dict(result)
+
     def get_offline_conductors(self):
         interval = CONF.conductor.heartbeat_timeout
         limit = timeutils.utcnow() - datetime.timedelta(seconds=interval)
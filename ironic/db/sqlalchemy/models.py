@@ -23,13 +23,14 @@ from oslo_db import options as db_options
 from oslo_db.sqlalchemy import models
 from oslo_db.sqlalchemy import types as db_types
 import six.moves.urllib.parse as urlparse
-from sqlalchemy import Boolean, Column, DateTime
+from sqlalchemy import BigInteger, Boolean, Column, DateTime
 from sqlalchemy import ForeignKey, Integer
 from sqlalchemy import schema, String, Text
 from sqlalchemy.ext.declarative import declarative_base
 
 from ironic.common.i18n import _
 from ironic.common import paths
+from ironic.common import utils
 
 
 sql_opts = [
@@ -45,6 +46,27 @@ cfg.CONF.register_opts(sql_opts, 'database')
 db_options.set_defaults(cfg.CONF, _DEFAULT_SQL_CONNECTION, 'ironic.sqlite')
 
 
+class LazyJsonEncodedDict(db_types.JsonEncodedDict):
+    """Represents a dict serialized as JSON, decoded on first access.
+
+    The values read from the database are
+    :class:`ironic.common.utils.LazyJsonDict` instances.
+    """
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, utils.LazyJsonDict):
+            return value.encode()
+        return super(LazyJsonEncodedDict, self).process_bind_param(value,
+                                                                   dialect)
+
+    def process_result_value(self, value, dialect):
+        # NOTE: like JsonEncodedDict, a JSON null is read as None, which can
+        # not be decoded lazily as a dict.
+        if value is None or value.strip() == 'null':
+            return None
+        return utils.LazyJsonDict(value)
+
+
 def table_args():
     engine_name = urlparse.urlparse(cfg.CONF.database.connection).scheme
     if engine_name == 'mysql':
@@ -94,6 +116,7 @@ class Conductor(Base):
     hostname = Column(String(255), nullable=False)
     drivers = Column(db_types.JsonEncodedList)
     online = Column(Boolean, default=True)
+    weight = Column(Integer, nullable=True)
 
 
 class Node(Base):
@@ -105,6 +128,15 @@ class Node(Base):
         schema.UniqueConstraint('instance_uuid',
                                 name='uniq_nodes0instance_uuid'),
         schema.UniqueConstraint('name', name='uniq_nodes0name'),
+        schema.Index('nodes_hash_key_idx', 'hash_key'),
+        schema.Index('nodes_provision_state_updated_at_idx',
+                     'provision_state', 'provision_updated_at'),
+        # NOTE: for the nodes reserved by a conductor, and to find the
+        # nodes reserved by Connection.reserve_nodes() where the database
+        # can not return the rows it updates. "reservation IS NULL" matches
+        # most nodes and does not use it.
+        schema.Index('nodes_reservation_idx', 'reservation'),
+        schema.Index('nodes_driver_idx', 'driver'),
         table_args())
     id = Column(Integer, primary_key=True)
     uuid = Column(String(36))
@@ -120,15 +152,15 @@ class Node(Base):
     target_provision_state = Column(String(15), nullable=True)
     provision_updated_at = Column(DateTime, nullable=True)
     last_error = Column(Text, nullable=True)
-    instance_info = Column(db_types.JsonEncodedDict)
-    properties = Column(db_types.JsonEncodedDict)
+    instance_info = Column(LazyJsonEncodedDict)
+    properties = Column(LazyJsonEncodedDict)
     driver = Column(String(255))
-    driver_info = Column(db_types.JsonEncodedDict)
-    driver_internal_info = Column(db_types.JsonEncodedDict)
-    clean_step = Column(db_types.JsonEncodedDict)
+    driver_info = Column(LazyJsonEncodedDict)
+    driver_internal_info = Column(LazyJsonEncodedDict)
+    clean_step = Column(LazyJsonEncodedDict)
 
-    raid_config = Column(db_types.JsonEncodedDict)
-    target_raid_config = Column(db_types.JsonEncodedDict)
+    raid_config = Column(LazyJsonEncodedDict)
+    target_raid_config = Column(LazyJsonEncodedDict)
 
     # NOTE(deva): this is the host name of the conductor which has
     #             acquired a TaskManager lock on the node.
@@ -149,7 +181,12 @@ class Node(Base):
     console_enabled = Column(Boolean, default=False)
     inspection_finished_at = Column(DateTime, nullable=True)
     inspection_started_at = Column(DateTime, nullable=True)
-    extra = Column(db_types.JsonEncodedDict)
+    extra = Column(LazyJsonEncodedDict)
+
+    # NOTE: this is the hash_ring.hash_key() of the uuid, which lets
+    #       conductors look up the nodes the hash ring maps onto them
+    #       with a range query instead of hashing the uuid of every node.
+    hash_key = Column(BigInteger, nullable=True)
 
 
 class Port(Base):
@@ -159,6 +196,9 @@ class Port(Base):
     __table_args__ = (
         schema.UniqueConstraint('address', name='uniq_ports0address'),
         schema.UniqueConstraint('uuid', name='uniq_ports0uuid'),
+        # NOTE: on MySQL, which indexes foreign keys, the migrations leave
+        # node_id indexed under the name MySQL gave to the index.
+        schema.Index('ports_node_id_idx', 'node_id'),
         table_args())
     id = Column(Integer, primary_key=True)
     uuid = Column(String(36))
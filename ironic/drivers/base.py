@@ -463,6 +463,40 @@ class PowerInterface(BaseInterface):
         :returns: a power state. One of :mod:`ironic.common.states`.
         """
 
+    def get_power_states(self, tasks):
+        """Return the power states of several nodes at once.
+
+        Used by the conductor's power state sync periodic task instead of
+        calling :meth:`get_power_state` for each node. Interfaces which can
+        learn the power state of many nodes with a single request (e.g. all
+        virtual machines of a hypervisor or all servers of a chassis) should
+        override this method. The default implementation calls
+        :meth:`get_power_state` for each task in turn.
+
+        :param tasks: a list of TaskManager instances containing the nodes
+                      to act on. All of them use this interface.
+        :returns: a dictionary mapping the UUID of each node to its power
+                  state, one of :mod:`ironic.common.states`, or to the
+                  exception raised while getting it.
+        """
+        power_states = {}
+        for task in tasks:
+            try:
+                power_states[task.node.uuid] = self.get_power_state(task)
+            except Exception as e:
+                power_states[task.node.uuid] = e
+        return power_states
+
+    @property
+    def supports_get_power_states(self):
+        """Whether :meth:`get_power_states` is overridden by this interface.
+
+        :returns: True if the power states of several nodes can be queried
+                  at once, False otherwise.
+        """
+        return (six.get_method_function(self.get_power_states) is not
+                six.get_unbound_function(PowerInterface.get_power_states))
+
     @abc.abstractmethod
     def set_power_state(self, task, power_state):
         """Set the power state of the task's node.
@@ -578,7 +612,7 @@ VendorMetadata = collections.namedtuple('VendorMetadata', ['method',
 
 
 def _passthru(http_methods, method=None, async=True, driver_passthru=False,
-              description=None, attach=False):
+              description=None, attach=False, require_exclusive_lock=True):
     """A decorator for registering a function as a passthru function.
 
     Decorator ensures function is ready to catch any ironic exceptions
@@ -604,6 +638,12 @@ def _passthru(http_methods, method=None, async=True, driver_passthru=False,
                    value should be returned in the response body.
                    Defaults to False.
     :param description: a string shortly describing what the method does.
+    :param require_exclusive_lock: Boolean value. Only valid for node passthru
+                                   methods. If True, the method is invoked
+                                   with an exclusive lock on the node; if
+                                   False, with a shared lock, which the
+                                   method upgrades when it needs to.
+                                   Defaults to True.
 
     """
     def handle_passthru(func):
@@ -620,6 +660,8 @@ def _passthru(http_methods, method=None, async=True, driver_passthru=False,
         if driver_passthru:
             func._driver_metadata = metadata
         else:
+            metadata.metadata['require_exclusive_lock'] = (
+                require_exclusive_lock)
             func._vendor_metadata = metadata
 
         passthru_logmessage = _LE('vendor_passthru failed with method %s')
@@ -640,9 +682,10 @@ def _passthru(http_methods, method=None, async=True, driver_passthru=False,
 
 
 def passthru(http_methods, method=None, async=True, description=None,
-             attach=False):
+             attach=False, require_exclusive_lock=True):
     return _passthru(http_methods, method, async, driver_passthru=False,
-                     description=description, attach=attach)
+                     description=description, attach=attach,
+                     require_exclusive_lock=require_exclusive_lock)
 
 
 def driver_passthru(http_methods, method=None, async=True, description=None,
@@ -34,6 +34,7 @@ from ironic.common import states
 from ironic.common import utils
 from ironic.conductor import manager
 from ironic.conductor import rpcapi
+from ironic.conductor import task_manager
 from ironic.conductor import utils as manager_utils
 from ironic.drivers import base
 from ironic.drivers.modules import agent_client
@@ -44,6 +45,18 @@ agent_opts = [
     cfg.IntOpt('heartbeat_timeout',
                default=300,
                help=_('Maximum interval (in seconds) for agent heartbeats.')),
+    cfg.IntOpt('heartbeat_flush_interval',
+               default=120,
+               help=_('Interval (in seconds) between writes of the time of '
+                      'the last agent heartbeats to the nodes '
+                      '(agent_last_heartbeat in their driver_internal_info). '
+                      'The heartbeats are recorded in memory by the '
+                      'conductor in between, so that a heartbeat does not '
+                      'write the node. The provisioning of the nodes '
+                      'waiting for their agent is marked as alive by the '
+                      'same writes, so this should be lower than '
+                      'heartbeat_timeout and than the deploy and clean '
+                      'callback timeouts of the conductor.')),
     cfg.IntOpt('post_deploy_get_power_state_retries',
                default=6,
                help=_('Number of times to retry getting power state to check '
@@ -60,12 +73,44 @@ CONF.register_opts(agent_opts, group='agent')
 
 LOG = log.getLogger(__name__)
 
+# NOTE: the time of the last heartbeat of the agents, by node UUID, which
+# is not written to the nodes yet. See BaseAgentVendor._flush_heartbeats().
+_heartbeats = {}
+
+# The provision states in which a node waits for its agent, and in which its
+# heartbeats are recorded. CLEANING is there for backwards compatibility,
+# see heartbeat().
+_AGENT_WAIT_STATES = (states.DEPLOYWAIT, states.CLEANWAIT, states.CLEANING)
+
 
 def _time():
     """Broken out for testing."""
     return time.time()
 
 
+def _upgrade_lock(task):
+    """Upgrade the shared lock of a heartbeat to an exclusive lock.
+
+    Another task may hold the node, or have moved it on while the lock was
+    shared, eg the handling of a previous heartbeat. The heartbeat must not
+    act on the node then, the agent heartbeats again later.
+
+    :param task: a TaskManager instance.
+    :returns: True if the node is still in the same state, False if it is
+        locked by another task or not in the same state any more.
+    """
+    node = task.node
+    state = (node.provision_state, node.clean_step, node.maintenance)
+    try:
+        task.upgrade_lock()
+    except exception.NodeLocked:
+        LOG.debug('Node %s is locked by another task, skipping the '
+                  'heartbeat.', node.uuid)
+        return False
+    node = task.node
+    return state == (node.provision_state, node.clean_step, node.maintenance)
+
+
 def _get_client():
     client = agent_client.AgentClient()
     return client
@@ -175,6 +220,9 @@ class BaseAgentVendor(base.VendorInterface):
             # Command is not done yet
             return
 
+        if not _upgrade_lock(task):
+            return
+
         if command.get('command_status') == 'FAILED':
             msg = (_('Agent returned error for clean step %(step)s on node '
                      '%(node)s : %(err)s.') %
@@ -213,7 +261,7 @@ class BaseAgentVendor(base.VendorInterface):
             LOG.error(msg)
             return manager.cleaning_error_handler(task, msg)
 
-    @base.passthru(['POST'])
+    @base.passthru(['POST'], require_exclusive_lock=False)
     def heartbeat(self, task, **kwargs):
         """Method for agent to periodically check in.
 
@@ -225,23 +273,42 @@ class BaseAgentVendor(base.VendorInterface):
          }
 
         AGENT_PORT defaults to 9999.
+
+        The heartbeat is called with a shared lock on the node, which is
+        upgraded only to save a new agent_url, or to move the deployment or
+        the cleaning on. The time of the heartbeat is recorded in memory,
+        and written to the node later by :meth:`_flush_heartbeats`, which
+        also marks the provisioning of the node as alive. It is forgotten
+        if the node leaves the states waiting for the agent.
         """
         node = task.node
-        driver_internal_info = node.driver_internal_info
         LOG.debug(
             'Heartbeat from %(node)s, last heartbeat at %(heartbeat)s.',
             {'node': node.uuid,
-             'heartbeat': driver_internal_info.get('agent_last_heartbeat')})
-        driver_internal_info['agent_last_heartbeat'] = int(_time())
+             'heartbeat': _heartbeats.get(
+                 node.uuid,
+                 node.driver_internal_info.get('agent_last_heartbeat'))})
         try:
-            driver_internal_info['agent_url'] = kwargs['agent_url']
+            agent_url = kwargs['agent_url']
         except KeyError:
             raise exception.MissingParameterValue(_('For heartbeat operation, '
                                                     '"agent_url" must be '
                                                     'specified.'))
 
-        node.driver_internal_info = driver_internal_info
-        node.save()
+        heartbeat = int(_time())
+        if node.driver_internal_info.get('agent_url') != agent_url:
+            # NOTE: the agent_url is needed to talk to the agent, it is
+            # saved right away.
+            task.upgrade_lock()
+            node = task.node
+            driver_internal_info = node.driver_internal_info
+            driver_internal_info['agent_last_heartbeat'] = heartbeat
+            driver_internal_info['agent_url'] = agent_url
+            node.driver_internal_info = driver_internal_info
+            node.save()
+            _heartbeats.pop(node.uuid, None)
+        else:
+            _heartbeats[node.uuid] = heartbeat
 
         # Async call backs don't set error state on their own
         # TODO(jimrollenhagen) improve error messages here
@@ -255,31 +322,39 @@ class BaseAgentVendor(base.VendorInterface):
             elif (node.provision_state == states.DEPLOYWAIT and
                   not self.deploy_has_started(task)):
                 msg = _('Node failed to get image for deploy.')
-                self.continue_deploy(task, **kwargs)
+                if _upgrade_lock(task):
+                    self.continue_deploy(task, **kwargs)
             elif (node.provision_state == states.DEPLOYWAIT and
                   self.deploy_is_done(task)):
                 msg = _('Node failed to move to active state.')
-                self.reboot_to_instance(task, **kwargs)
-            elif (node.provision_state == states.DEPLOYWAIT and
-                  self.deploy_has_started(task)):
-                node.touch_provisioning()
+                if _upgrade_lock(task):
+                    self.reboot_to_instance(task, **kwargs)
             # TODO(lucasagomes): CLEANING here for backwards compat
             # with previous code, otherwise nodes in CLEANING when this
             # is deployed would fail. Should be removed once the Mitaka
             # release starts.
             elif node.provision_state in (states.CLEANWAIT, states.CLEANING):
-                node.touch_provisioning()
                 if not node.clean_step:
                     LOG.debug('Node %s just booted to start cleaning.',
                               node.uuid)
                     msg = _('Node failed to start the next cleaning step.')
-                    manager.set_node_cleaning_steps(task)
-                    self._notify_conductor_resume_clean(task)
+                    if _upgrade_lock(task):
+                        manager.set_node_cleaning_steps(task)
+                        self._notify_conductor_resume_clean(task)
                 else:
                     msg = _('Node failed to check cleaning progress.')
                     self.continue_cleaning(task, **kwargs)
 
         except Exception as e:
+            # NOTE: the failure is handled only if no other task acts on
+            # the node, nor has moved it on, eg to ACTIVE.
+            if not _upgrade_lock(task):
+                LOG.warning(_LW('Failed to handle the heartbeat of node '
+                                '%(node)s, which is locked or was moved on '
+                                'by another task: %(msg)s %(e)s'),
+                            {'node': node.uuid, 'msg': msg, 'e': e})
+                return
+            node = task.node
             err_info = {'node': node.uuid, 'msg': msg, 'e': e}
             last_error = _('Asynchronous exception for node %(node)s: '
                            '%(msg)s exception: %(e)s') % err_info
@@ -288,6 +363,41 @@ class BaseAgentVendor(base.VendorInterface):
                 manager.cleaning_error_handler(task, last_error)
             else:
                 deploy_utils.set_failed_state(task, last_error)
+        finally:
+            if task.node.provision_state not in _AGENT_WAIT_STATES:
+                _heartbeats.pop(node.uuid, None)
+
+    @base.driver_periodic_task(spacing=CONF.agent.heartbeat_flush_interval)
+    def _flush_heartbeats(self, manager, context):
+        """Periodic task writing the last heartbeats of the agents.
+
+        Also marks the provisioning of the nodes still waiting for their
+        agent as alive, so that it does not time out.
+        The nodes locked by other tasks are left for the next run.
+        """
+        for node_uuid, heartbeat in list(_heartbeats.items()):
+            try:
+                with task_manager.acquire(
+                        context, node_uuid,
+                        purpose='recording agent heartbeat') as task:
+                    node = task.node
+                    driver_internal_info = node.driver_internal_info
+                    if (driver_internal_info.get('agent_last_heartbeat', 0) <
+                            heartbeat):
+                        driver_internal_info['agent_last_heartbeat'] = (
+                            heartbeat)
+                        node.driver_internal_info = driver_internal_info
+                        node.save()
+                    if (not node.maintenance and
+                            node.provision_state in _AGENT_WAIT_STATES):
+                        node.touch_provisioning()
+            except exception.NodeLocked:
+                continue
+            except exception.NodeNotFound:
+                pass
+            # NOTE: keep a heartbeat received in the meantime
+            if _heartbeats.get(node_uuid) == heartbeat:
+                del _heartbeats[node_uuid]
 
     @base.driver_passthru(['POST'], async=False)
     def lookup(self, context, **kwargs):
@@ -442,14 +552,10 @@ class BaseAgentVendor(base.VendorInterface):
         and return them as a list of Port objects, or an empty list if there
         are no matches
         """
-        ports = []
+        ports = objects.Port.list_by_addresses(context, mac_addresses)
+        found = set(port_ob.address for port_ob in ports)
         for mac in mac_addresses:
-            # Will do a search by mac if the mac isn't malformed
-            try:
-                port_ob = objects.Port.get_by_address(context, mac)
-                ports.append(port_ob)
-
-            except exception.PortNotFound:
+            if mac not in found:
                 LOG.warning(_LW('MAC address %s not found in database'), mac)
 
         return ports
@@ -27,6 +27,7 @@ Currently supported environments are:
     Parallels   (parallels)
 """
 
+import collections
 import os
 
 from oslo_concurrency import processutils
@@ -77,6 +78,11 @@ OTHER_PROPERTIES = {
 COMMON_PROPERTIES = REQUIRED_PROPERTIES.copy()
 COMMON_PROPERTIES.update(OTHER_PROPERTIES)
 
+# The driver_info keys that identify an SSH connection to a host. Nodes whose
+# driver_info share all of these can be handled over the same connection.
+_CONNECTION_KEYS = ('host', 'port', 'username', 'password', 'key_contents',
+                    'key_filename', 'virt_type')
+
 # NOTE(dguerri) Generic boot device map. Virtualisation types that don't define
 # a more specific one, will use this.
 # This is left for compatibility with other modules and is still valid for
@@ -387,6 +393,81 @@ def _get_power_status(ssh_obj, driver_info):
     return power_state
 
 
+def _get_power_states(ssh_obj, driver_infos):
+    """Returns the current power states of several nodes on the same host.
+
+    Unlike calling :func:`_get_power_status` for each node, the virtual
+    machines defined on the host, their MAC addresses and the running virtual
+    machines are only listed once for all the nodes.
+
+    :param ssh_obj: paramiko.SSHClient, an active ssh connection.
+    :param driver_infos: a dictionary mapping the UUID of each node to the
+        information for accessing it. All the nodes must be hosted on the
+        host ssh_obj is connected to.
+    :returns: a dictionary mapping the UUID of each node to one of
+        ironic.common.states POWER_OFF, POWER_ON, or to a NodeNotFound
+        exception if the node was not found on the host.
+    :raises: SSHCommandFailed on an error from ssh.
+
+    """
+    cmd_set = list(driver_infos.values())[0]['cmd_set']
+    cmd_to_exec = "%s %s" % (cmd_set['base_cmd'], cmd_set['list_all'])
+    vm_names = [vm for vm in _ssh_execute(ssh_obj, cmd_to_exec) if vm]
+    vm_macs = {}
+
+    def _get_vm_macs(vm_name):
+        if vm_name not in vm_macs:
+            cmd_to_exec = "%s %s" % (cmd_set['base_cmd'],
+                                     cmd_set['get_node_macs'])
+            cmd_to_exec = cmd_to_exec.replace('{_NodeName_}', vm_name)
+            vm_macs[vm_name] = [_normalize_mac(mac) for mac in
+                                _ssh_execute(ssh_obj, cmd_to_exec) if mac]
+        return vm_macs[vm_name]
+
+    def _get_running_list(node_name=None):
+        cmd_to_exec = "%s %s" % (cmd_set['base_cmd'],
+                                 cmd_set['list_running'])
+        if node_name is not None:
+            cmd_to_exec = cmd_to_exec.replace('{_NodeName_}', node_name)
+        return [vm for vm in _ssh_execute(ssh_obj, cmd_to_exec) if vm]
+
+    # NOTE: some virt types (e.g. vmware) can only tell whether one given
+    # virtual machine is running.
+    list_running_per_node = '{_NodeName_}' in cmd_set['list_running']
+    if not list_running_per_node:
+        running_list = _get_running_list()
+
+    power_states = {}
+    for node_uuid, driver_info in driver_infos.items():
+        node_macs = [_normalize_mac(mac) for mac in driver_info['macs']
+                     if mac]
+        node_name = None
+        for vm_name in vm_names:
+            if any(vm_mac in node_mac for vm_mac in _get_vm_macs(vm_name)
+                   for node_mac in node_macs):
+                node_name = vm_name
+                break
+
+        if node_name is None:
+            err_msg = _LE('Node "%(host)s" with MAC address %(mac)s not '
+                          'found.')
+            LOG.error(err_msg, {'host': driver_info['host'],
+                                'mac': driver_info['macs']})
+            power_states[node_uuid] = exception.NodeNotFound(
+                node=driver_info['host'])
+            continue
+
+        if list_running_per_node:
+            running_list = _get_running_list(node_name)
+        quoted_node_name = '"%s"' % node_name
+        if any(quoted_node_name in vm for vm in running_list):
+            power_states[node_uuid] = states.POWER_ON
+        else:
+            power_states[node_uuid] = states.POWER_OFF
+
+    return power_states
+
+
 def _get_connection(node):
     """Returns an SSH client connected to a node.
 
@@ -545,6 +626,41 @@ class SSHPower(base.PowerInterface):
         ssh_obj = _get_connection(task.node)
         return _get_power_status(ssh_obj, driver_info)
 
+    def get_power_states(self, tasks):
+        """Get the current power states of several nodes.
+
+        Nodes hosted on the same host share a single SSH connection, over
+        which the virtual machines of the host are listed only once.
+
+        :param tasks: a list of TaskManager instances containing the nodes
+            to act on.
+        :returns: a dictionary mapping the UUID of each node to its power
+            state, one of :class:`ironic.common.states`, or to the exception
+            raised while getting it.
+        """
+        power_states = {}
+        hosts = collections.defaultdict(dict)
+        for task in tasks:
+            try:
+                driver_info = _parse_driver_info(task.node)
+            except (exception.InvalidParameterValue,
+                    exception.MissingParameterValue) as e:
+                power_states[task.node.uuid] = e
+                continue
+            driver_info['macs'] = driver_utils.get_node_mac_addresses(task)
+            connection = tuple(driver_info.get(key)
+                               for key in _CONNECTION_KEYS)
+            hosts[connection][task.node.uuid] = driver_info
+
+        for driver_infos in hosts.values():
+            try:
+                ssh_obj = utils.ssh_connect(list(driver_infos.values())[0])
+                power_states.update(_get_power_states(ssh_obj, driver_infos))
+            except (exception.SSHConnectFailed,
+                    exception.SSHCommandFailed) as e:
+                power_states.update(dict.fromkeys(driver_infos, e))
+        return power_states
+
     @task_manager.require_exclusive_lock
     def set_power_state(self, task, pstate):
         """Turn the power on or off.
@@ -26,6 +26,7 @@ import six
 from ironic.common import exception
 from ironic.common.i18n import _
 from ironic.common.i18n import _LE
+from ironic.common import utils
 from ironic.objects import fields as object_fields
 from ironic.objects import utils as obj_utils
 
@@ -53,11 +54,15 @@ def make_class_properties(cls):
                 cls.fields[name] = field
     for name, typefn in cls.fields.items():
 
-        def getter(self, name=name):
+        def getter(self, name=name, typefn=typefn):
             attrname = get_attrname(name)
             if not hasattr(self, attrname):
                 self.obj_load_attr(name)
-            return getattr(self, attrname)
+            value = getattr(self, attrname)
+            if isinstance(value, utils.LazyJsonDict):
+                value = typefn(value.decode())
+                setattr(self, attrname, value)
+            return value
 
         def setter(self, value, name=name, typefn=typefn):
             self._changed_fields.add(name)
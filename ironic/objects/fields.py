@@ -61,6 +61,9 @@ class ListOfStringsField(object_fields.ListOfStringsField, _Callable):
 class FlexibleDict(object_fields.FieldType, _Callable):
     @staticmethod
     def coerce(obj, attr, value):
+        if isinstance(value, utils.LazyJsonDict):
+            # NOTE: it is decoded by the getter of the field, when used
+            return value
         if isinstance(value, six.string_types):
             value = ast.literal_eval(value)
         return dict(value)
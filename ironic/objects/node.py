@@ -38,7 +38,11 @@ class Node(base.IronicObject):
     # Version 1.11: Add clean_step
     # Version 1.12: Add raid_config and target_raid_config
     # Version 1.13: Add touch_provisioning()
-    VERSION = '1.13'
+    # Version 1.14: Add filters to get(), get_by_id(), get_by_uuid() and
+    #               reserve()
+    # Version 1.15: Add reserve_many()
+    # Version 1.16: Add fields to list()
+    VERSION = '1.16'
 
     dbapi = db_api.get_instance()
 
@@ -97,46 +101,58 @@ class Node(base.IronicObject):
     }
 
     @staticmethod
-    def _from_db_object(node, db_node):
-        """Converts a database entity to a formal object."""
-        for field in node.fields:
+    def _from_db_object(node, db_node, fields=None):
+        """Converts a database entity to a formal object.
+
+        :param fields: the fields to set, all of them if None.
+        """
+        for field in fields or node.fields:
             node[field] = db_node[field]
         node.obj_reset_changes()
         return node
 
     @base.remotable_classmethod
-    def get(cls, context, node_id):
+    def get(cls, context, node_id, filters=None):
         """Find a node based on its id or uuid and return a Node object.
 
         :param node_id: the id *or* uuid of a node.
+        :param filters: filters the node must match, see
+                        :meth:`ironic.db.api.Connection.get_nodeinfo_list`.
+        :raises: NodeNotEligible if the node does not match the filters.
         :returns: a :class:`Node` object.
         """
         if strutils.is_int_like(node_id):
-            return cls.get_by_id(context, node_id)
+            return cls.get_by_id(context, node_id, filters=filters)
         elif uuidutils.is_uuid_like(node_id):
-            return cls.get_by_uuid(context, node_id)
+            return cls.get_by_uuid(context, node_id, filters=filters)
         else:
             raise exception.InvalidIdentity(identity=node_id)
 
     @base.remotable_classmethod
-    def get_by_id(cls, context, node_id):
+    def get_by_id(cls, context, node_id, filters=None):
         """Find a node based on its integer id and return a Node object.
 
         :param node_id: the id of a node.
+        :param filters: filters the node must match, see
+                        :meth:`ironic.db.api.Connection.get_nodeinfo_list`.
+        :raises: NodeNotEligible if the node does not match the filters.
         :returns: a :class:`Node` object.
         """
-        db_node = cls.dbapi.get_node_by_id(node_id)
+        db_node = cls.dbapi.get_node_by_id(node_id, filters=filters)
         node = Node._from_db_object(cls(context), db_node)
         return node
 
     @base.remotable_classmethod
-    def get_by_uuid(cls, context, uuid):
+    def get_by_uuid(cls, context, uuid, filters=None):
         """Find a node based on uuid and return a Node object.
 
         :param uuid: the uuid of a node.
+        :param filters: filters the node must match, see
+                        :meth:`ironic.db.api.Connection.get_nodeinfo_list`.
+        :raises: NodeNotEligible if the node does not match the filters.
         :returns: a :class:`Node` object.
         """
-        db_node = cls.dbapi.get_node_by_uuid(uuid)
+        db_node = cls.dbapi.get_node_by_uuid(uuid, filters=filters)
         node = Node._from_db_object(cls(context), db_node)
         return node
 
@@ -164,7 +180,7 @@ class Node(base.IronicObject):
 
     @base.remotable_classmethod
     def list(cls, context, limit=None, marker=None, sort_key=None,
-             sort_dir=None, filters=None):
+             sort_dir=None, filters=None, fields=None):
         """Return a list of Node objects.
 
         :param context: Security context.
@@ -173,16 +189,22 @@ class Node(base.IronicObject):
         :param sort_key: column to sort results by.
         :param sort_dir: direction to sort. "asc" or "desc".
         :param filters: Filters to apply.
+        :param fields: the fields to load from the database, all of them if
+                       None. The other fields of the nodes are not set.
         :returns: a list of :class:`Node` object.
 
         """
+        if fields is not None:
+            # The nodes are identified by their ID
+            fields = sorted(set(fields) | set(['id']))
         db_nodes = cls.dbapi.get_node_list(filters=filters, limit=limit,
                                            marker=marker, sort_key=sort_key,
-                                           sort_dir=sort_dir)
-        return [Node._from_db_object(cls(context), obj) for obj in db_nodes]
+                                           sort_dir=sort_dir, fields=fields)
+        return [Node._from_db_object(cls(context), obj, fields=fields)
+                for obj in db_nodes]
 
     @base.remotable_classmethod
-    def reserve(cls, context, tag, node_id):
+    def reserve(cls, context, tag, node_id, filters=None):
         """Get and reserve a node.
 
         To prevent other ManagerServices from manipulating the given
@@ -191,14 +213,36 @@ class Node(base.IronicObject):
         :param context: Security context.
         :param tag: A string uniquely identifying the reservation holder.
         :param node_id: A node id or uuid.
+        :param filters: Filters the node must match to be reserved, see
+                        :meth:`ironic.db.api.Connection.get_nodeinfo_list`.
         :raises: NodeNotFound if the node is not found.
+        :raises: NodeNotEligible if the node does not match the filters.
         :returns: a :class:`Node` object.
 
         """
-        db_node = cls.dbapi.reserve_node(tag, node_id)
+        db_node = cls.dbapi.reserve_node(tag, node_id, filters=filters)
         node = Node._from_db_object(cls(context), db_node)
         return node
 
+    @base.remotable_classmethod
+    def reserve_many(cls, context, tag, node_ids, filters=None):
+        """Get and reserve the nodes of a list which are not reserved yet.
+
+        Like :meth:`reserve`, for many nodes at once.
+
+        :param context: Security context.
+        :param tag: A string uniquely identifying the reservation holder.
+        :param node_ids: A list of node ids or uuids.
+        :param filters: Filters the nodes must match to be reserved, see
+                        :meth:`ironic.db.api.Connection.get_nodeinfo_list`.
+        :returns: a list of the reserved :class:`Node` objects. The nodes
+                  which are not found, already reserved or do not match the
+                  filters are skipped.
+
+        """
+        db_nodes = cls.dbapi.reserve_nodes(tag, node_ids, filters=filters)
+        return [Node._from_db_object(cls(context), obj) for obj in db_nodes]
+
     @base.remotable_classmethod
     def release(cls, context, tag, node_id):
         """Release the reservation on a node.
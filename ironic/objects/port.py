@@ -37,7 +37,8 @@ class Port(base.IronicObject):
     # Version 1.2: Add create() and destroy()
     # Version 1.3: Add list()
     # Version 1.4: Add list_by_node_id()
-    VERSION = '1.4'
+    # Version 1.5: Add list_by_addresses()
+    VERSION = '1.5'
 
     dbapi = dbapi.get_instance()
 
@@ -114,6 +115,19 @@ class Port(base.IronicObject):
         port = Port._from_db_object(cls(context), db_port)
         return port
 
+    @base.remotable_classmethod
+    def list_by_addresses(cls, context, addresses):
+        """Return a list of Port objects with the given addresses.
+
+        :param context: Security context.
+        :param addresses: a list of MAC addresses.
+        :returns: a list of :class:`Port` object, in no particular order.
+                  The addresses without a port are ignored.
+
+        """
+        db_ports = cls.dbapi.get_ports_by_addresses(addresses)
+        return Port._from_db_object_list(db_ports, cls, context)
+
     @base.remotable_classmethod
     def list(cls, context, limit=None, marker=None,
              sort_key=None, sort_dir=None):
@@ -175,6 +175,14 @@ class TestNoExceptionTracebackHook(base.FunctionalTest):
             response.json['error_message'])['faultstring']
         self.assertEqual(self.MSG_WITH_TRACE, actual_msg)
 
+    def test_hook_success_body_not_read(self):
+        # The body of a streamed response is read by the WSGI server
+        state = mock.Mock()
+        state.response.status_int = http_client.OK
+        type(state.response).body = mock.PropertyMock()
+        hooks.NoExceptionTracebackHook().after(state)
+        self.assertFalse(type(state.response).body.called)
+
 
 class TestContextHook(base.FunctionalTest):
     @mock.patch.object(context, 'RequestContext')
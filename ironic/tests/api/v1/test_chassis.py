@@ -57,6 +57,21 @@ class TestListChassis(test_api_base.FunctionalTest):
         self.assertNotIn('extra', data['chassis'][0])
         self.assertNotIn('nodes', data['chassis'][0])
 
+    def test_etag(self):
+        chassis = obj_utils.create_test_chassis(self.context)
+        for path in ('/chassis/%s' % chassis.uuid, '/chassis/detail'):
+            etag = self.get_json(path, expect_errors=True).headers['ETag']
+            response = self.get_json(path, headers={'If-None-Match': etag},
+                                     expect_errors=True)
+            self.assertEqual(http_client.NOT_MODIFIED, response.status_int)
+            self.assertEqual(b'', response.body)
+
+            chassis.extra = {'foo': path}
+            chassis.save()
+            response = self.get_json(path, headers={'If-None-Match': etag},
+                                     expect_errors=True)
+            self.assertEqual(http_client.OK, response.status_int)
+
     def test_get_one(self):
         chassis = obj_utils.create_test_chassis(self.context)
         data = self.get_json('/chassis/%s' % chassis['uuid'])
@@ -0,0 +1,67 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+from six.moves import http_client
+
+from ironic.api.controllers import base as api_base
+from ironic.conductor import rpcapi
+from ironic.tests.api import base
+
+
+@mock.patch.object(rpcapi.ConductorAPI, 'get_conductor_stats')
+class TestConductorStats(base.FunctionalTest):
+    hostname = 'fake-host'
+
+    def setUp(self):
+        super(TestConductorStats, self).setUp()
+        self.dbapi.register_conductor({'hostname': self.hostname,
+                                       'drivers': ['fake']})
+
+    def test_stats(self, stats_mock):
+        stats = {'locks': {'node deployment': {'acquired': 1}}}
+        stats_mock.return_value = stats
+        data = self.get_json('/conductors/%s/stats' % self.hostname,
+                             headers={api_base.Version.string: "1.13"})
+        self.assertEqual(stats, data)
+        stats_mock.assert_called_once_with(
+            mock.ANY, topic='ironic.conductor_manager.%s' % self.hostname)
+
+    def test_get_one(self, stats_mock):
+        data = self.get_json('/conductors/%s' % self.hostname,
+                             headers={api_base.Version.string: "1.13"})
+        self.assertEqual(self.hostname, data['hostname'])
+        self.assertEqual(['fake'], data['drivers'])
+        self.validate_link(data['links'][0]['href'])
+        self.validate_link(data['links'][1]['href'])
+        self.assertFalse(stats_mock.called)
+
+    def test_get_one_older_version(self, stats_mock):
+        ret = self.get_json('/conductors/%s' % self.hostname,
+                            headers={api_base.Version.string: "1.12"},
+                            expect_errors=True)
+        self.assertEqual(http_client.NOT_ACCEPTABLE, ret.status_code)
+
+    def test_stats_older_version(self, stats_mock):
+        ret = self.get_json('/conductors/%s/stats' % self.hostname,
+                            headers={api_base.Version.string: "1.12"},
+                            expect_errors=True)
+        self.assertEqual(http_client.NOT_ACCEPTABLE, ret.status_code)
+        self.assertFalse(stats_mock.called)
+
+    def test_stats_conductor_not_found(self, stats_mock):
+        ret = self.get_json('/conductors/other-host/stats',
+                            headers={api_base.Version.string: "1.13"},
+                            expect_errors=True)
+        self.assertEqual(http_client.NOT_FOUND, ret.status_code)
+        self.assertTrue(ret.json['error_message'])
+        self.assertFalse(stats_mock.called)
@@ -22,16 +22,20 @@ import mock
 from oslo_config import cfg
 from oslo_utils import timeutils
 from oslo_utils import uuidutils
+import pecan
 import six
 from six.moves import http_client
 from six.moves.urllib import parse as urlparse
 from testtools.matchers import HasLength
+from wsme.rest import json as wsme_json
 from wsme import types as wtypes
 
 from ironic.api.controllers import base as api_base
 from ironic.api.controllers import v1 as api_v1
 from ironic.api.controllers.v1 import node as api_node
+from ironic.api.controllers.v1 import types
 from ironic.api.controllers.v1 import utils as api_utils
+from ironic.api.controllers.v1 import versions
 from ironic.common import boot_devices
 from ironic.common import exception
 from ironic.common import states
@@ -52,6 +56,64 @@ class TestNodeObject(base.TestCase):
         self.assertEqual(wtypes.Unset, node.instance_uuid)
 
 
+class TestNodeCollection(test_api_base.FunctionalTest):
+
+    def setUp(self):
+        super(TestNodeCollection, self).setUp()
+        chassis = obj_utils.create_test_chassis(self.context)
+        obj_utils.create_test_node(
+            self.context, chassis_id=chassis.id, name='node-1',
+            provision_state=states.AVAILABLE,
+            driver_info={'ipmi_address': '1.2.3.4',
+                         'ipmi_password': 'secret'},
+            clean_step={'step': 'erase_devices', 'priority': 10},
+            raid_config={'logical_disks': []},
+            inspection_started_at=datetime.datetime(2000, 1, 1, 12, 0, 0))
+        obj_utils.create_test_node(
+            self.context, uuid=uuidutils.generate_uuid(),
+            chassis_id=chassis.id, maintenance=True,
+            extra={'foo': 'bar', 'baz': [1, 2]})
+
+    def _get_json(self, convert, return_type, fields):
+        nodes = objects.Node.list(self.context,
+                                  fields=api_node.get_db_fields(fields))
+        result = convert(nodes, 2, url='nodes/detail', fields=fields,
+                         sort_key='id', sort_dir='asc')
+        return wsme_json.encode_result(result, return_type)
+
+    @mock.patch.object(pecan, 'request')
+    def test_convert_to_dict(self, mock_request):
+        mock_request.context = self.context
+        mock_request.host_url = 'http://localhost:6385'
+        for minor in range(1, versions.MINOR_MAX_VERSION + 1):
+            for fields in (None, api_node._DEFAULT_RETURN_FIELDS,
+                           ['uuid', 'chassis_uuid', 'driver_info',
+                            'name']):
+                for show_password in (True, False):
+                    mock_request.version.minor = minor
+                    self.context.show_password = show_password
+                    expected = self._get_json(
+                        api_node.NodeCollection.convert_with_links,
+                        api_node.NodeCollection, fields)
+                    result = self._get_json(
+                        api_node.NodeCollection.convert_to_dict,
+                        types.jsontype, fields)
+                    self.assertEqual(expected, result)
+
+    @mock.patch.object(pecan, 'request')
+    def test_convert_to_dict_next_without_uuid(self, mock_request):
+        mock_request.context = self.context
+        mock_request.host_url = 'http://localhost:6385'
+        mock_request.version.minor = versions.MINOR_MAX_VERSION
+        self.context.show_password = True
+        nodes = objects.Node.list(self.context)
+        result = api_node.NodeCollection.convert_to_dict(nodes, 2,
+                                                         fields=['name'])
+        self.assertEqual(['node-1', None],
+                         [n['name'] for n in result['nodes']])
+        self.assertIn('marker=%s' % nodes[-1].uuid, result['next'])
+
+
 class TestListNodes(test_api_base.FunctionalTest):
 
     def setUp(self):
@@ -113,6 +175,88 @@ class TestListNodes(test_api_base.FunctionalTest):
         # never expose the chassis_id
         self.assertNotIn('chassis_id', data['nodes'][0])
 
+    def _get_etag(self, path, etag=None, version=None):
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if version:
+            headers[api_base.Version.string] = version
+        return self.get_json(path, headers=headers, expect_errors=True)
+
+    def test_get_one_etag(self):
+        node = obj_utils.create_test_node(self.context)
+        response = self._get_etag('/nodes/%s' % node.uuid)
+        self.assertEqual(http_client.OK, response.status_int)
+        etag = response.headers['ETag']
+
+        with mock.patch.object(api_node.Node,
+                               'convert_with_links') as mock_convert:
+            response = self._get_etag('/nodes/%s' % node.uuid, etag=etag)
+        self.assertEqual(http_client.NOT_MODIFIED, response.status_int)
+        self.assertEqual(b'', response.body)
+        self.assertEqual(etag, response.headers['ETag'])
+        self.assertFalse(mock_convert.called)
+
+        # The representation depends on the API version
+        response = self._get_etag('/nodes/%s' % node.uuid, etag=etag,
+                                  version=str(api_v1.MAX_VER))
+        self.assertEqual(http_client.OK, response.status_int)
+        self.assertNotEqual(etag, response.headers['ETag'])
+
+        node.power_state = states.POWER_OFF
+        node.save()
+        response = self._get_etag('/nodes/%s' % node.uuid, etag=etag)
+        self.assertEqual(http_client.OK, response.status_int)
+        self.assertEqual(states.POWER_OFF, response.json['power_state'])
+
+    def test_detail_etag(self):
+        nodes = [obj_utils.create_test_node(self.context,
+                                            uuid=uuidutils.generate_uuid())
+                 for i in range(2)]
+        response = self._get_etag('/nodes/detail')
+        etag = response.headers['ETag']
+
+        with mock.patch.object(api_node.NodeCollection,
+                               'convert_to_dict') as mock_convert:
+            response = self._get_etag('/nodes/detail', etag=etag)
+        self.assertEqual(http_client.NOT_MODIFIED, response.status_int)
+        self.assertFalse(mock_convert.called)
+
+        # The representation depends on the query
+        response = self._get_etag('/nodes/detail?limit=1', etag=etag)
+        self.assertEqual(http_client.OK, response.status_int)
+
+        nodes[1].destroy()
+        response = self._get_etag('/nodes/detail', etag=etag)
+        self.assertEqual(http_client.OK, response.status_int)
+        self.assertEqual([nodes[0].uuid],
+                         [n['uuid'] for n in response.json['nodes']])
+
+    def test_detail_stream(self):
+        for i in range(3):
+            obj_utils.create_test_node(self.context,
+                                       uuid=uuidutils.generate_uuid(),
+                                       chassis_id=self.chassis.id,
+                                       driver_info={'ipmi_password': 'pw'})
+        for path in ('/nodes/detail', '/nodes/detail?limit=2'):
+            expected = self.get_json(path)
+            cfg.CONF.set_override('stream_collections', True, 'api')
+            with mock.patch.object(api_node.NodeCollection,
+                                   'convert_to_dict') as mock_convert:
+                response = self.get_json(path, expect_errors=True)
+            cfg.CONF.clear_override('stream_collections', 'api')
+            self.assertEqual(http_client.OK, response.status_int)
+            self.assertEqual('application/json', response.content_type)
+            self.assertEqual(expected, response.json)
+            self.assertFalse(mock_convert.called)
+        self.assertIn('next', expected)
+
+    def test_get_all_etag(self):
+        obj_utils.create_test_node(self.context)
+        etag = self._get_etag('/nodes').headers['ETag']
+        response = self._get_etag('/nodes', etag=etag)
+        self.assertEqual(http_client.NOT_MODIFIED, response.status_int)
+
     def test_get_one(self):
         node = obj_utils.create_test_node(self.context,
                                           chassis_id=self.chassis.id)
@@ -163,6 +307,31 @@ class TestListNodes(test_api_base.FunctionalTest):
             # We always append "links"
             self.assertItemsEqual(['uuid', 'instance_info', 'links'], node)
 
+    @mock.patch.object(objects.Node, 'list')
+    def test_get_collection_custom_fields_projection(self, mock_list):
+        mock_list.return_value = []
+        self.get_json(
+            '/nodes?fields=chassis_uuid,extra,spongebob',
+            headers={api_base.Version.string: str(api_v1.MAX_VER)})
+        # The fields of the entity tag are loaded too
+        self.assertEqual(sorted(set(['chassis_id', 'extra', 'uuid']) |
+                                set(api_node._ETAG_FIELDS)),
+                         mock_list.call_args[1]['fields'])
+
+    @mock.patch.object(objects.Node, 'list')
+    def test_get_all_projection(self, mock_list):
+        mock_list.return_value = []
+        self.get_json('/nodes')
+        self.assertEqual(sorted(set(api_node._DEFAULT_RETURN_FIELDS) |
+                                set(api_node._ETAG_FIELDS)),
+                         mock_list.call_args[1]['fields'])
+
+    @mock.patch.object(objects.Node, 'list')
+    def test_detail_no_projection(self, mock_list):
+        mock_list.return_value = []
+        self.get_json('/nodes/detail')
+        self.assertIsNone(mock_list.call_args[1]['fields'])
+
     def test_get_custom_fields_invalid_fields(self):
         node = obj_utils.create_test_node(self.context,
                                           chassis_id=self.chassis.id)
@@ -197,6 +366,17 @@ class TestListNodes(test_api_base.FunctionalTest):
         self.assertItemsEqual(['driver_info', 'links'], data)
         self.assertEqual('******', data['driver_info']['fake_password'])
 
+    def test_detail_masks_passwords(self):
+        driver_info = {'ipmi_password': 'it\'s "secret"',
+                       'ipmi_address': '1.2.3.4',
+                       'ssh': {'ssh_password': 'secret', 'ssh_port': 22}}
+        obj_utils.create_test_node(self.context, driver_info=driver_info)
+        data = self.get_json('/nodes/detail')
+        self.assertEqual({'ipmi_password': '******',
+                          'ipmi_address': '1.2.3.4',
+                          'ssh': {'ssh_password': '******', 'ssh_port': 22}},
+                         data['nodes'][0]['driver_info'])
+
     def test_detail(self):
         node = obj_utils.create_test_node(self.context,
                                           chassis_id=self.chassis.id)
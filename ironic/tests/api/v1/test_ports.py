@@ -19,11 +19,13 @@ import datetime
 
 import mock
 from oslo_config import cfg
+from oslo_db.sqlalchemy import enginefacade
 from oslo_utils import timeutils
 from oslo_utils import uuidutils
 import six
 from six.moves import http_client
 from six.moves.urllib import parse as urlparse
+from sqlalchemy import event
 from testtools.matchers import HasLength
 from wsme import types as wtypes
 
@@ -77,6 +79,21 @@ class TestListPorts(test_api_base.FunctionalTest):
         # never expose the node_id
         self.assertNotIn('node_id', data['ports'][0])
 
+    def test_etag(self):
+        port = obj_utils.create_test_port(self.context, node_id=self.node.id)
+        for path in ('/ports/%s' % port.uuid, '/ports/detail'):
+            etag = self.get_json(path, expect_errors=True).headers['ETag']
+            response = self.get_json(path, headers={'If-None-Match': etag},
+                                     expect_errors=True)
+            self.assertEqual(http_client.NOT_MODIFIED, response.status_int)
+            self.assertEqual(b'', response.body)
+
+            port.extra = {'foo': path}
+            port.save()
+            response = self.get_json(path, headers={'If-None-Match': etag},
+                                     expect_errors=True)
+            self.assertEqual(http_client.OK, response.status_int)
+
     def test_get_one(self):
         port = obj_utils.create_test_port(self.context, node_id=self.node.id)
         data = self.get_json('/ports/%s' % port.uuid)
@@ -141,6 +158,41 @@ class TestListPorts(test_api_base.FunctionalTest):
         # never expose the node_id
         self.assertNotIn('node_id', data['ports'][0])
 
+    def test_detail_stream(self):
+        for i in range(3):
+            obj_utils.create_test_port(
+                self.context, node_id=self.node.id,
+                uuid=uuidutils.generate_uuid(),
+                address='52:54:00:cf:2d:3%s' % i)
+        for path in ('/ports/detail', '/ports/detail?limit=2'):
+            expected = self.get_json(path)
+            cfg.CONF.set_override('stream_collections', True, 'api')
+            response = self.get_json(path, expect_errors=True)
+            cfg.CONF.clear_override('stream_collections', 'api')
+            self.assertEqual(http_client.OK, response.status_int)
+            self.assertEqual('application/json', response.content_type)
+            self.assertEqual(expected, response.json)
+        self.assertIn('next', expected)
+
+    @mock.patch.object(api_port, '_get_node_uuids', autospec=True)
+    def test_detail_stream_node_not_found(self, get_node_uuids_mock):
+        node = obj_utils.create_test_node(self.context,
+                                          uuid=uuidutils.generate_uuid())
+        port = obj_utils.create_test_port(self.context, node_id=self.node.id)
+        obj_utils.create_test_port(self.context, node_id=node.id,
+                                   uuid=uuidutils.generate_uuid(),
+                                   address='52:54:00:cf:2d:3f')
+        # the second node is deleted after the ports are listed
+        get_node_uuids_mock.return_value = {self.node.id: self.node.uuid}
+        cfg.CONF.set_override('stream_collections', True, 'api')
+        self.addCleanup(cfg.CONF.clear_override, 'stream_collections', 'api')
+        with mock.patch.object(api_port.objects.Node, 'get',
+                               autospec=True) as node_get_mock:
+            data = self.get_json('/ports/detail')
+        self.assertEqual([port.uuid], [p['uuid'] for p in data['ports']])
+        self.assertEqual(self.node.uuid, data['ports'][0]['node_uuid'])
+        self.assertFalse(node_get_mock.called)
+
     def test_detail_against_single(self):
         port = obj_utils.create_test_port(self.context, node_id=self.node.id)
         response = self.get_json('/ports/%s/detail' % port.uuid,
@@ -161,6 +213,41 @@ class TestListPorts(test_api_base.FunctionalTest):
         uuids = [n['uuid'] for n in data['ports']]
         six.assertCountEqual(self, ports, uuids)
 
+    def _count_statements(self, url):
+        statements = []
+        engine = enginefacade.get_legacy_facade().get_engine()
+
+        def count(*args):
+            statements.append(args[2])
+
+        event.listen(engine, 'before_cursor_execute', count)
+        try:
+            data = self.get_json(url)
+        finally:
+            event.remove(engine, 'before_cursor_execute', count)
+        return data, len(statements)
+
+    def test_detail_node_lookups(self):
+        # The nodes of the ports are looked up in a single query per page,
+        # whatever the number of ports and nodes
+        nodes = [self.node] + [
+            obj_utils.create_test_node(self.context,
+                                       uuid=uuidutils.generate_uuid())
+            for i in range(2)]
+        counts = []
+        for i in range(2):
+            for node in nodes:
+                obj_utils.create_test_port(
+                    self.context, node_id=node.id,
+                    uuid=uuidutils.generate_uuid(),
+                    address='52:54:00:cf:2d:%02x' % (node.id * 2 + i))
+            data, count = self._count_statements('/ports/detail')
+            self.assertEqual(
+                sorted(n.uuid for n in nodes for j in range(i + 1)),
+                sorted(p['node_uuid'] for p in data['ports']))
+            counts.append(count)
+        self.assertEqual(counts[0], counts[1])
+
     def test_links(self):
         uuid = uuidutils.generate_uuid()
         obj_utils.create_test_port(self.context,
@@ -35,6 +35,8 @@ from oslo_log import log as logging
 import testtools
 
 from ironic.common import hash_ring
+from ironic.conductor import locks
+from ironic.conductor import timeouts
 from ironic.objects import base as objects_base
 from ironic.tests import conf_fixture
 from ironic.tests import policy_fixture
@@ -109,6 +111,9 @@ class TestCase(testtools.TestCase):
 
         self.addCleanup(self._clear_attrs)
         self.addCleanup(hash_ring.HashRingManager().reset)
+        self.addCleanup(timeouts.ProvisionTimeouts.reset)
+        self.addCleanup(locks.reset_wait_stats)
+        self.addCleanup(locks.reset_lock_stats)
         self.useFixture(fixtures.EnvironmentVariable('http_proxy'))
         self.policy = self.useFixture(policy_fixture.PolicyFixture())
         CONF.set_override('fatal_exception_format_errors', True)
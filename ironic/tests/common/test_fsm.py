@@ -14,7 +14,11 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import mock
+
+from ironic.common import exception
 from ironic.common import fsm
+from ironic.common import states
 from ironic.tests import base
 
 
@@ -27,3 +31,116 @@ class FSMTest(base.TestCase):
         m.add_state('foo', target='working')
         m.default_start_state = 'working'
         m.initialize()
+
+
+class FSMCursorTest(base.TestCase):
+    def setUp(self):
+        super(FSMCursorTest, self).setUp()
+        m = fsm.FSM()
+        m.add_state('available', stable=True)
+        m.add_state('active', stable=True)
+        m.add_state('deploying', target='active')
+        m.add_state('done', terminal=True)
+        m.add_transition('available', 'deploying', 'deploy')
+        m.add_transition('deploying', 'active', 'done')
+        m.add_transition('active', 'done', 'finish')
+        self.table = m.compile()
+
+    def test_process_event(self):
+        c = self.table.cursor()
+        c.initialize('available')
+        self.assertEqual('available', c.current_state)
+        self.assertIsNone(c.target_state)
+        c.process_event('deploy')
+        self.assertEqual('deploying', c.current_state)
+        self.assertEqual('active', c.target_state)
+        c.process_event('done')
+        self.assertEqual('active', c.current_state)
+        self.assertIsNone(c.target_state)
+
+    def test_initialize_target_state(self):
+        c = self.table.cursor()
+        c.initialize('deploying')
+        self.assertEqual('active', c.target_state)
+
+    def test_cursors_are_independent(self):
+        c1 = self.table.cursor()
+        c2 = self.table.cursor()
+        c1.initialize('available')
+        c2.initialize('available')
+        c1.process_event('deploy')
+        self.assertEqual('deploying', c1.current_state)
+        self.assertEqual('available', c2.current_state)
+
+    def test_is_actionable_event(self):
+        c = self.table.cursor()
+        self.assertFalse(c.is_actionable_event('deploy'))
+        c.initialize('available')
+        self.assertTrue(c.is_actionable_event('deploy'))
+        self.assertFalse(c.is_actionable_event('done'))
+
+    def test_initialize_undefined_state(self):
+        c = self.table.cursor()
+        self.assertRaises(exception.InvalidState, c.initialize, 'foo')
+
+    def test_initialize_terminal_state(self):
+        c = self.table.cursor()
+        self.assertRaises(exception.InvalidState, c.initialize, 'done')
+
+    def test_process_event_not_initialized(self):
+        c = self.table.cursor()
+        self.assertRaises(exception.InvalidState, c.process_event, 'deploy')
+        self.assertIsNone(c.current_state)
+
+    def test_process_event_invalid(self):
+        c = self.table.cursor()
+        c.initialize('available')
+        self.assertRaises(exception.InvalidState, c.process_event, 'done')
+        self.assertEqual('available', c.current_state)
+
+    def test_process_event_from_terminal_state(self):
+        c = self.table.cursor()
+        c.initialize('active')
+        c.process_event('finish')
+        self.assertRaises(exception.InvalidState, c.process_event, 'deploy')
+
+    def test_callbacks(self):
+        on_enter = mock.Mock()
+        on_exit = mock.Mock()
+        m = fsm.FSM()
+        m.add_state('a', stable=True, on_exit=on_exit)
+        m.add_state('b', stable=True, on_enter=on_enter)
+        m.add_transition('a', 'b', 'go')
+        c = m.compile().cursor()
+        c.initialize('a')
+        c.process_event('go')
+        on_exit.assert_called_once_with('a', 'go')
+        on_enter.assert_called_once_with('b', 'go')
+
+    def test_compile_copies(self):
+        m = fsm.FSM()
+        m.add_state('a', stable=True)
+        table = m.compile()
+        m.add_state('b', stable=True)
+        self.assertEqual(['a'], table.states)
+
+    def test_same_as_machine(self):
+        # Walking the provision state machine with a cursor or with a copy
+        # of the machine gives the same results.
+        events = set(event for start, event, end in states.machine)
+        for state in states.machine.states:
+            for event in events:
+                m = states.machine.copy()
+                m.initialize(state)
+                c = states.machine_table.cursor()
+                c.initialize(state)
+                self.assertEqual(m.is_actionable_event(event),
+                                 c.is_actionable_event(event))
+                if not m.is_actionable_event(event):
+                    self.assertRaises(exception.InvalidState,
+                                      c.process_event, event)
+                    continue
+                m.process_event(event)
+                c.process_event(event)
+                self.assertEqual(m.current_state, c.current_state)
+                self.assertEqual(m.target_state, c.target_state)
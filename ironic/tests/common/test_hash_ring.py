@@ -197,6 +197,196 @@ class HashRingTestCase(base.TestCase):
         self.assertEqual(['foo'], ring.get_hosts('fake',
                                                  ignore_hosts=['baz']))
 
+    def test_get_hosts_batch(self):
+        hosts = ['foo', 'bar', 'baz']
+        ring = hash_ring.HashRing(hosts, replicas=2)
+        data = ['node-%d' % i for i in range(200)]
+        expected = [ring.get_hosts(d) for d in data]
+        self.assertEqual(expected, ring.get_hosts_batch(data))
+
+    def test_get_hosts_batch_ignore_hosts(self):
+        CONF.set_override('hash_ring_cache_size', 0)
+        hosts = ['foo', 'bar', 'baz']
+        ring = hash_ring.HashRing(hosts, replicas=1)
+        data = ['node-%d' % i for i in range(200)]
+        expected = [ring.get_hosts(d, ignore_hosts=['foo']) for d in data]
+        self.assertEqual(expected,
+                         ring.get_hosts_batch(data, ignore_hosts=['foo']))
+
+    def test_get_hosts_batch_empty(self):
+        ring = hash_ring.HashRing(['foo'])
+        self.assertEqual([], ring.get_hosts_batch([]))
+
+    def test_get_hosts_batch_invalid_data(self):
+        ring = hash_ring.HashRing(['foo', 'bar'])
+        self.assertRaises(exception.Invalid, ring.get_hosts_batch,
+                          ['fake', None])
+
+    def test_get_hosts_cached(self):
+        ring = hash_ring.HashRing(['foo', 'bar'])
+        hosts = ring.get_hosts('fake')
+        with mock.patch.object(ring, '_get_partition',
+                               autospec=True) as partition_mock:
+            self.assertEqual(hosts, ring.get_hosts('fake'))
+            self.assertFalse(partition_mock.called)
+            # ignore_hosts is part of the cache key
+            ring.get_hosts('fake', ignore_hosts=['foo'])
+            partition_mock.assert_called_once_with('fake')
+
+    def test_get_hosts_batch_fills_cache(self):
+        ring = hash_ring.HashRing(['foo', 'bar'])
+        ring.get_hosts_batch(['fake', 'fake-again'])
+        with mock.patch.object(ring, '_get_partition',
+                               autospec=True) as partition_mock:
+            ring.get_hosts('fake')
+            ring.get_hosts('fake-again')
+            self.assertFalse(partition_mock.called)
+
+    def test_get_hosts_cache_is_bounded(self):
+        CONF.set_override('hash_ring_cache_size', 2)
+        ring = hash_ring.HashRing(['foo', 'bar'])
+        ring.get_hosts('a')
+        ring.get_hosts('b')
+        # 'a' becomes the most recently used, so 'b' is evicted
+        ring.get_hosts('a')
+        ring.get_hosts('c')
+        self.assertEqual(2, len(ring._cache))
+        with mock.patch.object(ring, '_get_partition', autospec=True,
+                               return_value=0) as partition_mock:
+            ring.get_hosts('a')
+            ring.get_hosts('b')
+            partition_mock.assert_called_once_with('b')
+
+    def test_get_hosts_cache_disabled(self):
+        CONF.set_override('hash_ring_cache_size', 0)
+        ring = hash_ring.HashRing(['foo', 'bar'])
+        ring.get_hosts('fake')
+        self.assertEqual(0, len(ring._cache))
+
+    def test_get_hosts_returns_a_copy(self):
+        ring = hash_ring.HashRing(['foo', 'bar'])
+        ring.get_hosts('fake').append('baz')
+        self.assertNotIn('baz', ring.get_hosts('fake'))
+
+    def test_hash_key(self):
+        key = hash_ring.hash_key('fake')
+        self.assertEqual(int(hashlib.md5(b'fake').hexdigest()[:8], 16), key)
+
+    def test_hash_key_invalid_data(self):
+        self.assertRaises(exception.Invalid, hash_ring.hash_key, None)
+
+    def _assert_hash_key_ranges(self, ring, hosts):
+        ranges = dict((host, ring.get_hash_key_ranges(host))
+                      for host in hosts)
+
+        def _in_ranges(key, host):
+            return any(first <= key <= last for first, last in ranges[host])
+
+        for i in range(500):
+            data = 'node-%d' % i
+            key = hash_ring.hash_key(data)
+            for host in ring.get_hosts(data):
+                self.assertTrue(_in_ranges(key, host))
+
+    def test_get_hash_key_ranges(self):
+        hosts = ['foo', 'bar', 'baz']
+        ring = hash_ring.HashRing(hosts, replicas=1)
+        self._assert_hash_key_ranges(ring, hosts)
+
+    def test_get_hash_key_ranges_with_replicas(self):
+        hosts = ['foo', 'bar', 'baz']
+        ring = hash_ring.HashRing(hosts, replicas=2)
+        self._assert_hash_key_ranges(ring, hosts)
+
+    def test_get_hash_key_ranges_are_merged(self):
+        ring = hash_ring.HashRing(['foo'], replicas=1)
+        self.assertEqual([(0, 2 ** hash_ring.HASH_KEY_BITS - 1)],
+                         ring.get_hash_key_ranges('foo'))
+
+    def test_get_hash_key_ranges_unknown_host(self):
+        ring = hash_ring.HashRing(['foo', 'bar'])
+        self.assertEqual([], ring.get_hash_key_ranges('baz'))
+
+    def _count_partitions(self, ring):
+        counts = dict((host, 0) for host in ring.hosts)
+        for host in ring._host_hashes.values():
+            counts[host] += 1
+        return counts
+
+    def test_create_ring_weighted(self):
+        ring = hash_ring.HashRing(['foo', 'bar'],
+                                  weights={'foo': 300, 'bar': 100})
+        self.assertEqual({'foo': 300, 'bar': 100}, ring.weights)
+        self.assertEqual({'foo': 48, 'bar': 16}, self._count_partitions(ring))
+
+    def test_create_ring_weighted_default_weight(self):
+        # hosts without a weight are given the average weight
+        ring = hash_ring.HashRing(['foo', 'bar', 'baz'],
+                                  weights={'foo': 300, 'bar': 100})
+        self.assertEqual({'foo': 48, 'bar': 16, 'baz': 32},
+                         self._count_partitions(ring))
+
+    def test_create_ring_weighted_unknown_host(self):
+        ring = hash_ring.HashRing(['foo', 'bar'],
+                                  weights={'foo': 100, 'baz': 300})
+        self.assertEqual({'foo': 32, 'bar': 32}, self._count_partitions(ring))
+
+    def test_create_ring_invalid_weights(self):
+        for weights in ({'foo': 0}, {'foo': -1}, {'foo': None}):
+            self.assertRaises(exception.Invalid,
+                              hash_ring.HashRing,
+                              ['foo', 'bar'], weights=weights)
+
+    def test_create_ring_bounded_loads(self):
+        hosts = ['foo', 'bar', 'baz', 'qux']
+        ring = hash_ring.HashRing(hosts, load_factor=0)
+        self.assertEqual(dict((host, 32) for host in hosts),
+                         self._count_partitions(ring))
+        # the partitions split the hash space evenly
+        step = 2 ** 128 // 128
+        self.assertEqual([i * step for i in range(128)], ring._partitions)
+
+    def test_create_ring_bounded_loads_weighted(self):
+        ring = hash_ring.HashRing(['foo', 'bar'],
+                                  weights={'foo': 300, 'bar': 100},
+                                  load_factor=0)
+        self.assertEqual({'foo': 48, 'bar': 16}, self._count_partitions(ring))
+
+    def test_create_ring_bounded_loads_load_factor(self):
+        hosts = ['host-%d' % i for i in range(5)]
+        ring = hash_ring.HashRing(hosts, load_factor=0.1)
+        counts = self._count_partitions(ring)
+        self.assertEqual(2 ** 5 * 5, sum(counts.values()))
+        # no host gets more than ceil(1.1 * 32) partitions
+        self.assertThat(max(counts.values()), matchers.LessThan(37))
+
+    def test_create_ring_bounded_loads_stable(self):
+        # hosts keep most of their partitions when another host joins
+        hosts = ['host-%d' % i for i in range(4)]
+        ring1 = hash_ring.HashRing(hosts, load_factor=0.25)
+        ring2 = hash_ring.HashRing(hosts + ['host-4'], load_factor=0.25)
+        moved = 0
+        for i in range(1000):
+            data = 'node-%d' % i
+            if ring1.get_hosts(data) != ring2.get_hosts(data):
+                moved += 1
+        self.assertThat(moved, matchers.LessThan(500))
+
+    def test_create_ring_invalid_load_factor(self):
+        for load_factor in (-1, 'foo'):
+            self.assertRaises(exception.Invalid,
+                              hash_ring.HashRing,
+                              ['foo', 'bar'], load_factor=load_factor)
+
+    def test_get_hosts_bounded_loads(self):
+        hosts = ['foo', 'bar', 'baz']
+        ring = hash_ring.HashRing(hosts, weights={'foo': 200},
+                                  load_factor=0.25)
+        data = ['node-%d' % i for i in range(100)]
+        self.assertEqual([ring.get_hosts(d) for d in data],
+                         ring.get_hosts_batch(data))
+        self._assert_hash_key_ranges(ring, hosts)
+
     def test_create_ring_invalid_data(self):
         hosts = None
         self.assertRaises(exception.Invalid,
@@ -249,3 +439,90 @@ class HashRingManagerTestCase(db_base.DbTestCase):
         self.assertRaises(exception.DriverNotFound,
                           self.ring_manager.__getitem__,
                           'driver1')
+
+    def test_hash_ring_manager_refresh(self):
+        self.register_conductors()
+        ring1 = self.ring_manager['driver1']
+        ring2 = self.ring_manager['driver2']
+        generation = self.ring_manager.generation
+        self.dbapi.register_conductor({
+            'hostname': 'host3',
+            'drivers': ['driver2', 'driver3'],
+        })
+        self.assertTrue(self.ring_manager.refresh())
+        self.assertGreater(self.ring_manager.generation, generation)
+        # the ring of driver1 is unchanged and is kept
+        self.assertIs(ring1, self.ring_manager['driver1'])
+        self.assertIsNot(ring2, self.ring_manager['driver2'])
+        self.assertEqual(set(['host1', 'host3']),
+                         self.ring_manager['driver2'].hosts)
+        self.assertEqual(set(['host3']), self.ring_manager['driver3'].hosts)
+
+    def test_hash_ring_manager_refresh_unchanged(self):
+        self.register_conductors()
+        rings = self.ring_manager.ring
+        generation = self.ring_manager.generation
+        self.assertFalse(self.ring_manager.refresh())
+        self.assertEqual(generation, self.ring_manager.generation)
+        self.assertIs(rings, self.ring_manager.ring)
+
+    def test_hash_ring_manager_refresh_driver_removed(self):
+        self.register_conductors()
+        ring1 = self.ring_manager['driver1']
+        self.dbapi.unregister_conductor('host2')
+        self.assertTrue(self.ring_manager.refresh())
+        self.assertIsNot(ring1, self.ring_manager['driver1'])
+        self.assertEqual(set(['host1']), self.ring_manager['driver1'].hosts)
+        self.dbapi.unregister_conductor('host1')
+        self.assertTrue(self.ring_manager.refresh())
+        self.assertEqual({}, self.ring_manager.ring)
+
+    def test_hash_ring_manager_refresh_not_loaded(self):
+        self.register_conductors()
+        generation = self.ring_manager.generation
+        self.assertTrue(self.ring_manager.refresh())
+        self.assertGreater(self.ring_manager.generation, generation)
+        self.assertEqual(set(['driver1', 'driver2']),
+                         set(self.ring_manager.ring))
+
+    def test_hash_ring_manager_weighted(self):
+        self.config(hash_ring_weighted=True, hash_ring_load_factor=0.5)
+        self.dbapi.register_conductor({
+            'hostname': 'host1',
+            'drivers': ['driver1', 'driver2'],
+            'weight': 100,
+        })
+        self.dbapi.register_conductor({
+            'hostname': 'host2',
+            'drivers': ['driver1'],
+        })
+        with mock.patch.object(hash_ring, 'HashRing',
+                               autospec=True) as ring_mock:
+            self.ring_manager.refresh()
+        ring_mock.assert_has_calls(
+            [mock.call(set(['host1', 'host2']), weights={'host1': 100},
+                       load_factor=0.5),
+             mock.call(set(['host1']), weights={'host1': 100},
+                       load_factor=0.5)],
+            any_order=True)
+
+    def test_hash_ring_manager_refresh_weight_changed(self):
+        self.config(hash_ring_weighted=True)
+        self.register_conductors()
+        ring1 = self.ring_manager['driver1']
+        self.dbapi.register_conductor({
+            'hostname': 'host2',
+            'drivers': ['driver1'],
+            'weight': 50,
+        }, update_existing=True)
+        self.assertTrue(self.ring_manager.refresh())
+        self.assertIsNot(ring1, self.ring_manager['driver1'])
+        self.assertEqual({'host2': 50}, self.ring_manager['driver1'].weights)
+
+    def test_hash_ring_manager_reset(self):
+        self.register_conductors()
+        rings = self.ring_manager.ring
+        generation = self.ring_manager.generation
+        self.ring_manager.reset()
+        self.assertGreater(self.ring_manager.generation, generation)
+        self.assertIsNot(rings, self.ring_manager.ring)
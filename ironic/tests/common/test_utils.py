@@ -685,3 +685,72 @@ class GetUpdatedCapabilitiesTestCase(base.TestCase):
         set2 = set(cap_returned.split(','))
         self.assertEqual(set1, set2)
         self.assertIsInstance(cap_returned, str)
+
+
+class MaskSecretsTestCase(base.TestCase):
+
+    def test_mask_secrets(self):
+        value = {'ipmi_address': '1.2.3.4', 'ipmi_password': 'secret',
+                 'drac_password': 1234, 'amt_password': None,
+                 'adminPass': "it's a secret"}
+        self.assertEqual({'ipmi_address': '1.2.3.4',
+                          'ipmi_password': '******',
+                          'drac_password': '******',
+                          'amt_password': None,
+                          'adminPass': '******'},
+                         utils.mask_secrets(value))
+        # The document is copied
+        self.assertEqual('secret', value['ipmi_password'])
+
+    def test_mask_secrets_nested(self):
+        value = {'credentials': [{'user': 'admin', 'password': 'secret'}],
+                 'password': {'ssh_password': 'secret', 'port': 22}}
+        self.assertEqual({'credentials': [{'user': 'admin',
+                                           'password': 'XXX'}],
+                          'password': {'ssh_password': 'XXX', 'port': 22}},
+                         utils.mask_secrets(value, secret='XXX'))
+
+    def test_mask_secrets_in_strings(self):
+        value = {'deploy_args': 'user=admin password=secret'}
+        self.assertEqual({'deploy_args': 'user=admin password=******'},
+                         utils.mask_secrets(value))
+
+
+class LazyJsonDictTestCase(base.TestCase):
+
+    def test_decode_on_access(self):
+        value = utils.LazyJsonDict('{"foo": "bar"}')
+        self.assertFalse(value.is_decoded())
+        self.assertEqual('bar', value['foo'])
+        self.assertTrue(value.is_decoded())
+        self.assertEqual({'foo': 'bar'}, value)
+        self.assertEqual(['foo'], list(value))
+
+    def test_decode_null(self):
+        value = utils.LazyJsonDict('null')
+        self.assertIsNone(value.decode())
+        self.assertTrue(value.is_decoded())
+        self.assertEqual('null', value.encode())
+
+    def test_decode_empty(self):
+        value = utils.LazyJsonDict('{}')
+        self.assertEqual({}, value.decode())
+        self.assertTrue(value.is_decoded())
+        self.assertEqual('{}', value.encode())
+
+    def test_encode_not_decoded(self):
+        encoded = '{"foo":  "bar"}'
+        value = utils.LazyJsonDict(encoded)
+        self.assertIs(encoded, value.encode())
+        self.assertFalse(value.is_decoded())
+
+    def test_encode_mutated(self):
+        value = utils.LazyJsonDict('{"foo": "bar"}')
+        value['spam'] = 'ham'
+        del value['foo']
+        self.assertEqual('{"spam": "ham"}', value.encode())
+
+    def test_equal(self):
+        value = utils.LazyJsonDict('{"foo": "bar"}')
+        self.assertEqual(utils.LazyJsonDict('{"foo":"bar"}'), value)
+        self.assertNotEqual({'foo': 'baz'}, value)
@@ -0,0 +1,129 @@
+# coding=utf-8
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for :mod:`ironic.conductor.locks`."""
+
+import mock
+
+from ironic.conductor import locks
+from ironic.tests import base as tests_base
+
+
+class LockWaitersTestCase(tests_base.TestCase):
+
+    def test_notify(self):
+        waiters = locks.LockWaiters()
+        with waiters.watch('1') as released:
+            self.assertFalse(released.is_set())
+            locks.LockWaiters().notify(1, 'uuid')
+            self.assertTrue(released.is_set())
+        self.assertEqual({}, locks.LockWaiters._entries)
+
+    def test_notify_other_node(self):
+        waiters = locks.LockWaiters()
+        with waiters.watch('uuid1') as released:
+            waiters.notify('uuid2')
+            self.assertFalse(released.is_set())
+
+    def test_watch_shared(self):
+        waiters = locks.LockWaiters()
+        with waiters.watch('uuid') as released1:
+            with waiters.watch('uuid') as released2:
+                self.assertIs(released1, released2)
+            self.assertIn('uuid', locks.LockWaiters._entries)
+        self.assertEqual({}, locks.LockWaiters._entries)
+
+    def test_watch_after_notify(self):
+        waiters = locks.LockWaiters()
+        with waiters.watch('uuid') as released1:
+            waiters.notify('uuid')
+            # A new attempt waits for the next release
+            with waiters.watch('uuid') as released2:
+                self.assertTrue(released1.is_set())
+                self.assertFalse(released2.is_set())
+        self.assertEqual({}, locks.LockWaiters._entries)
+
+
+class GetBackoffTestCase(tests_base.TestCase):
+
+    @mock.patch.object(locks.random, 'uniform', lambda a, b: b)
+    def test_get_backoff_max(self):
+        delays = [locks.get_backoff(i, 4, 7) for i in range(1, 4)]
+        self.assertEqual([1, 2, 4], delays)
+
+    @mock.patch.object(locks.random, 'uniform', lambda a, b: a)
+    def test_get_backoff_min(self):
+        delays = [locks.get_backoff(i, 4, 7) for i in range(1, 4)]
+        self.assertEqual([0.5, 1, 2], delays)
+
+    def test_get_backoff_single_attempt(self):
+        self.assertEqual(0, locks.get_backoff(1, 1, 0))
+
+
+class WaitStatsTestCase(tests_base.TestCase):
+
+    def test_record_wait(self):
+        locks.record_wait('1', 0.5, acquired=True)
+        locks.record_wait(1, 1.5, acquired=False)
+        self.assertEqual({1: {'waits': 2, 'failures': 1, 'wait_time': 2.0,
+                              'max_wait_time': 1.5}},
+                         locks.get_wait_stats())
+
+    @mock.patch.object(locks, '_MAX_NODES_STATS', 2)
+    def test_record_wait_bounded(self):
+        locks.record_wait('uuid1', 1, acquired=True)
+        locks.record_wait('uuid2', 1, acquired=True)
+        locks.record_wait('uuid1', 1, acquired=True)
+        locks.record_wait('uuid3', 1, acquired=True)
+        self.assertEqual(['uuid1', 'uuid3'], sorted(locks.get_wait_stats()))
+
+    def test_reset_wait_stats(self):
+        locks.record_wait('uuid', 1, acquired=True)
+        locks.reset_wait_stats()
+        self.assertEqual({}, locks.get_wait_stats())
+
+
+class LockStatsTestCase(tests_base.TestCase):
+
+    def test_histogram(self):
+        histogram = locks.Histogram(buckets=(1, 10))
+        for value in (0.5, 1, 2, 20):
+            histogram.add(value)
+        self.assertEqual({'count': 4, 'sum': 23.5, 'max': 20,
+                          'buckets': [{'le': 1, 'count': 2},
+                                      {'le': 10, 'count': 1},
+                                      {'le': None, 'count': 1}]},
+                         histogram.as_dict())
+
+    def test_get_lock_stats(self):
+        locks.record_acquired('deploy', 0.5)
+        locks.record_upgrade('deploy')
+        locks.record_released('deploy', 20)
+        locks.record_failed('deploy')
+        locks.record_failed('power')
+        stats = locks.get_lock_stats()
+        self.assertEqual(['deploy', 'power'], sorted(stats))
+        deploy = stats['deploy']
+        self.assertEqual((1, 1, 1), (deploy['acquired'], deploy['failed'],
+                                     deploy['upgrades']))
+        self.assertEqual(0.5, deploy['acquire_time']['sum'])
+        self.assertEqual(20, deploy['hold_time']['max'])
+        self.assertEqual(0, stats['power']['acquired'])
+        self.assertEqual(1, stats['power']['failed'])
+        self.assertEqual(0, stats['power']['hold_time']['count'])
+
+    def test_reset_lock_stats(self):
+        locks.record_failed('deploy')
+        locks.reset_lock_stats()
+        self.assertEqual({}, locks.get_lock_stats())
@@ -19,6 +19,7 @@
 """Test class for Ironic ManagerService."""
 
 import datetime
+import time
 
 import eventlet
 import mock
@@ -26,17 +27,21 @@ from oslo_config import cfg
 from oslo_db import exception as db_exception
 import oslo_messaging as messaging
 from oslo_utils import strutils
+from oslo_utils import timeutils
 from oslo_utils import uuidutils
 
 from ironic.common import boot_devices
 from ironic.common import driver_factory
 from ironic.common import exception
+from ironic.common import hash_ring
 from ironic.common import images
 from ironic.common import states
 from ironic.common import swift
 from ironic.conductor import manager
 from ironic.conductor import task_manager
+from ironic.conductor import timeouts
 from ironic.conductor import utils as conductor_utils
+from ironic.conductor import workers
 from ironic.db import api as dbapi
 from ironic.drivers import base as drivers_base
 from ironic.drivers.modules import fake
@@ -167,6 +172,10 @@ class _ServiceSetUpMixin(object):
 
 
 def _mock_record_keepalive(func_or_class):
+    func_or_class = mock.patch.object(
+        manager.ConductorManager,
+        '_provision_timeouts_loop',
+        lambda: None)(func_or_class)
     return mock.patch.object(
         manager.ConductorManager,
         '_conductor_service_record_keepalive',
@@ -603,6 +612,41 @@ class VendorPassthruTestCase(_ServiceSetUpMixin, tests_db_base.DbTestCase):
         # Verify reservation has been cleared.
         self.assertIsNone(node.reservation)
 
+    @mock.patch.object(task_manager, 'acquire', wraps=task_manager.acquire)
+    @mock.patch.object(task_manager.TaskManager, 'spawn_after')
+    def test_vendor_passthru_exclusive_lock(self, mock_spawn, mock_acquire):
+        node = obj_utils.create_test_node(self.context, driver='fake')
+        info = {'bar': 'baz'}
+        self._start_service()
+
+        self.service.vendor_passthru(self.context, node.uuid, 'first_method',
+                                     'POST', info)
+
+        mock_acquire.assert_called_once_with(self.context, node.uuid,
+                                             shared=False, purpose=mock.ANY)
+
+    @mock.patch.object(task_manager, 'acquire', wraps=task_manager.acquire)
+    @mock.patch.object(task_manager.TaskManager, 'upgrade_lock')
+    @mock.patch.object(task_manager.TaskManager, 'spawn_after')
+    def test_vendor_passthru_shared_lock(self, mock_spawn, mock_upgrade,
+                                         mock_acquire):
+        node = obj_utils.create_test_node(self.context, driver='fake')
+        info = {'bar': 'baz'}
+        self._start_service()
+        route = self.driver.vendor.vendor_routes['first_method']
+        route['require_exclusive_lock'] = False
+        self.addCleanup(route.__setitem__, 'require_exclusive_lock', True)
+
+        response = self.service.vendor_passthru(self.context, node.uuid,
+                                                'first_method', 'POST',
+                                                info)
+
+        self.assertTrue(response['async'])
+        self.assertTrue(mock_spawn.called)
+        self.assertFalse(mock_upgrade.called)
+        mock_acquire.assert_called_once_with(self.context, node.uuid,
+                                             shared=True, purpose=mock.ANY)
+
     def test_vendor_passthru_http_method_not_supported(self):
         node = obj_utils.create_test_node(self.context, driver='fake')
         self._start_service()
@@ -1599,7 +1643,7 @@ class DoNodeCleanTestCase(_ServiceSetUpMixin, tests_db_base.DbTestCase):
 
         self.assertEqual(self.clean_steps, steps)
 
-    @mock.patch('ironic.conductor.manager.ConductorManager._spawn_worker')
+    @mock.patch.object(manager.ConductorManager, '_spawn_callback_worker')
     def test_continue_node_clean_worker_pool_full(self, mock_spawn):
         # Test the appropriate exception is raised if the worker pool is full
         prv_state = states.CLEANWAIT
@@ -1619,7 +1663,7 @@ class DoNodeCleanTestCase(_ServiceSetUpMixin, tests_db_base.DbTestCase):
         self.service._worker_pool.waitall()
         node.refresh()
 
-    @mock.patch('ironic.conductor.manager.ConductorManager._spawn_worker')
+    @mock.patch.object(manager.ConductorManager, '_spawn_callback_worker')
     def test_continue_node_clean_wrong_state(self, mock_spawn):
         # Test the appropriate exception is raised if node isn't already
         # in CLEANWAIT state
@@ -1643,7 +1687,7 @@ class DoNodeCleanTestCase(_ServiceSetUpMixin, tests_db_base.DbTestCase):
         # Verify reservation has been cleared.
         self.assertIsNone(node.reservation)
 
-    @mock.patch('ironic.conductor.manager.ConductorManager._spawn_worker')
+    @mock.patch.object(manager.ConductorManager, '_spawn_callback_worker')
     def _continue_node_clean(self, return_state, mock_spawn):
         # test a node can continue cleaning via RPC
         prv_state = return_state
@@ -2158,6 +2202,21 @@ class MiscTestCase(_ServiceSetUpMixin, _CommonMixIn, tests_db_base.DbTestCase):
         self.assertRaises(exception.DriverNotFound,
                           self.service._get_driver, 'unknown_driver')
 
+    def test_get_conductor_stats(self):
+        self._start_service()
+        node = obj_utils.create_test_node(self.context, driver='fake')
+        with task_manager.acquire(self.context, node.uuid,
+                                  purpose='testing'):
+            pass
+
+        stats = self.service.get_conductor_stats(self.context)
+        self.assertEqual(['lock_waits', 'locks', 'tasks', 'workers'],
+                         sorted(stats))
+        self.assertEqual(1, stats['locks']['testing']['acquired'])
+        self.assertEqual(1, stats['locks']['testing']['hold_time']['count'])
+        self.assertEqual(CONF.conductor.workers_pool_size,
+                         stats['workers']['size'])
+
     def test__mapped_to_this_conductor(self):
         self._start_service()
         n = utils.get_test_node()
@@ -2167,6 +2226,42 @@ class MiscTestCase(_ServiceSetUpMixin, _CommonMixIn, tests_db_base.DbTestCase):
 
                                                                 'otherdriver'))
 
+    def test__map_nodes(self):
+        self._start_service()
+        ring = self.service.ring_manager['fake']
+        nodes = [('uuid1', 'fake'), ('uuid2', 'fake'),
+                 ('uuid3', 'otherdriver')]
+        with mock.patch.object(ring, 'get_hosts_batch',
+                               autospec=True) as batch_mock:
+            self.service._map_nodes(nodes)
+            batch_mock.assert_called_once_with(['uuid1', 'uuid2'])
+
+    def test__map_nodes_more_than_cache_size(self):
+        self.config(hash_ring_cache_size=1)
+        self._start_service()
+        ring = self.service.ring_manager['fake']
+        with mock.patch.object(ring, 'get_hosts_batch',
+                               autospec=True) as batch_mock:
+            self.service._map_nodes([('uuid1', 'fake'), ('uuid2', 'fake')])
+            self.assertFalse(batch_mock.called)
+
+    @mock.patch.object(hash_ring.HashRing, 'get_hash_key_ranges',
+                       autospec=True)
+    def test__get_hash_key_ranges_cached(self, ranges_mock):
+        self._start_service()
+        ranges_mock.return_value = [(0, 1)]
+        self.service.ring_manager.reset()
+        ranges_mock.reset_mock()
+        self.assertEqual({'fake': [(0, 1)]},
+                         self.service._get_hash_key_ranges())
+        self.assertEqual({'fake': [(0, 1)]},
+                         self.service._get_hash_key_ranges())
+        self.assertEqual(1, ranges_mock.call_count)
+        # the cached ranges are dropped when the rings change
+        self.service.ring_manager.reset()
+        self.service._get_hash_key_ranges()
+        self.assertEqual(2, ranges_mock.call_count)
+
     @mock.patch.object(images, 'is_whole_disk_image')
     def test_validate_driver_interfaces(self, mock_iwdi):
         mock_iwdi.return_value = False
@@ -2204,7 +2299,7 @@ class MiscTestCase(_ServiceSetUpMixin, _CommonMixIn, tests_db_base.DbTestCase):
     @mock.patch.object(manager.ConductorManager, '_fail_if_in_state',
                        autospec=True)
     @mock.patch.object(manager.ConductorManager, '_mapped_to_this_conductor')
-    @mock.patch.object(dbapi.IMPL, 'get_nodeinfo_list')
+    @mock.patch.object(dbapi.IMPL, 'iter_nodeinfo')
     def test_iter_nodes(self, mock_nodeinfo_list, mock_mapped,
                         mock_fail_if_state):
         self._start_service()
@@ -2215,16 +2310,49 @@ class MiscTestCase(_ServiceSetUpMixin, _CommonMixIn, tests_db_base.DbTestCase):
         mock_mapped.side_effect = [True, False]
 
         result = list(self.service.iter_nodes(fields=['id'],
-                                              filters=mock.sentinel.filters))
+                                              filters={'reserved': False}))
         self.assertEqual([(nodes[0].uuid, 'fake', 0)], result)
+        # the only conductor is mapped the whole ring
+        filters = {'reserved': False,
+                   'hash_key_ranges': {'fake': [(0, 2 ** 32 - 1)]}}
         mock_nodeinfo_list.assert_called_once_with(
-            columns=self.columns, filters=mock.sentinel.filters)
+            columns=self.columns, filters=filters, batch_size=1000)
         mock_fail_if_state.assert_called_once_with(
             mock.ANY, mock.ANY,
             {'provision_state': 'deploying', 'reserved': False},
             'deploying', 'provision_updated_at',
             last_error=mock.ANY)
 
+    @mock.patch.object(manager.ConductorManager, '_map_nodes')
+    @mock.patch.object(dbapi.IMPL, 'iter_nodeinfo')
+    def test_iter_nodes_batches(self, mock_nodeinfo, mock_map_nodes):
+        self.config(periodic_nodes_batch_size=2, group='conductor')
+        self._start_service()
+        mock_nodeinfo.reset_mock()
+        mock_map_nodes.reset_mock()
+        loaded = []
+
+        def iter_nodeinfo(**kwargs):
+            for i in range(3):
+                loaded.append(i)
+                yield ('uuid%d' % i, 'fake')
+
+        mock_nodeinfo.side_effect = iter_nodeinfo
+        node_iter = self.service.iter_nodes()
+
+        # The first batch is yielded before the next one is loaded
+        self.assertEqual(('uuid0', 'fake'), next(node_iter))
+        self.assertEqual([0, 1], loaded)
+        mock_map_nodes.assert_called_once_with([('uuid0', 'fake'),
+                                                ('uuid1', 'fake')])
+        self.assertEqual([('uuid1', 'fake'), ('uuid2', 'fake')],
+                         list(node_iter))
+        mock_map_nodes.assert_called_with([('uuid2', 'fake')])
+        self.assertEqual(2, mock_map_nodes.call_count)
+        mock_nodeinfo.assert_called_once_with(columns=['uuid', 'driver'],
+                                              filters=mock.ANY,
+                                              batch_size=2)
+
 
 @_mock_record_keepalive
 class ConsoleTestCase(_ServiceSetUpMixin, tests_db_base.DbTestCase):
@@ -2559,7 +2687,7 @@ class UpdatePortTestCase(_ServiceSetUpMixin, tests_db_base.DbTestCase):
         self.assertEqual(expected_result, actual_result)
 
     @mock.patch.object(manager.ConductorManager, '_mapped_to_this_conductor')
-    @mock.patch.object(dbapi.IMPL, 'get_nodeinfo_list')
+    @mock.patch.object(dbapi.IMPL, 'iter_nodeinfo')
     @mock.patch.object(task_manager, 'acquire')
     def test___send_sensor_data(self, acquire_mock, get_nodeinfo_list_mock,
                                 _mapped_to_this_conductor_mock):
@@ -2586,7 +2714,7 @@ class UpdatePortTestCase(_ServiceSetUpMixin, tests_db_base.DbTestCase):
     @mock.patch.object(manager.ConductorManager, '_fail_if_in_state',
                        autospec=True)
     @mock.patch.object(manager.ConductorManager, '_mapped_to_this_conductor')
-    @mock.patch.object(dbapi.IMPL, 'get_nodeinfo_list')
+    @mock.patch.object(dbapi.IMPL, 'iter_nodeinfo')
     @mock.patch.object(task_manager, 'acquire')
     def test___send_sensor_data_disabled(self, acquire_mock,
                                          get_nodeinfo_list_mock,
@@ -2636,6 +2764,27 @@ class UpdatePortTestCase(_ServiceSetUpMixin, tests_db_base.DbTestCase):
         self.assertFalse(get_sensors_data_mock.called)
         self.assertFalse(validate_mock.called)
 
+    def test___send_worker_pool_stats(self):
+        CONF.set_override('send_worker_pool_stats', True, group='conductor')
+        self.service._worker_pool = mock.Mock(spec_set=['get_stats'])
+        self.service._worker_pool.get_stats.return_value = {'size': 10}
+        with mock.patch.object(self.service, 'notifier',
+                               autospec=True) as notifier_mock:
+            self.service._send_worker_pool_stats(self.context)
+        notifier_mock.info.assert_called_once_with(
+            self.context, 'conductor.workers.metrics', mock.ANY)
+        message = notifier_mock.info.call_args[0][2]
+        self.assertEqual('test-host', message['host'])
+        self.assertEqual({'size': 10}, message['payload'])
+
+    def test___send_worker_pool_stats_disabled(self):
+        self.service._worker_pool = mock.Mock(spec_set=['get_stats'])
+        with mock.patch.object(self.service, 'notifier',
+                               autospec=True) as notifier_mock:
+            self.service._send_worker_pool_stats(self.context)
+        self.assertFalse(notifier_mock.info.called)
+        self.assertFalse(self.service._worker_pool.get_stats.called)
+
     def test_set_boot_device(self):
         node = obj_utils.create_test_node(self.context, driver='fake')
         with mock.patch.object(self.driver.management, 'validate') as mock_val:
@@ -2816,24 +2965,39 @@ class ManagerSpawnWorkerTestCase(tests_base.TestCase):
         self.service = manager.ConductorManager('hostname', 'test-topic')
 
     def test__spawn_worker(self):
-        worker_pool = mock.Mock(spec_set=['free', 'spawn'])
-        worker_pool.free.return_value = True
+        worker_pool = mock.Mock(spec_set=['spawn'])
         self.service._worker_pool = worker_pool
 
         self.service._spawn_worker('fake', 1, 2, foo='bar', cat='meow')
 
         worker_pool.spawn.assert_called_once_with(
-            'fake', 1, 2, foo='bar', cat='meow')
+            workers.API, 'fake', 1, 2, foo='bar', cat='meow')
 
     def test__spawn_worker_none_free(self):
-        worker_pool = mock.Mock(spec_set=['free', 'spawn'])
-        worker_pool.free.return_value = False
+        worker_pool = mock.Mock(spec_set=['spawn'])
+        worker_pool.spawn.side_effect = exception.NoFreeConductorWorker()
         self.service._worker_pool = worker_pool
 
         self.assertRaises(exception.NoFreeConductorWorker,
                           self.service._spawn_worker, 'fake')
 
-        self.assertFalse(worker_pool.spawn.called)
+    def test__spawn_callback_worker(self):
+        worker_pool = mock.Mock(spec_set=['spawn'])
+        self.service._worker_pool = worker_pool
+
+        self.service._spawn_callback_worker('fake', 1, foo='bar')
+
+        worker_pool.spawn.assert_called_once_with(
+            workers.CALLBACK, 'fake', 1, foo='bar')
+
+    def test__spawn_periodic_worker(self):
+        worker_pool = mock.Mock(spec_set=['spawn'])
+        self.service._worker_pool = worker_pool
+
+        self.service._spawn_periodic_worker('fake', 1, foo='bar')
+
+        worker_pool.spawn.assert_called_once_with(
+            workers.PERIODIC, 'fake', 1, foo='bar')
 
 
 @mock.patch.object(conductor_utils, 'node_power_action')
@@ -2914,6 +3078,29 @@ class ManagerDoSyncPowerStateTestCase(tests_db_base.DbTestCase):
         self.assertEqual(1,
                          self.service.power_state_sync_count[self.node.uuid])
 
+    def test_known_power_state(self, node_power_action):
+        self.node.power_state = states.POWER_ON
+
+        count = manager.do_sync_power_state(self.task, 0,
+                                            power_state=states.POWER_OFF)
+
+        self.assertEqual(1, count)
+        self.assertFalse(self.power.get_power_state.called)
+        self.node.save.assert_called_once_with()
+        self.assertEqual(states.POWER_OFF, self.node.power_state)
+        self.task.upgrade_lock.assert_called_once_with()
+
+    def test_known_power_state_exception(self, node_power_action):
+        self.node.power_state = states.POWER_ON
+
+        count = manager.do_sync_power_state(
+            self.task, 0, power_state=exception.IronicException('foo'))
+
+        self.assertEqual(1, count)
+        self.assertFalse(self.power.get_power_state.called)
+        self.assertFalse(self.node.save.called)
+        self.assertEqual(states.POWER_ON, self.node.power_state)
+
     def test_get_power_state_error(self, node_power_action):
         self._do_sync_power_state('fake', states.ERROR)
         self.assertFalse(self.power.validate.called)
@@ -3080,14 +3267,17 @@ class ManagerDoSyncPowerStateTestCase(tests_db_base.DbTestCase):
 @mock.patch.object(manager, 'do_sync_power_state')
 @mock.patch.object(task_manager, 'acquire')
 @mock.patch.object(manager.ConductorManager, '_mapped_to_this_conductor')
-@mock.patch.object(dbapi.IMPL, 'get_nodeinfo_list')
+@mock.patch.object(dbapi.IMPL, 'iter_nodeinfo')
 class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_db_base.DbTestCase):
     def setUp(self):
         super(ManagerSyncPowerStatesTestCase, self).setUp()
         self.service = manager.ConductorManager('hostname', 'test-topic')
         self.service.dbapi = self.dbapi
+        self.service.ring_manager = mock.Mock(ring={})
         self.node = self._create_node()
-        self.filters = {'reserved': False, 'maintenance': False}
+        self.filters = dict(manager.SYNC_POWER_STATE_FILTERS,
+                            reserved=False, hash_key_ranges=mock.ANY)
+        self.filters_acquire = manager.SYNC_POWER_STATE_FILTERS
         self.columns = ['uuid', 'driver', 'id']
 
     def test_node_not_mapped(self, get_nodeinfo_mock,
@@ -3098,7 +3288,8 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_db_base.DbTestCase):
         self.service._sync_power_states(self.context)
 
         get_nodeinfo_mock.assert_called_once_with(
-            columns=self.columns, filters=self.filters)
+            columns=self.columns, filters=self.filters,
+            batch_size=1000)
         mapped_mock.assert_called_once_with(self.node.uuid,
                                             self.node.driver)
         self.assertFalse(acquire_mock.called)
@@ -3114,96 +3305,36 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_db_base.DbTestCase):
         self.service._sync_power_states(self.context)
 
         get_nodeinfo_mock.assert_called_once_with(
-            columns=self.columns, filters=self.filters)
-        mapped_mock.assert_called_once_with(self.node.uuid,
-                                            self.node.driver)
-        acquire_mock.assert_called_once_with(self.context, self.node.uuid,
-                                             purpose=mock.ANY,
-                                             shared=True)
-        self.assertFalse(sync_mock.called)
-
-    def test_node_in_deploywait_on_acquire(self, get_nodeinfo_mock,
-                                           mapped_mock, acquire_mock,
-                                           sync_mock):
-        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        mapped_mock.return_value = True
-        task = self._create_task(
-            node_attrs=dict(provision_state=states.DEPLOYWAIT,
-                            target_provision_state=states.ACTIVE,
-                            uuid=self.node.uuid))
-        acquire_mock.side_effect = self._get_acquire_side_effect(task)
-
-        self.service._sync_power_states(self.context)
-
-        get_nodeinfo_mock.assert_called_once_with(
-            columns=self.columns, filters=self.filters)
-        mapped_mock.assert_called_once_with(self.node.uuid,
-                                            self.node.driver)
-        acquire_mock.assert_called_once_with(self.context, self.node.uuid,
-                                             purpose=mock.ANY,
-                                             shared=True)
-        self.assertFalse(sync_mock.called)
-
-    def test_node_in_enroll_on_acquire(self, get_nodeinfo_mock, mapped_mock,
-                                       acquire_mock, sync_mock):
-        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        mapped_mock.return_value = True
-        task = self._create_task(
-            node_attrs=dict(provision_state=states.ENROLL,
-                            target_provision_state=states.NOSTATE,
-                            uuid=self.node.uuid))
-        acquire_mock.side_effect = self._get_acquire_side_effect(task)
-
-        self.service._sync_power_states(self.context)
-
-        get_nodeinfo_mock.assert_called_once_with(
-            columns=self.columns, filters=self.filters)
-        mapped_mock.assert_called_once_with(self.node.uuid,
-                                            self.node.driver)
-        acquire_mock.assert_called_once_with(self.context, self.node.uuid,
-                                             purpose=mock.ANY,
-                                             shared=True)
-        self.assertFalse(sync_mock.called)
-
-    def test_node_in_power_transition_on_acquire(self, get_nodeinfo_mock,
-                                                 mapped_mock, acquire_mock,
-                                                 sync_mock):
-        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        mapped_mock.return_value = True
-        task = self._create_task(
-            node_attrs=dict(target_power_state=states.POWER_ON,
-                            uuid=self.node.uuid))
-        acquire_mock.side_effect = self._get_acquire_side_effect(task)
-
-        self.service._sync_power_states(self.context)
-
-        get_nodeinfo_mock.assert_called_once_with(
-            columns=self.columns, filters=self.filters)
+            columns=self.columns, filters=self.filters,
+            batch_size=1000)
         mapped_mock.assert_called_once_with(self.node.uuid,
                                             self.node.driver)
         acquire_mock.assert_called_once_with(self.context, self.node.uuid,
                                              purpose=mock.ANY,
-                                             shared=True)
+                                             shared=True,
+                                             filters=self.filters_acquire)
         self.assertFalse(sync_mock.called)
 
-    def test_node_in_maintenance_on_acquire(self, get_nodeinfo_mock,
-                                            mapped_mock, acquire_mock,
-                                            sync_mock):
+    def test_node_not_eligible_on_acquire(self, get_nodeinfo_mock,
+                                          mapped_mock, acquire_mock,
+                                          sync_mock):
+        # e.g. the node moved to DEPLOYWAIT or maintenance after listing
         get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
         mapped_mock.return_value = True
-        task = self._create_task(
-            node_attrs=dict(maintenance=True, uuid=self.node.uuid))
-        acquire_mock.side_effect = self._get_acquire_side_effect(task)
+        acquire_mock.side_effect = exception.NodeNotEligible(
+            node=self.node.uuid)
 
         self.service._sync_power_states(self.context)
 
         get_nodeinfo_mock.assert_called_once_with(
-            columns=self.columns, filters=self.filters)
+            columns=self.columns, filters=self.filters,
+            batch_size=1000)
         mapped_mock.assert_called_once_with(self.node.uuid,
                                             self.node.driver)
         acquire_mock.assert_called_once_with(self.context, self.node.uuid,
                                              purpose=mock.ANY,
-                                             shared=True)
+                                             shared=True,
+                                             filters=self.filters_acquire)
         self.assertFalse(sync_mock.called)
 
     def test_node_disappears_on_acquire(self, get_nodeinfo_mock,
@@ -3216,12 +3347,14 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_db_base.DbTestCase):
         self.service._sync_power_states(self.context)
 
         get_nodeinfo_mock.assert_called_once_with(
-            columns=self.columns, filters=self.filters)
+            columns=self.columns, filters=self.filters,
+            batch_size=1000)
         mapped_mock.assert_called_once_with(self.node.uuid,
                                             self.node.driver)
         acquire_mock.assert_called_once_with(self.context, self.node.uuid,
                                              purpose=mock.ANY,
-                                             shared=True)
+                                             shared=True,
+                                             filters=self.filters_acquire)
         self.assertFalse(sync_mock.called)
 
     def test_single_node(self, get_nodeinfo_mock,
@@ -3234,13 +3367,15 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_db_base.DbTestCase):
         self.service._sync_power_states(self.context)
 
         get_nodeinfo_mock.assert_called_once_with(
-            columns=self.columns, filters=self.filters)
+            columns=self.columns, filters=self.filters,
+            batch_size=1000)
         mapped_mock.assert_called_once_with(self.node.uuid,
                                             self.node.driver)
         acquire_mock.assert_called_once_with(self.context, self.node.uuid,
                                              purpose=mock.ANY,
-                                             shared=True)
-        sync_mock.assert_called_once_with(task, mock.ANY)
+                                             shared=True,
+                                             filters=self.filters_acquire)
+        sync_mock.assert_called_once_with(task, mock.ANY, power_state=None)
 
     def test__sync_power_state_multiple_nodes(self, get_nodeinfo_mock,
                                               mapped_mock, acquire_mock,
@@ -3248,9 +3383,9 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_db_base.DbTestCase):
         # Create 8 nodes:
         # 1st node: Should acquire and try to sync
         # 2nd node: Not mapped to this conductor
-        # 3rd node: In DEPLOYWAIT provision_state
-        # 4th node: In maintenance mode
-        # 5th node: Is in power transition
+        # 3rd node: Moved to DEPLOYWAIT provision_state
+        # 4th node: Moved to maintenance mode
+        # 5th node: Started a power transition
         # 6th node: Disappears after getting nodeinfo list
         # 7th node: Should acquire and try to sync
         # 8th node: do_sync_power_state raises NodeLocked
@@ -3275,6 +3410,10 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_db_base.DbTestCase):
 
         tasks = [self._create_task(node_attrs=node_attrs[x.uuid])
                  for x in nodes if x.id != 2]
+        # not eligible during acquire (1-3 = index of Node3-5 after
+        # removing Node2)
+        for i in range(1, 4):
+            tasks[i] = exception.NodeNotEligible(node=i + 2)
         # not found during acquire (4 = index of Node6 after removing Node2)
         tasks[4] = exception.NodeNotFound(node=6)
         sync_results = [0] * 7 + [exception.NodeLocked(node=8, host='')]
@@ -3292,23 +3431,180 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_db_base.DbTestCase):
             self.assertEqual(len(nodes) - 1, sleep_mock.call_count)
 
         get_nodeinfo_mock.assert_called_once_with(
-            columns=self.columns, filters=self.filters)
+            columns=self.columns, filters=self.filters,
+            batch_size=1000)
         mapped_calls = [mock.call(x.uuid, x.driver) for x in nodes]
         self.assertEqual(mapped_calls, mapped_mock.call_args_list)
         acquire_calls = [mock.call(self.context, x.uuid,
                                    purpose=mock.ANY,
-                                   shared=True)
+                                   shared=True,
+                                   filters=self.filters_acquire)
                          for x in nodes if x.id != 2]
         self.assertEqual(acquire_calls, acquire_mock.call_args_list)
         # Nodes 1 and 7 (5 = index of Node7 after removing Node2)
-        sync_calls = [mock.call(tasks[0], mock.ANY),
-                      mock.call(tasks[5], mock.ANY)]
+        sync_calls = [mock.call(tasks[0], mock.ANY, power_state=None),
+                      mock.call(tasks[5], mock.ANY, power_state=None)]
         self.assertEqual(sync_calls, sync_mock.call_args_list)
 
+    @mock.patch.object(manager, 'LOG')
+    def test_cycle_stats(self, log_mock, get_nodeinfo_mock, mapped_mock,
+                         acquire_mock, sync_mock):
+        # 1st node: synced, 2nd node: failed to sync, 3rd node: locked,
+        # 4th node: unexpected error
+        nodes = [self._create_node(id=i, uuid=uuidutils.generate_uuid())
+                 for i in range(1, 5)]
+        tasks = [self._create_task(node_attrs=dict(uuid=n.uuid))
+                 for n in nodes]
+        tasks[2] = exception.NodeLocked(node=nodes[2].uuid, host='fake')
+        get_nodeinfo_mock.return_value = (
+            self._get_nodeinfo_list_response(nodes))
+        mapped_mock.return_value = True
+        acquire_mock.side_effect = self._get_acquire_side_effect(tasks)
+        sync_mock.side_effect = [0, 1, Exception('boom')]
+
+        self.service._sync_power_states(self.context)
+
+        self.assertEqual(3, sync_mock.call_count)
+        self.assertNotIn(nodes[0].uuid, self.service.power_state_sync_count)
+        self.assertEqual(1, self.service.power_state_sync_count[nodes[1].uuid])
+        self.assertTrue(log_mock.exception.called)
+        stats = log_mock.info.call_args[0][1]
+        self.assertEqual(4, stats['total'])
+        self.assertEqual(1, stats['synced'])
+        self.assertEqual(1, stats['skipped'])
+        self.assertEqual(2, stats['failed'])
+        self.assertFalse(log_mock.warning.called)
+
+    @mock.patch.object(task_manager, 'acquire_many')
+    @mock.patch.object(manager.ConductorManager,
+                       '_supports_get_power_states')
+    def test_batched_nodes(self, supports_mock, acquire_many_mock,
+                           get_nodeinfo_mock, mapped_mock, acquire_mock,
+                           sync_mock):
+        self.config(sync_power_state_batch_size=2, group='conductor')
+        supports_mock.return_value = True
+        # 1st node: synced, 2nd node: locked or not eligible,
+        # 3rd and 4th nodes: synced in a second batch
+        nodes = [self._create_node(id=i, uuid=uuidutils.generate_uuid(),
+                                   driver='fake')
+                 for i in range(1, 5)]
+        tasks = []
+        for node in nodes:
+            task = mock.Mock(spec_set=['node', 'driver',
+                                       'release_resources'])
+            task.node = node
+            task.driver.power.get_power_states.side_effect = (
+                lambda tasks: dict((t.node.uuid, states.POWER_ON)
+                                   for t in tasks))
+            tasks.append(task)
+        get_nodeinfo_mock.return_value = (
+            self._get_nodeinfo_list_response(nodes))
+        mapped_mock.return_value = True
+        acquire_many_mock.side_effect = [[tasks[0]], tasks[2:]]
+        sync_mock.return_value = 0
+
+        self.service._sync_power_states(self.context)
+
+        acquire_calls = [mock.call(self.context, [nodes[0].uuid,
+                                                  nodes[1].uuid],
+                                   purpose=mock.ANY,
+                                   filters=self.filters_acquire),
+                         mock.call(self.context, [nodes[2].uuid,
+                                                  nodes[3].uuid],
+                                   purpose=mock.ANY,
+                                   filters=self.filters_acquire)]
+        self.assertEqual(acquire_calls, acquire_many_mock.call_args_list)
+        self.assertFalse(acquire_mock.called)
+        tasks[0].driver.power.get_power_states.assert_called_once_with(
+            [tasks[0]])
+        tasks[2].driver.power.get_power_states.assert_called_once_with(
+            tasks[2:])
+        sync_calls = [mock.call(tasks[i], 0, power_state=states.POWER_ON)
+                      for i in (0, 2, 3)]
+        self.assertEqual(sync_calls, sync_mock.call_args_list)
+        for i in (0, 2, 3):
+            tasks[i].release_resources.assert_called_once_with()
+        self.assertFalse(tasks[1].release_resources.called)
+
+    @mock.patch.object(task_manager, 'acquire_many')
+    @mock.patch.object(manager.ConductorManager,
+                       '_supports_get_power_states')
+    def test_batched_nodes_get_power_states_fails(self, supports_mock,
+                                                  acquire_many_mock,
+                                                  get_nodeinfo_mock,
+                                                  mapped_mock, acquire_mock,
+                                                  sync_mock):
+        supports_mock.return_value = True
+        task = mock.Mock(spec_set=['node', 'driver', 'release_resources'])
+        task.node = self.node
+        error = exception.IronicException('boom')
+        task.driver.power.get_power_states.side_effect = error
+        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
+        mapped_mock.return_value = True
+        acquire_many_mock.return_value = [task]
+        sync_mock.return_value = 1
+
+        self.service._sync_power_states(self.context)
+
+        sync_mock.assert_called_once_with(task, 0, power_state=error)
+        self.assertEqual(1,
+                         self.service.power_state_sync_count[self.node.uuid])
+        task.release_resources.assert_called_once_with()
+
+    @mock.patch.object(manager, 'LOG')
+    @mock.patch.object(task_manager, 'acquire_many')
+    @mock.patch.object(manager.ConductorManager,
+                       '_supports_get_power_states')
+    def test_batched_nodes_acquire_fails(self, supports_mock,
+                                         acquire_many_mock, log_mock,
+                                         get_nodeinfo_mock, mapped_mock,
+                                         acquire_mock, sync_mock):
+        supports_mock.return_value = True
+        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
+        mapped_mock.return_value = True
+        acquire_many_mock.side_effect = exception.DriverNotFound(
+            driver_name='fake')
+
+        self.service._sync_power_states(self.context)
+
+        self.assertFalse(sync_mock.called)
+        self.assertTrue(log_mock.exception.called)
+        stats = log_mock.info.call_args[0][1]
+        self.assertEqual(1, stats['failed'])
+
+    def test_concurrency_is_bounded(self, get_nodeinfo_mock, mapped_mock,
+                                    acquire_mock, sync_mock):
+        self.config(sync_power_state_workers=3, group='conductor')
+        nodes = [self._create_node(id=i, uuid=uuidutils.generate_uuid())
+                 for i in range(1, 9)]
+        tasks = [self._create_task(node_attrs=dict(uuid=n.uuid))
+                 for n in nodes]
+        get_nodeinfo_mock.return_value = (
+            self._get_nodeinfo_list_response(nodes))
+        mapped_mock.return_value = True
+        acquire_mock.side_effect = self._get_acquire_side_effect(tasks)
+
+        running = {'now': 0, 'max': 0}
+
+        def _fake_sync(task, count, power_state=None):
+            running['now'] += 1
+            running['max'] = max(running['max'], running['now'])
+            # Simulate waiting for the BMC
+            eventlet.sleep(0.01)
+            running['now'] -= 1
+            return 0
+
+        sync_mock.side_effect = _fake_sync
+
+        self.service._sync_power_states(self.context)
+
+        self.assertEqual(len(nodes), sync_mock.call_count)
+        self.assertEqual(3, running['max'])
+
 
 @mock.patch.object(task_manager, 'acquire')
 @mock.patch.object(manager.ConductorManager, '_mapped_to_this_conductor')
-@mock.patch.object(dbapi.IMPL, 'get_nodeinfo_list')
+@mock.patch.object(dbapi.IMPL, 'iter_nodeinfo')
 class ManagerCheckDeployTimeoutsTestCase(_CommonMixIn,
                                          tests_db_base.DbTestCase):
     def setUp(self):
@@ -3316,6 +3612,7 @@ class ManagerCheckDeployTimeoutsTestCase(_CommonMixIn,
         self.config(deploy_callback_timeout=300, group='conductor')
         self.service = manager.ConductorManager('hostname', 'test-topic')
         self.service.dbapi = self.dbapi
+        self.service.ring_manager = mock.Mock(ring={})
 
         self.node = self._create_node(provision_state=states.DEPLOYWAIT,
                                       target_provision_state=states.ACTIVE)
@@ -3327,12 +3624,15 @@ class ManagerCheckDeployTimeoutsTestCase(_CommonMixIn,
 
         self.filters = {'reserved': False, 'maintenance': False,
                         'provisioned_before': 300,
-                        'provision_state': states.DEPLOYWAIT}
+                        'provision_state': states.DEPLOYWAIT,
+                        'hash_key_ranges': mock.ANY}
+        self.acquire_filters = {'maintenance': False,
+                                'provision_state': states.DEPLOYWAIT}
         self.columns = ['uuid', 'driver']
 
     def _assert_get_nodeinfo_args(self, get_nodeinfo_mock):
         get_nodeinfo_mock.assert_called_once_with(
-            columns=self.columns, filters=self.filters,
+            columns=self.columns, filters=self.filters, batch_size=1000,
             sort_key='provision_updated_at', sort_dir='asc')
 
     def test_disabled(self, get_nodeinfo_mock, mapped_mock,
@@ -3365,10 +3665,11 @@ class ManagerCheckDeployTimeoutsTestCase(_CommonMixIn,
         self._assert_get_nodeinfo_args(get_nodeinfo_mock)
         mapped_mock.assert_called_once_with(self.node.uuid, self.node.driver)
         acquire_mock.assert_called_once_with(self.context, self.node.uuid,
-                                             purpose=mock.ANY)
+                                             purpose=mock.ANY,
+                                             filters=self.acquire_filters)
         self.task.process_event.assert_called_with(
             'fail',
-            callback=self.service._spawn_worker,
+            callback=self.service._spawn_periodic_worker,
             call_args=(conductor_utils.cleanup_after_timeout, self.task),
             err_handler=manager.provisioning_error_handler)
 
@@ -3386,7 +3687,8 @@ class ManagerCheckDeployTimeoutsTestCase(_CommonMixIn,
             self.node.uuid, self.node.driver)
         acquire_mock.assert_called_once_with(self.context,
                                              self.node.uuid,
-                                             purpose=mock.ANY)
+                                             purpose=mock.ANY,
+                                             filters=self.acquire_filters)
         self.assertFalse(self.task.spawn_after.called)
 
     def test_acquire_node_locked(self, get_nodeinfo_mock, mapped_mock,
@@ -3404,7 +3706,8 @@ class ManagerCheckDeployTimeoutsTestCase(_CommonMixIn,
             self.node.uuid, self.node.driver)
         acquire_mock.assert_called_once_with(self.context,
                                              self.node.uuid,
-                                             purpose=mock.ANY)
+                                             purpose=mock.ANY,
+                                             filters=self.acquire_filters)
         self.assertFalse(self.task.spawn_after.called)
 
     def test_no_deploywait_after_lock(self, get_nodeinfo_mock, mapped_mock,
@@ -3414,7 +3717,8 @@ class ManagerCheckDeployTimeoutsTestCase(_CommonMixIn,
                             uuid=self.node.uuid))
         get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
         mapped_mock.return_value = True
-        acquire_mock.side_effect = self._get_acquire_side_effect(task)
+        acquire_mock.side_effect = exception.NodeNotEligible(
+            node=self.node.uuid)
 
         self.service._check_deploy_timeouts(self.context)
 
@@ -3423,7 +3727,8 @@ class ManagerCheckDeployTimeoutsTestCase(_CommonMixIn,
             self.node.uuid, self.node.driver)
         acquire_mock.assert_called_once_with(self.context,
                                              self.node.uuid,
-                                             purpose=mock.ANY)
+                                             purpose=mock.ANY,
+                                             filters=self.acquire_filters)
         self.assertFalse(task.spawn_after.called)
 
     def test_maintenance_after_lock(self, get_nodeinfo_mock, mapped_mock,
@@ -3436,8 +3741,8 @@ class ManagerCheckDeployTimeoutsTestCase(_CommonMixIn,
         get_nodeinfo_mock.return_value = (
             self._get_nodeinfo_list_response([task.node, self.node2]))
         mapped_mock.return_value = True
-        acquire_mock.side_effect = (
-            self._get_acquire_side_effect([task, self.task2]))
+        acquire_mock.side_effect = self._get_acquire_side_effect(
+            [exception.NodeNotEligible(node=self.node.uuid), self.task2])
 
         self.service._check_deploy_timeouts(self.context)
 
@@ -3446,16 +3751,18 @@ class ManagerCheckDeployTimeoutsTestCase(_CommonMixIn,
                           mock.call(self.node2.uuid, self.node2.driver)],
                          mapped_mock.call_args_list)
         self.assertEqual([mock.call(self.context, self.node.uuid,
-                                    purpose=mock.ANY),
+                                    purpose=mock.ANY,
+                                    filters=self.acquire_filters),
                           mock.call(self.context, self.node2.uuid,
-                                    purpose=mock.ANY)],
+                                    purpose=mock.ANY,
+                                    filters=self.acquire_filters)],
                          acquire_mock.call_args_list)
         # First node skipped
         self.assertFalse(task.spawn_after.called)
         # Second node spawned
         self.task2.process_event.assert_called_with(
             'fail',
-            callback=self.service._spawn_worker,
+            callback=self.service._spawn_periodic_worker,
             call_args=(conductor_utils.cleanup_after_timeout, self.task2),
             err_handler=manager.provisioning_error_handler)
 
@@ -3477,10 +3784,11 @@ class ManagerCheckDeployTimeoutsTestCase(_CommonMixIn,
             self.node.uuid, self.node.driver)
         acquire_mock.assert_called_once_with(self.context,
                                              self.node.uuid,
-                                             purpose=mock.ANY)
+                                             purpose=mock.ANY,
+                                             filters=self.acquire_filters)
         self.task.process_event.assert_called_with(
             'fail',
-            callback=self.service._spawn_worker,
+            callback=self.service._spawn_periodic_worker,
             call_args=(conductor_utils.cleanup_after_timeout, self.task),
             err_handler=manager.provisioning_error_handler)
 
@@ -3503,10 +3811,11 @@ class ManagerCheckDeployTimeoutsTestCase(_CommonMixIn,
         mapped_mock.assert_called_once_with(self.node.uuid, self.node.driver)
         acquire_mock.assert_called_once_with(self.context,
                                              self.node.uuid,
-                                             purpose=mock.ANY)
+                                             purpose=mock.ANY,
+                                             filters=self.acquire_filters)
         self.task.process_event.assert_called_with(
             'fail',
-            callback=self.service._spawn_worker,
+            callback=self.service._spawn_periodic_worker,
             call_args=(conductor_utils.cleanup_after_timeout, self.task),
             err_handler=manager.provisioning_error_handler)
 
@@ -3528,11 +3837,12 @@ class ManagerCheckDeployTimeoutsTestCase(_CommonMixIn,
         self.assertEqual([mock.call(self.node.uuid, self.node.driver)] * 2,
                          mapped_mock.call_args_list)
         self.assertEqual([mock.call(self.context, self.node.uuid,
-                                    purpose=mock.ANY)] * 2,
+                                    purpose=mock.ANY,
+                                    filters=self.acquire_filters)] * 2,
                          acquire_mock.call_args_list)
         process_event_call = mock.call(
             'fail',
-            callback=self.service._spawn_worker,
+            callback=self.service._spawn_periodic_worker,
             call_args=(conductor_utils.cleanup_after_timeout, self.task),
             err_handler=manager.provisioning_error_handler)
         self.assertEqual([process_event_call] * 2,
@@ -3554,6 +3864,245 @@ class ManagerCheckDeployTimeoutsTestCase(_CommonMixIn,
         self.assertFalse(mac_update_mock.called)
 
 
+class ManagerProvisionTimeoutsTestCase(_ServiceSetUpMixin,
+                                       tests_db_base.DbTestCase):
+    def setUp(self):
+        super(ManagerProvisionTimeoutsTestCase, self).setUp()
+        self.config(deploy_callback_timeout=300, group='conductor')
+        self.config(clean_callback_timeout=0, group='conductor')
+        self.timeouts = timeouts.ProvisionTimeouts()
+
+    def _create_deploywait_node(self, minutes_ago):
+        updated_at = timeutils.utcnow() - datetime.timedelta(
+            minutes=minutes_ago)
+        return obj_utils.create_test_node(
+            self.context, driver='fake', uuid=uuidutils.generate_uuid(),
+            provision_state=states.DEPLOYWAIT,
+            target_provision_state=states.ACTIVE,
+            provision_updated_at=updated_at)
+
+    @_mock_record_keepalive
+    def test_init_host_configures_timeouts(self):
+        self._start_service()
+        self.assertIsNotNone(self.service._provision_timeouts)
+        self.assertEqual({states.DEPLOYWAIT: 300, states.INSPECTING: 1800},
+                         self.timeouts._timeouts)
+
+    @mock.patch.object(manager.ConductorManager,
+                       '_conductor_service_record_keepalive', lambda: None)
+    @mock.patch.object(eventlet, 'spawn', autospec=True)
+    def test_init_host_spawns_timeouts_thread(self, spawn_mock):
+        self._start_service()
+        spawn_mock.assert_called_once_with(
+            self.service._provision_timeouts_loop)
+
+    @_mock_record_keepalive
+    def test_init_host_timeouts_disabled(self):
+        self.config(provision_timeout_reconcile_interval=0,
+                    group='conductor')
+        self._start_service()
+        self.assertIsNone(self.service._provision_timeouts)
+        self.assertEqual({}, self.timeouts._timeouts)
+
+    @_mock_record_keepalive
+    @mock.patch('ironic.drivers.modules.fake.FakeDeploy.clean_up')
+    def test__check_deploy_timeouts_tracks_nodes(self, mock_cleanup):
+        self._start_service()
+        expired = self._create_deploywait_node(minutes_ago=10)
+        waiting = self._create_deploywait_node(minutes_ago=1)
+
+        self.service._check_deploy_timeouts(self.context)
+        self.service._worker_pool.waitall()
+
+        expired.refresh()
+        self.assertEqual(states.DEPLOYFAIL, expired.provision_state)
+        self.assertNotIn(expired.uuid, self.timeouts)
+        self.assertIn(waiting.uuid, self.timeouts)
+        now = time.time()
+        self.assertEqual([], self.timeouts.pop_expired(now + 238))
+        self.assertEqual([(waiting.uuid, states.DEPLOYWAIT)],
+                         self.timeouts.pop_expired(now + 242))
+
+    @_mock_record_keepalive
+    @mock.patch.object(manager.ConductorManager, '_fail_if_in_state',
+                       autospec=True)
+    def test__check_deploy_timeouts_reconciles(self, mock_fail_if_state):
+        self._start_service()
+        mock_fail_if_state.reset_mock()
+        self.service._check_deploy_timeouts(self.context)
+        self.assertEqual(1, mock_fail_if_state.call_count)
+
+        # the nodes are tracked, the database is not checked again
+        self.service._check_deploy_timeouts(self.context)
+        self.assertEqual(1, mock_fail_if_state.call_count)
+
+        # until the hash ring changes
+        self.service.ring_manager.reset()
+        self.service._check_deploy_timeouts(self.context)
+        self.assertEqual(2, mock_fail_if_state.call_count)
+
+        # or the reconciliation interval elapses
+        now = time.time()
+        with mock.patch.object(time, 'time', autospec=True) as time_mock:
+            time_mock.return_value = now + 600
+            self.service._check_deploy_timeouts(self.context)
+        self.assertEqual(3, mock_fail_if_state.call_count)
+
+    @_mock_record_keepalive
+    @mock.patch('ironic.drivers.modules.fake.FakeDeploy.clean_up')
+    def test__fail_expired_node(self, mock_cleanup):
+        self._start_service()
+        node = self._create_deploywait_node(minutes_ago=10)
+
+        self.service._fail_expired_node(self.context, node.uuid,
+                                        states.DEPLOYWAIT)
+        self.service._worker_pool.waitall()
+
+        node.refresh()
+        self.assertEqual(states.DEPLOYFAIL, node.provision_state)
+        self.assertIsNotNone(node.last_error)
+        mock_cleanup.assert_called_once_with(mock.ANY)
+
+    @_mock_record_keepalive
+    def test__fail_expired_node_not_expired(self):
+        # The node was touched, eg by an agent heartbeat, after its
+        # deadline was scheduled
+        self._start_service()
+        node = self._create_deploywait_node(minutes_ago=1)
+        self.service._fail_expired_node(self.context, node.uuid,
+                                        states.DEPLOYWAIT)
+        node.refresh()
+        self.assertEqual(states.DEPLOYWAIT, node.provision_state)
+        now = time.time()
+        self.assertEqual([], self.timeouts.pop_expired(now + 238))
+        self.assertEqual([(node.uuid, states.DEPLOYWAIT)],
+                         self.timeouts.pop_expired(now + 242))
+
+    @_mock_record_keepalive
+    def test__fail_expired_node_touched_while_failing(self):
+        self._start_service()
+        node = self._create_deploywait_node(minutes_ago=10)
+        with mock.patch.object(self.service, '_fail_node',
+                               autospec=True) as fail_mock:
+            fail_mock.side_effect = exception.NodeNotEligible(node=node.uuid)
+            self.service._fail_expired_node(self.context, node.uuid,
+                                            states.DEPLOYWAIT)
+        now = time.time()
+        self.assertEqual([], self.timeouts.pop_expired(now + 298))
+        self.assertEqual([(node.uuid, states.DEPLOYWAIT)],
+                         self.timeouts.pop_expired(now + 302))
+
+    def test__fail_expired_node_left_state(self):
+        node = self._create_deploywait_node(minutes_ago=10)
+        node.provision_state = states.DEPLOYING
+        node.save()
+        self.assertRaises(exception.NodeNotEligible,
+                          self.service._fail_expired_node,
+                          self.context, node.uuid, states.DEPLOYWAIT)
+        self.assertNotIn(node.uuid, self.timeouts)
+
+    @_mock_record_keepalive
+    def test__fail_expired_node_not_mapped(self):
+        self._start_service()
+        node = self._create_deploywait_node(minutes_ago=10)
+        with mock.patch.object(self.service, '_mapped_to_this_conductor',
+                               autospec=True) as mapped_mock:
+            mapped_mock.return_value = False
+            self.service._fail_expired_node(self.context, node.uuid,
+                                            states.DEPLOYWAIT)
+            mapped_mock.assert_called_once_with(node.uuid, 'fake')
+        node.refresh()
+        self.assertEqual(states.DEPLOYWAIT, node.provision_state)
+        self.assertNotIn(node.uuid, self.timeouts)
+
+    def test__fail_expired_node_timeout_disabled(self):
+        node = obj_utils.create_test_node(self.context, driver='fake',
+                                          provision_state=states.CLEANWAIT)
+        with mock.patch.object(task_manager, 'acquire',
+                               autospec=True) as acquire_mock:
+            self.service._fail_expired_node(self.context, node.uuid,
+                                            states.CLEANWAIT)
+            self.assertFalse(acquire_mock.called)
+
+    def _run_provision_timeouts_loop_once(self):
+        self.service._provision_timeouts = self.timeouts
+        self.service._timeouts_evt = mock.Mock(spec=['is_set', 'wait'])
+        self.service._timeouts_evt.is_set.side_effect = [False, True]
+        self.service._provision_timeouts_loop()
+        self.service._timeouts_evt.wait.assert_called_once_with(1)
+
+    @mock.patch.object(manager.ConductorManager, '_spawn_periodic_worker',
+                       autospec=True)
+    def test__provision_timeouts_loop(self, mock_spawn):
+        for i in range(3):
+            self.timeouts.schedule('node%d' % i, states.DEPLOYWAIT, i)
+        self.timeouts.schedule('node3', states.DEPLOYWAIT, time.time() + 60)
+
+        self._run_provision_timeouts_loop_once()
+
+        self.assertEqual(
+            [mock.call(self.service, self.service._handle_expired_node,
+                       mock.ANY, 'node%d' % i, states.DEPLOYWAIT)
+             for i in range(3)],
+            mock_spawn.call_args_list)
+        self.assertEqual(set(['node3']), set(self.timeouts._entries))
+
+    @mock.patch.object(manager.ConductorManager, '_spawn_periodic_worker',
+                       autospec=True)
+    def test__provision_timeouts_loop_no_free_worker(self, mock_spawn):
+        mock_spawn.side_effect = [None, exception.NoFreeConductorWorker()]
+        for i in range(3):
+            self.timeouts.schedule('node%d' % i, states.DEPLOYWAIT, i)
+
+        self._run_provision_timeouts_loop_once()
+
+        self.assertEqual(2, mock_spawn.call_count)
+        # retried on the next pass
+        self.assertEqual([('node1', states.DEPLOYWAIT),
+                          ('node2', states.DEPLOYWAIT)],
+                         sorted(self.timeouts.pop_expired()))
+
+    @mock.patch.object(manager.ConductorManager, '_fail_expired_node',
+                       autospec=True)
+    def test__handle_expired_node(self, mock_fail_expired):
+        self.service._provision_timeouts = self.timeouts
+        self.service._handle_expired_node(self.context, 'node1',
+                                          states.DEPLOYWAIT)
+        mock_fail_expired.assert_called_once_with(
+            self.service, self.context, 'node1', states.DEPLOYWAIT)
+        self.assertEqual(0, len(self.timeouts))
+
+    @mock.patch.object(manager.ConductorManager, '_fail_expired_node',
+                       autospec=True)
+    def test__handle_expired_node_locked(self, mock_fail_expired):
+        self.config(check_provision_state_interval=30, group='conductor')
+        self.service._provision_timeouts = self.timeouts
+        for exc in (exception.NodeLocked(node='node1', host='host'),
+                    exception.NoFreeConductorWorker()):
+            mock_fail_expired.side_effect = exc
+            now = time.time()
+            self.service._handle_expired_node(self.context, 'node1',
+                                              states.DEPLOYWAIT)
+            # retried after a while, not on the next pass
+            self.assertEqual([], self.timeouts.pop_expired(now + 29))
+            self.assertEqual([('node1', states.DEPLOYWAIT)],
+                             self.timeouts.pop_expired(now + 31))
+
+    @mock.patch.object(manager, 'LOG', autospec=True)
+    @mock.patch.object(manager.ConductorManager, '_fail_expired_node',
+                       autospec=True)
+    def test__handle_expired_node_errors(self, mock_fail_expired, log_mock):
+        self.service._provision_timeouts = self.timeouts
+        for exc in (exception.NodeNotFound(node='node1'),
+                    exception.NodeNotEligible(node='node1'),
+                    Exception('boom')):
+            mock_fail_expired.side_effect = exc
+            self.service._handle_expired_node(self.context, 'node1',
+                                              states.DEPLOYWAIT)
+            self.assertEqual(0, len(self.timeouts))
+        self.assertEqual(1, log_mock.exception.call_count)
+
+
 class ManagerTestProperties(tests_db_base.DbTestCase):
 
     def setUp(self):
@@ -3673,7 +4222,7 @@ class ManagerTestProperties(tests_db_base.DbTestCase):
 
 @mock.patch.object(task_manager, 'acquire')
 @mock.patch.object(manager.ConductorManager, '_mapped_to_this_conductor')
-@mock.patch.object(dbapi.IMPL, 'get_nodeinfo_list')
+@mock.patch.object(dbapi.IMPL, 'iter_nodeinfo')
 class ManagerSyncLocalStateTestCase(_CommonMixIn, tests_db_base.DbTestCase):
 
     def setUp(self):
@@ -3683,7 +4232,7 @@ class ManagerSyncLocalStateTestCase(_CommonMixIn, tests_db_base.DbTestCase):
 
         self.service.conductor = mock.Mock()
         self.service.dbapi = self.dbapi
-        self.service.ring_manager = mock.Mock()
+        self.service.ring_manager = mock.Mock(ring={})
 
         self.node = self._create_node(provision_state=states.ACTIVE,
                                       target_provision_state=states.NOSTATE)
@@ -3691,12 +4240,16 @@ class ManagerSyncLocalStateTestCase(_CommonMixIn, tests_db_base.DbTestCase):
 
         self.filters = {'reserved': False,
                         'maintenance': False,
-                        'provision_state': states.ACTIVE}
+                        'provision_state': states.ACTIVE,
+                        'hash_key_ranges': mock.ANY}
+        self.acquire_filters = {'maintenance': False,
+                                'provision_state': states.ACTIVE}
         self.columns = ['uuid', 'driver', 'id', 'conductor_affinity']
 
     def _assert_get_nodeinfo_args(self, get_nodeinfo_mock):
         get_nodeinfo_mock.assert_called_once_with(
-            columns=self.columns, filters=self.filters)
+            columns=self.columns, filters=self.filters,
+            batch_size=1000)
 
     def test_not_mapped(self, get_nodeinfo_mock, mapped_mock, acquire_mock):
         get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
@@ -3707,7 +4260,7 @@ class ManagerSyncLocalStateTestCase(_CommonMixIn, tests_db_base.DbTestCase):
         self._assert_get_nodeinfo_args(get_nodeinfo_mock)
         mapped_mock.assert_called_once_with(self.node.uuid, self.node.driver)
         self.assertFalse(acquire_mock.called)
-        self.service.ring_manager.reset.assert_called_once_with()
+        self.service.ring_manager.refresh.assert_called_once_with()
 
     def test_already_mapped(self, get_nodeinfo_mock, mapped_mock,
                             acquire_mock):
@@ -3723,7 +4276,7 @@ class ManagerSyncLocalStateTestCase(_CommonMixIn, tests_db_base.DbTestCase):
         self._assert_get_nodeinfo_args(get_nodeinfo_mock)
         mapped_mock.assert_called_once_with(self.node.uuid, self.node.driver)
         self.assertFalse(acquire_mock.called)
-        self.service.ring_manager.reset.assert_called_once_with()
+        self.service.ring_manager.refresh.assert_called_once_with()
 
     def test_good(self, get_nodeinfo_mock, mapped_mock, acquire_mock):
         get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
@@ -3735,10 +4288,11 @@ class ManagerSyncLocalStateTestCase(_CommonMixIn, tests_db_base.DbTestCase):
         self._assert_get_nodeinfo_args(get_nodeinfo_mock)
         mapped_mock.assert_called_once_with(self.node.uuid, self.node.driver)
         acquire_mock.assert_called_once_with(self.context, self.node.uuid,
-                                             purpose=mock.ANY)
+                                             purpose=mock.ANY,
+                                             filters=self.acquire_filters)
         # assert spawn_after has been called
         self.task.spawn_after.assert_called_once_with(
-            self.service._spawn_worker,
+            self.service._spawn_periodic_worker,
             self.service._do_takeover, self.task)
 
     def test_no_free_worker(self, get_nodeinfo_mock, mapped_mock,
@@ -3768,11 +4322,12 @@ class ManagerSyncLocalStateTestCase(_CommonMixIn, tests_db_base.DbTestCase):
         # assert  acquire() gets called 2 times only instead of 3. When
         # NoFreeConductorWorker is raised the loop should be broken
         expected = [mock.call(self.context, self.node.uuid,
-                              purpose=mock.ANY)] * 2
+                              purpose=mock.ANY,
+                              filters=self.acquire_filters)] * 2
         self.assertEqual(expected, acquire_mock.call_args_list)
 
         # assert spawn_after has been called twice
-        expected = [mock.call(self.service._spawn_worker,
+        expected = [mock.call(self.service._spawn_periodic_worker,
                     self.service._do_takeover, self.task)] * 2
         self.assertEqual(expected, self.task.spawn_after.call_args_list)
 
@@ -3796,11 +4351,12 @@ class ManagerSyncLocalStateTestCase(_CommonMixIn, tests_db_base.DbTestCase):
 
         # assert acquire() gets called 3 times
         expected = [mock.call(self.context, self.node.uuid,
-                              purpose=mock.ANY)] * 3
+                              purpose=mock.ANY,
+                              filters=self.acquire_filters)] * 3
         self.assertEqual(expected, acquire_mock.call_args_list)
 
         # assert spawn_after has been called only 2 times
-        expected = [mock.call(self.service._spawn_worker,
+        expected = [mock.call(self.service._spawn_periodic_worker,
                     self.service._do_takeover, self.task)] * 2
         self.assertEqual(expected, self.task.spawn_after.call_args_list)
 
@@ -3826,11 +4382,12 @@ class ManagerSyncLocalStateTestCase(_CommonMixIn, tests_db_base.DbTestCase):
 
         # assert acquire() gets called only once because of the worker limit
         acquire_mock.assert_called_once_with(self.context, self.node.uuid,
-                                             purpose=mock.ANY)
+                                             purpose=mock.ANY,
+                                             filters=self.acquire_filters)
 
         # assert spawn_after has been called
         self.task.spawn_after.assert_called_once_with(
-            self.service._spawn_worker,
+            self.service._spawn_periodic_worker,
             self.service._do_takeover, self.task)
 
 
@@ -4008,7 +4565,7 @@ class NodeInspectHardware(_ServiceSetUpMixin,
 
 @mock.patch.object(task_manager, 'acquire')
 @mock.patch.object(manager.ConductorManager, '_mapped_to_this_conductor')
-@mock.patch.object(dbapi.IMPL, 'get_nodeinfo_list')
+@mock.patch.object(dbapi.IMPL, 'iter_nodeinfo')
 class ManagerCheckInspectTimeoutsTestCase(_CommonMixIn,
                                           tests_db_base.DbTestCase):
     def setUp(self):
@@ -4016,6 +4573,7 @@ class ManagerCheckInspectTimeoutsTestCase(_CommonMixIn,
         self.config(inspect_timeout=300, group='conductor')
         self.service = manager.ConductorManager('hostname', 'test-topic')
         self.service.dbapi = self.dbapi
+        self.service.ring_manager = mock.Mock(ring={})
 
         self.node = self._create_node(provision_state=states.INSPECTING,
                                       target_provision_state=states.MANAGEABLE)
@@ -4028,13 +4586,16 @@ class ManagerCheckInspectTimeoutsTestCase(_CommonMixIn,
 
         self.filters = {'reserved': False,
                         'inspection_started_before': 300,
-                        'provision_state': states.INSPECTING}
+                        'provision_state': states.INSPECTING,
+                        'hash_key_ranges': mock.ANY}
+        self.acquire_filters = {'maintenance': False,
+                                'provision_state': states.INSPECTING}
         self.columns = ['uuid', 'driver']
 
     def _assert_get_nodeinfo_args(self, get_nodeinfo_mock):
         get_nodeinfo_mock.assert_called_once_with(
             sort_dir='asc', columns=self.columns, filters=self.filters,
-            sort_key='inspection_started_at')
+            batch_size=1000, sort_key='inspection_started_at')
 
     def test__check_inspect_timeouts_disabled(self, get_nodeinfo_mock,
                                               mapped_mock, acquire_mock):
@@ -4068,7 +4629,8 @@ class ManagerCheckInspectTimeoutsTestCase(_CommonMixIn,
         self._assert_get_nodeinfo_args(get_nodeinfo_mock)
         mapped_mock.assert_called_once_with(self.node.uuid, self.node.driver)
         acquire_mock.assert_called_once_with(self.context, self.node.uuid,
-                                             purpose=mock.ANY)
+                                             purpose=mock.ANY,
+                                             filters=self.acquire_filters)
         self.task.process_event.assert_called_with('fail')
 
     def test__check_inspect_timeouts_acquire_node_disappears(self,
@@ -4087,7 +4649,8 @@ class ManagerCheckInspectTimeoutsTestCase(_CommonMixIn,
                                             self.node.driver)
         acquire_mock.assert_called_once_with(self.context,
                                              self.node.uuid,
-                                             purpose=mock.ANY)
+                                             purpose=mock.ANY,
+                                             filters=self.acquire_filters)
         self.assertFalse(self.task.process_event.called)
 
     def test__check_inspect_timeouts_acquire_node_locked(self,
@@ -4107,7 +4670,8 @@ class ManagerCheckInspectTimeoutsTestCase(_CommonMixIn,
                                             self.node.driver)
         acquire_mock.assert_called_once_with(self.context,
                                              self.node.uuid,
-                                             purpose=mock.ANY)
+                                             purpose=mock.ANY,
+                                             filters=self.acquire_filters)
         self.assertFalse(self.task.process_event.called)
 
     def test__check_inspect_timeouts_no_acquire_after_lock(self,
@@ -4119,7 +4683,8 @@ class ManagerCheckInspectTimeoutsTestCase(_CommonMixIn,
                             uuid=self.node.uuid))
         get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
         mapped_mock.return_value = True
-        acquire_mock.side_effect = self._get_acquire_side_effect(task)
+        acquire_mock.side_effect = exception.NodeNotEligible(
+            node=self.node.uuid)
 
         self.service._check_inspect_timeouts(self.context)
 
@@ -4128,7 +4693,8 @@ class ManagerCheckInspectTimeoutsTestCase(_CommonMixIn,
             self.node.uuid, self.node.driver)
         acquire_mock.assert_called_once_with(self.context,
                                              self.node.uuid,
-                                             purpose=mock.ANY)
+                                             purpose=mock.ANY,
+                                             filters=self.acquire_filters)
         self.assertFalse(task.process_event.called)
 
     def test__check_inspect_timeouts_to_maintenance_after_lock(
@@ -4141,8 +4707,8 @@ class ManagerCheckInspectTimeoutsTestCase(_CommonMixIn,
         get_nodeinfo_mock.return_value = (
             self._get_nodeinfo_list_response([task.node, self.node2]))
         mapped_mock.return_value = True
-        acquire_mock.side_effect = (
-            self._get_acquire_side_effect([task, self.task2]))
+        acquire_mock.side_effect = self._get_acquire_side_effect(
+            [exception.NodeNotEligible(node=self.node.uuid), self.task2])
 
         self.service._check_inspect_timeouts(self.context)
 
@@ -4151,9 +4717,11 @@ class ManagerCheckInspectTimeoutsTestCase(_CommonMixIn,
                           mock.call(self.node2.uuid, self.node2.driver)],
                          mapped_mock.call_args_list)
         self.assertEqual([mock.call(self.context, self.node.uuid,
-                                    purpose=mock.ANY),
+                                    purpose=mock.ANY,
+                                    filters=self.acquire_filters),
                           mock.call(self.context, self.node2.uuid,
-                                    purpose=mock.ANY)],
+                                    purpose=mock.ANY,
+                                    filters=self.acquire_filters)],
                          acquire_mock.call_args_list)
         # First node skipped
         self.assertFalse(task.process_event.called)
@@ -4178,7 +4746,8 @@ class ManagerCheckInspectTimeoutsTestCase(_CommonMixIn,
             self.node.uuid, self.node.driver)
         acquire_mock.assert_called_once_with(self.context,
                                              self.node.uuid,
-                                             purpose=mock.ANY)
+                                             purpose=mock.ANY,
+                                             filters=self.acquire_filters)
         self.task.process_event.assert_called_with('fail')
 
     def test__check_inspect_timeouts_exit_with_other_exception(
@@ -4201,7 +4770,8 @@ class ManagerCheckInspectTimeoutsTestCase(_CommonMixIn,
             self.node.uuid, self.node.driver)
         acquire_mock.assert_called_once_with(self.context,
                                              self.node.uuid,
-                                             purpose=mock.ANY)
+                                             purpose=mock.ANY,
+                                             filters=self.acquire_filters)
         self.task.process_event.assert_called_with('fail')
 
     def test__check_inspect_timeouts_worker_limit(self, get_nodeinfo_mock,
@@ -4223,7 +4793,8 @@ class ManagerCheckInspectTimeoutsTestCase(_CommonMixIn,
         self.assertEqual([mock.call(self.node.uuid, self.node.driver)] * 2,
                          mapped_mock.call_args_list)
         self.assertEqual([mock.call(self.context, self.node.uuid,
-                                    purpose=mock.ANY)] * 2,
+                                    purpose=mock.ANY,
+                                    filters=self.acquire_filters)] * 2,
                          acquire_mock.call_args_list)
         process_event_call = mock.call('fail')
         self.assertEqual([process_event_call] * 2,
@@ -306,3 +306,8 @@ class RPCAPITestCase(base.DbTestCase):
                           version='1.30',
                           node_id=self.fake_node['uuid'],
                           target_raid_config='config')
+
+    def test_get_conductor_stats(self):
+        self._test_rpcapi('get_conductor_stats',
+                          'call',
+                          version='1.31')
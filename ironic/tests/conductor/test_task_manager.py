@@ -26,7 +26,9 @@ from ironic.common import driver_factory
 from ironic.common import exception
 from ironic.common import fsm
 from ironic.common import states
+from ironic.conductor import locks
 from ironic.conductor import task_manager
+from ironic.conductor import timeouts
 from ironic import objects
 from ironic.tests import base as tests_base
 from ironic.tests.db import base as tests_db_base
@@ -58,13 +60,44 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
             self.assertFalse(task.shared)
 
         reserve_mock.assert_called_once_with(self.context, self.host,
-                                             'fake-node-id')
+                                             'fake-node-id', filters=None)
         get_ports_mock.assert_called_once_with(self.context, self.node.id)
         get_driver_mock.assert_called_once_with(self.node.driver)
         release_mock.assert_called_once_with(self.context, self.host,
                                              self.node.id)
         self.assertFalse(node_get_mock.called)
 
+    def test_excl_lock_with_filters(self, get_ports_mock, get_driver_mock,
+                                    reserve_mock, release_mock,
+                                    node_get_mock):
+        reserve_mock.return_value = self.node
+        filters = {'maintenance': False}
+        with task_manager.TaskManager(self.context, 'fake-node-id',
+                                      filters=filters) as task:
+            self.assertFalse(task.shared)
+
+        reserve_mock.assert_called_once_with(self.context, self.host,
+                                             'fake-node-id', filters=filters)
+        release_mock.assert_called_once_with(self.context, self.host,
+                                             self.node.id)
+
+    def test_excl_lock_not_eligible(self, get_ports_mock, get_driver_mock,
+                                    reserve_mock, release_mock,
+                                    node_get_mock):
+        self.config(node_locked_retry_attempts=3, group='conductor')
+        reserve_mock.side_effect = exception.NodeNotEligible(node='foo')
+
+        self.assertRaises(exception.NodeNotEligible,
+                          task_manager.TaskManager,
+                          self.context, 'fake-node-id',
+                          filters={'maintenance': False})
+
+        # not retried like NodeLocked
+        self.assertEqual(1, reserve_mock.call_count)
+        self.assertFalse(get_ports_mock.called)
+        self.assertFalse(get_driver_mock.called)
+        self.assertFalse(release_mock.called)
+
     def test_excl_lock_with_driver(self, get_ports_mock, get_driver_mock,
                                    reserve_mock, release_mock,
                                    node_get_mock):
@@ -78,7 +111,7 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
             self.assertFalse(task.shared)
 
         reserve_mock.assert_called_once_with(self.context, self.host,
-                                             'fake-node-id')
+                                             'fake-node-id', filters=None)
         get_ports_mock.assert_called_once_with(self.context, self.node.id)
         get_driver_mock.assert_called_once_with('fake-driver')
         release_mock.assert_called_once_with(self.context, self.host,
@@ -92,13 +125,14 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
                                            uuid=uuidutils.generate_uuid(),
                                            driver='fake')
 
+        ports = {self.node.id: mock.sentinel.ports1,
+                 node2.id: mock.sentinel.ports2}
         reserve_mock.return_value = self.node
-        get_ports_mock.return_value = mock.sentinel.ports1
+        get_ports_mock.side_effect = lambda context, node_id: ports[node_id]
         get_driver_mock.return_value = mock.sentinel.driver1
 
         with task_manager.TaskManager(self.context, 'node-id1') as task:
             reserve_mock.return_value = node2
-            get_ports_mock.return_value = mock.sentinel.ports2
             get_driver_mock.return_value = mock.sentinel.driver2
             with task_manager.TaskManager(self.context, 'node-id2') as task2:
                 self.assertEqual(self.context, task.context)
@@ -112,8 +146,10 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
                 self.assertEqual(mock.sentinel.driver2, task2.driver)
                 self.assertFalse(task2.shared)
 
-        self.assertEqual([mock.call(self.context, self.host, 'node-id1'),
-                          mock.call(self.context, self.host, 'node-id2')],
+        self.assertEqual([mock.call(self.context, self.host, 'node-id1',
+                                    filters=None),
+                          mock.call(self.context, self.host, 'node-id2',
+                                    filters=None)],
                          reserve_mock.call_args_list)
         self.assertEqual([mock.call(self.context, self.node.id),
                           mock.call(self.context, node2.id)],
@@ -143,7 +179,7 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
             self.assertFalse(task.shared)
 
         expected_calls = [mock.call(self.context, self.host,
-                                    'fake-node-id')] * 2
+                                    'fake-node-id', filters=None)] * 2
         reserve_mock.assert_has_calls(expected_calls)
         self.assertEqual(2, reserve_mock.call_count)
 
@@ -162,28 +198,145 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
                           'fake-node-id')
 
         reserve_mock.assert_called_with(self.context, self.host,
-                                        'fake-node-id')
+                                        'fake-node-id', filters=None)
         self.assertEqual(retry_attempts, reserve_mock.call_count)
         self.assertFalse(get_ports_mock.called)
         self.assertFalse(get_driver_mock.called)
         self.assertFalse(release_mock.called)
         self.assertFalse(node_get_mock.called)
 
+    @mock.patch.object(task_manager.time, 'sleep')
+    def test_excl_lock_remote_backoff(self, sleep_mock, get_ports_mock,
+                                      get_driver_mock, reserve_mock,
+                                      release_mock, node_get_mock):
+        self.config(node_locked_retry_attempts=3, group='conductor')
+        self.config(node_locked_retry_interval=1, group='conductor')
+        reserve_mock.side_effect = exception.NodeLocked(node='foo',
+                                                        host='foo')
+
+        self.assertRaises(exception.NodeLocked,
+                          task_manager.TaskManager,
+                          self.context,
+                          'fake-node-id')
+
+        self.assertEqual(3, reserve_mock.call_count)
+        self.assertEqual(2, sleep_mock.call_count)
+        first, second = [c[0][0] for c in sleep_mock.call_args_list]
+        # The waits double, and add up to the budget at most
+        self.assertTrue(1.0 / 3 <= first <= 2.0 / 3)
+        self.assertTrue(2.0 / 3 <= second <= 4.0 / 3)
+        stats = locks.get_wait_stats()['fake-node-id']
+        self.assertEqual(1, stats['waits'])
+        self.assertEqual(1, stats['failures'])
+
+    def test_excl_lock_local_waits_for_release(self, get_ports_mock,
+                                               get_driver_mock, reserve_mock,
+                                               release_mock, node_get_mock):
+        self.config(node_locked_retry_attempts=3, group='conductor')
+        self.config(node_locked_retry_interval=30, group='conductor')
+        results = [exception.NodeLocked(node='foo', host=self.host),
+                   self.node]
+
+        def reserve(*args, **kwargs):
+            result = results.pop(0)
+            if isinstance(result, Exception):
+                # Another task of this conductor releases the lock
+                eventlet.spawn(locks.LockWaiters().notify, 'fake-node-id')
+                raise result
+            return result
+
+        reserve_mock.side_effect = reserve
+
+        with task_manager.TaskManager(self.context, 'fake-node-id') as task:
+            self.assertEqual(self.node, task.node)
+
+        self.assertEqual(2, reserve_mock.call_count)
+        stats = locks.get_wait_stats()['fake-node-id']
+        self.assertEqual(1, stats['waits'])
+        self.assertEqual(0, stats['failures'])
+        self.assertTrue(stats['max_wait_time'] < 30)
+
+    def test_excl_lock_local_timeout(self, get_ports_mock, get_driver_mock,
+                                     reserve_mock, release_mock,
+                                     node_get_mock):
+        self.config(node_locked_retry_attempts=3, group='conductor')
+        reserve_mock.side_effect = exception.NodeLocked(node='foo',
+                                                        host=self.host)
+
+        self.assertRaises(exception.NodeLocked,
+                          task_manager.TaskManager,
+                          self.context,
+                          'fake-node-id')
+
+        # No time to wait for the release of the lock
+        self.assertEqual(1, reserve_mock.call_count)
+        self.assertEqual(1, locks.get_wait_stats()['fake-node-id']['failures'])
+
+    @mock.patch.object(locks.LockWaiters, 'notify')
+    def test_excl_lock_release_notifies(self, notify_mock, get_ports_mock,
+                                        get_driver_mock, reserve_mock,
+                                        release_mock, node_get_mock):
+        reserve_mock.return_value = self.node
+        with task_manager.TaskManager(self.context, 'fake-node-id'):
+            self.assertFalse(notify_mock.called)
+
+        notify_mock.assert_called_once_with(self.node.id, self.node.uuid)
+        self.assertEqual({}, locks.get_wait_stats())
+
+    def test_excl_lock_stats(self, get_ports_mock, get_driver_mock,
+                             reserve_mock, release_mock, node_get_mock):
+        reserve_mock.return_value = self.node
+        with task_manager.TaskManager(self.context, 'fake-node-id',
+                                      purpose='testing'):
+            stats = locks.get_lock_stats()['testing']
+            self.assertEqual(1, stats['acquired'])
+            self.assertEqual(1, stats['acquire_time']['count'])
+            self.assertEqual(0, stats['hold_time']['count'])
+
+        stats = locks.get_lock_stats()['testing']
+        self.assertEqual(1, stats['hold_time']['count'])
+        self.assertEqual(0, stats['failed'])
+        self.assertEqual(0, stats['upgrades'])
+
+    def test_excl_lock_stats_failed(self, get_ports_mock, get_driver_mock,
+                                    reserve_mock, release_mock,
+                                    node_get_mock):
+        reserve_mock.side_effect = exception.NodeLocked(node='foo',
+                                                        host='foo')
+        self.assertRaises(exception.NodeLocked,
+                          task_manager.TaskManager,
+                          self.context, 'fake-node-id', purpose='testing')
+
+        stats = locks.get_lock_stats()['testing']
+        self.assertEqual(0, stats['acquired'])
+        self.assertEqual(1, stats['failed'])
+        self.assertEqual(0, stats['hold_time']['count'])
+
+    def test_shared_lock_release_does_not_notify(self, get_ports_mock,
+                                                 get_driver_mock,
+                                                 reserve_mock, release_mock,
+                                                 node_get_mock):
+        node_get_mock.return_value = self.node
+        with mock.patch.object(locks.LockWaiters, 'notify') as notify_mock:
+            with task_manager.TaskManager(self.context, 'fake-node-id',
+                                          shared=True):
+                pass
+            self.assertFalse(notify_mock.called)
+
     def test_excl_lock_get_ports_exception(self, get_ports_mock,
                                            get_driver_mock, reserve_mock,
                                            release_mock, node_get_mock):
         reserve_mock.return_value = self.node
         get_ports_mock.side_effect = exception.IronicException('foo')
 
-        self.assertRaises(exception.IronicException,
-                          task_manager.TaskManager,
-                          self.context,
-                          'fake-node-id')
+        with task_manager.TaskManager(self.context, 'fake-node-id') as task:
+            self.assertRaises(exception.IronicException,
+                              getattr, task, 'ports')
 
         reserve_mock.assert_called_once_with(self.context, self.host,
-                                             'fake-node-id')
+                                             'fake-node-id', filters=None)
         get_ports_mock.assert_called_once_with(self.context, self.node.id)
-        self.assertFalse(get_driver_mock.called)
+        get_driver_mock.assert_called_once_with(self.node.driver)
         release_mock.assert_called_once_with(self.context, self.host,
                                              self.node.id)
         self.assertFalse(node_get_mock.called)
@@ -201,8 +354,8 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
                           'fake-node-id')
 
         reserve_mock.assert_called_once_with(self.context, self.host,
-                                             'fake-node-id')
-        get_ports_mock.assert_called_once_with(self.context, self.node.id)
+                                             'fake-node-id', filters=None)
+        self.assertFalse(get_ports_mock.called)
         get_driver_mock.assert_called_once_with(self.node.driver)
         release_mock.assert_called_once_with(self.context, self.host,
                                              self.node.id)
@@ -221,10 +374,37 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
 
         self.assertFalse(reserve_mock.called)
         self.assertFalse(release_mock.called)
-        node_get_mock.assert_called_once_with(self.context, 'fake-node-id')
+        node_get_mock.assert_called_once_with(self.context, 'fake-node-id',
+                                              filters=None)
         get_ports_mock.assert_called_once_with(self.context, self.node.id)
         get_driver_mock.assert_called_once_with(self.node.driver)
 
+    def test_shared_lock_with_filters(self, get_ports_mock, get_driver_mock,
+                                      reserve_mock, release_mock,
+                                      node_get_mock):
+        node_get_mock.return_value = self.node
+        filters = {'maintenance': False}
+        with task_manager.TaskManager(self.context, 'fake-node-id',
+                                      shared=True, filters=filters) as task:
+            self.assertTrue(task.shared)
+
+        self.assertFalse(reserve_mock.called)
+        node_get_mock.assert_called_once_with(self.context, 'fake-node-id',
+                                              filters=filters)
+
+    def test_shared_lock_not_eligible(self, get_ports_mock, get_driver_mock,
+                                      reserve_mock, release_mock,
+                                      node_get_mock):
+        node_get_mock.side_effect = exception.NodeNotEligible(node='foo')
+
+        self.assertRaises(exception.NodeNotEligible,
+                          task_manager.TaskManager,
+                          self.context, 'fake-node-id', shared=True,
+                          filters={'maintenance': False})
+
+        self.assertFalse(get_ports_mock.called)
+        self.assertFalse(get_driver_mock.called)
+
     def test_shared_lock_with_driver(self, get_ports_mock, get_driver_mock,
                                      reserve_mock, release_mock,
                                      node_get_mock):
@@ -241,7 +421,8 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
 
         self.assertFalse(reserve_mock.called)
         self.assertFalse(release_mock.called)
-        node_get_mock.assert_called_once_with(self.context, 'fake-node-id')
+        node_get_mock.assert_called_once_with(self.context, 'fake-node-id',
+                                              filters=None)
         get_ports_mock.assert_called_once_with(self.context, self.node.id)
         get_driver_mock.assert_called_once_with('fake-driver')
 
@@ -258,7 +439,8 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
 
         self.assertFalse(reserve_mock.called)
         self.assertFalse(release_mock.called)
-        node_get_mock.assert_called_once_with(self.context, 'fake-node-id')
+        node_get_mock.assert_called_once_with(self.context, 'fake-node-id',
+                                              filters=None)
         self.assertFalse(get_ports_mock.called)
         self.assertFalse(get_driver_mock.called)
 
@@ -268,17 +450,17 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
         node_get_mock.return_value = self.node
         get_ports_mock.side_effect = exception.IronicException('foo')
 
-        self.assertRaises(exception.IronicException,
-                          task_manager.TaskManager,
-                          self.context,
-                          'fake-node-id',
-                          shared=True)
+        with task_manager.TaskManager(self.context, 'fake-node-id',
+                                      shared=True) as task:
+            self.assertRaises(exception.IronicException,
+                              getattr, task, 'ports')
 
         self.assertFalse(reserve_mock.called)
         self.assertFalse(release_mock.called)
-        node_get_mock.assert_called_once_with(self.context, 'fake-node-id')
+        node_get_mock.assert_called_once_with(self.context, 'fake-node-id',
+                                              filters=None)
         get_ports_mock.assert_called_once_with(self.context, self.node.id)
-        self.assertFalse(get_driver_mock.called)
+        get_driver_mock.assert_called_once_with(self.node.driver)
 
     def test_shared_lock_get_driver_exception(self, get_ports_mock,
                                               get_driver_mock, reserve_mock,
@@ -295,10 +477,102 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
 
         self.assertFalse(reserve_mock.called)
         self.assertFalse(release_mock.called)
-        node_get_mock.assert_called_once_with(self.context, 'fake-node-id')
-        get_ports_mock.assert_called_once_with(self.context, self.node.id)
+        node_get_mock.assert_called_once_with(self.context, 'fake-node-id',
+                                              filters=None)
+        self.assertFalse(get_ports_mock.called)
         get_driver_mock.assert_called_once_with(self.node.driver)
 
+    @mock.patch.object(objects.Node, 'reserve_many')
+    def test_acquire_many(self, reserve_many_mock, get_ports_mock,
+                          get_driver_mock, reserve_mock, release_mock,
+                          node_get_mock):
+        node2 = obj_utils.create_test_node(self.context,
+                                           uuid=uuidutils.generate_uuid())
+        reserve_many_mock.return_value = [self.node, node2]
+        filters = {'maintenance': False}
+
+        tasks = task_manager.acquire_many(self.context,
+                                          ['fake-id1', 'fake-id2', 'fake-id3'],
+                                          purpose='testing', filters=filters)
+
+        reserve_many_mock.assert_called_once_with(
+            self.context, self.host, ['fake-id1', 'fake-id2', 'fake-id3'],
+            filters=filters)
+        self.assertEqual([self.node, node2], [t.node for t in tasks])
+        for task in tasks:
+            self.assertFalse(task.shared)
+            task.release_resources()
+        self.assertFalse(reserve_mock.called)
+        self.assertFalse(node_get_mock.called)
+        self.assertEqual([mock.call(self.context, self.host, self.node.id),
+                          mock.call(self.context, self.host, node2.id)],
+                         release_mock.call_args_list)
+        stats = locks.get_lock_stats()['testing']
+        self.assertEqual(2, stats['acquired'])
+        self.assertEqual(2, stats['hold_time']['count'])
+
+    @mock.patch.object(objects.Node, 'reserve_many')
+    def test_acquire_many_get_driver_exception(self, reserve_many_mock,
+                                               get_ports_mock,
+                                               get_driver_mock, reserve_mock,
+                                               release_mock, node_get_mock):
+        nodes = [self.node] + [
+            obj_utils.create_test_node(self.context,
+                                       uuid=uuidutils.generate_uuid())
+            for i in range(2)]
+        reserve_many_mock.return_value = nodes
+        get_driver_mock.side_effect = [
+            mock.sentinel.driver,
+            exception.DriverNotFound(driver_name='foo')]
+
+        self.assertRaises(exception.DriverNotFound,
+                          task_manager.acquire_many,
+                          self.context, [n.uuid for n in nodes])
+
+        # all the nodes are released, the ones turned into tasks or not
+        self.assertEqual(sorted(n.id for n in nodes),
+                         sorted(c[0][2] for c in release_mock.call_args_list))
+
+    def test_ports_loaded_on_first_access(self, get_ports_mock,
+                                          get_driver_mock, reserve_mock,
+                                          release_mock, node_get_mock):
+        node_get_mock.return_value = self.node
+        stats = task_manager.get_stats()
+        with task_manager.TaskManager(self.context, 'fake-node-id',
+                                      shared=True) as task:
+            self.assertFalse(get_ports_mock.called)
+            self.assertEqual(get_ports_mock.return_value, task.ports)
+            self.assertEqual(get_ports_mock.return_value, task.ports)
+
+        get_ports_mock.assert_called_once_with(self.context, self.node.id)
+        self.assertIsNone(task.ports)
+        self.assertEqual({'tasks': stats['tasks'] + 1,
+                          'ports_loaded': stats['ports_loaded'] + 1},
+                         task_manager.get_stats())
+
+    def test_ports_not_loaded(self, get_ports_mock, get_driver_mock,
+                              reserve_mock, release_mock, node_get_mock):
+        node_get_mock.return_value = self.node
+        stats = task_manager.get_stats()
+        with task_manager.TaskManager(self.context, 'fake-node-id',
+                                      shared=True):
+            pass
+
+        self.assertFalse(get_ports_mock.called)
+        self.assertEqual({'tasks': stats['tasks'] + 1,
+                          'ports_loaded': stats['ports_loaded']},
+                         task_manager.get_stats())
+
+    def test_ports_set(self, get_ports_mock, get_driver_mock,
+                       reserve_mock, release_mock, node_get_mock):
+        node_get_mock.return_value = self.node
+        with task_manager.TaskManager(self.context, 'fake-node-id',
+                                      shared=True) as task:
+            task.ports = mock.sentinel.ports
+            self.assertEqual(mock.sentinel.ports, task.ports)
+
+        self.assertFalse(get_ports_mock.called)
+
     def test_upgrade_lock(self, get_ports_mock, get_driver_mock,
                           reserve_mock, release_mock, node_get_mock):
         node_get_mock.return_value = self.node
@@ -320,10 +594,14 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
 
         # make sure reserve() was called only once
         reserve_mock.assert_called_once_with(self.context, self.host,
-                                             'fake-node-id')
+                                             'fake-node-id', filters=None)
         release_mock.assert_called_once_with(self.context, self.host,
                                              self.node.id)
-        node_get_mock.assert_called_once_with(self.context, 'fake-node-id')
+        stats = locks.get_lock_stats()['unspecified action']
+        self.assertEqual(1, stats['upgrades'])
+        self.assertEqual(1, stats['acquired'])
+        node_get_mock.assert_called_once_with(self.context, 'fake-node-id',
+                                              filters=None)
         get_ports_mock.assert_called_once_with(self.context, self.node.id)
         get_driver_mock.assert_called_once_with(self.node.driver)
 
@@ -452,15 +730,15 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
         on_error_handler.assert_called_once_with(expected_exception,
                                                  'fake-argument')
 
-    @mock.patch.object(states.machine, 'copy')
+    @mock.patch.object(states.machine_table, 'cursor')
     def test_init_prepares_fsm(
-            self, copy_mock, get_ports_mock, get_driver_mock, reserve_mock,
+            self, cursor_mock, get_ports_mock, get_driver_mock, reserve_mock,
             release_mock, node_get_mock):
-        m = mock.Mock(spec=fsm.FSM)
+        m = mock.Mock(spec=fsm.FSMCursor)
         reserve_mock.return_value = self.node
-        copy_mock.return_value = m
+        cursor_mock.return_value = m
         t = task_manager.TaskManager('fake', 'fake')
-        copy_mock.assert_called_once_with()
+        cursor_mock.assert_called_once_with()
         self.assertIs(m, t.fsm)
         m.initialize.assert_called_once_with(self.node.provision_state)
 
@@ -468,7 +746,7 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
 class TaskManagerStateModelTestCases(tests_base.TestCase):
     def setUp(self):
         super(TaskManagerStateModelTestCases, self).setUp()
-        self.fsm = mock.Mock(spec=fsm.FSM)
+        self.fsm = mock.Mock(spec=fsm.FSMCursor)
         self.node = mock.Mock(spec=objects.Node)
         self.task = mock.Mock(spec=task_manager.TaskManager)
         self.task.fsm = self.fsm
@@ -538,6 +816,14 @@ class TaskManagerStateModelTestCases(tests_base.TestCase):
         self.assertNotEqual(target_provision_state,
                             self.node.target_provision_state)
 
+    @mock.patch.object(timeouts.ProvisionTimeouts, 'watch', autospec=True)
+    def test_process_event_watches_provision_timeouts(self, watch_mock):
+        self.fsm.current_state = states.DEPLOYWAIT
+        self.task.process_event = task_manager.TaskManager.process_event
+        self.task.process_event(self.task, 'wait')
+        watch_mock.assert_called_once_with(mock.ANY, self.node.uuid,
+                                           states.DEPLOYWAIT)
+
 
 @task_manager.require_exclusive_lock
 def _req_excl_lock_method(*args, **kwargs):
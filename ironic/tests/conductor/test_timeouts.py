@@ -0,0 +1,115 @@
+# coding=utf-8
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for :class:`ironic.conductor.timeouts.ProvisionTimeouts`."""
+
+import time
+
+import mock
+
+from ironic.common import states
+from ironic.conductor import timeouts
+from ironic.tests import base as tests_base
+
+
+@mock.patch.object(time, 'time', autospec=True)
+class ProvisionTimeoutsTestCase(tests_base.TestCase):
+
+    def setUp(self):
+        super(ProvisionTimeoutsTestCase, self).setUp()
+        self.timeouts = timeouts.ProvisionTimeouts()
+        self.timeouts.configure({states.DEPLOYWAIT: 60,
+                                 states.CLEANWAIT: 30,
+                                 states.INSPECTING: 0})
+
+    def test_watch(self, time_mock):
+        time_mock.return_value = 1000
+        self.timeouts.watch('node1', states.DEPLOYWAIT)
+        self.timeouts.watch('node2', states.CLEANWAIT)
+        self.assertEqual(2, len(self.timeouts))
+        self.assertEqual([], self.timeouts.pop_expired(1029))
+        self.assertEqual([('node2', states.CLEANWAIT)],
+                         self.timeouts.pop_expired(1030))
+        self.assertEqual([('node1', states.DEPLOYWAIT)],
+                         self.timeouts.pop_expired(1100))
+        self.assertEqual(0, len(self.timeouts))
+
+    def test_watch_state_without_timeout(self, time_mock):
+        time_mock.return_value = 1000
+        self.timeouts.watch('node1', states.INSPECTING)
+        self.timeouts.watch('node2', states.ACTIVE)
+        self.assertEqual(0, len(self.timeouts))
+
+    def test_watch_replaces_deadline(self, time_mock):
+        time_mock.return_value = 1000
+        self.timeouts.watch('node1', states.DEPLOYWAIT)
+        time_mock.return_value = 1050
+        self.timeouts.watch('node1', states.DEPLOYWAIT)
+        self.assertEqual([], self.timeouts.pop_expired(1100))
+        self.assertEqual([('node1', states.DEPLOYWAIT)],
+                         self.timeouts.pop_expired(1110))
+
+    def test_watch_cancels_deadline(self, time_mock):
+        time_mock.return_value = 1000
+        self.timeouts.watch('node1', states.DEPLOYWAIT)
+        self.timeouts.watch('node1', states.DEPLOYING)
+        self.assertNotIn('node1', self.timeouts)
+        self.assertEqual([], self.timeouts.pop_expired(2000))
+
+    def test_not_configured(self, time_mock):
+        time_mock.return_value = 1000
+        self.timeouts.reset()
+        self.timeouts.watch('node1', states.DEPLOYWAIT)
+        self.assertEqual(0, len(self.timeouts))
+
+    def test_shared(self, time_mock):
+        time_mock.return_value = 1000
+        self.timeouts.watch('node1', states.DEPLOYWAIT)
+        self.assertIn('node1', timeouts.ProvisionTimeouts())
+
+    def test_configure_drops_deadlines(self, time_mock):
+        self.timeouts.schedule('node1', states.DEPLOYWAIT, 1000)
+        self.timeouts.configure({states.DEPLOYWAIT: 60})
+        self.assertEqual([], self.timeouts.pop_expired(2000))
+
+    def test_schedule(self, time_mock):
+        self.timeouts.schedule('node1', states.DEPLOYWAIT, 1000)
+        self.timeouts.schedule('node2', states.INSPECTING, 900)
+        self.timeouts.schedule('node3', states.CLEANWAIT, 1100)
+        self.assertEqual([('node2', states.INSPECTING),
+                          ('node1', states.DEPLOYWAIT)],
+                         self.timeouts.pop_expired(1000))
+        self.assertIn('node3', self.timeouts)
+
+    def test_pop_expired_default_now(self, time_mock):
+        time_mock.return_value = 1000
+        self.timeouts.schedule('node1', states.DEPLOYWAIT, 1000)
+        self.assertEqual([('node1', states.DEPLOYWAIT)],
+                         self.timeouts.pop_expired())
+
+    def test_cancel(self, time_mock):
+        self.timeouts.schedule('node1', states.DEPLOYWAIT, 1000)
+        self.timeouts.cancel('node1')
+        self.timeouts.cancel('node2')
+        self.assertEqual([], self.timeouts.pop_expired(1000))
+
+    @mock.patch.object(timeouts, '_MAX_CANCELLED', 2)
+    def test_cancelled_deadlines_are_dropped(self, time_mock):
+        for i in range(4):
+            self.timeouts.schedule('node%d' % i, states.DEPLOYWAIT, 1000 + i)
+        for i in range(3):
+            self.timeouts.cancel('node%d' % i)
+        self.assertEqual(1, len(self.timeouts._heap))
+        self.assertEqual([('node3', states.DEPLOYWAIT)],
+                         self.timeouts.pop_expired(2000))
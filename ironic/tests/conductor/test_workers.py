@@ -0,0 +1,146 @@
+# coding=utf-8
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for :class:`ironic.conductor.workers.WorkerPool`."""
+
+from eventlet import event
+
+from ironic.common import exception
+from ironic.conductor import workers
+from ironic.tests import base as tests_base
+
+
+class WorkerPoolTestCase(tests_base.TestCase):
+
+    def setUp(self):
+        super(WorkerPoolTestCase, self).setUp()
+        self.done = event.Event()
+        self.ran = []
+
+    def _block(self, name):
+        self.ran.append(name)
+        self.done.wait()
+
+    def _run(self, name):
+        self.ran.append(name)
+        return name
+
+    def test_spawn(self):
+        pool = workers.WorkerPool(2)
+        thread = pool.spawn(workers.API, self._run, 'foo')
+        self.assertEqual('foo', thread.wait())
+        self.assertEqual(2, pool.free())
+
+    def test_spawn_full(self):
+        pool = workers.WorkerPool(1)
+        pool.spawn(workers.API, self._block, 'foo')
+        self.assertEqual(0, pool.free())
+        self.assertRaises(exception.NoFreeConductorWorker,
+                          pool.spawn, workers.API, self._run, 'bar')
+        self.done.send()
+        pool.waitall()
+        self.assertEqual(['foo'], self.ran)
+
+    def test_spawn_reserved(self):
+        pool = workers.WorkerPool(3, reserved={workers.API: 1,
+                                               workers.CALLBACK: 1})
+        pool.spawn(workers.PERIODIC, self._block, 'periodic')
+        self.assertRaises(exception.NoFreeConductorWorker,
+                          pool.spawn, workers.PERIODIC, self._run, 'foo')
+        pool.spawn(workers.CALLBACK, self._block, 'callback')
+        self.assertRaises(exception.NoFreeConductorWorker,
+                          pool.spawn, workers.CALLBACK, self._run, 'foo')
+        pool.spawn(workers.API, self._block, 'api')
+        self.assertEqual(0, pool.free())
+        self.done.send()
+        pool.waitall()
+        self.assertEqual(['periodic', 'callback', 'api'], self.ran)
+
+    def test_spawn_reserved_too_many(self):
+        pool = workers.WorkerPool(2, reserved={workers.API: 5})
+        pool.spawn(workers.PERIODIC, self._block, 'periodic')
+        self.assertRaises(exception.NoFreeConductorWorker,
+                          pool.spawn, workers.PERIODIC, self._run, 'foo')
+        self.done.send()
+        pool.waitall()
+
+    def test_spawn_queued(self):
+        pool = workers.WorkerPool(1, queue_size=1)
+        pool.spawn(workers.API, self._block, 'foo')
+        thread = pool.spawn(workers.API, self._run, 'bar')
+        self.assertRaises(exception.NoFreeConductorWorker,
+                          pool.spawn, workers.API, self._run, 'baz')
+        self.done.send()
+        self.assertEqual('bar', thread.wait())
+        self.assertEqual(['foo', 'bar'], self.ran)
+
+    def test_spawn_queued_by_priority(self):
+        pool = workers.WorkerPool(1, queue_size=4)
+        pool.spawn(workers.API, self._block, 'running')
+        pool.spawn(workers.PERIODIC, self._run, 'periodic')
+        pool.spawn(workers.CALLBACK, self._run, 'callback1')
+        pool.spawn(workers.API, self._run, 'api')
+        pool.spawn(workers.CALLBACK, self._run, 'callback2')
+        self.done.send()
+        pool.waitall()
+        self.assertEqual(['running', 'api', 'callback1', 'callback2',
+                          'periodic'], self.ran)
+
+    def test_spawn_overtakes_lower_priority(self):
+        pool = workers.WorkerPool(2, reserved={workers.API: 1},
+                                  queue_size=1)
+        pool.spawn(workers.PERIODIC, self._block, 'periodic1')
+        pool.spawn(workers.PERIODIC, self._run, 'periodic2')
+        thread = pool.spawn(workers.API, self._run, 'api')
+        self.assertEqual('api', thread.wait())
+        self.assertEqual(['periodic1', 'api'], self.ran)
+        self.done.send()
+        pool.waitall()
+        self.assertEqual(['periodic1', 'api', 'periodic2'], self.ran)
+
+    def test_spawn_releases_worker_on_error(self):
+        def fail():
+            raise ValueError()
+
+        pool = workers.WorkerPool(1)
+        thread = pool.spawn(workers.API, fail)
+        self.assertRaises(ValueError, thread.wait)
+        self.assertEqual(1, pool.free())
+
+    def test_get_stats(self):
+        pool = workers.WorkerPool(1, queue_size=1)
+        pool.spawn(workers.API, self._block, 'foo')
+        pool.spawn(workers.CALLBACK, self._run, 'bar')
+        self.assertRaises(exception.NoFreeConductorWorker,
+                          pool.spawn, workers.PERIODIC, self._run, 'baz')
+        stats = pool.get_stats()
+        self.assertEqual({'size': 1,
+                          'running': 1,
+                          'waiting': {'api': 0, 'callback': 1, 'periodic': 0},
+                          'rejected': {'api': 0, 'callback': 0,
+                                       'periodic': 1},
+                          'functions': {}}, stats)
+
+        self.done.send()
+        pool.waitall()
+        stats = pool.get_stats()
+        self.assertEqual(0, stats['running'])
+        self.assertEqual({'api': 0, 'callback': 0, 'periodic': 0},
+                         stats['waiting'])
+        self.assertEqual(['_block', '_run'], sorted(stats['functions']))
+        self.assertEqual(1, stats['functions']['_block']['count'])
+        self.assertEqual(1, stats['functions']['_run']['count'])
+        self.assertEqual(['count', 'max_run_time', 'max_wait_time',
+                          'run_time', 'wait_time'],
+                         sorted(stats['functions']['_run']))
@@ -0,0 +1,107 @@
+# coding=utf-8
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the SQLAlchemy-specific parts of the DB API."""
+
+import sqlite3
+
+import mock
+from oslo_utils import uuidutils
+from sqlalchemy.dialects.postgresql import base as pg_base
+from sqlalchemy.dialects.sqlite import base as sqlite_base
+from sqlalchemy import orm
+import testtools
+
+from ironic.common import exception
+from ironic.common import states
+from ironic.db.sqlalchemy import api as sa_api
+from ironic.tests.db import base
+from ironic.tests.db import utils
+
+
+@testtools.skipIf(sqlite3.sqlite_version_info < (3, 35),
+                  'SQLite does not support UPDATE ... RETURNING')
+@mock.patch.object(sqlite_base.SQLiteCompiler, 'returning_clause',
+                   pg_base.PGCompiler.returning_clause.__func__)
+@mock.patch.object(sa_api, '_UPDATE_RETURNING_DIALECTS', ('sqlite',))
+class DbNodeUpdateReturningTestCase(base.DbTestCase):
+    """Reserves nodes with UPDATE ... RETURNING, as on PostgreSQL."""
+
+    def test_reserve_node(self):
+        node = utils.create_test_node(provision_state=states.ACTIVE)
+
+        with mock.patch.object(orm.Query, 'one',
+                               autospec=True) as one_mock:
+            res = self.dbapi.reserve_node(
+                'fake-reservation', node.uuid,
+                filters={'provision_state': states.ACTIVE})
+
+        # The node is returned by the UPDATE statement
+        self.assertFalse(one_mock.called)
+        self.assertEqual(node.uuid, res.uuid)
+        self.assertEqual('fake-reservation', res.reservation)
+        self.assertEqual(node.driver_info, res.driver_info)
+        self.assertEqual('fake-reservation',
+                         self.dbapi.get_node_by_id(node.id).reservation)
+
+    def test_reserve_node_locked(self):
+        node = utils.create_test_node()
+        self.dbapi.reserve_node('fake-reservation', node.id)
+
+        self.assertRaises(exception.NodeLocked,
+                          self.dbapi.reserve_node,
+                          'another-reservation', node.id)
+
+    def test_reserve_node_not_matching_filters(self):
+        node = utils.create_test_node(provision_state=states.ACTIVE)
+
+        self.assertRaises(exception.NodeNotEligible,
+                          self.dbapi.reserve_node,
+                          'fake-reservation', node.uuid,
+                          filters={'provision_state_not_in':
+                                   [states.ACTIVE]})
+        self.assertIsNone(self.dbapi.get_node_by_id(node.id).reservation)
+
+    def test_reserve_node_not_found(self):
+        self.assertRaises(exception.NodeNotFound,
+                          self.dbapi.reserve_node,
+                          'fake-reservation', uuidutils.generate_uuid())
+
+    def test_reserve_nodes(self):
+        node1 = utils.create_test_node(id=1, uuid=uuidutils.generate_uuid())
+        node2 = utils.create_test_node(id=2, uuid=uuidutils.generate_uuid())
+        self.dbapi.reserve_node('another-reservation', node2.id)
+
+        res = self.dbapi.reserve_nodes('fake-reservation',
+                                       [node1.uuid, node2.uuid])
+
+        self.assertEqual([node1.id], [n.id for n in res])
+        self.assertEqual('fake-reservation', res[0].reservation)
+        self.assertEqual('another-reservation',
+                         self.dbapi.get_node_by_id(node2.id).reservation)
+
+
+class DbNodeIterTestCase(base.DbTestCase):
+
+    def test_iter_nodeinfo_batches(self):
+        for i in range(5):
+            utils.create_test_node(uuid=uuidutils.generate_uuid())
+        with mock.patch.object(orm.Query, 'all', autospec=True,
+                               side_effect=orm.Query.all) as all_mock:
+            res = self.dbapi.iter_nodeinfo(batch_size=2)
+            next(res)
+            # Only the first batch is loaded
+            self.assertEqual(1, all_mock.call_count)
+            self.assertEqual(4, len(list(res)))
+            self.assertEqual(3, all_mock.call_count)
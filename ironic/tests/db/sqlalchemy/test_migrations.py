@@ -48,6 +48,7 @@ from oslo_utils import uuidutils
 import sqlalchemy
 import sqlalchemy.exc
 
+from ironic.common import hash_ring
 from ironic.common.i18n import _LE
 from ironic.db.sqlalchemy import migration
 from ironic.db.sqlalchemy import models
@@ -393,6 +394,52 @@ class MigrationCheckersMixin(object):
         node = nodes.select(nodes.c.uuid == uuid).execute().first()
         self.assertEqual(bigstring, node['driver'])
 
+    def _pre_upgrade_1a8f2b6c9d3e(self, engine):
+        nodes = db_utils.get_table(engine, 'nodes')
+        # more nodes than backfilled by a single statement
+        data = [{'uuid': uuidutils.generate_uuid()} for i in range(501)]
+        nodes.insert().execute(data)
+        # a node without UUID is left without hash key
+        nodes.insert().execute({'uuid': None})
+        return data
+
+    def _check_1a8f2b6c9d3e(self, engine, data):
+        nodes = db_utils.get_table(engine, 'nodes')
+        col_names = [column.name for column in nodes.c]
+        self.assertIn('hash_key', col_names)
+        self.assertIsInstance(nodes.c.hash_key.type,
+                              sqlalchemy.types.BigInteger)
+        hash_keys = dict(sqlalchemy.select(
+            [nodes.c.uuid, nodes.c.hash_key]).execute().fetchall())
+        for row in data:
+            self.assertEqual(hash_ring.hash_key(row['uuid']),
+                             hash_keys[row['uuid']])
+        self.assertIsNone(hash_keys[None])
+
+    def _check_4c1d7e9a2b5f(self, engine, data):
+        conductors = db_utils.get_table(engine, 'conductors')
+        col_names = [column.name for column in conductors.c]
+        self.assertIn('weight', col_names)
+        self.assertIsInstance(conductors.c.weight.type,
+                              sqlalchemy.types.Integer)
+
+    def _check_5ea1b0d310e0(self, engine, data):
+        inspector = sqlalchemy.inspect(engine)
+        indexes = dict((index['name'], index['column_names'])
+                       for index in inspector.get_indexes('nodes'))
+        self.assertEqual(['provision_state', 'provision_updated_at'],
+                         indexes['nodes_provision_state_updated_at_idx'])
+        self.assertEqual(['reservation'], indexes['nodes_reservation_idx'])
+        self.assertEqual(['driver'], indexes['nodes_driver_idx'])
+        indexes = dict((index['name'], index['column_names'])
+                       for index in inspector.get_indexes('ports'))
+        if engine.name == 'mysql':
+            # the index of the foreign key is not duplicated
+            self.assertNotIn('ports_node_id_idx', indexes)
+            self.assertIn(['node_id'], indexes.values())
+        else:
+            self.assertEqual(['node_id'], indexes['ports_node_id_idx'])
+
     def test_upgrade_and_version(self):
         with patch_with_engine(self.engine):
             self.migration_api.upgrade('head')
@@ -446,7 +493,13 @@ class ModelsMigrationSyncMixin(object):
 class ModelsMigrationsSyncMysql(ModelsMigrationSyncMixin,
                                 test_migrations.ModelsMigrationsSync,
                                 test_base.MySQLOpportunisticTestCase):
-    pass
+
+    def filter_metadata_diff(self, diff):
+        # NOTE: the migrations do not add ports_node_id_idx on MySQL, which
+        # indexes the foreign key on node_id already.
+        return [change for change in diff
+                if not (change[0] == 'add_index' and
+                        change[1].name == 'ports_node_id_idx')]
 
 
 class ModelsMigrationsSyncPostgres(ModelsMigrationSyncMixin,
@@ -0,0 +1,164 @@
+# coding=utf-8
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests that the hot queries on the nodes and the ports use indexes.
+
+The tables are seeded with enough nodes and ports, distributed among the
+provision states, drivers and conductors like in a large deployment, for
+the query planners to prefer an index only if it is selective.
+"""
+
+import datetime
+
+from oslo_db.sqlalchemy import enginefacade
+from oslo_db.sqlalchemy import test_base
+from oslo_utils import timeutils
+from oslo_utils import uuidutils
+from sqlalchemy import orm
+
+from ironic.common import hash_ring
+from ironic.common import states
+from ironic.db.sqlalchemy import api as sa_api
+from ironic.db.sqlalchemy import models
+from ironic.tests.db import base
+
+_NODES = 2000
+_PORTS_PER_NODE = 2
+
+
+def _get_provision_state(i):
+    if i % 50 == 0:
+        return states.DEPLOYWAIT
+    if i % 50 == 1:
+        return states.CLEANWAIT
+    if i % 50 == 2:
+        return states.INSPECTING
+    if i % 50 == 3:
+        return states.DEPLOYING
+    if i % 10 == 4:
+        return states.AVAILABLE
+    return states.ACTIVE
+
+
+class QueryPlanMixin(object):
+    """Checks the plans of the queries, on the database of self.engine."""
+
+    def _seed(self):
+        now = timeutils.utcnow()
+        nodes = []
+        ports = []
+        for i in range(1, _NODES + 1):
+            node_uuid = uuidutils.generate_uuid()
+            nodes.append({
+                'id': i,
+                'uuid': node_uuid,
+                'hash_key': hash_ring.hash_key(node_uuid),
+                'driver': 'fake' if i % 20 else 'fake-other',
+                'provision_state': _get_provision_state(i),
+                'provision_updated_at': now - datetime.timedelta(minutes=i),
+                'inspection_started_at': now - datetime.timedelta(minutes=i),
+                'maintenance': i % 100 == 0,
+                'reservation': 'conductor-%d' % (i % 10) if i % 40 == 0
+                               else None})
+            for j in range(_PORTS_PER_NODE):
+                ports.append({
+                    'uuid': uuidutils.generate_uuid(),
+                    'address': '52:54:%02x:%02x:%02x:%02x' % (
+                        j, i // 65536, i // 256 % 256, i % 256),
+                    'node_id': i})
+        self.engine.execute(models.Node.__table__.insert(), nodes)
+        self.engine.execute(models.Port.__table__.insert(), ports)
+        for table in ('nodes', 'ports'):
+            if self.engine.dialect.name == 'mysql':
+                self.engine.execute('ANALYZE TABLE %s' % table)
+            else:
+                self.engine.execute('ANALYZE %s' % table)
+
+    def _get_indexes_used(self, query):
+        """Return the names of the indexes used by a query."""
+        compiled = query.statement.compile(dialect=self.engine.dialect)
+        params = [compiled.params[key] for key in compiled.positiontup]
+        if self.engine.dialect.name == 'sqlite':
+            rows = self.engine.execute('EXPLAIN QUERY PLAN %s' % compiled,
+                                       *params)
+            # The detail column describes the step, eg "SEARCH TABLE nodes
+            # USING INDEX nodes_driver_idx (driver=?)"
+            return set(word for row in rows for word in row['detail'].split()
+                       if word.endswith('_idx'))
+        rows = self.engine.execute('EXPLAIN %s' % compiled, *params)
+        return set(row['key'] for row in rows if row['key'])
+
+    def _nodes_query(self, filters, model=models.Node.id):
+        # The filters are the ones of the DB API, with its queries
+        return sa_api.Connection()._add_nodes_filters(orm.Query(model),
+                                                      filters)
+
+    def test_provision_timeout(self):
+        query = self._nodes_query({'reserved': False,
+                                   'provision_state': states.DEPLOYWAIT,
+                                   'maintenance': False,
+                                   'provisioned_before': 60})
+        self.assertEqual(set(['nodes_provision_state_updated_at_idx']),
+                         self._get_indexes_used(query))
+
+    def test_inspection_timeout(self):
+        query = self._nodes_query({'reserved': False,
+                                   'provision_state': states.INSPECTING,
+                                   'inspection_started_before': 60})
+        self.assertEqual(set(['nodes_provision_state_updated_at_idx']),
+                         self._get_indexes_used(query))
+
+    def test_provision_state(self):
+        query = self._nodes_query({'provision_state': states.DEPLOYING,
+                                   'maintenance': False})
+        self.assertEqual(set(['nodes_provision_state_updated_at_idx']),
+                         self._get_indexes_used(query))
+
+    def test_driver(self):
+        query = self._nodes_query({'driver': 'fake-other'})
+        self.assertEqual(set(['nodes_driver_idx']),
+                         self._get_indexes_used(query))
+
+    def test_reserved_by_any_of(self):
+        query = self._nodes_query({'reserved_by_any_of': ['conductor-1',
+                                                          'conductor-2']})
+        self.assertEqual(set(['nodes_reservation_idx']),
+                         self._get_indexes_used(query))
+
+    def test_clear_node_reservations_for_conductor(self):
+        query = orm.Query(models.Node).filter_by(reservation='conductor-1')
+        self.assertEqual(set(['nodes_reservation_idx']),
+                         self._get_indexes_used(query))
+
+    def test_get_ports_by_node_id(self):
+        query = orm.Query(models.Port).filter_by(node_id=42)
+        self.assertEqual(set(['ports_node_id_idx']),
+                         self._get_indexes_used(query))
+
+
+class SQLiteQueryPlanTestCase(QueryPlanMixin, base.DbTestCase):
+
+    def setUp(self):
+        super(SQLiteQueryPlanTestCase, self).setUp()
+        self.engine = enginefacade.get_legacy_facade().get_engine()
+        self._seed()
+
+
+class MySQLQueryPlanTestCase(QueryPlanMixin,
+                             test_base.MySQLOpportunisticTestCase):
+
+    def setUp(self):
+        super(MySQLQueryPlanTestCase, self).setUp()
+        models.Base.metadata.create_all(self.engine)
+        self._seed()
@@ -13,11 +13,15 @@
 """Tests for custom SQLAlchemy types via Ironic DB."""
 
 from oslo_db import exception as db_exc
+from oslo_db.sqlalchemy import enginefacade
 from oslo_utils import uuidutils
+import sqlalchemy as sa
 
+from ironic.common import utils as common_utils
 import ironic.db.sqlalchemy.api as sa_api
 from ironic.db.sqlalchemy import models
 from ironic.tests.db import base
+from ironic.tests.db import utils
 
 
 class SqlAlchemyCustomTypesTestCase(base.DbTestCase):
@@ -77,3 +81,38 @@ class SqlAlchemyCustomTypesTestCase(base.DbTestCase):
                           self.dbapi.register_conductor,
                           {'hostname': 'test_host3',
                            'drivers': {'this is not a list': 'test'}})
+
+    def test_LazyJSONEncodedDict(self):
+        node = utils.create_test_node(properties={'cpus': 4})
+        db_node = (sa_api
+                   .model_query(models.Node)
+                   .filter_by(id=node.id)
+                   .one())
+        self.assertIsInstance(db_node.properties, common_utils.LazyJsonDict)
+        self.assertFalse(db_node.properties.is_decoded())
+        self.assertEqual({'cpus': 4}, db_node.properties)
+
+    def test_LazyJSONEncodedDict_save(self):
+        node = utils.create_test_node(properties={'cpus': 4})
+        db_node = self.dbapi.get_node_by_id(node.id)
+        self.dbapi.update_node(node.id, {'driver_info': db_node.properties})
+        db_node = self.dbapi.get_node_by_id(node.id)
+        self.assertEqual({'cpus': 4}, db_node.driver_info)
+
+    def test_LazyJSONEncodedDict_null(self):
+        node = utils.create_test_node(properties={'cpus': 4})
+        engine = enginefacade.get_legacy_facade().get_engine()
+        engine.execute(models.Node.__table__.update()
+                       .where(models.Node.id == node.id)
+                       .values(properties=sa.literal_column("'null'")))
+        db_node = self.dbapi.get_node_by_id(node.id)
+        self.assertIsNone(db_node.properties)
+        # saved like JsonEncodedDict saves None
+        self.dbapi.update_node(node.id, {'driver_info': db_node.properties})
+        db_node = self.dbapi.get_node_by_id(node.id)
+        self.assertEqual({}, db_node.driver_info)
+
+    def test_LazyJSONEncodedDict_type_check(self):
+        self.assertRaises(db_exc.DBError,
+                          utils.create_test_node,
+                          properties=['this is not a dict'])
@@ -201,6 +201,26 @@ class DbConductorTestCase(base.DbTestCase):
         result = self.dbapi.get_active_driver_dict(interval=two_minute)
         self.assertEqual(expected, result)
 
+    @mock.patch.object(timeutils, 'utcnow', autospec=True)
+    def test_get_active_conductor_weights(self, mock_utcnow):
+        self.config(heartbeat_timeout=60, group='conductor')
+        time_ = datetime.datetime(2000, 1, 1, 0, 0)
+
+        mock_utcnow.return_value = time_
+        self._create_test_cdr(id=1, hostname='old-host', weight=10)
+        mock_utcnow.return_value = time_ + datetime.timedelta(seconds=45)
+        self._create_test_cdr(id=2, hostname='host1', weight=100)
+        self._create_test_cdr(id=3, hostname='host2', weight=50)
+        self._create_test_cdr(id=4, hostname='host3')
+        self.dbapi.unregister_conductor('host2')
+
+        mock_utcnow.return_value = time_ + datetime.timedelta(seconds=90)
+        self.assertEqual({'host1': 100},
+                         self.dbapi.get_active_conductor_weights())
+        self.assertEqual({'host1': 100, 'old-host': 10},
+                         self.dbapi.get_active_conductor_weights(
+                             interval=120))
+
     @mock.patch.object(timeutils, 'utcnow', autospec=True)
     def test_get_offline_conductors(self, mock_utcnow):
         self.config(heartbeat_timeout=60, group='conductor')
@@ -23,6 +23,7 @@ from oslo_utils import uuidutils
 import six
 
 from ironic.common import exception
+from ironic.common import hash_ring
 from ironic.common import states
 from ironic.tests.db import base
 from ironic.tests.db import utils
@@ -33,6 +34,10 @@ class DbNodeTestCase(base.DbTestCase):
     def test_create_node(self):
         utils.create_test_node()
 
+    def test_create_node_sets_hash_key(self):
+        node = utils.create_test_node()
+        self.assertEqual(hash_ring.hash_key(node.uuid), node.hash_key)
+
     def test_create_node_already_exists(self):
         utils.create_test_node()
         self.assertRaises(exception.NodeAlreadyExists,
@@ -82,6 +87,29 @@ class DbNodeTestCase(base.DbTestCase):
                           self.dbapi.get_node_by_name,
                           'spam-eggs-bacon-spam')
 
+    def test_get_node_with_filters(self):
+        node = utils.create_test_node(provision_state=states.ACTIVE)
+        res = self.dbapi.get_node_by_id(
+            node.id, filters={'provision_state': states.ACTIVE})
+        self.assertEqual(node.uuid, res.uuid)
+        res = self.dbapi.get_node_by_uuid(
+            node.uuid, filters={'maintenance': False})
+        self.assertEqual(node.id, res.id)
+
+    def test_get_node_not_matching_filters(self):
+        node = utils.create_test_node(provision_state=states.ACTIVE)
+        self.assertRaises(exception.NodeNotEligible,
+                          self.dbapi.get_node_by_id, node.id,
+                          filters={'maintenance': True})
+        self.assertRaises(exception.NodeNotEligible,
+                          self.dbapi.get_node_by_uuid, node.uuid,
+                          filters={'provision_state_not_in':
+                                   [states.ACTIVE]})
+        self.assertRaises(exception.NodeNotFound,
+                          self.dbapi.get_node_by_uuid,
+                          '12345678-9999-0000-aaaa-123456789012',
+                          filters={'maintenance': False})
+
     def test_get_nodeinfo_list_defaults(self):
         node_id_list = []
         for i in range(1, 6):
@@ -152,6 +180,91 @@ class DbNodeTestCase(base.DbTestCase):
         self.assertEqual(sorted([node1.id, node3.id]),
                          sorted([r.id for r in res]))
 
+    def test_iter_nodeinfo(self):
+        nodes = [utils.create_test_node(uuid=uuidutils.generate_uuid(),
+                                        driver='driver-one' if i % 2
+                                        else 'driver-two')
+                 for i in range(5)]
+        res = self.dbapi.iter_nodeinfo(columns=['id', 'uuid'], batch_size=2)
+        self.assertEqual([(n.id, n.uuid) for n in nodes], list(res))
+
+        res = self.dbapi.iter_nodeinfo(filters={'driver': 'driver-one'},
+                                       sort_dir='desc', batch_size=1)
+        self.assertEqual([(nodes[3].id,), (nodes[1].id,)], list(res))
+
+    def test_iter_nodeinfo_sort_key(self):
+        now = timeutils.utcnow()
+        times = [now, now - datetime.timedelta(minutes=2), None,
+                 now - datetime.timedelta(minutes=1), now]
+        nodes = [utils.create_test_node(uuid=uuidutils.generate_uuid(),
+                                        provision_updated_at=t)
+                 for t in times]
+        res = self.dbapi.iter_nodeinfo(sort_key='provision_updated_at',
+                                       batch_size=2)
+        # The nodes with the same time are sorted by ID, the ones without
+        # a time are left out
+        self.assertEqual([nodes[i].id for i in (1, 3, 0, 4)],
+                         [r[0] for r in res])
+
+        res = self.dbapi.iter_nodeinfo(sort_key='provision_updated_at',
+                                       sort_dir='desc', batch_size=1)
+        self.assertEqual([nodes[i].id for i in (4, 0, 3, 1)],
+                         [r[0] for r in res])
+
+    def test_iter_nodeinfo_invalid_sort(self):
+        self.assertRaises(exception.InvalidParameterValue, list,
+                          self.dbapi.iter_nodeinfo(sort_key='foo'))
+        self.assertRaises(exception.InvalidParameterValue, list,
+                          self.dbapi.iter_nodeinfo(sort_dir='up'))
+
+    def test_get_nodeinfo_list_hash_key_ranges(self):
+        nodes = [utils.create_test_node(uuid=uuidutils.generate_uuid(),
+                                        driver=driver)
+                 for driver in ('driver-one', 'driver-one', 'driver-two')]
+        key = nodes[0].hash_key
+        # a node created before hash keys were stored
+        self.dbapi.update_node(nodes[2].id, {'hash_key': None})
+
+        res = self.dbapi.get_nodeinfo_list(
+            filters={'hash_key_ranges': {'driver-one': [(key, key)],
+                                         'driver-two': []}})
+        self.assertEqual(sorted([nodes[0].id, nodes[2].id]),
+                         sorted([r[0] for r in res]))
+
+        res = self.dbapi.get_nodeinfo_list(
+            filters={'hash_key_ranges': {'driver-two': [(key, key)]}})
+        self.assertEqual([nodes[2].id], [r[0] for r in res])
+
+        res = self.dbapi.get_nodeinfo_list(filters={'hash_key_ranges': {}})
+        self.assertEqual([], [r[0] for r in res])
+
+    def test_get_nodeinfo_list_provision_state_and_power_filters(self):
+        node1 = utils.create_test_node(
+            uuid=uuidutils.generate_uuid(),
+            provision_state=states.ACTIVE)
+        node2 = utils.create_test_node(
+            uuid=uuidutils.generate_uuid(),
+            provision_state=states.DEPLOYWAIT)
+        node3 = utils.create_test_node(
+            uuid=uuidutils.generate_uuid(),
+            provision_state=states.ACTIVE,
+            target_power_state=states.POWER_OFF)
+
+        res = self.dbapi.get_nodeinfo_list(
+            filters={'provision_state_not_in': [states.DEPLOYWAIT,
+                                                states.CLEANWAIT]})
+        self.assertEqual(sorted([node1.id, node3.id]),
+                         sorted([r[0] for r in res]))
+
+        res = self.dbapi.get_nodeinfo_list(
+            filters={'target_power_state': None})
+        self.assertEqual(sorted([node1.id, node2.id]),
+                         sorted([r[0] for r in res]))
+
+        res = self.dbapi.get_nodeinfo_list(
+            filters={'target_power_state': states.POWER_OFF})
+        self.assertEqual([node3.id], [r[0] for r in res])
+
     @mock.patch.object(timeutils, 'utcnow', autospec=True)
     def test_get_nodeinfo_list_provision(self, mock_utcnow):
         past = datetime.datetime(2000, 1, 1, 0, 0)
@@ -212,6 +325,16 @@ class DbNodeTestCase(base.DbTestCase):
         res_uuids = [r.uuid for r in res]
         six.assertCountEqual(self, uuids, res_uuids)
 
+    def test_get_node_list_fields(self):
+        node = utils.create_test_node(extra={'foo': 'bar'})
+        res = self.dbapi.get_node_list(fields=['id', 'uuid', 'extra'])
+        self.assertEqual(1, len(res))
+        self.assertEqual((node['id'], node['uuid'], {'foo': 'bar'}),
+                         (res[0].id, res[0].uuid, res[0].extra))
+        # The other columns are not loaded
+        self.assertNotIn('driver_info', res[0].__dict__)
+        self.assertNotIn('properties', res[0].__dict__)
+
     def test_get_node_list_with_filters(self):
         ch1 = utils.create_test_chassis(uuid=uuidutils.generate_uuid())
         ch2 = utils.create_test_chassis(uuid=uuidutils.generate_uuid())
@@ -240,6 +363,9 @@ class DbNodeTestCase(base.DbTestCase):
         res = self.dbapi.get_node_list(filters={'driver': 'bad-driver'})
         self.assertEqual([], [r.id for r in res])
 
+        res = self.dbapi.get_node_list(filters={'id_in': [node2.id, 42]})
+        self.assertEqual([node2.id], [r.id for r in res])
+
         res = self.dbapi.get_node_list(filters={'associated': True})
         self.assertEqual([node1.id], [r.id for r in res])
 
@@ -433,6 +559,85 @@ class DbNodeTestCase(base.DbTestCase):
         res = self.dbapi.get_node_by_uuid(uuid)
         self.assertEqual(r1, res.reservation)
 
+    def test_reserve_node_with_filters(self):
+        node = utils.create_test_node(provision_state=states.ACTIVE)
+
+        res = self.dbapi.reserve_node(
+            'fake-reservation', node.uuid,
+            filters={'maintenance': False,
+                     'provision_state': states.ACTIVE})
+
+        self.assertEqual('fake-reservation', res.reservation)
+
+    def test_reserve_node_not_matching_filters(self):
+        node = utils.create_test_node(provision_state=states.ACTIVE)
+
+        self.assertRaises(exception.NodeNotEligible,
+                          self.dbapi.reserve_node,
+                          'fake-reservation', node.uuid,
+                          filters={'provision_state_not_in':
+                                   [states.ACTIVE]})
+
+        # the node was not reserved
+        res = self.dbapi.get_node_by_uuid(node.uuid)
+        self.assertIsNone(res.reservation)
+
+    def test_reserve_reserved_node_with_filters(self):
+        node = utils.create_test_node(provision_state=states.ACTIVE)
+        self.dbapi.reserve_node('fake-reservation', node.uuid)
+
+        self.assertRaises(exception.NodeLocked,
+                          self.dbapi.reserve_node,
+                          'another-reservation', node.uuid,
+                          filters={'maintenance': False})
+
+    def test_reserve_nodes(self):
+        node1 = utils.create_test_node(id=1, uuid=uuidutils.generate_uuid())
+        node2 = utils.create_test_node(id=2, uuid=uuidutils.generate_uuid())
+        node3 = utils.create_test_node(id=3, uuid=uuidutils.generate_uuid())
+        utils.create_test_node(id=4, uuid=uuidutils.generate_uuid())
+        self.dbapi.reserve_node('another-reservation', node2.id)
+
+        res = self.dbapi.reserve_nodes(
+            'fake-reservation',
+            [node1.uuid, node2.id, node3.id, uuidutils.generate_uuid()])
+
+        self.assertEqual([node1.id, node3.id], sorted(n.id for n in res))
+        for node in res:
+            self.assertEqual('fake-reservation', node.reservation)
+        self.assertEqual(
+            ['another-reservation', 'fake-reservation', 'fake-reservation',
+             None],
+            [self.dbapi.get_node_by_id(i).reservation for i in (2, 1, 3, 4)])
+
+    def test_reserve_nodes_with_filters(self):
+        node1 = utils.create_test_node(id=1, uuid=uuidutils.generate_uuid(),
+                                       provision_state=states.ACTIVE)
+        node2 = utils.create_test_node(id=2, uuid=uuidutils.generate_uuid(),
+                                       provision_state=states.AVAILABLE)
+
+        res = self.dbapi.reserve_nodes(
+            'fake-reservation', [node1.id, node2.id],
+            filters={'provision_state': states.ACTIVE})
+
+        self.assertEqual([node1.id], [n.id for n in res])
+        self.assertIsNone(self.dbapi.get_node_by_id(node2.id).reservation)
+
+    def test_reserve_nodes_none_reserved(self):
+        node = utils.create_test_node()
+        self.dbapi.reserve_node('another-reservation', node.id)
+
+        self.assertEqual([], self.dbapi.reserve_nodes('fake-reservation',
+                                                      [node.id]))
+
+    def test_reserve_nodes_empty(self):
+        self.assertEqual([], self.dbapi.reserve_nodes('fake-reservation', []))
+
+    def test_reserve_nodes_invalid_identity(self):
+        self.assertRaises(exception.InvalidIdentity,
+                          self.dbapi.reserve_nodes,
+                          'fake-reservation', ['not-an-id'])
+
     def test_release_reservation(self):
         node = utils.create_test_node()
         uuid = node.uuid
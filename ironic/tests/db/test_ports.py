@@ -44,6 +44,17 @@ class DbPortTestCase(base.DbTestCase):
         res = self.dbapi.get_port_by_address(self.port.address)
         self.assertEqual(self.port.id, res.id)
 
+    def test_get_ports_by_addresses(self):
+        port = db_utils.create_test_port(uuid=uuidutils.generate_uuid(),
+                                         address='52:54:00:cf:2d:41')
+        res = self.dbapi.get_ports_by_addresses(
+            [self.port.address, port.address, '52:54:00:cf:2d:42'])
+        self.assertEqual(sorted([self.port.id, port.id]),
+                         sorted(r.id for r in res))
+
+    def test_get_ports_by_addresses_empty(self):
+        self.assertEqual([], self.dbapi.get_ports_by_addresses([]))
+
     def test_get_port_list(self):
         uuids = []
         for i in range(1, 6):
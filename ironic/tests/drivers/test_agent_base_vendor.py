@@ -18,7 +18,9 @@
 import time
 import types
 
+import eventlet
 import mock
+from oslo_utils import uuidutils
 
 from ironic.common import boot_devices
 from ironic.common import exception
@@ -54,6 +56,7 @@ class TestBaseAgentVendor(db_base.DbTestCase):
             'driver_internal_info': DRIVER_INTERNAL_INFO,
         }
         self.node = object_utils.create_test_node(self.context, **n)
+        self.addCleanup(agent_base_vendor._heartbeats.clear)
 
     def test_validate(self):
         with task_manager.acquire(self.context, self.node.uuid) as task:
@@ -159,13 +162,14 @@ class TestBaseAgentVendor(db_base.DbTestCase):
         self.assertEqual(self.node.as_dict(), node['node'])
         mock_get_node.assert_called_once_with(mock.ANY, 'fake uuid')
 
-    @mock.patch.object(objects.port.Port, 'get_by_address',
+    @mock.patch.object(agent_base_vendor.LOG, 'warning', autospec=True)
+    @mock.patch.object(objects.port.Port, 'list_by_addresses',
                        spec_set=types.FunctionType)
-    def test_find_ports_by_macs(self, mock_get_port):
+    def test_find_ports_by_macs(self, mock_list_ports, mock_log):
         fake_port = object_utils.get_test_port(self.context)
-        mock_get_port.return_value = fake_port
+        mock_list_ports.return_value = [fake_port]
 
-        macs = ['aa:bb:cc:dd:ee:ff']
+        macs = [fake_port.address, 'aa:bb:cc:dd:ee:fe']
 
         with task_manager.acquire(
                 self.context, self.node['uuid'], shared=True) as task:
@@ -173,11 +177,13 @@ class TestBaseAgentVendor(db_base.DbTestCase):
         self.assertEqual(1, len(ports))
         self.assertEqual(fake_port.uuid, ports[0].uuid)
         self.assertEqual(fake_port.node_id, ports[0].node_id)
+        mock_list_ports.assert_called_once_with(task, macs)
+        mock_log.assert_called_once_with(mock.ANY, 'aa:bb:cc:dd:ee:fe')
 
-    @mock.patch.object(objects.port.Port, 'get_by_address',
+    @mock.patch.object(objects.port.Port, 'list_by_addresses',
                        spec_set=types.FunctionType)
-    def test_find_ports_by_macs_bad_params(self, mock_get_port):
-        mock_get_port.side_effect = exception.PortNotFound(port="123")
+    def test_find_ports_by_macs_bad_params(self, mock_list_ports):
+        mock_list_ports.return_value = []
 
         macs = ['aa:bb:cc:dd:ee:ff']
         with task_manager.acquire(
@@ -291,6 +297,230 @@ class TestBaseAgentVendor(db_base.DbTestCase):
                 self.context, self.node['uuid'], shared=True) as task:
             self.passthru.heartbeat(task, **kwargs)
 
+    @mock.patch.object(agent_base_vendor, '_time', autospec=True)
+    def test_heartbeat_new_agent_url(self, time_mock):
+        time_mock.return_value = 42
+        kwargs = {
+            'agent_url': 'http://127.0.0.1:9999/bar'
+        }
+        with task_manager.acquire(
+                self.context, self.node['uuid'], shared=True) as task:
+            self.passthru.heartbeat(task, **kwargs)
+            self.assertFalse(task.shared)
+        self.node.refresh()
+        self.assertEqual('http://127.0.0.1:9999/bar',
+                         self.node.driver_internal_info['agent_url'])
+        driver_internal_info = self.node.driver_internal_info
+        self.assertEqual(42, driver_internal_info['agent_last_heartbeat'])
+        self.assertEqual({}, agent_base_vendor._heartbeats)
+
+    @mock.patch.object(objects.node.Node, 'touch_provisioning',
+                       autospec=True)
+    @mock.patch.object(agent_base_vendor.BaseAgentVendor, 'deploy_is_done',
+                       autospec=True)
+    @mock.patch.object(agent_base_vendor.BaseAgentVendor, 'deploy_has_started',
+                       autospec=True)
+    @mock.patch.object(agent_base_vendor, '_time', autospec=True)
+    def test_heartbeat_in_memory(self, time_mock, started_mock, done_mock,
+                                 touch_mock):
+        time_mock.return_value = 42
+        started_mock.return_value = True
+        done_mock.return_value = False
+        self.node.provision_state = states.DEPLOYWAIT
+        self.node.save()
+        kwargs = {
+            'agent_url': DRIVER_INTERNAL_INFO['agent_url']
+        }
+        with task_manager.acquire(
+                self.context, self.node['uuid'], shared=True) as task:
+            with mock.patch.object(objects.node.Node, 'save',
+                                   autospec=True) as save_mock:
+                self.passthru.heartbeat(task, **kwargs)
+            self.assertTrue(task.shared)
+        self.assertFalse(save_mock.called)
+        self.assertFalse(touch_mock.called)
+        self.assertEqual({self.node.uuid: 42}, agent_base_vendor._heartbeats)
+
+    def test_heartbeat_not_waiting_forgotten(self):
+        agent_base_vendor._heartbeats[self.node.uuid] = 1
+        kwargs = {
+            'agent_url': DRIVER_INTERNAL_INFO['agent_url']
+        }
+        with task_manager.acquire(
+                self.context, self.node['uuid'], shared=True) as task:
+            self.passthru.heartbeat(task, **kwargs)
+        self.assertEqual({}, agent_base_vendor._heartbeats)
+
+    @mock.patch.object(agent_base_vendor.BaseAgentVendor, 'continue_deploy',
+                       autospec=True)
+    @mock.patch.object(agent_base_vendor.BaseAgentVendor, 'deploy_has_started',
+                       autospec=True)
+    def test_heartbeat_continue_deploy(self, started_mock, continue_mock):
+        started_mock.return_value = False
+        kwargs = {
+            'agent_url': DRIVER_INTERNAL_INFO['agent_url']
+        }
+        self.node.provision_state = states.DEPLOYWAIT
+        self.node.save()
+        with task_manager.acquire(
+                self.context, self.node['uuid'], shared=True) as task:
+            self.passthru.heartbeat(task, **kwargs)
+            self.assertFalse(task.shared)
+        continue_mock.assert_called_once_with(mock.ANY, task, **kwargs)
+
+    @mock.patch.object(agent_base_vendor.BaseAgentVendor, 'continue_deploy',
+                       autospec=True)
+    @mock.patch.object(agent_base_vendor.BaseAgentVendor, 'deploy_has_started',
+                       autospec=True)
+    def test_heartbeat_continue_deploy_moved_on(self, started_mock,
+                                                continue_mock):
+        started_mock.return_value = False
+        kwargs = {
+            'agent_url': DRIVER_INTERNAL_INFO['agent_url']
+        }
+        self.node.provision_state = states.DEPLOYWAIT
+        self.node.save()
+        with task_manager.acquire(
+                self.context, self.node['uuid'], shared=True) as task:
+            # Another heartbeat moves the deployment on in the meantime
+            self.node.provision_state = states.DEPLOYING
+            self.node.save()
+            self.passthru.heartbeat(task, **kwargs)
+        self.assertFalse(continue_mock.called)
+
+    @mock.patch.object(deploy_utils, 'set_failed_state', autospec=True)
+    @mock.patch.object(agent_base_vendor.BaseAgentVendor, 'reboot_to_instance',
+                       autospec=True)
+    @mock.patch.object(agent_base_vendor.BaseAgentVendor, 'deploy_is_done',
+                       autospec=True)
+    @mock.patch.object(agent_base_vendor.BaseAgentVendor, 'deploy_has_started',
+                       autospec=True)
+    def test_heartbeat_deploy_done_locked(self, started_mock, done_mock,
+                                          reboot_mock, failed_mock):
+        # Another heartbeat moves the deployment on, the node is locked
+        started_mock.return_value = True
+        done_mock.return_value = True
+        kwargs = {
+            'agent_url': DRIVER_INTERNAL_INFO['agent_url']
+        }
+        self.node.provision_state = states.DEPLOYWAIT
+        self.node.save()
+        with task_manager.acquire(
+                self.context, self.node['uuid'], shared=True) as task:
+            with mock.patch.object(task, 'upgrade_lock',
+                                   autospec=True) as upgrade_mock:
+                upgrade_mock.side_effect = exception.NodeLocked(
+                    node=self.node.uuid, host='other')
+                self.passthru.heartbeat(task, **kwargs)
+            self.assertTrue(task.shared)
+        self.assertFalse(reboot_mock.called)
+        self.assertFalse(failed_mock.called)
+        self.node.refresh()
+        self.assertEqual(states.DEPLOYWAIT, self.node.provision_state)
+
+    @mock.patch.object(deploy_utils, 'set_failed_state', autospec=True)
+    @mock.patch.object(agent_base_vendor.BaseAgentVendor, 'deploy_is_done',
+                       autospec=True)
+    @mock.patch.object(agent_base_vendor.BaseAgentVendor, 'deploy_has_started',
+                       autospec=True)
+    def test_heartbeat_deploy_done_fails_moved_on(self, started_mock,
+                                                  done_mock, failed_mock):
+        started_mock.return_value = True
+        kwargs = {
+            'agent_url': DRIVER_INTERNAL_INFO['agent_url']
+        }
+        self.node.provision_state = states.DEPLOYWAIT
+        self.node.save()
+
+        def deploy_is_done(vendor, task):
+            # The agent fails to answer while another heartbeat finishes
+            # the deployment
+            self.node.provision_state = states.ACTIVE
+            self.node.save()
+            raise Exception('LlamaException')
+
+        done_mock.side_effect = deploy_is_done
+        with task_manager.acquire(
+                self.context, self.node['uuid'], shared=True) as task:
+            self.passthru.heartbeat(task, **kwargs)
+        self.assertFalse(failed_mock.called)
+        self.node.refresh()
+        self.assertEqual(states.ACTIVE, self.node.provision_state)
+
+    @mock.patch('ironic.conductor.manager.cleaning_error_handler')
+    @mock.patch.object(agent_base_vendor.BaseAgentVendor,
+                       '_notify_conductor_resume_clean', autospec=True)
+    @mock.patch.object(agent_client.AgentClient, 'get_commands_status',
+                       autospec=True)
+    def test_heartbeat_continue_cleaning_locked(self, status_mock,
+                                                notify_mock, handler_mock):
+        kwargs = {
+            'agent_url': DRIVER_INTERNAL_INFO['agent_url']
+        }
+        self.node.clean_step = {
+            'priority': 10,
+            'interface': 'deploy',
+            'step': 'erase_devices',
+            'reboot_requested': False
+        }
+        self.node.provision_state = states.CLEANWAIT
+        self.node.save()
+        status_mock.return_value = [{
+            'command_status': 'SUCCEEDED',
+            'command_name': 'execute_clean_step',
+            'command_result': {
+                'clean_step': self.node.clean_step
+            }
+        }]
+        with task_manager.acquire(
+                self.context, self.node['uuid'], shared=True) as task:
+            with mock.patch.object(task, 'upgrade_lock',
+                                   autospec=True) as upgrade_mock:
+                upgrade_mock.side_effect = exception.NodeLocked(
+                    node=self.node.uuid, host='other')
+                self.passthru.heartbeat(task, **kwargs)
+        self.assertFalse(notify_mock.called)
+        self.assertFalse(handler_mock.called)
+
+    @mock.patch.object(eventlet.greenthread, 'spawn_n',
+                       lambda f, *args, **kwargs: f(*args, **kwargs))
+    @mock.patch.object(objects.node.Node, 'touch_provisioning',
+                       autospec=True)
+    def test_flush_heartbeats(self, touch_mock):
+        agent_base_vendor._heartbeats[self.node.uuid] = 42
+        # A node deleted in the meantime
+        agent_base_vendor._heartbeats[uuidutils.generate_uuid()] = 1
+        self.passthru._flush_heartbeats(mock.Mock(), self.context)
+        self.node.refresh()
+        driver_internal_info = self.node.driver_internal_info
+        self.assertEqual(42, driver_internal_info['agent_last_heartbeat'])
+        self.assertEqual({}, agent_base_vendor._heartbeats)
+        # the node does not wait for its agent
+        self.assertFalse(touch_mock.called)
+
+    @mock.patch.object(eventlet.greenthread, 'spawn_n',
+                       lambda f, *args, **kwargs: f(*args, **kwargs))
+    @mock.patch.object(objects.node.Node, 'touch_provisioning',
+                       autospec=True)
+    def test_flush_heartbeats_touch_provisioning(self, touch_mock):
+        self.node.provision_state = states.CLEANWAIT
+        self.node.save()
+        agent_base_vendor._heartbeats[self.node.uuid] = 42
+        self.passthru._flush_heartbeats(mock.Mock(), self.context)
+        touch_mock.assert_called_once_with(mock.ANY)
+        self.assertEqual(self.node.uuid, touch_mock.call_args[0][0].uuid)
+        self.assertEqual({}, agent_base_vendor._heartbeats)
+
+    @mock.patch.object(eventlet.greenthread, 'spawn_n',
+                       lambda f, *args, **kwargs: f(*args, **kwargs))
+    @mock.patch.object(task_manager, 'acquire', autospec=True)
+    def test_flush_heartbeats_locked(self, acquire_mock):
+        acquire_mock.side_effect = exception.NodeLocked(node='foo',
+                                                        host='bar')
+        agent_base_vendor._heartbeats[self.node.uuid] = 42
+        self.passthru._flush_heartbeats(mock.Mock(), self.context)
+        self.assertEqual({self.node.uuid: 42}, agent_base_vendor._heartbeats)
+
     def test_heartbeat_bad(self):
         kwargs = {}
         with task_manager.acquire(
@@ -311,10 +541,11 @@ class TestBaseAgentVendor(db_base.DbTestCase):
             'agent_url': 'http://127.0.0.1:9999/bar'
         }
         done_mock.side_effect = iter([Exception('LlamaException')])
+        self.node.provision_state = states.DEPLOYWAIT
+        self.node.target_provision_state = states.ACTIVE
+        self.node.save()
         with task_manager.acquire(
                 self.context, self.node['uuid'], shared=True) as task:
-            task.node.provision_state = states.DEPLOYWAIT
-            task.node.target_provision_state = states.ACTIVE
             self.passthru.heartbeat(task, **kwargs)
             failed_mock.assert_called_once_with(task, mock.ANY)
         log_mock.assert_called_once_with(
@@ -339,7 +570,7 @@ class TestBaseAgentVendor(db_base.DbTestCase):
                     self.context, self.node.uuid, shared=True) as task:
                 self.passthru.heartbeat(task, **kwargs)
 
-            mock_touch.assert_called_once_with(mock.ANY)
+            self.assertFalse(mock_touch.called)
             mock_notify.assert_called_once_with(mock.ANY, task)
             mock_set_steps.assert_called_once_with(task)
             # Reset mocks for the next interaction
@@ -367,7 +598,7 @@ class TestBaseAgentVendor(db_base.DbTestCase):
                     self.context, self.node.uuid, shared=True) as task:
                 self.passthru.heartbeat(task, **kwargs)
 
-            mock_touch.assert_called_once_with(mock.ANY)
+            self.assertFalse(mock_touch.called)
             mock_continue.assert_called_once_with(mock.ANY, task, **kwargs)
             # Reset mocks for the next interaction
             mock_touch.reset_mock()
@@ -430,8 +661,8 @@ class TestBaseAgentVendor(db_base.DbTestCase):
     @mock.patch.object(objects.node.Node, 'touch_provisioning', autospec=True)
     @mock.patch.object(agent_base_vendor.BaseAgentVendor, 'deploy_has_started',
                        autospec=True)
-    def test_heartbeat_touch_provisioning(self, mock_deploy_started,
-                                          mock_touch):
+    def test_heartbeat_no_touch_provisioning(self, mock_deploy_started,
+                                             mock_touch):
         mock_deploy_started.return_value = True
         kwargs = {
             'agent_url': 'http://127.0.0.1:9999/bar'
@@ -443,7 +674,8 @@ class TestBaseAgentVendor(db_base.DbTestCase):
                 self.context, self.node.uuid, shared=True) as task:
             self.passthru.heartbeat(task, **kwargs)
 
-        mock_touch.assert_called_once_with(mock.ANY)
+        # NOTE: written by _flush_heartbeats() only
+        self.assertFalse(mock_touch.called)
 
     def test_vendor_passthru_vendor_routes(self):
         expected = ['heartbeat']
@@ -36,6 +36,10 @@ class FakeVendorInterface(driver_base.VendorInterface):
     def driver_noexception(self):
         return "Fake"
 
+    @driver_base.passthru(['POST'], require_exclusive_lock=False)
+    def shared_noexception(self):
+        return "Fake"
+
     @driver_base.passthru(['POST'])
     def ironicexception(self):
         raise exception.IronicException("Fake!")
@@ -75,6 +79,15 @@ class PassthruDecoratorTestCase(base.TestCase):
         mock_log.exception.assert_called_with(
             mock.ANY, 'normalexception')
 
+    def test_passthru_require_exclusive_lock(self):
+        self.assertTrue(
+            self.fvi.vendor_routes['noexception']['require_exclusive_lock'])
+        self.assertFalse(
+            self.fvi.vendor_routes['shared_noexception'][
+                'require_exclusive_lock'])
+        self.assertNotIn('require_exclusive_lock',
+                         self.fvi.driver_routes['driver_noexception'])
+
     def test_passthru_check_func_references(self):
         inst1 = FakeVendorInterface()
         inst2 = FakeVendorInterface()
@@ -241,3 +254,50 @@ class RAIDInterfaceTestCase(base.TestCase):
         raid_interface = MyRAIDInterface()
         raid_interface.get_logical_disk_properties()
         get_properties_mock.assert_called_once_with(raid_schema)
+
+
+class MyPowerInterface(driver_base.PowerInterface):
+
+    def get_properties(self):
+        pass
+
+    def validate(self, task):
+        pass
+
+    def get_power_state(self, task):
+        pass
+
+    def set_power_state(self, task, power_state):
+        pass
+
+    def reboot(self, task):
+        pass
+
+
+class MyBatchPowerInterface(MyPowerInterface):
+
+    def get_power_states(self, tasks):
+        pass
+
+
+class PowerInterfaceTestCase(base.TestCase):
+
+    @mock.patch.object(MyPowerInterface, 'get_power_state', autospec=True)
+    def test_get_power_states(self, get_power_state_mock):
+        power = MyPowerInterface()
+        task1 = mock.MagicMock()
+        task1.node.uuid = 'uuid1'
+        task2 = mock.MagicMock()
+        task2.node.uuid = 'uuid2'
+        error = exception.PowerStateFailure(pstate='power on')
+        get_power_state_mock.side_effect = ['power on', error]
+
+        power_states = power.get_power_states([task1, task2])
+
+        self.assertEqual({'uuid1': 'power on', 'uuid2': error}, power_states)
+        get_power_state_mock.assert_has_calls([mock.call(power, task1),
+                                               mock.call(power, task2)])
+
+    def test_supports_get_power_states(self):
+        self.assertFalse(MyPowerInterface().supports_get_power_states)
+        self.assertTrue(MyBatchPowerInterface().supports_get_power_states)
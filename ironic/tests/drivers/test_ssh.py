@@ -15,6 +15,7 @@
 
 """Test class for Ironic SSH power driver."""
 
+import collections
 import tempfile
 
 import mock
@@ -377,6 +378,61 @@ class SSHPrivateMethodsTestCase(db_base.DbTestCase):
                           info)
         self.assertEqual(expected, exec_ssh_mock.call_args_list)
 
+    @mock.patch.object(processutils, 'ssh_execute', autospec=True)
+    def test__get_power_states(self, exec_ssh_mock):
+        info1 = ssh._parse_driver_info(self.node)
+        info1['macs'] = ["52:54:00:cf:2d:31"]
+        info2 = dict(info1, macs=["52:54:00:cf:2d:32"])
+        info3 = dict(info1, macs=["52:54:00:cf:2d:33"])
+        cmd_set = info1['cmd_set']
+        exec_ssh_mock.side_effect = iter([
+            ('Node1\nNode2\n', ''),
+            ('"Node2" {b43c4982-110c-4c29-9325-d5f41b053513}\n', ''),
+            ('52:54:00:cf:2d:31', ''),
+            ('52:54:00:cf:2d:32', '')])
+
+        power_states = ssh._get_power_states(
+            self.sshclient, collections.OrderedDict(
+                [('uuid1', info1), ('uuid2', info2), ('uuid3', info3)]))
+
+        self.assertEqual(states.POWER_OFF, power_states['uuid1'])
+        self.assertEqual(states.POWER_ON, power_states['uuid2'])
+        self.assertIsInstance(power_states['uuid3'], exception.NodeNotFound)
+        base_cmd = cmd_set['base_cmd']
+        macs_cmd = "%s %s" % (base_cmd, cmd_set['get_node_macs'])
+        expected = [
+            mock.call(self.sshclient,
+                      "%s %s" % (base_cmd, cmd_set['list_all'])),
+            mock.call(self.sshclient,
+                      "%s %s" % (base_cmd, cmd_set['list_running'])),
+            mock.call(self.sshclient,
+                      macs_cmd.replace('{_NodeName_}', 'Node1')),
+            mock.call(self.sshclient,
+                      macs_cmd.replace('{_NodeName_}', 'Node2'))]
+        # The VMs and the running VMs are only listed once
+        self.assertEqual(expected, exec_ssh_mock.call_args_list)
+
+    @mock.patch.object(processutils, 'ssh_execute', autospec=True)
+    def test__get_power_states_list_running_per_node(self, exec_ssh_mock):
+        driver_info = db_utils.get_test_ssh_info()
+        driver_info['ssh_virt_type'] = 'vmware'
+        node = obj_utils.get_test_node(self.context, driver='fake_ssh',
+                                       driver_info=driver_info)
+        info = ssh._parse_driver_info(node)
+        info['macs'] = ["52:54:00:cf:2d:31"]
+        exec_ssh_mock.side_effect = iter([('1\n', ''),
+                                          ('52:54:00:cf:2d:31', ''),
+                                          ('"1"\n', '')])
+
+        power_states = ssh._get_power_states(self.sshclient,
+                                             {'uuid1': info})
+
+        self.assertEqual({'uuid1': states.POWER_ON}, power_states)
+        running_cmd = "%s %s" % (info['cmd_set']['base_cmd'],
+                                 info['cmd_set']['list_running'])
+        exec_ssh_mock.assert_called_with(
+            self.sshclient, running_cmd.replace('{_NodeName_}', '1'))
+
     @mock.patch.object(processutils, 'ssh_execute', autospec=True)
     @mock.patch.object(ssh, '_get_power_status', autospec=True)
     @mock.patch.object(ssh, '_get_hosts_name_for_node', autospec=True)
@@ -618,6 +674,46 @@ class SSHDriverTestCase(db_base.DbTestCase):
                               task.driver.power.validate,
                               task)
 
+    @mock.patch.object(utils, 'ssh_connect', autospec=True)
+    @mock.patch.object(ssh, '_get_power_states', autospec=True)
+    def test_get_power_states(self, get_power_states_mock, ssh_connect_mock):
+        other_host_info = db_utils.get_test_ssh_info()
+        other_host_info['ssh_address'] = '10.0.0.2'
+        node2 = obj_utils.create_test_node(
+            self.context, driver='fake_ssh', uuid=uuidutils.generate_uuid(),
+            driver_info=db_utils.get_test_ssh_info())
+        node3 = obj_utils.create_test_node(
+            self.context, driver='fake_ssh', uuid=uuidutils.generate_uuid(),
+            driver_info=other_host_info)
+        node4 = obj_utils.create_test_node(
+            self.context, driver='fake_ssh', uuid=uuidutils.generate_uuid(),
+            driver_info={})
+        ssh_connect_mock.return_value = self.sshclient
+        error = exception.SSHCommandFailed(cmd='fake')
+        get_power_states_mock.side_effect = (
+            lambda ssh_obj, infos: dict.fromkeys(
+                infos, states.POWER_ON if len(infos) == 2 else error))
+
+        tasks = [task_manager.acquire(self.context, n.uuid, shared=True)
+                 for n in (self.node, node2, node3, node4)]
+        try:
+            power_states = self.driver.power.get_power_states(tasks)
+        finally:
+            for task in tasks:
+                task.release_resources()
+
+        self.assertEqual(states.POWER_ON, power_states[self.node.uuid])
+        self.assertEqual(states.POWER_ON, power_states[node2.uuid])
+        self.assertEqual(error, power_states[node3.uuid])
+        self.assertIsInstance(power_states[node4.uuid],
+                              exception.MissingParameterValue)
+        # One connection per host
+        self.assertEqual(2, ssh_connect_mock.call_count)
+        self.assertEqual(2, get_power_states_mock.call_count)
+
+    def test_supports_get_power_states(self):
+        self.assertTrue(self.driver.power.supports_get_power_states)
+
     @mock.patch.object(driver_utils, 'get_node_mac_addresses', autospec=True)
     @mock.patch.object(ssh, '_get_connection', autospec=True)
     @mock.patch.object(ssh, '_power_on', autospec=True)
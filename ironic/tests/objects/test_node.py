@@ -17,6 +17,7 @@ import mock
 from testtools.matchers import HasLength
 
 from ironic.common import exception
+from ironic.common import utils as common_utils
 from ironic import objects
 from ironic.tests.db import base
 from ironic.tests.db import utils
@@ -36,7 +37,7 @@ class TestNodeObject(base.DbTestCase):
 
             node = objects.Node.get(self.context, node_id)
 
-            mock_get_node.assert_called_once_with(node_id)
+            mock_get_node.assert_called_once_with(node_id, filters=None)
             self.assertEqual(self.context, node._context)
 
     def test_get_by_uuid(self):
@@ -47,9 +48,20 @@ class TestNodeObject(base.DbTestCase):
 
             node = objects.Node.get(self.context, uuid)
 
-            mock_get_node.assert_called_once_with(uuid)
+            mock_get_node.assert_called_once_with(uuid, filters=None)
             self.assertEqual(self.context, node._context)
 
+    def test_get_with_filters(self):
+        uuid = self.fake_node['uuid']
+        filters = {'maintenance': False}
+        with mock.patch.object(self.dbapi, 'get_node_by_uuid',
+                               autospec=True) as mock_get_node:
+            mock_get_node.return_value = self.fake_node
+
+            objects.Node.get(self.context, uuid, filters=filters)
+
+            mock_get_node.assert_called_once_with(uuid, filters=filters)
+
     def test_get_bad_id_and_uuid(self):
         self.assertRaises(exception.InvalidIdentity,
                           objects.Node.get, self.context, 'not-a-uuid')
@@ -69,7 +81,7 @@ class TestNodeObject(base.DbTestCase):
                 n.driver = "fake-driver"
                 n.save()
 
-                mock_get_node.assert_called_once_with(uuid)
+                mock_get_node.assert_called_once_with(uuid, filters=None)
                 mock_update_node.assert_called_once_with(
                     uuid, {'properties': {"fake": "property"},
                            'driver': 'fake-driver',
@@ -81,7 +93,7 @@ class TestNodeObject(base.DbTestCase):
         uuid = self.fake_node['uuid']
         returns = [dict(self.fake_node, properties={"fake": "first"}),
                    dict(self.fake_node, properties={"fake": "second"})]
-        expected = [mock.call(uuid), mock.call(uuid)]
+        expected = [mock.call(uuid, filters=None)] * 2
         with mock.patch.object(self.dbapi, 'get_node_by_uuid',
                                side_effect=returns,
                                autospec=True) as mock_get_node:
@@ -100,6 +112,30 @@ class TestNodeObject(base.DbTestCase):
             self.assertThat(nodes, HasLength(1))
             self.assertIsInstance(nodes[0], objects.Node)
             self.assertEqual(self.context, nodes[0]._context)
+            mock_get_list.assert_called_once_with(
+                filters=None, limit=None, marker=None, sort_key=None,
+                sort_dir=None, fields=None)
+
+    def test_list_fields(self):
+        with mock.patch.object(self.dbapi, 'get_node_list',
+                               autospec=True) as mock_get_list:
+            mock_get_list.return_value = [self.fake_node]
+            nodes = objects.Node.list(self.context, fields=['uuid', 'extra'])
+            self.assertThat(nodes, HasLength(1))
+            self.assertEqual(self.fake_node['uuid'], nodes[0].uuid)
+            self.assertEqual(self.fake_node['extra'], nodes[0].extra)
+            self.assertFalse(nodes[0].obj_attr_is_set('driver_info'))
+            mock_get_list.assert_called_once_with(
+                filters=None, limit=None, marker=None, sort_key=None,
+                sort_dir=None, fields=['extra', 'id', 'uuid'])
+
+    def test_get_json_fields_decoded_on_access(self):
+        node = utils.create_test_node(properties={'cpus': 4})
+        node = objects.Node.get(self.context, node.id)
+        self.assertIsInstance(node._properties, common_utils.LazyJsonDict)
+        self.assertEqual({'cpus': 4}, node.properties)
+        self.assertIs(dict, type(node._properties))
+        self.assertEqual(set(), node.obj_what_changed())
 
     def test_reserve(self):
         with mock.patch.object(self.dbapi, 'reserve_node',
@@ -109,9 +145,36 @@ class TestNodeObject(base.DbTestCase):
             fake_tag = 'fake-tag'
             node = objects.Node.reserve(self.context, fake_tag, node_id)
             self.assertIsInstance(node, objects.Node)
-            mock_reserve.assert_called_once_with(fake_tag, node_id)
+            mock_reserve.assert_called_once_with(fake_tag, node_id,
+                                                 filters=None)
             self.assertEqual(self.context, node._context)
 
+    def test_reserve_with_filters(self):
+        with mock.patch.object(self.dbapi, 'reserve_node',
+                               autospec=True) as mock_reserve:
+            mock_reserve.return_value = self.fake_node
+            node_id = self.fake_node['id']
+            filters = {'maintenance': False}
+            objects.Node.reserve(self.context, 'fake-tag', node_id,
+                                 filters=filters)
+            mock_reserve.assert_called_once_with('fake-tag', node_id,
+                                                 filters=filters)
+
+    def test_reserve_many(self):
+        with mock.patch.object(self.dbapi, 'reserve_nodes',
+                               autospec=True) as mock_reserve:
+            mock_reserve.return_value = [self.fake_node]
+            node_ids = [self.fake_node['id'], 'fake-uuid']
+            filters = {'maintenance': False}
+            nodes = objects.Node.reserve_many(self.context, 'fake-tag',
+                                              node_ids, filters=filters)
+            mock_reserve.assert_called_once_with('fake-tag', node_ids,
+                                                 filters=filters)
+            self.assertEqual(1, len(nodes))
+            self.assertIsInstance(nodes[0], objects.Node)
+            self.assertEqual(self.fake_node['uuid'], nodes[0].uuid)
+            self.assertEqual(self.context, nodes[0]._context)
+
     def test_reserve_node_not_found(self):
         with mock.patch.object(self.dbapi, 'reserve_node',
                                autospec=True) as mock_reserve:
@@ -104,6 +104,17 @@ class TestPortObject(base.DbTestCase):
             self.assertEqual(expected, mock_get_port.call_args_list)
             self.assertEqual(self.context, p._context)
 
+    def test_list_by_addresses(self):
+        address = self.fake_port['address']
+        with mock.patch.object(self.dbapi, 'get_ports_by_addresses',
+                               autospec=True) as mock_get_ports:
+            mock_get_ports.return_value = [self.fake_port]
+            ports = objects.Port.list_by_addresses(self.context, [address])
+            mock_get_ports.assert_called_once_with([address])
+            self.assertThat(ports, HasLength(1))
+            self.assertIsInstance(ports[0], objects.Port)
+            self.assertEqual(self.context, ports[0]._context)
+
     def test_list(self):
         with mock.patch.object(self.dbapi, 'get_port_list',
                                autospec=True) as mock_get_list:
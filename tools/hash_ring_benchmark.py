@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the number of hash ring lookups per second.
+
+Compares looking up nodes one at a time without cache (the behaviour of
+HashRing.get_hosts() before lookups were cached), with a warm cache, and
+in one pass with HashRing.get_hosts_batch().
+"""
+
+import optparse
+import os
+import sys
+import time
+import uuid
+
+top_dir = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                       os.pardir))
+sys.path.insert(0, top_dir)
+
+from oslo_config import cfg  # noqa
+
+from ironic.common import hash_ring  # noqa
+
+CONF = cfg.CONF
+
+
+def _measure(func, count, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return count / best if best else float('inf')
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--hosts", dest="hosts", type="int", default=20,
+                      help="number of conductors in the ring")
+    parser.add_option("--nodes", dest="nodes", type="int", default=3000,
+                      help="number of nodes to look up")
+    parser.add_option("--repeat", dest="repeat", type="int", default=5,
+                      help="number of runs, the best one is reported")
+    options, args = parser.parse_args()
+
+    CONF([], project='ironic')
+    hosts = ['conductor-%d' % i for i in range(options.hosts)]
+    nodes = [str(uuid.uuid4()) for i in range(options.nodes)]
+
+    CONF.set_override('hash_ring_cache_size', 0)
+    ring = hash_ring.HashRing(hosts)
+    uncached = _measure(lambda: [ring.get_hosts(n) for n in nodes],
+                        len(nodes), options.repeat)
+    batch = _measure(lambda: ring.get_hosts_batch(nodes),
+                     len(nodes), options.repeat)
+
+    CONF.set_override('hash_ring_cache_size', len(nodes))
+    ring = hash_ring.HashRing(hosts)
+    ring.get_hosts_batch(nodes)
+    cached = _measure(lambda: [ring.get_hosts(n) for n in nodes],
+                      len(nodes), options.repeat)
+
+    print("%d hosts, %d nodes, %d partitions" %
+          (options.hosts, options.nodes, len(ring._partitions)))
+    print("get_hosts(), no cache:   %10.0f lookups/s" % uncached)
+    print("get_hosts_batch():       %10.0f lookups/s" % batch)
+    print("get_hosts(), warm cache: %10.0f lookups/s" % cached)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the throughput of GET /v1/nodes/detail.
+
+The nodes are stored in a temporary SQLite database, and pages of nodes
+are requested from the API application, without authentication. The
+collection of nodes is serialized with NodeCollection.convert_to_dict(),
+and with NodeCollection.convert_with_links() and WSME, which is what the
+API did before. The time to the first byte of the response is then
+compared with the time to the whole response, with the collection built
+at once and streamed (the [api]stream_collections option).
+"""
+
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+top_dir = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                       os.pardir))
+sys.path.insert(0, top_dir)
+
+from oslo_config import cfg  # noqa
+from oslo_db.sqlalchemy import enginefacade  # noqa
+from oslo_utils import uuidutils  # noqa
+import webob  # noqa
+import webtest  # noqa
+from wsme.rest import json as wsme_json  # noqa
+
+from ironic.api import app as api_app  # noqa
+from ironic.api.controllers.v1 import node as api_node  # noqa
+from ironic.common import policy  # noqa
+from ironic.common import rpc  # noqa
+from ironic.common import states  # noqa
+from ironic.db import api as db_api  # noqa
+from ironic.db.sqlalchemy import models  # noqa
+
+CONF = cfg.CONF
+
+
+def _create_nodes(count):
+    dbapi = db_api.get_instance()
+    chassis = dbapi.create_chassis({'uuid': uuidutils.generate_uuid()})
+    for i in range(count):
+        dbapi.create_node({
+            'uuid': uuidutils.generate_uuid(),
+            'name': 'node-%d' % i,
+            'driver': 'fake',
+            'chassis_id': chassis.id,
+            'provision_state': states.ACTIVE,
+            'power_state': states.POWER_ON,
+            'driver_info': {'ipmi_address': '10.0.%d.%d' % (i // 256,
+                                                            i % 256),
+                            'ipmi_username': 'admin',
+                            'ipmi_password': 'secret'},
+            'properties': {'cpus': 8, 'memory_mb': 16384, 'local_gb': 100,
+                           'cpu_arch': 'x86_64',
+                           'capabilities': 'boot_mode:uefi'},
+            'instance_info': {'image_source': 'glance://image',
+                              'root_gb': 10},
+            'extra': {'rack': 'r%d' % (i // 40)}})
+
+
+def _convert_with_wsme(nodes, limit, url=None, fields=None, **kwargs):
+    collection = api_node.NodeCollection.convert_with_links(
+        nodes, limit, url=url, fields=fields, **kwargs)
+    return wsme_json.tojson(api_node.NodeCollection, collection)
+
+
+def _measure(app, url, headers, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        body = app.get(url, headers=headers).body
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return 1 / best, body
+
+
+def _measure_first_byte(app, url, headers, repeat):
+    best_first = best_all = None
+    for i in range(repeat):
+        request = webob.Request.blank(url, headers=headers)
+        start = time.time()
+        status, response_headers, app_iter = request.call_application(app)
+        chunks = iter(app_iter)
+        next(chunks)
+        first = time.time() - start
+        for chunk in chunks:
+            pass
+        elapsed = time.time() - start
+        best_first = first if best_first is None else min(best_first, first)
+        best_all = elapsed if best_all is None else min(best_all, elapsed)
+    return best_first, best_all
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--nodes", dest="nodes", type="int", default=1000,
+                      help="number of nodes to create")
+    parser.add_option("--version", dest="version", default="1.13",
+                      help="API version requested")
+    parser.add_option("--repeat", dest="repeat", type="int", default=5,
+                      help="number of requests, the best one is reported")
+    options, args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        CONF([], project='ironic')
+        CONF.set_override('connection',
+                          'sqlite:///%s' % os.path.join(tmp_dir, 'ironic.db'),
+                          group='database')
+        CONF.set_override('auth_strategy', 'noauth')
+        rpc.init(CONF)
+        policy.init_enforcer(policy_file=os.path.join(
+            top_dir, 'etc', 'ironic', 'policy.json'))
+        CONF.set_override('max_limit', options.nodes, group='api')
+        engine = enginefacade.get_legacy_facade().get_engine()
+        models.Base.metadata.create_all(engine)
+        _create_nodes(options.nodes)
+
+        app = webtest.TestApp(api_app.VersionSelectorApplication())
+        url = '/v1/nodes/detail?limit=%d' % options.nodes
+        headers = {'X-OpenStack-Ironic-API-Version': options.version}
+
+        print("%d nodes per page, API version %s" %
+              (options.nodes, options.version))
+        convert_to_dict = api_node.NodeCollection.convert_to_dict
+        results = []
+        for convert, label in ((_convert_with_wsme, 'WSME'),
+                               (convert_to_dict, 'convert_to_dict')):
+            api_node.NodeCollection.convert_to_dict = staticmethod(convert)
+            rate, body = _measure(app, url, headers, options.repeat)
+            results.append(body)
+            print("%-16s %8.2f requests/s" % (label + ':', rate))
+        api_node.NodeCollection.convert_to_dict = staticmethod(
+            convert_to_dict)
+        print("identical responses: %s" % (results[0] == results[1]))
+
+        for stream in (False, True):
+            CONF.set_override('stream_collections', stream, group='api')
+            first, elapsed = _measure_first_byte(app.app, url, headers,
+                                                 options.repeat)
+            print("%-16s first byte: %8.3f s, whole response: %8.3f s" %
+                  ('streamed:' if stream else 'built at once:',
+                   first, elapsed))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
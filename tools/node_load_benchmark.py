@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the throughput of Node.get() and Node.list().
+
+The nodes are stored in a temporary SQLite database, with large
+driver_internal_info and properties documents. The JSON fields of the
+nodes are only decoded when they are used: the nodes are loaded once
+reading only their provision state, and once reading all their fields,
+which is what loading a node cost when the JSON fields were decoded with
+the rows.
+"""
+
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+top_dir = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                       os.pardir))
+sys.path.insert(0, top_dir)
+
+from oslo_config import cfg  # noqa
+from oslo_db.sqlalchemy import enginefacade  # noqa
+from oslo_utils import uuidutils  # noqa
+
+from ironic.common import states  # noqa
+from ironic.db import api as db_api  # noqa
+from ironic.db.sqlalchemy import models  # noqa
+from ironic import objects  # noqa
+
+CONF = cfg.CONF
+
+
+def _create_nodes(count, size):
+    dbapi = db_api.get_instance()
+    blob = dict(('key%d' % i, 'value-%d' % i) for i in range(size))
+    ids = []
+    for i in range(count):
+        node = dbapi.create_node({
+            'uuid': uuidutils.generate_uuid(),
+            'driver': 'fake',
+            'provision_state': states.ACTIVE,
+            'driver_internal_info': dict(blob, clean_steps=[blob] * 2),
+            'properties': dict(blob, capabilities='boot_mode:uefi'),
+            'instance_info': {'image_source': 'glance://image'}})
+        ids.append(node.id)
+    return ids
+
+
+def _read(node, all_fields):
+    if all_fields:
+        return node.as_dict()
+    return node.provision_state
+
+
+def _best(repeat, func):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--nodes", dest="nodes", type="int", default=1000,
+                      help="number of nodes to create")
+    parser.add_option("--size", dest="size", type="int", default=200,
+                      help="number of keys of the JSON documents")
+    parser.add_option("--repeat", dest="repeat", type="int", default=5,
+                      help="number of runs, the best one is reported")
+    options, args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        CONF([], project='ironic')
+        CONF.set_override('connection',
+                          'sqlite:///%s' % os.path.join(tmp_dir, 'ironic.db'),
+                          group='database')
+        engine = enginefacade.get_legacy_facade().get_engine()
+        models.Base.metadata.create_all(engine)
+        ids = _create_nodes(options.nodes, options.size)
+
+        print("%d nodes, %d keys per document" % (options.nodes,
+                                                  options.size))
+        for all_fields, label in ((False, 'provision state'),
+                                  (True, 'all the fields')):
+            def get():
+                for node_id in ids:
+                    _read(objects.Node.get_by_id(None, node_id), all_fields)
+
+            def list_():
+                for node in objects.Node.list(None):
+                    _read(node, all_fields)
+
+            get_time = _best(options.repeat, get)
+            list_time = _best(options.repeat, list_)
+            print("reading %-16s Node.get: %8.0f nodes/s, "
+                  "Node.list: %8.0f nodes/s" %
+                  (label + ':', len(ids) / get_time, len(ids) / list_time))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
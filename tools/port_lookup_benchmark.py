@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the lookup of the ports of a node by their MAC addresses.
+
+This is what the agent lookup does with the MAC addresses reported by the
+ramdisk. The ports are stored in a temporary SQLite database, and looked
+up with one query per MAC address (Port.get_by_address(), which the
+lookup used before) and with a single query (Port.list_by_addresses()).
+"""
+
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+top_dir = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                       os.pardir))
+sys.path.insert(0, top_dir)
+
+from oslo_config import cfg  # noqa
+from oslo_db.sqlalchemy import enginefacade  # noqa
+from oslo_utils import uuidutils  # noqa
+from sqlalchemy import event  # noqa
+
+from ironic.common import exception  # noqa
+from ironic.db import api as db_api  # noqa
+from ironic.db.sqlalchemy import models  # noqa
+from ironic import objects  # noqa
+
+CONF = cfg.CONF
+
+
+def _get_address(node_index, nic):
+    return '52:54:%02x:%02x:%02x:%02x' % (nic, node_index // 65536,
+                                          node_index // 256 % 256,
+                                          node_index % 256)
+
+
+def _create_nodes(count, nics):
+    dbapi = db_api.get_instance()
+    for i in range(count):
+        node = dbapi.create_node({'uuid': uuidutils.generate_uuid(),
+                                  'driver': 'fake'})
+        for nic in range(nics):
+            dbapi.create_port({'uuid': uuidutils.generate_uuid(),
+                               'node_id': node.id,
+                               'address': _get_address(i, nic)})
+
+
+def _get_by_address(macs):
+    ports = []
+    for mac in macs:
+        try:
+            ports.append(objects.Port.get_by_address(None, mac))
+        except exception.PortNotFound:
+            pass
+    return ports
+
+
+def _list_by_addresses(macs):
+    return objects.Port.list_by_addresses(None, macs)
+
+
+def _measure(lookup, nodes, nics, repeat, queries):
+    best = None
+    for i in range(repeat):
+        del queries[:]
+        start = time.time()
+        for j in range(nodes):
+            lookup([_get_address(j, nic) for nic in range(nics)])
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return nodes / best, len(queries) / nodes
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--nodes", dest="nodes", type="int", default=1000,
+                      help="number of nodes to create")
+    parser.add_option("--nics", dest="nics", type="int", default=8,
+                      help="number of ports per node")
+    parser.add_option("--repeat", dest="repeat", type="int", default=5,
+                      help="number of runs, the best one is reported")
+    options, args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        CONF([], project='ironic')
+        CONF.set_override('connection',
+                          'sqlite:///%s' % os.path.join(tmp_dir, 'ironic.db'),
+                          group='database')
+        engine = enginefacade.get_legacy_facade().get_engine()
+        models.Base.metadata.create_all(engine)
+        _create_nodes(options.nodes, options.nics)
+
+        queries = []
+        event.listen(engine, 'before_cursor_execute',
+                     lambda *args: queries.append(args[2]))
+
+        print("%d nodes, %d ports per node" % (options.nodes, options.nics))
+        for lookup, label in ((_get_by_address, 'Port.get_by_address'),
+                              (_list_by_addresses, 'Port.list_by_addresses')):
+            rate, per_lookup = _measure(lookup, options.nodes, options.nics,
+                                        options.repeat, queries)
+            print("%-23s %8.0f lookups/s, %d statements per lookup" %
+                  (label + ':', rate, per_lookup))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the cost of creating a TaskManager, and its memory footprint.
+
+Compares tracking the provision state of the node with a copy of the whole
+state machine (the behaviour before the states and transitions were shared
+by all tasks) and with a cursor on the shared table. The database and the
+driver are left out: the node is returned from memory.
+"""
+
+import optparse
+import os
+import sys
+import time
+
+top_dir = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                       os.pardir))
+sys.path.insert(0, top_dir)
+
+from oslo_config import cfg  # noqa
+
+from ironic.common import driver_factory  # noqa
+from ironic.common import states  # noqa
+from ironic.conductor import task_manager  # noqa
+from ironic import objects  # noqa
+
+CONF = cfg.CONF
+
+
+class _CopyingTable(object):
+    """Gives each task its own copy of the state machine."""
+
+    def cursor(self):
+        return states.machine.copy()
+
+
+def _reachable(obj, seen):
+    """Return the size of the objects reachable from obj, and not seen."""
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        if hasattr(obj, '__dict__'):
+            stack.append(obj.__dict__)
+        for slot in getattr(type(obj), '__slots__', ()):
+            if hasattr(obj, slot):
+                stack.append(getattr(obj, slot))
+    return size
+
+
+def _measure(count, repeat, node):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        for j in range(count):
+            task_manager.TaskManager(None, node.uuid, shared=True)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    task = task_manager.TaskManager(None, node.uuid, shared=True)
+    # The objects shared by all the tasks do not count
+    seen = set()
+    _reachable(states.machine, seen)
+    _reachable(states.machine_table, seen)
+    return count / best if best else float('inf'), _reachable(task.fsm, seen)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--tasks", dest="tasks", type="int", default=10000,
+                      help="number of tasks to create")
+    parser.add_option("--repeat", dest="repeat", type="int", default=5,
+                      help="number of runs, the best one is reported")
+    options, args = parser.parse_args()
+
+    CONF([], project='ironic')
+    node = objects.Node(None)
+    node.id = 1
+    node.uuid = '1be26c0b-03f2-4d2e-ae87-c02d7f33c123'
+    node.driver = 'fake'
+    node.provision_state = states.DEPLOYWAIT
+    objects.Node.get = classmethod(lambda cls, context, node_id,
+                                   filters=None: node)
+    driver_factory.get_driver = lambda name: None
+
+    table = states.machine_table
+    states.machine_table = _CopyingTable()
+    copied, copied_size = _measure(options.tasks, options.repeat, node)
+    states.machine_table = table
+    shared, shared_size = _measure(options.tasks, options.repeat, node)
+
+    print("%d tasks" % options.tasks)
+    print("copy of the state machine: %8.0f tasks/s, %6d bytes per task" %
+          (copied, copied_size))
+    print("cursor on a shared table:  %8.0f tasks/s, %6d bytes per task" %
+          (shared, shared_size))
+
+
+if __name__ == '__main__':
+    main()